@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2020 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Benchmark for checking the state of outstanding Celery tasks.
+
+This compares reading each task state and result separately with the bulk
+lookup the Celery Task Manager uses, for a number of outstanding tasks.  The
+benchmark writes fake task results into the given result backend, so it should
+be run against a test Redis server:
+
+  $ tools/celery_status_benchmark.py -b redis://localhost:6379/15 \
+      -n 1000 -n 10000
+
+Without a Redis server, the results can be kept in memory by a fake Redis
+client that waits for a fixed time on every round trip instead:
+
+  $ tools/celery_status_benchmark.py --fake_latency 0.2 -n 1000 -n 10000
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import argparse
+import time
+import uuid
+
+import celery
+from celery import states as celery_states
+
+from turbinia import celery as turbinia_celery
+
+# Every tenth task has finished, and the rest are still running.
+FINISHED_RATIO = 10
+
+
+class FakeRedisClient(object):
+  """In-memory Redis client with a fixed latency for every round trip.
+
+  Only the commands used by the Celery Redis result backend are supported.
+
+  Attributes:
+    latency (float): The time in seconds to wait for every command, or for
+        every pipeline execution.
+    values (dict): The stored keys mapped to their values.
+  """
+
+  def __init__(self, latency):
+    self.latency = latency
+    self.values = {}
+
+  def _round_trip(self):
+    """Waits for the latency of a round trip to the server."""
+    time.sleep(self.latency)
+
+  def get(self, key):
+    self._round_trip()
+    return self.values.get(key)
+
+  def mget(self, keys):
+    self._round_trip()
+    return [self.values.get(key) for key in keys]
+
+  def set(self, key, value, **_):
+    self._round_trip()
+    self.values[key] = value
+
+  def setex(self, key, _, value):
+    self.set(key, value)
+
+  def delete(self, *keys):
+    self._round_trip()
+    for key in keys:
+      self.values.pop(key, None)
+
+  def expire(self, *_):
+    self._round_trip()
+
+  def publish(self, *_):
+    self._round_trip()
+
+  def pipeline(self):
+    return FakeRedisPipeline(self)
+
+
+class FakeRedisPipeline(object):
+  """Pipeline for the fake Redis client that sends commands in one round trip.
+
+  Attributes:
+    client (FakeRedisClient): The client to run the commands with.
+    commands (list[tuple]): The queued (client method, args, kwargs) tuples.
+  """
+
+  def __init__(self, client):
+    self.client = client
+    self.commands = []
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *_):
+    self.commands = []
+
+  def set(self, *args, **kwargs):
+    self.commands.append((self.client.set, args, kwargs))
+
+  def setex(self, *args):
+    self.commands.append((self.client.setex, args, {}))
+
+  def publish(self, *args):
+    self.commands.append((self.client.publish, args, {}))
+
+  def execute(self):
+    """Runs the queued commands with the latency of a single round trip."""
+    self.client._round_trip()  # pylint: disable=protected-access
+    latency, self.client.latency = self.client.latency, 0
+    try:
+      for method, args, kwargs in self.commands:
+        method(*args, **kwargs)
+    finally:
+      self.client.latency = latency
+      self.commands = []
+
+
+def store_results(backend, count):
+  """Writes fake results for a number of tasks.
+
+  Args:
+    backend (celery.backends.base.Backend): The result backend.
+    count (int): The number of tasks.
+
+  Returns:
+    list[str]: The task IDs.
+  """
+  task_ids = []
+  for i in range(count):
+    task_id = 'benchmark-{0:s}'.format(uuid.uuid4().hex)
+    if i % FINISHED_RATIO:
+      backend.store_result(task_id, None, celery_states.STARTED)
+    else:
+      backend.store_result(
+          task_id, {'status': 'benchmark result'}, celery_states.SUCCESS)
+    task_ids.append(task_id)
+  return task_ids
+
+
+def check_each(app, task_ids):
+  """Checks task states one task at a time like AsyncResult users do.
+
+  Args:
+    app (celery.Celery): The Celery app.
+    task_ids (list[str]): The task IDs.
+
+  Returns:
+    int: The number of finished tasks.
+  """
+  finished = 0
+  for task_id in task_ids:
+    async_result = app.AsyncResult(task_id)
+    if async_result.status == celery_states.SUCCESS:
+      _ = async_result.result
+      finished += 1
+  return finished
+
+
+def check_bulk(turbinia_app, task_ids):
+  """Checks task states with the bulk lookup.
+
+  Args:
+    turbinia_app (TurbiniaCelery): The Turbinia Celery app.
+    task_ids (list[str]): The task IDs.
+
+  Returns:
+    int: The number of finished tasks.
+  """
+  results = turbinia_app.get_task_results(task_ids)
+  return sum(
+      1 for result in results.values()
+      if result['status'] == celery_states.SUCCESS)
+
+
+def run_benchmark(backend_url, counts, loops, fake_latency=None):
+  """Runs the benchmark.
+
+  Args:
+    backend_url (str): The Celery result backend URL.
+    counts (list[int]): Numbers of outstanding tasks to benchmark.
+    loops (int): The number of times to check all tasks for each count.
+    fake_latency (float): If set, the Redis result backend uses a fake
+        in-memory client that waits this many milliseconds per round trip.
+  """
+  turbinia_app = turbinia_celery.TurbiniaCelery()
+  turbinia_app.app = celery.Celery(
+      'turbinia-benchmark', broker='memory://', backend=backend_url)
+  backend = turbinia_app.app.backend
+  if fake_latency is not None:
+    backend.client = FakeRedisClient(fake_latency / 1000.0)
+  print('tasks, each_seconds_per_loop, bulk_seconds_per_loop, speedup')
+  for count in counts:
+    task_ids = store_results(backend, count)
+    try:
+      timings = []
+      for check in (lambda: check_each(turbinia_app.app, task_ids),
+                    lambda: check_bulk(turbinia_app, task_ids)):
+        start = time.time()
+        for _ in range(loops):
+          check()
+        timings.append((time.time() - start) / loops)
+      print(
+          '{0:d}, {1:.4f}, {2:.4f}, {3:.1f}'.format(
+              count, timings[0], timings[1], timings[0] / timings[1]))
+    finally:
+      for task_id in task_ids:
+        backend.forget(task_id)
+
+
+def main():
+  """Main function for the benchmark."""
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument(
+      '-b', '--backend',
+      help='Celery result backend URL (e.g. redis://localhost:6379/15)')
+  parser.add_argument(
+      '--fake_latency', type=float,
+      help='Use a fake in-memory Redis result backend that waits this many '
+      'milliseconds for every round trip instead of a Redis server.')
+  parser.add_argument(
+      '-n', '--count', type=int, action='append',
+      help='Number of outstanding tasks.  Can be specified multiple times.')
+  parser.add_argument(
+      '-l', '--loops', type=int, default=3,
+      help='Number of times to check all tasks for each count.')
+  args = parser.parse_args()
+  if args.fake_latency is None and not args.backend:
+    parser.error('Either --backend or --fake_latency is required')
+
+  run_benchmark(
+      args.backend or 'redis://', args.count or [1000, 10000], args.loops,
+      args.fake_latency)
+
+
+if __name__ == '__main__':
+  main()
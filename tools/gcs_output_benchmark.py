@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2020 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Benchmark for the GCS output writer.
+
+This can be run against a local GCS emulator (e.g. fake-gcs-server) by setting
+the STORAGE_EMULATOR_HOST environment variable before running:
+
+  $ STORAGE_EMULATOR_HOST=http://localhost:4443 \
+      tools/gcs_output_benchmark.py -b gs://bucket/output -s 512 -s 2048
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from turbinia import config
+
+
+def write_test_file(path, size):
+  """Writes a test file of the given size with random data.
+
+  Args:
+    path (str): Path to write the file to.
+    size (int): Size of the file in bytes.
+  """
+  block = os.urandom(2**20)
+  with open(path, 'wb') as file_handle:
+    for _ in range(size // len(block)):
+      file_handle.write(block)
+    file_handle.write(block[:size % len(block)])
+
+
+def run_benchmark(gcs_path, sizes, parallel=True):
+  """Runs the upload and download benchmark.
+
+  Args:
+    gcs_path (str): The GCS path to write output into.
+    sizes (list[int]): File sizes in MB to benchmark.
+    parallel (bool): Whether to use parallel composite transfers.
+  """
+  from turbinia import output_manager  # pylint: disable=import-outside-toplevel
+
+  if not parallel:
+    output_manager.GCSOutputWriter.PARALLEL_THRESHOLD = float('inf')
+  tmp_dir = tempfile.mkdtemp(prefix='turbinia-gcs-benchmark')
+  try:
+    unique_dir = 'benchmark-{0:d}'.format(int(time.time()))
+    writer = output_manager.GCSOutputWriter(
+        gcs_path=gcs_path, unique_dir=unique_dir, local_output_dir=tmp_dir)
+    print(
+        'size_mb, upload_seconds, upload_mbps, download_seconds, '
+        'download_mbps')
+    for size in sizes:
+      source_path = os.path.join(tmp_dir, 'upload-{0:d}.bin'.format(size))
+      write_test_file(source_path, size * 2**20)
+      start = time.time()
+      saved_path = writer.copy_to(source_path)
+      upload_time = time.time() - start
+      os.remove(source_path)
+
+      start = time.time()
+      writer.copy_from(saved_path)
+      download_time = time.time() - start
+      os.remove(os.path.join(tmp_dir, os.path.basename(saved_path)))
+      print(
+          '{0:d}, {1:.2f}, {2:.1f}, {3:.2f}, {4:.1f}'.format(
+              size, upload_time, size / upload_time, download_time,
+              size / download_time))
+  finally:
+    shutil.rmtree(tmp_dir)
+
+
+def main():
+  """Main function for the benchmark."""
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument(
+      '-b', '--gcs_path', required=True,
+      help='GCS path to write to (e.g. gs://bucket/output)')
+  parser.add_argument(
+      '-s', '--size', type=int, action='append',
+      help='File size in MB to benchmark.  Can be specified multiple times.')
+  parser.add_argument(
+      '--no_parallel', action='store_true',
+      help='Disable parallel composite uploads and ranged downloads.')
+  args = parser.parse_args()
+
+  config.LoadConfig()
+  config.GCS_OUTPUT_PATH = args.gcs_path
+  run_benchmark(
+      args.gcs_path, args.size or [16, 256, 1024],
+      parallel=not args.no_parallel)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2020 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Migrates and compacts Turbinia output directories.
+
+Output directories created with the old flat '{epoch}-{uid}-{name}' layout are
+moved into '{base}/legacy/{uid prefix}/' so that the base output directories
+no longer hold an entry for every Task.  Paths to the old locations are still
+resolved by the output manager.  With --remove_empty, empty output directories
+(e.g. Task temp directories) are removed instead.
+
+  $ tools/output_dir_migrate.py --remove_empty --min_age 24
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import argparse
+import logging
+import sys
+
+from turbinia import config
+from turbinia import output_manager
+from turbinia import TurbiniaException
+
+
+def main():
+  """Main function."""
+  parser = argparse.ArgumentParser(
+      description='Migrates and compacts Turbinia output directories.')
+  parser.add_argument(
+      '-d', '--directory', action='append', default=[],
+      help='Base output directory to migrate.  Can be specified multiple '
+      'times.  Defaults to the configured OUTPUT_DIR and TMP_DIR.')
+  parser.add_argument(
+      '-m', '--min_age', type=int, default=24,
+      help='Only migrate directories not modified in this many hours.')
+  parser.add_argument(
+      '-n', '--dry_run', action='store_true',
+      help='Only show what would be done.')
+  parser.add_argument(
+      '-r', '--remove_empty', action='store_true',
+      help='Remove empty output directories.')
+  args = parser.parse_args()
+
+  logging.basicConfig(level=logging.INFO, format='%(message)s')
+  config.LoadConfig()
+  directories = args.directory or [config.OUTPUT_DIR, config.TMP_DIR]
+
+  for directory in directories:
+    try:
+      migrated, removed = output_manager.migrate_output_dirs(
+          directory, dry_run=args.dry_run, remove_empty=args.remove_empty,
+          min_age=args.min_age * 3600)
+    except (OSError, TurbiniaException) as exception:
+      print('Failed to migrate {0:s}: {1!s}'.format(directory, exception))
+      sys.exit(1)
+    print(
+        '{0:s}: migrated {1:d} and removed {2:d} directories'.format(
+            directory, migrated, removed))
+
+
+if __name__ == '__main__':
+  main()
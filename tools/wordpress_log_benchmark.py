@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2020 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Benchmark for the Wordpress access log analysis.
+
+This writes synthetic access logs of the given total size split over a number
+of files, and then analyzes them by reading each file into memory (as the Task
+used to), by streaming them one at a time, and by streaming them in parallel.
+Each method runs in a separate process so that its peak memory use can be
+reported:
+
+  $ tools/wordpress_log_benchmark.py -s 1024 -s 4096 -f 8 --gzip
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import argparse
+import gzip
+import multiprocessing
+import os
+import random
+import resource
+import shutil
+import tempfile
+import time
+
+from turbinia import config
+from turbinia.workers.analysis import wordpress
+
+# Every this many lines of the synthetic logs is a Wordpress finding.
+FINDING_INTERVAL = 100000
+
+LOG_LINE = (
+    '{0:d}.{1:d}.{2:d}.{3:d} - - [27/Jun/2018:19:{4:02d}:{5:02d} +0000] '
+    '"{6:s} HTTP/1.1" 200 {7:d} "-" "Mozilla/5.0 (X11; Linux x86_64) '
+    'AppleWebKit/537.36 (KHTML, like Gecko) Chrome/83.0 Safari/537.36"\n')
+
+REQUESTS = [
+    'GET /index.php', 'GET /wp-login.php', 'POST /wp-admin/admin-ajax.php',
+    'GET /wp-content/themes/twentytwenty/style.css?ver=1.2',
+    'GET /wp-admin/theme-editor.php', 'GET /?p=42'
+]
+
+FINDINGS = [
+    'POST /wp-admin/install.php?step=2',
+    'GET /wp-admin/theme-editor.php?file=header.php'
+]
+
+
+def write_log_file(path, size, compress):
+  """Writes a synthetic access log.
+
+  Args:
+    path (str): Path to write the log to.
+    size (int): Size of the uncompressed log in bytes.
+    compress (bool): Whether to gzip compress the log.
+  """
+  open_function = gzip.open if compress else open
+  written = 0
+  line_number = 0
+  with open_function(path, 'wb') as file_handle:
+    while written < size:
+      lines = []
+      for _ in range(1000):
+        line_number += 1
+        if line_number % FINDING_INTERVAL:
+          request = random.choice(REQUESTS)
+        else:
+          request = random.choice(FINDINGS)
+        lines.append(
+            LOG_LINE.format(
+                random.randint(1, 254), random.randint(0, 255),
+                random.randint(0, 255), random.randint(1, 254),
+                random.randint(0, 59), random.randint(0, 59), request,
+                random.randint(100, 100000)))
+      data = ''.join(lines).encode('utf-8')
+      file_handle.write(data)
+      written += len(data)
+
+
+def analyze_in_memory(paths):
+  """Analyzes the logs by reading each file into memory."""
+  task = wordpress.WordpressAccessLogAnalysisTask()
+  for path in paths:
+    open_function = gzip.open if path.endswith('.gz') else open
+    with open_function(path, 'rb') as input_file:
+      task.analyze_wp_access_logs(input_file.read().decode('utf-8'))
+
+
+def analyze_streaming(paths):
+  """Analyzes the logs by streaming one file at a time."""
+  task = wordpress.WordpressAccessLogAnalysisTask()
+  task.MAX_PROCESSES = 1
+  task.analyze_wp_access_log_files(paths)
+
+
+def analyze_parallel(paths):
+  """Analyzes the logs by streaming the files in a process pool."""
+  task = wordpress.WordpressAccessLogAnalysisTask()
+  task.analyze_wp_access_log_files(paths)
+
+
+def _run_method(method, paths, queue):
+  """Runs a method and reports its run time and peak memory use."""
+  start = time.time()
+  method(paths)
+  run_time = time.time() - start
+  peak_rss = max(
+      resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+      resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+  queue.put((run_time, peak_rss))
+
+
+def run_benchmark(sizes, file_count, compress, in_memory):
+  """Runs the benchmark.
+
+  Args:
+    sizes (list[int]): Total uncompressed log sizes in MB to benchmark.
+    file_count (int): The number of files to split the logs over.
+    compress (bool): Whether to gzip compress the logs.
+    in_memory (bool): Whether to benchmark reading whole files into memory.
+  """
+  config.LoadConfig()
+  methods = [('streaming', analyze_streaming), ('parallel', analyze_parallel)]
+  if in_memory:
+    methods.insert(0, ('in_memory', analyze_in_memory))
+  tmp_dir = tempfile.mkdtemp(prefix='turbinia-wordpress-benchmark')
+  try:
+    print('size_mb, files, method, seconds, mbps, peak_rss_mb')
+    for size in sizes:
+      paths = []
+      for i in range(file_count):
+        path = os.path.join(
+            tmp_dir, 'access-{0:d}-{1:d}.log{2:s}'.format(
+                size, i, '.gz' if compress else ''))
+        write_log_file(path, size * 2**20 // file_count, compress)
+        paths.append(path)
+      for name, method in methods:
+        queue = multiprocessing.Queue()
+        process = multiprocessing.Process(
+            target=_run_method, args=(method, paths, queue))
+        process.start()
+        run_time, peak_rss = queue.get()
+        process.join()
+        print(
+            '{0:d}, {1:d}, {2:s}, {3:.2f}, {4:.1f}, {5:.1f}'.format(
+                size, file_count, name, run_time, size / run_time,
+                peak_rss / 1024.0))
+      for path in paths:
+        os.remove(path)
+  finally:
+    shutil.rmtree(tmp_dir)
+
+
+def main():
+  """Main function for the benchmark."""
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument(
+      '-s', '--size', type=int, action='append',
+      help='Total uncompressed size of the logs in MB.  Can be specified '
+      'multiple times.')
+  parser.add_argument(
+      '-f', '--files', type=int, default=4,
+      help='Number of files to split the logs over.')
+  parser.add_argument(
+      '--gzip', action='store_true', help='Gzip compress the logs.')
+  parser.add_argument(
+      '--in_memory', action='store_true',
+      help='Also benchmark reading whole files into memory.  This needs more '
+      'memory than the size of the largest file.')
+  args = parser.parse_args()
+
+  run_benchmark(
+      args.size or [1024, 4096], args.files, args.gzip, args.in_memory)
+
+
+if __name__ == '__main__':
+  main()
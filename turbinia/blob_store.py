@@ -0,0 +1,388 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Out-of-line storage for large Task state fields.
+
+Large Task fields (e.g. report_data) are stored in a content addressed blob
+store instead of inline in the state record.  The state record keeps a
+truncated preview of the field, and a reference to the full value in its
+blob_refs attribute.
+"""
+
+from __future__ import unicode_literals
+
+import codecs
+import errno
+import hashlib
+import logging
+import os
+import posixpath
+import threading
+
+import six
+
+from turbinia import config
+from turbinia import TurbiniaException
+
+log = logging.getLogger('turbinia')
+
+BLOB_REF_PREFIX = 'turbinia-blob'
+# Suffix added to the truncated preview of fields stored in the blob store.
+PREVIEW_SUFFIX = '[...]'
+# Maximum length of the preview kept inline in the state record.
+MAX_PREVIEW_LENGTH = 1000
+
+
+def get_blob_store():
+  """Gets the configured blob store.
+
+  Returns:
+    BaseBlobStore: The blob store, or None if none is configured.
+
+  Raises:
+    TurbiniaException: When an unknown blob store is configured.
+  """
+  config.LoadConfig()
+  if not config.STATE_BLOB_STORE:
+    return None
+  store_type = config.STATE_BLOB_STORE.lower()
+  # pylint: disable=no-else-return
+  if store_type == 'local':
+    return LocalBlobStore()
+  elif store_type == 'gcs':
+    return GCSBlobStore()
+  elif store_type == 'redis':
+    return RedisBlobStore()
+  else:
+    raise TurbiniaException(
+        'State blob store type "{0:s}" not implemented'.format(
+            config.STATE_BLOB_STORE))
+
+
+def get_ref(store_name, digest):
+  """Gets the reference to a blob.
+
+  Args:
+    store_name (str): The name of the blob store.
+    digest (str): The SHA256 hex digest of the blob.
+
+  Returns:
+    str: The reference.
+  """
+  return ':'.join([BLOB_REF_PREFIX, store_name, 'sha256', digest])
+
+
+def parse_ref(ref):
+  """Parses a blob reference.
+
+  Args:
+    ref (str): The blob reference.
+
+  Returns:
+    Tuple(str, str): The blob store name and SHA256 hex digest.
+
+  Raises:
+    TurbiniaException: When the reference is not valid.
+  """
+  parts = ref.split(':') if isinstance(ref, six.string_types) else []
+  if len(parts) != 4 or parts[0] != BLOB_REF_PREFIX or parts[2] != 'sha256':
+    raise TurbiniaException('Invalid blob reference {0!s}'.format(ref))
+  return parts[1], parts[3]
+
+
+def resolve_task_fields(task_dict, blob_store=None):
+  """Replaces field previews in a Task dict with their full values.
+
+  Args:
+    task_dict (dict): The Task data from the state manager.
+    blob_store (BaseBlobStore): The blob store to read from.  Defaults to the
+        configured blob store.
+
+  Returns:
+    dict: The Task data with full field values where they could be fetched.
+  """
+  blob_refs = task_dict.get('blob_refs')
+  if not blob_refs:
+    return task_dict
+  blob_store = blob_store or get_blob_store()
+  if not blob_store:
+    log.warning(
+        'Task {0!s} has fields in a blob store, but no STATE_BLOB_STORE is '
+        'configured'.format(task_dict.get('id')))
+    return task_dict
+
+  for field, ref in blob_refs.items():
+    try:
+      task_dict[field] = blob_store.get(ref)
+    except TurbiniaException as exception:
+      log.warning(
+          'Could not get field {0:s} for Task {1!s}: {2!s}'.format(
+              field, task_dict.get('id'), exception))
+  return task_dict
+
+
+class BaseBlobStore(object):
+  """Base class for content addressed blob stores.
+
+  Attributes:
+    threshold (int): Size in bytes above which fields are stored as blobs.
+  """
+
+  NAME = 'base'
+
+  def __init__(self):
+    config.LoadConfig()
+    self.threshold = config.STATE_BLOB_THRESHOLD or 65536
+    # Digests that we know are already stored so we don't write them again.
+    self._stored = set()
+    self._lock = threading.Lock()
+
+  def _exists(self, digest):
+    """Checks whether a blob is already stored.
+
+    Args:
+      digest (str): The SHA256 hex digest of the blob.
+
+    Returns:
+      bool: True if the blob exists.
+    """
+    raise NotImplementedError
+
+  def _write(self, digest, data):
+    """Writes a blob.
+
+    Args:
+      digest (str): The SHA256 hex digest of the blob.
+      data (bytes): The blob data.
+    """
+    raise NotImplementedError
+
+  def _read(self, digest):
+    """Reads a blob.
+
+    Args:
+      digest (str): The SHA256 hex digest of the blob.
+
+    Returns:
+      bytes: The blob data.
+    """
+    raise NotImplementedError
+
+  def put(self, value):
+    """Stores a value as a blob.
+
+    Args:
+      value (str): The value to store.
+
+    Returns:
+      str: The reference to the stored blob.
+    """
+    data = value.encode('utf-8')
+    digest = hashlib.sha256(data).hexdigest()
+    with self._lock:
+      stored = digest in self._stored
+    if not stored and not self._exists(digest):
+      log.debug(
+          'Writing {0:d} byte state blob {1:s} to {2:s} blob store'.format(
+              len(data), digest, self.NAME))
+      self._write(digest, data)
+    with self._lock:
+      self._stored.add(digest)
+    return get_ref(self.NAME, digest)
+
+  def get(self, ref):
+    """Gets the value of a blob.
+
+    Args:
+      ref (str): The reference to the blob.
+
+    Returns:
+      str: The stored value.
+
+    Raises:
+      TurbiniaException: When the blob can't be read or fails verification.
+    """
+    store_name, digest = parse_ref(ref)
+    if store_name != self.NAME:
+      raise TurbiniaException(
+          'Blob {0:s} is not in the {1:s} blob store'.format(ref, self.NAME))
+    data = self._read(digest)
+    if hashlib.sha256(data).hexdigest() != digest:
+      raise TurbiniaException('Blob {0:s} failed hash verification'.format(ref))
+    return codecs.decode(data, 'utf-8')
+
+  def offload_fields(self, task_dict, max_size=None):
+    """Moves large string fields of a Task dict into the blob store.
+
+    Args:
+      task_dict (dict): The Task data to store.
+      max_size (int): The maximum size the state backend can store inline,
+          which overrides the configured threshold if it is smaller.
+
+    Returns:
+      dict: The Task data with large fields replaced by previews, and their
+          references in the 'blob_refs' field.
+    """
+    threshold = self.threshold
+    if max_size:
+      threshold = min(threshold, max_size)
+    preview_length = min(threshold, MAX_PREVIEW_LENGTH) - len(PREVIEW_SUFFIX)
+
+    blob_refs = {}
+    for field, value in task_dict.items():
+      if not isinstance(value, six.string_types) or len(value) <= threshold:
+        continue
+      try:
+        blob_refs[field] = self.put(value)
+      except TurbiniaException as exception:
+        log.error(
+            'Could not store field {0:s} in the blob store: {1!s}'.format(
+                field, exception))
+        continue
+      task_dict[field] = value[:max(preview_length, 0)] + PREVIEW_SUFFIX
+    task_dict['blob_refs'] = blob_refs or None
+    return task_dict
+
+
+class LocalBlobStore(BaseBlobStore):
+  """Blob store in a local (or shared) directory.
+
+  Attributes:
+    path (str): The directory blobs are stored in.
+  """
+
+  NAME = 'local'
+
+  def __init__(self, path=None):
+    super(LocalBlobStore, self).__init__()
+    self.path = path or config.STATE_BLOB_PATH or os.path.join(
+        config.OUTPUT_DIR, 'state-blobs')
+
+  def _get_path(self, digest):
+    """Gets the path to a blob."""
+    return os.path.join(self.path, digest[:2], digest)
+
+  def _exists(self, digest):
+    return os.path.exists(self._get_path(digest))
+
+  def _write(self, digest, data):
+    path = self._get_path(digest)
+    tmp_path = '{0:s}.{1:d}.tmp'.format(path, os.getpid())
+    try:
+      if not os.path.exists(os.path.dirname(path)):
+        try:
+          os.makedirs(os.path.dirname(path))
+        except OSError as exception:
+          if exception.errno != errno.EEXIST:
+            raise
+      with open(tmp_path, 'wb') as file_handle:
+        file_handle.write(data)
+      os.rename(tmp_path, path)
+    except (IOError, OSError) as exception:
+      raise TurbiniaException(
+          'Could not write blob {0:s}: {1!s}'.format(path, exception))
+
+  def _read(self, digest):
+    path = self._get_path(digest)
+    try:
+      with open(path, 'rb') as file_handle:
+        return file_handle.read()
+    except (IOError, OSError) as exception:
+      raise TurbiniaException(
+          'Could not read blob {0:s}: {1!s}'.format(path, exception))
+
+
+class GCSBlobStore(BaseBlobStore):
+  """Blob store in Google Cloud Storage.
+
+  Attributes:
+    bucket (google.cloud.storage.Bucket): The bucket blobs are stored in.
+    prefix (str): The object name prefix for blobs.
+  """
+
+  NAME = 'gcs'
+
+  def __init__(self, path=None):
+    super(GCSBlobStore, self).__init__()
+    # pylint: disable=import-outside-toplevel
+    from google.cloud import exceptions
+    from google.cloud import storage
+    self._exceptions = exceptions
+    path = path or config.STATE_BLOB_PATH
+    if not path or not path.startswith('gs://'):
+      raise TurbiniaException(
+          'STATE_BLOB_PATH must be a gs:// path for the GCS blob store, not '
+          '{0!s}'.format(path))
+    bucket_name, _, self.prefix = path[5:].partition('/')
+    client = storage.Client(project=config.TURBINIA_PROJECT)
+    self.bucket = client.bucket(bucket_name)
+
+  def _get_blob(self, digest):
+    """Gets the GCS blob object for a digest."""
+    return self.bucket.blob(posixpath.join(self.prefix, digest))
+
+  def _exists(self, digest):
+    try:
+      return self._get_blob(digest).exists()
+    except self._exceptions.GoogleCloudError as exception:
+      raise TurbiniaException(
+          'Could not check blob {0:s}: {1!s}'.format(digest, exception))
+
+  def _write(self, digest, data):
+    try:
+      self._get_blob(digest).upload_from_string(data)
+    except self._exceptions.GoogleCloudError as exception:
+      raise TurbiniaException(
+          'Could not write blob {0:s}: {1!s}'.format(digest, exception))
+
+  def _read(self, digest):
+    try:
+      return self._get_blob(digest).download_as_string()
+    except self._exceptions.GoogleCloudError as exception:
+      raise TurbiniaException(
+          'Could not read blob {0:s}: {1!s}'.format(digest, exception))
+
+
+class RedisBlobStore(BaseBlobStore):
+  """Blob store in Redis keys separate from the Task state.
+
+  Attributes:
+    client: Redis database object.
+  """
+
+  NAME = 'redis'
+  KEY_PREFIX = 'TurbiniaBlob'
+
+  def __init__(self):
+    super(RedisBlobStore, self).__init__()
+    # pylint: disable=import-outside-toplevel
+    import redis
+    self.client = redis.StrictRedis(
+        host=config.REDIS_HOST, port=config.REDIS_PORT, db=config.REDIS_DB)
+
+  def _get_key(self, digest):
+    """Gets the Redis key for a blob."""
+    return ':'.join([self.KEY_PREFIX, digest])
+
+  def _exists(self, digest):
+    return bool(self.client.exists(self._get_key(digest)))
+
+  def _write(self, digest, data):
+    self.client.set(self._get_key(digest), data, nx=True)
+
+  def _read(self, digest):
+    data = self.client.get(self._get_key(digest))
+    if data is None:
+      raise TurbiniaException('Blob {0:s} does not exist'.format(digest))
+    return data
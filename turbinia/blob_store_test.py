@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests the blob store module."""
+
+from __future__ import unicode_literals
+
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from turbinia import blob_store
+from turbinia import config
+from turbinia import TurbiniaException
+
+
+class TestLocalBlobStore(unittest.TestCase):
+  """Test LocalBlobStore class."""
+
+  def setUp(self):
+    self.tmp_dir = tempfile.mkdtemp(prefix='turbinia-test-blobs')
+    self.config_save = {
+        var: getattr(config, var, None) for var in (
+            'STATE_BLOB_STORE', 'STATE_BLOB_PATH', 'STATE_BLOB_THRESHOLD')
+    }
+    config.LoadConfig()
+    config.STATE_BLOB_STORE = 'Local'
+    config.STATE_BLOB_PATH = self.tmp_dir
+    config.STATE_BLOB_THRESHOLD = 100
+    self.store = blob_store.get_blob_store()
+
+  def tearDown(self):
+    for var, value in self.config_save.items():
+      setattr(config, var, value)
+    shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+  def testGetBlobStore(self):
+    """Tests get_blob_store returns the configured store."""
+    self.assertIsInstance(self.store, blob_store.LocalBlobStore)
+    self.assertEqual(self.store.path, self.tmp_dir)
+    config.STATE_BLOB_STORE = None
+    self.assertIsNone(blob_store.get_blob_store())
+    config.STATE_BLOB_STORE = 'Bogus'
+    self.assertRaises(TurbiniaException, blob_store.get_blob_store)
+
+  def testPutGet(self):
+    """Tests storing and reading back a blob."""
+    value = 'föö' * 100
+    digest = hashlib.sha256(value.encode('utf-8')).hexdigest()
+    ref = self.store.put(value)
+    self.assertEqual(ref, 'turbinia-blob:local:sha256:{0:s}'.format(digest))
+    self.assertTrue(
+        os.path.exists(os.path.join(self.tmp_dir, digest[:2], digest)))
+    self.assertEqual(self.store.get(ref), value)
+
+  def testPutDeduplicates(self):
+    """Tests that identical values are only written once."""
+    # pylint: disable=protected-access
+    with mock.patch.object(self.store, '_write',
+                           wraps=self.store._write) as mock_write:
+      ref1 = self.store.put('data' * 100)
+      ref2 = self.store.put('data' * 100)
+    self.assertEqual(ref1, ref2)
+    self.assertEqual(mock_write.call_count, 1)
+
+  def testGetBadRef(self):
+    """Tests that invalid or corrupted blobs are rejected."""
+    self.assertRaises(TurbiniaException, self.store.get, 'bogus')
+    self.assertRaises(
+        TurbiniaException, self.store.get,
+        'turbinia-blob:redis:sha256:{0:s}'.format('a' * 64))
+    ref = self.store.put('data')
+    _, digest = blob_store.parse_ref(ref)
+    with open(os.path.join(self.tmp_dir, digest[:2], digest), 'w') as fh:
+      fh.write('corrupted')
+    self.assertRaises(TurbiniaException, self.store.get, ref)
+
+  def testOffloadAndResolveFields(self):
+    """Tests large fields are replaced with previews and can be resolved."""
+    report = 'A' * 500
+    task_dict = {'id': 'abc', 'report_data': report, 'status': 'short'}
+    task_dict = self.store.offload_fields(task_dict)
+    self.assertEqual(task_dict['status'], 'short')
+    self.assertTrue(task_dict['report_data'].endswith('[...]'))
+    self.assertLessEqual(len(task_dict['report_data']), 100)
+    self.assertEqual(list(task_dict['blob_refs']), ['report_data'])
+
+    task_dict = blob_store.resolve_task_fields(task_dict, self.store)
+    self.assertEqual(task_dict['report_data'], report)
+
+  def testOffloadFieldsMaxSize(self):
+    """Tests that a backend size limit lowers the threshold."""
+    task_dict = {'report_data': 'A' * 50}
+    task_dict = self.store.offload_fields(task_dict)
+    self.assertIsNone(task_dict['blob_refs'])
+    task_dict = self.store.offload_fields(task_dict, max_size=20)
+    self.assertIn('report_data', task_dict['blob_refs'])
+    self.assertLessEqual(len(task_dict['report_data']), 20)
+
+  def testResolveMissingBlob(self):
+    """Tests that the preview is kept when a blob can't be read."""
+    task_dict = self.store.offload_fields({'report_data': 'A' * 500})
+    preview = task_dict['report_data']
+    shutil.rmtree(self.tmp_dir)
+    task_dict = blob_store.resolve_task_fields(task_dict, self.store)
+    self.assertEqual(task_dict['report_data'], preview)
+
+
+class TestGCSBlobStore(unittest.TestCase):
+  """Test GCSBlobStore class."""
+
+  @mock.patch('google.cloud.storage.Client')
+  def testGetBlobName(self, mock_client):
+    """Tests blob object names with and without a path prefix."""
+    bucket = mock_client.return_value.bucket.return_value
+    # pylint: disable=protected-access
+    blob_store.GCSBlobStore(path='gs://bucket')._get_blob('abc')
+    bucket.blob.assert_called_with('abc')
+    blob_store.GCSBlobStore(path='gs://bucket/')._get_blob('abc')
+    bucket.blob.assert_called_with('abc')
+    blob_store.GCSBlobStore(path='gs://bucket/blobs/')._get_blob('abc')
+    bucket.blob.assert_called_with('blobs/abc')
+    mock_client.return_value.bucket.assert_called_with('bucket')
+
+
+if __name__ == '__main__':
+  unittest.main()
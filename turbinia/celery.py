@@ -22,19 +22,119 @@ from __future__ import absolute_import
 from __future__ import unicode_literals
 
 import logging
+import threading
+import time
+import zlib
 
+import six
 from six.moves import queue
 
 import celery
+from celery import states as celery_states
+from celery.backends.base import BaseKeyValueStoreBackend
 import kombu
+from kombu import serialization
 from kombu.exceptions import OperationalError
+from kombu.utils import json as kombu_json
 from amqp.exceptions import ChannelError
+from prometheus_client import Histogram
 
 from turbinia import config
+from turbinia import TurbiniaException
 from turbinia.message import TurbiniaMessageBase
 
 log = logging.getLogger('turbinia')
 
+# Define metrics
+CELERY_PAYLOAD_BYTES = Histogram(
+    'celery_payload_bytes',
+    'Turbinia Celery task and result message sizes after compression',
+    ['task_type', 'payload'], buckets=(
+        2**10, 2**12, 2**14, 2**16, 2**18, 2**20, 2**22, 2**24, float('inf')))
+
+
+class CompressedJSONSerializer(object):
+  """Kombu serializer for JSON that compresses large payloads with zlib.
+
+  Task messages carry the serialized Task and Evidence, including the recipe,
+  so they can be large.  Payloads of at least threshold bytes are compressed
+  and prefixed with COMPRESSED_PREFIX, which can't start a JSON document, so
+  both kinds of payload can be decoded without extra headers.
+
+  Attributes:
+    threshold (int): Minimum payload size in bytes to compress, or None to not
+        compress payloads.
+  """
+
+  NAME = 'turbinia-json'
+  CONTENT_TYPE = 'application/x-turbinia-json'
+  COMPRESSED_PREFIX = b'\x00zlib:'
+  # Fast compression keeps the latency low for large payloads.
+  COMPRESSION_LEVEL = 1
+
+  def __init__(self, threshold=None):
+    self.threshold = threshold
+
+  @staticmethod
+  def _get_payload_type(obj):
+    """Gets the Task type and kind of payload for metrics.
+
+    Args:
+      obj (object): Task message body or result metadata.
+
+    Returns:
+      tuple(str, str): The Task type and the kind of payload.
+    """
+    # Task messages are (args, kwargs, embed) tuples, and the serialized Task
+    # is the first argument to the task_runner.
+    if isinstance(obj, (list, tuple)) and obj and isinstance(obj[0],
+                                                             (list, tuple)):
+      if obj[0] and isinstance(obj[0][0], dict):
+        return obj[0][0].get('name') or 'unknown', 'task'
+    # Results are stored in task metadata with the serialized Task result.
+    if isinstance(obj, dict) and isinstance(obj.get('result'), dict):
+      return obj['result'].get('task_name') or 'unknown', 'result'
+    return 'unknown', 'other'
+
+  def dumps(self, obj):
+    """Serializes an object.
+
+    Args:
+      obj (object): The object to serialize.
+
+    Returns:
+      bytes: The serialized and possibly compressed object.
+    """
+    data = kombu_json.dumps(obj).encode('utf-8')
+    if self.threshold and len(data) >= self.threshold:
+      data = self.COMPRESSED_PREFIX + zlib.compress(
+          data, self.COMPRESSION_LEVEL)
+    task_type, payload = self._get_payload_type(obj)
+    CELERY_PAYLOAD_BYTES.labels(task_type, payload).observe(len(data))
+    return data
+
+  def loads(self, data):
+    """Deserializes an object.
+
+    Args:
+      data (bytes): The serialized object.
+
+    Returns:
+      object: The deserialized object.
+    """
+    if isinstance(data, six.text_type):
+      data = data.encode('utf-8')
+    data = bytes(data)
+    if data.startswith(self.COMPRESSED_PREFIX):
+      data = zlib.decompress(data[len(self.COMPRESSED_PREFIX):])
+    return kombu_json.loads(data.decode('utf-8'))
+
+  def register(self):
+    """Registers the serializer with Kombu."""
+    serialization.register(
+        self.NAME, self.dumps, self.loads, content_type=self.CONTENT_TYPE,
+        content_encoding='binary')
+
 
 class TurbiniaCelery(object):
   """Celery app object.
@@ -43,6 +143,9 @@ class TurbiniaCelery(object):
     app (Celery): The Celery app itself.
   """
 
+  # Maximum number of task results fetched from the result backend at once.
+  RESULT_BATCH_SIZE = 1000
+
   def __init__(self):
     """Celery configurations."""
     self.app = None
@@ -50,11 +153,22 @@ class TurbiniaCelery(object):
   def setup(self):
     """Set up Celery"""
     config.LoadConfig()
+    serializer = CompressedJSONSerializer(config.CELERY_COMPRESSION_THRESHOLD)
+    serializer.register()
+    # Without compression, messages are sent as plain JSON so that workers
+    # running older versions that only accept JSON can still read them.
+    serializer_name = 'json'
+    if config.CELERY_COMPRESSION_THRESHOLD:
+      serializer_name = serializer.NAME
     self.app = celery.Celery(
         'turbinia', broker=config.CELERY_BROKER, backend=config.CELERY_BACKEND)
     self.app.conf.update(
         task_default_queue=config.INSTANCE_ID,
-        accept_content=['json'],
+        task_serializer=serializer_name,
+        result_serializer=serializer_name,
+        # Both are accepted so that compression can be turned on and off
+        # while messages are queued.
+        accept_content=['json', serializer.NAME],
         # TODO(ericzinnikas): Without task_acks_late Celery workers will start
         # on one task and prefetch another (i.e. can result in 1 worker getting
         # 2 plaso jobs while another worker is free). But enabling this causes
@@ -65,18 +179,66 @@ class TurbiniaCelery(object):
         worker_prefetch_multiplier=1,
     )
 
+  def get_task_results(self, task_ids):
+    """Gets the states and results of Celery tasks in bulk.
+
+    Key/value result backends (e.g. Redis) are read with one MGET per batch of
+    tasks rather than a round trip per task for the state and another for the
+    result.  Other backends fall back to reading each task separately.
+
+    Args:
+      task_ids (list[str]): The Celery task IDs.
+
+    Returns:
+      dict: Task IDs mapped to task meta dicts with 'status' and 'result' keys.
+          Tasks without a stored result are PENDING.
+    """
+    backend = self.app.backend
+    results = {}
+    if not isinstance(backend, BaseKeyValueStoreBackend):
+      for task_id in task_ids:
+        results[task_id] = backend.get_task_meta(task_id)
+      return results
+
+    for i in range(0, len(task_ids), self.RESULT_BATCH_SIZE):
+      batch = task_ids[i:i + self.RESULT_BATCH_SIZE]
+      keys = [backend.get_key_for_task(task_id) for task_id in batch]
+      values = backend.mget(keys)
+      if hasattr(values, 'items'):
+        # Some clients return a dict of the keys that exist.
+        values = [values.get(key) for key in keys]
+      for task_id, value in zip(batch, values):
+        if value:
+          results[task_id] = backend.decode_result(value)
+        else:
+          results[task_id] = {'status': celery_states.PENDING, 'result': None}
+    return results
+
 
 class TurbiniaKombu(TurbiniaMessageBase):
   """Queue object for receiving evidence messages.
 
+  On the server, a consumer thread owns the Kombu connection.  It fetches and
+  validates messages, and acknowledges the messages for processed requests, as
+  Kombu channels must not be shared between threads.
+
   Attributes:
     queue (Kombu.SimpleBuffer|Kombu.SimpleQueue): evidence queue.
   """
 
+  # Time in seconds to wait between checks of an empty queue.
+  POLL_INTERVAL = 1
+  # Maximum time in seconds to wait before fetching again after errors.
+  MAX_ERROR_BACKOFF = 60
+
   def __init__(self, routing_key):
     """Kombu config."""
+    super(TurbiniaKombu, self).__init__()
     self.queue = None
     self.routing_key = routing_key
+    # Messages to be acknowledged by the consumer thread.
+    self._acks = queue.Queue()
+    self._consumer_thread = None
 
   def setup(self):
     """Set up Kombu SimpleBuffer"""
@@ -84,24 +246,73 @@ class TurbiniaKombu(TurbiniaMessageBase):
     conn = kombu.Connection(config.KOMBU_BROKER)
     if config.KOMBU_DURABLE:
       self.queue = conn.SimpleQueue(name=self.routing_key)
+      # Messages stay unacknowledged until their requests are processed, so
+      # this limits how many are delivered to us at once.
+      self.queue.consumer.qos(prefetch_count=self.prefetch)
     else:
       self.queue = conn.SimpleBuffer(name=self.routing_key)
 
+  def start_consumer(self):
+    """Starts the thread that fetches messages from the queue."""
+    if self._consumer_thread:
+      return
+    self._consumer_thread = threading.Thread(
+        target=self._consume, name='TurbiniaKombuConsumer')
+    self._consumer_thread.daemon = True
+    self._consumer_thread.start()
+
   def check_messages(self):
-    """See if we have any messages in the queue.
+    """Check queue for any messages.
 
     Returns:
-      list[TurbiniaRequest]: all evidence requests.
+      list[TurbiniaRequest]: up to batch_size new evidence requests
+
+    Raises:
+      TurbiniaException: If the consumer thread has stopped, as no new
+          messages would be fetched.
     """
-    requests = []
+    if self._consumer_thread and not self._consumer_thread.is_alive():
+      raise TurbiniaException(
+          'Kombu consumer thread for {0:s} has stopped'.format(
+              self.routing_key))
+    return super(TurbiniaKombu, self).check_messages()
+
+  def _consume(self):
+    """Fetches messages until the process exits.
+
+    Unexpected errors are logged and fetching is retried with an exponential
+    backoff, so that they don't stop the thread.
+    """
+    backoff = self.POLL_INTERVAL
     while True:
+      try:
+        fetched = self._fetch_messages()
+      # pylint: disable=broad-except
+      except Exception as exception:
+        log.exception(
+            'Error fetching Kombu messages, retrying in {0:d} seconds: '
+            '{1!s}'.format(backoff, exception))
+        time.sleep(backoff)
+        backoff = min(backoff * 2, self.MAX_ERROR_BACKOFF)
+        continue
+      backoff = self.POLL_INTERVAL
+      if not fetched:
+        time.sleep(self.POLL_INTERVAL)
+
+  def _fetch_messages(self):
+    """Acknowledges processed messages and fetches new ones.
+
+    Fetching stops when the queue is empty, or when prefetch requests are
+    waiting to be processed.
+
+    Returns:
+      int: The number of messages fetched.
+    """
+    self._process_acks()
+    fetched = 0
+    while not self._requests.full():
       try:
         message = self.queue.get(block=False)
-        request = self._validate_message(message.payload)
-        if request:
-          requests.append(request)
-          if self.queue.queue.durable:
-            message.ack()
       except queue.Empty:
         break
       except ChannelError:
@@ -112,8 +323,64 @@ class TurbiniaKombu(TurbiniaMessageBase):
             'fetching from queue: {0!s}'.format(e))
         break
 
-    log.debug('Received {0:d} messages'.format(len(requests)))
-    return requests
+      fetched += 1
+      try:
+        payload = message.payload
+        request = self._validate_message(payload)
+      # Messages that can't be decoded would be delivered again and again, so
+      # they are rejected without requeueing.
+      # pylint: disable=broad-except
+      except Exception as exception:
+        log.error(
+            'Rejecting Kombu message that could not be decoded: {0!s}'.format(
+                exception))
+        self._reject(message)
+        continue
+      if request:
+        self._requests.put((request, message))
+      else:
+        log.error('Error processing Kombu message: {0!s}'.format(payload))
+        self._ack(message)
+    return fetched
+
+  def _process_acks(self):
+    """Acknowledges the messages queued by ack_requests()."""
+    while True:
+      try:
+        message = self._acks.get(block=False)
+      except queue.Empty:
+        break
+      self._ack(message)
+
+  def _ack(self, message):
+    """Acknowledges a message from the consumer thread.
+
+    Args:
+      message (kombu.Message): The message to acknowledge.
+    """
+    if not self.queue.queue.durable:
+      return
+    try:
+      message.ack()
+    except OperationalError as e:
+      log.warning('Could not acknowledge Kombu message: {0!s}'.format(e))
+
+  def _reject(self, message):
+    """Rejects a message from the consumer thread without requeueing it.
+
+    Args:
+      message (kombu.Message): The message to reject.
+    """
+    if not self.queue.queue.durable:
+      return
+    try:
+      message.reject()
+    # pylint: disable=broad-except
+    except Exception as exception:
+      log.warning('Could not reject Kombu message: {0!s}'.format(exception))
+
+  def _ack_message(self, message):
+    self._acks.put(message)
 
   def send_message(self, message):
     """Enqueues a message with Kombu"""
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the Celery app and Kombu queue classes."""
+
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import json
+import unittest
+
+import celery
+from celery import states as celery_states
+from kombu import serialization
+import mock
+
+from turbinia import celery as turbinia_celery
+
+
+class TestCompressedJSONSerializer(unittest.TestCase):
+  """Test CompressedJSONSerializer class."""
+
+  def setUp(self):
+    self.serializer = turbinia_celery.CompressedJSONSerializer(threshold=1024)
+    self.task_message = ([{
+        'name': 'PlasoTask',
+        'recipe': 'x' * 4096
+    }, {
+        'type': 'RawDisk'
+    }], {}, {})
+
+  def _get_sample(self, task_type, payload):
+    """Gets the total size of the payloads recorded for a Task type."""
+    return turbinia_celery.CELERY_PAYLOAD_BYTES.labels(task_type,
+                                                       payload)._sum.get()
+
+  def testCompression(self):
+    """Tests large payloads are compressed and small ones aren't."""
+    small = {'result': {'task_name': 'StatTask', 'status': 'done'}}
+    data = self.serializer.dumps(small)
+    self.assertEqual(json.loads(data.decode('utf-8')), small)
+    self.assertEqual(self.serializer.loads(data), small)
+
+    data = self.serializer.dumps(self.task_message)
+    self.assertTrue(data.startswith(self.serializer.COMPRESSED_PREFIX))
+    self.assertLess(len(data), 1024)
+    self.assertEqual(
+        self.serializer.loads(data), json.loads(json.dumps(self.task_message)))
+
+  def testNoThreshold(self):
+    """Tests nothing is compressed without a threshold."""
+    serializer = turbinia_celery.CompressedJSONSerializer()
+    data = serializer.dumps(self.task_message)
+    self.assertFalse(data.startswith(serializer.COMPRESSED_PREFIX))
+
+  def testPayloadMetrics(self):
+    """Tests payload sizes are recorded per Task type."""
+    task_total = self._get_sample('PlasoTask', 'task')
+    result_total = self._get_sample('StatTask', 'result')
+    data = self.serializer.dumps(self.task_message)
+    self.serializer.dumps({'result': {'task_name': 'StatTask'}})
+    self.assertEqual(
+        self._get_sample('PlasoTask', 'task'), task_total + len(data))
+    self.assertGreater(self._get_sample('StatTask', 'result'), result_total)
+
+  def testRegister(self):
+    """Tests the serializer can be used through Kombu."""
+    self.serializer.register()
+    content_type, encoding, data = serialization.dumps(
+        self.task_message, serializer=self.serializer.NAME)
+    self.assertEqual(content_type, self.serializer.CONTENT_TYPE)
+    self.assertEqual(
+        serialization.loads(
+            data, content_type, encoding,
+            accept=[self.serializer.CONTENT_TYPE])[0][0]['name'], 'PlasoTask')
+
+
+class TestTurbiniaCelery(unittest.TestCase):
+  """Test TurbiniaCelery class."""
+
+  def setUp(self):
+    self.celery = turbinia_celery.TurbiniaCelery()
+    # The in-memory cache backend is a key/value backend like Redis.
+    self.celery.app = celery.Celery(
+        'turbinia-test', broker='memory://', backend='cache+memory://')
+    self.backend = self.celery.app.backend
+    self.backend.store_result(
+        'task1', {'status': 'done'}, celery_states.SUCCESS)
+    self.backend.store_result('task2', None, celery_states.STARTED)
+
+  def testGetTaskResults(self):
+    """Tests task results are fetched in batches."""
+    self.celery.RESULT_BATCH_SIZE = 2
+    self.backend.mget = mock.MagicMock(wraps=self.backend.mget)
+    results = self.celery.get_task_results(['task1', 'task2', 'task3'])
+    self.assertEqual(self.backend.mget.call_count, 2)
+    self.assertEqual(results['task1']['status'], celery_states.SUCCESS)
+    self.assertEqual(results['task1']['result'], {'status': 'done'})
+    self.assertEqual(results['task2']['status'], celery_states.STARTED)
+    self.assertEqual(results['task3']['status'], celery_states.PENDING)
+    self.assertIsNone(results['task3']['result'])
+
+  @mock.patch('turbinia.celery.config')
+  def testSetupCompressedResults(self, mock_config):
+    """Tests results are stored with the compressing serializer."""
+    mock_config.CELERY_BROKER = 'memory://'
+    mock_config.CELERY_BACKEND = 'cache+memory://'
+    mock_config.CELERY_COMPRESSION_THRESHOLD = 1024
+    self.celery.setup()
+    backend = self.celery.app.backend
+    result = {'task_name': 'PlasoTask', 'report_data': 'x' * 4096}
+    backend.store_result('task3', result, celery_states.SUCCESS)
+    stored = backend.get(backend.get_key_for_task('task3'))
+    self.assertTrue(
+        stored.startswith(
+            turbinia_celery.CompressedJSONSerializer.COMPRESSED_PREFIX))
+    results = self.celery.get_task_results(['task3'])
+    self.assertEqual(results['task3']['result'], result)
+
+  @mock.patch('turbinia.celery.config')
+  def testSetupWithoutCompression(self, mock_config):
+    """Tests plain JSON is sent when compression is disabled."""
+    mock_config.CELERY_BROKER = 'memory://'
+    mock_config.CELERY_BACKEND = 'cache+memory://'
+    mock_config.CELERY_COMPRESSION_THRESHOLD = None
+    self.celery.setup()
+    self.assertEqual(self.celery.app.conf.task_serializer, 'json')
+    self.assertEqual(self.celery.app.conf.result_serializer, 'json')
+    self.assertIn(
+        turbinia_celery.CompressedJSONSerializer.NAME,
+        self.celery.app.conf.accept_content)
+
+  def testGetTaskResultsOtherBackend(self):
+    """Tests backends without bulk reads fetch each task."""
+    backend = mock.MagicMock()
+    backend.get_task_meta.return_value = {'status': celery_states.PENDING}
+    self.celery.app = mock.MagicMock(backend=backend)
+    results = self.celery.get_task_results(['task1', 'task2'])
+    self.assertEqual(backend.get_task_meta.call_count, 2)
+    self.assertEqual(results['task2']['status'], celery_states.PENDING)
+
+
+if __name__ == '__main__':
+  unittest.main()
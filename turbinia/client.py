@@ -33,10 +33,15 @@ import codecs
 
 from google import auth
 from prometheus_client import start_http_server
+from turbinia import blob_store
 from turbinia import config
 from turbinia.config import logger
 from turbinia.config import DATETIME_FORMAT
+from turbinia import task_aggregates
+from turbinia import task_cache
+from turbinia import task_events
 from turbinia import task_manager
+from turbinia import task_statistics
 from turbinia import TurbiniaException
 from turbinia.lib import text_formatter as fmt
 from turbinia.lib import docker_manager
@@ -56,8 +61,7 @@ from turbinia.workers.plaso import PlasoTask
 from turbinia.workers.psort import PsortTask
 from turbinia.workers.redis import RedisAnalysisTask
 from turbinia.workers.sshd import SSHDAnalysisTask
-from turbinia.workers.strings import StringsAsciiTask
-from turbinia.workers.strings import StringsUnicodeTask
+from turbinia.workers.strings import StringsTask
 from turbinia.workers.tomcat import TomcatAnalysisTask
 from turbinia.workers.volatility import VolatilityTask
 from turbinia.workers.worker_stat import StatTask
@@ -84,8 +88,7 @@ TASK_MAP = {
     'psorttask': PsortTask,
     'redisanalysistask': RedisAnalysisTask,
     'sshdanalysistask': SSHDAnalysisTask,
-    'stringsasciitask': StringsAsciiTask,
-    'stringsunicodetask': StringsUnicodeTask,
+    'stringstask': StringsTask,
     'tomcatanalysistask': TomcatAnalysisTask,
     'volatilitytask': VolatilityTask,
     'stattask': StatTask,
@@ -105,7 +108,7 @@ if config.TASK_MANAGER.lower() == 'psq':
 
   from libcloudforensics.providers.gcp.internal import function as gcp_function
 elif config.TASK_MANAGER.lower() == 'celery':
-  from turbinia.state_manager import RedisStateManager
+  from turbinia import state_manager
 
 log = logging.getLogger('turbinia')
 logger.setup()
@@ -243,6 +246,11 @@ class TurbiniaStats(object):
     min(datetime.timedelta): The minimum run time of all tasks
     max(datetime.timedelta): The maximum run time of all tasks
     mean(datetime.timedelta): The mean run time of all tasks
+    p50(datetime.timedelta): The median run time of all tasks
+    p90(datetime.timedelta): The 90th percentile run time of all tasks
+    p99(datetime.timedelta): The 99th percentile run time of all tasks
+    stddev(datetime.timedelta): The standard deviation of the run times
+    total(datetime.timedelta): The sum of the run times of all tasks
     tasks(list): A list of tasks to calculate stats for
   """
 
@@ -251,7 +259,13 @@ class TurbiniaStats(object):
     self.min = None
     self.mean = None
     self.max = None
+    self.p50 = None
+    self.p90 = None
+    self.p99 = None
+    self.stddev = None
+    self.total = None
     self.tasks = []
+    self._count = None
 
   def __str__(self):
     return self.format_stats()
@@ -263,6 +277,8 @@ class TurbiniaStats(object):
     Returns:
       Int of task count.
     """
+    if self._count is not None:
+      return self._count
     return len(self.tasks)
 
   def add_task(self, task):
@@ -273,20 +289,54 @@ class TurbiniaStats(object):
     """
     self.tasks.append(task)
 
+  def set_stats(
+      self, count, min_, mean, max_, total=None, stddev=None, p50=None,
+      p90=None, p99=None):
+    """Sets statistics that have already been calculated.
+
+    Args:
+      count(int): The number of tasks.
+      min_(float): The minimum run time in seconds.
+      mean(float): The mean run time in seconds.
+      max_(float): The maximum run time in seconds.
+      total(float): The sum of the run times in seconds.
+      stddev(float): The standard deviation of the run times in seconds.
+      p50(float): The median run time in seconds.
+      p90(float): The 90th percentile run time in seconds.
+      p99(float): The 99th percentile run time in seconds.
+    """
+    self._count = count
+    if not count:
+      return
+    # Remove the microseconds to keep things cleaner
+    to_timedelta = lambda x: None if x is None else timedelta(seconds=int(x))
+    self.min = to_timedelta(min_)
+    self.mean = to_timedelta(mean)
+    self.max = to_timedelta(max_)
+    self.total = to_timedelta(total)
+    self.stddev = to_timedelta(stddev)
+    self.p50 = to_timedelta(p50)
+    self.p90 = to_timedelta(p90)
+    self.p99 = to_timedelta(p99)
+
+  def set_summary(self, summary):
+    """Sets statistics from a run time summary.
+
+    Args:
+      summary(task_statistics.RunTimeSummary): The summary, or None if there
+          were no tasks.
+    """
+    if summary:
+      self.set_stats(*summary)
+    else:
+      self.set_stats(0, None, None, None)
+
   def calculate_stats(self):
     """Calculates statistics of the current tasks."""
     if not self.tasks:
       return
-
-    sorted_tasks = sorted(self.tasks, key=itemgetter('run_time'))
-    self.min = sorted_tasks[0]['run_time']
-    self.max = sorted_tasks[len(sorted_tasks) - 1]['run_time']
-    self.mean = sorted_tasks[len(sorted_tasks) // 2]['run_time']
-
-    # Remove the microseconds to keep things cleaner
-    self.min = self.min - timedelta(microseconds=self.min.microseconds)
-    self.max = self.max - timedelta(microseconds=self.max.microseconds)
-    self.mean = self.mean - timedelta(microseconds=self.mean.microseconds)
+    table = task_statistics.TaskStatsTable(self.tasks)
+    self.set_summary(table.summarize())
 
   def format_stats(self):
     """Formats statistics data.
@@ -294,8 +344,12 @@ class TurbiniaStats(object):
     Returns:
       String of statistics data
     """
-    return '{0:s}: Count: {1:d}, Min: {2!s}, Mean: {3!s}, Max: {4!s}'.format(
-        self.description, self.count, self.min, self.mean, self.max)
+    return (
+        '{0:s}: Count: {1:d}, Min: {2!s}, Mean: {3!s}, Max: {4!s}, '
+        'P50: {5!s}, P90: {6!s}, P99: {7!s}, Stddev: {8!s}, '
+        'Total: {9!s}'.format(
+            self.description, self.count, self.min, self.mean, self.max,
+            self.p50, self.p90, self.p99, self.stddev, self.total))
 
   def format_stats_csv(self):
     """Formats statistics data into CSV output.
@@ -303,8 +357,11 @@ class TurbiniaStats(object):
     Returns:
       String of statistics data in CSV format
     """
-    return '{0:s}, {1:d}, {2!s}, {3!s}, {4!s}'.format(
-        self.description, self.count, self.min, self.mean, self.max)
+    return (
+        '{0:s}, {1:d}, {2!s}, {3!s}, {4!s}, {5!s}, {6!s}, {7!s}, {8!s}, '
+        '{9!s}'.format(
+            self.description, self.count, self.min, self.mean, self.max,
+            self.p50, self.p90, self.p99, self.stddev, self.total))
 
 
 class BaseTurbiniaClient(object):
@@ -348,10 +405,32 @@ class BaseTurbiniaClient(object):
     for job in self.task_manager.jobs:
       log.info('\t{0:s}'.format(job.NAME))
 
+  def get_task_event_subscriber(self, instance, request_id=None):
+    """Gets a subscriber for Task state change events.
+
+    Args:
+      instance (string): The Turbinia instance name.
+      request_id (string): The Id of the request we want events for.
+
+    Returns:
+      task_events.BaseTaskEventSubscriber: The subscriber, or None if events
+          are not available.
+    """
+    try:
+      return task_events.get_subscriber(instance, request_id=request_id)
+    except TurbiniaException as exception:
+      log.warning(
+          'Could not subscribe to Task events, falling back to polling: '
+          '{0!s}'.format(exception))
+      return None
+
   def wait_for_request(
       self, instance, project, region, request_id=None, user=None,
       poll_interval=60):
-    """Polls and waits for Turbinia Request to complete.
+    """Waits for Turbinia Request to complete.
+
+    When Task events are available we check the Task state whenever a Task
+    changes state, and otherwise we poll for it.
 
     Args:
       instance (string): The Turbinia instance name (by default the same as the
@@ -360,42 +439,61 @@ class BaseTurbiniaClient(object):
       region (string): The name of the region to execute in.
       request_id (string): The Id of the request we want tasks for.
       user (string): The user of the request we want tasks for.
-      poll_interval (int): Interval of seconds between polling cycles.
+      poll_interval (int): Interval of seconds between polling cycles, or the
+          maximum time to wait for an event when Task events are available.
     """
     last_completed_count = -1
     last_uncompleted_count = -1
-    while True:
-      task_results = self.get_task_data(
-          instance, project, region, request_id=request_id, user=user)
-      completed_tasks = []
-      uncompleted_tasks = []
-      for task in task_results:
-        if task.get('successful') is not None:
-          completed_tasks.append(task)
+    # Subscribe before getting the Task data so we don't miss any events.
+    subscriber = self.get_task_event_subscriber(instance, request_id=request_id)
+    try:
+      while True:
+        task_results = self.get_task_data(
+            instance, project, region, request_id=request_id, user=user)
+        completed_tasks = []
+        uncompleted_tasks = []
+        for task in task_results:
+          if task.get('successful') is not None:
+            completed_tasks.append(task)
+          else:
+            uncompleted_tasks.append(task)
+
+        if completed_tasks and len(completed_tasks) == len(task_results):
+          break
+
+        completed_names = [t.get('name') for t in completed_tasks]
+        completed_names = ', '.join(sorted(completed_names))
+        uncompleted_names = [t.get('name') for t in uncompleted_tasks]
+        uncompleted_names = ', '.join(sorted(uncompleted_names))
+        total_count = len(completed_tasks) + len(uncompleted_tasks)
+        msg = (
+            'Tasks completed ({0:d}/{1:d}): [{2:s}], waiting for [{3:s}].'
+            .format(
+                len(completed_tasks), total_count, completed_names,
+                uncompleted_names))
+        if (len(completed_tasks) > last_completed_count or
+            len(uncompleted_tasks) > last_uncompleted_count):
+          log.info(msg)
         else:
-          uncompleted_tasks.append(task)
-
-      if completed_tasks and len(completed_tasks) == len(task_results):
-        break
-
-      completed_names = [t.get('name') for t in completed_tasks]
-      completed_names = ', '.join(sorted(completed_names))
-      uncompleted_names = [t.get('name') for t in uncompleted_tasks]
-      uncompleted_names = ', '.join(sorted(uncompleted_names))
-      total_count = len(completed_tasks) + len(uncompleted_tasks)
-      msg = (
-          'Tasks completed ({0:d}/{1:d}): [{2:s}], waiting for [{3:s}].'.format(
-              len(completed_tasks), total_count, completed_names,
-              uncompleted_names))
-      if (len(completed_tasks) > last_completed_count or
-          len(uncompleted_tasks) > last_uncompleted_count):
-        log.info(msg)
-      else:
-        log.debug(msg)
-
-      last_completed_count = len(completed_tasks)
-      last_uncompleted_count = len(uncompleted_tasks)
-      time.sleep(poll_interval)
+          log.debug(msg)
+
+        last_completed_count = len(completed_tasks)
+        last_uncompleted_count = len(uncompleted_tasks)
+        if not subscriber:
+          time.sleep(poll_interval)
+          continue
+        try:
+          events = subscriber.wait(poll_interval)
+          log.debug('Received {0:d} Task events'.format(len(events)))
+        except TurbiniaException as exception:
+          log.warning(
+              'Task event subscription failed, falling back to polling: '
+              '{0!s}'.format(exception))
+          subscriber.close()
+          subscriber = None
+    finally:
+      if subscriber:
+        subscriber.close()
 
     log.info('All {0:d} Tasks completed'.format(len(task_results)))
 
@@ -503,9 +601,55 @@ class BaseTurbiniaClient(object):
 
     return task_data
 
+  def get_cached_task_data(
+      self, instance, project, region, days=0, task_id=None, request_id=None,
+      user=None):
+    """Gets task data for a time window using the local Task cache.
+
+    Only the Tasks that have been updated since the last sync are fetched and
+    merged into the cache.  When the Task cache is not configured or no time
+    window is given this is the same as get_task_data().
+
+    Args:
+      instance (string): The Turbinia instance name (by default the same as the
+          INSTANCE_ID in the config).
+      project (string): The name of the project.
+      region (string): The name of the region to execute in.
+      days (int): The number of days we want history for.
+      task_id (string): The Id of the task.
+      request_id (string): The Id of the request we want tasks for.
+      user (string): The user of the request we want tasks for.
+
+    Returns:
+      List of Task dict objects.
+    """
+    if not days or not task_cache.enabled():
+      return self.get_task_data(
+          instance, project, region, days, task_id, request_id, user)
+
+    cache = task_cache.TaskCache(instance)
+    cache.load()
+    now = datetime.now()
+    start_time = now - timedelta(days=days)
+    sync_start = cache.get_sync_start(start_time)
+    log.debug(
+        'Fetching Tasks updated since {0!s} for Task cache {1:s}'.format(
+            sync_start, cache.path))
+    # We fetch all Tasks for the time window so that the cache can be used for
+    # any filters.
+    tasks = self.get_task_data(
+        instance, project, region,
+        days=(now - sync_start).total_seconds() / 86400.0)
+    cache.merge(tasks, start_time, now)
+    cache.save()
+    return cache.get_tasks(start_time, task_id, request_id, user)
+
   def format_task_detail(self, task, show_files=False):
     """Formats a single task in detail.
 
+    Fields that were too large to store inline with the Task state are fetched
+    from the blob store.
+
     Args:
       task (dict): The task to format data for
       show_files (bool): Whether we want to print out log file paths
@@ -514,6 +658,7 @@ class BaseTurbiniaClient(object):
       list: Formatted task data
     """
     report = []
+    task = blob_store.resolve_task_fields(task)
     saved_paths = task.get('saved_paths') or []
     status = task.get('status') or 'No task status'
 
@@ -556,6 +701,31 @@ class BaseTurbiniaClient(object):
     report.append('')
     return report
 
+  def format_worker_history(self, aggregate):
+    """Formats the history of finished Tasks for Worker view.
+
+    Args:
+      aggregate (task_aggregates.TaskAggregate): The Tasks the Worker finished.
+    Returns:
+      list: Formatted history, or an empty list if there is none.
+    """
+    if not aggregate or not aggregate.count:
+      return []
+    report = [
+        fmt.bullet(
+            '{0:d} Task(s) finished: {1:d} successful, {2:d} failed'.format(
+                aggregate.count, aggregate.successful, aggregate.failed))
+    ]
+    summary = aggregate.get_summary()
+    if summary:
+      report.append(
+          fmt.bullet(
+              'Run Time: mean {0!s}, p90 {1!s}, max {2!s}'.format(
+                  timedelta(seconds=round(summary.mean)),
+                  timedelta(seconds=round(summary.p90)),
+                  timedelta(seconds=round(summary.max))), level=2))
+    return report
+
   def format_task(self, task, show_files=False):
     """Formats a single task in short form.
 
@@ -576,9 +746,23 @@ class BaseTurbiniaClient(object):
       report.append('')
     return report
 
+  def get_worker_history(self, instance, days=0):
+    """Gets the history of completed Tasks per Worker from Task aggregates.
+
+    Args:
+      instance (string): The Turbinia instance name (by default the same as the
+          INSTANCE_ID in the config).
+      days (int): The number of days we want history for.
+
+    Returns:
+      dict: Worker names mapped to task_aggregates.TaskAggregate objects, or
+          None if there are no aggregates covering the days.
+    """
+    return None
+
   def get_task_statistics(
       self, instance, project, region, days=0, task_id=None, request_id=None,
-      user=None):
+      user=None, trend=None):
     """Gathers statistics for Turbinia execution data.
 
     Args:
@@ -590,110 +774,87 @@ class BaseTurbiniaClient(object):
       task_id (string): The Id of the task.
       request_id (string): The Id of the request we want tasks for.
       user (string): The user of the request we want tasks for.
+      trend (string): Also gather statistics per time bucket ('hour' or 'day')
+          as a list in the 'trend' key.
 
     Returns:
       task_stats(dict): Mapping of statistic names to values
     """
-    task_results = self.get_task_data(
+    task_results = self.get_cached_task_data(
         instance, project, region, days, task_id, request_id, user)
     if not task_results:
       return {}
 
-    task_stats = {
-        'all_tasks': TurbiniaStats('All Tasks'),
-        'successful_tasks': TurbiniaStats('Successful Tasks'),
-        'failed_tasks': TurbiniaStats('Failed Tasks'),
-        'requests': TurbiniaStats('Total Request Time'),
-        # The following are dicts mapping the user/worker/type names to their
-        # respective TurbiniaStats() objects.
+    # The Task data is loaded into columns once, and the statistics for all
+    # groupings are calculated from those.
+    table = task_statistics.TaskStatsTable(task_results)
+    if len(table) < len(task_results):
+      log.debug(
+          'Ignoring {0:d} tasks in statistics because the run_time is not '
+          'set, and it is required to calculate stats'.format(
+              len(task_results) - len(table)))
+
+    summaries = {
+        'all_tasks': ('All Tasks', table.summarize()),
+        'successful_tasks': ('Successful Tasks', table.summarize(True)),
+        'failed_tasks': ('Failed Tasks', table.summarize(False)),
+        # This will, for each request, calculate the start time of the
+        # earliest task and the stop time of the latest task.  This will give
+        # the overall run time covering all tasks in the request.
+        'requests': ('Total Request Time', table.summarize_requests())
+    }
+    task_stats = {}
+    for name, (description, summary) in summaries.items():
+      task_stats[name] = TurbiniaStats(description)
+      task_stats[name].set_summary(summary)
+
+    # The following are dicts mapping the user/worker/type names to their
+    # respective TurbiniaStats() objects.
+    groups = [
         # Total wall-time for all tasks of a given type
-        'tasks_per_type': {},
+        ('tasks_per_type', 'name', 'Task type {0!s}'),
         # Total wall-time for all tasks per Worker
-        'tasks_per_worker': {},
+        ('tasks_per_worker', 'worker_name', 'Worker {0!s}'),
         # Total wall-time for all tasks per User
-        'tasks_per_user': {},
-    }
-
-    # map of request ids to [min time, max time]
-    requests = {}
-
-    for task in task_results:
-      request_id = task.get('request_id')
-      task_type = task.get('name')
-      worker = task.get('worker_name')
-      user = task.get('requester')
-      if not task.get('run_time'):
-        log.debug(
-            'Ignoring task {0:s} in statistics because the run_time is not '
-            'set, and it is required to calculate stats'.format(
-                task.get('name')))
-        continue
-
-      # Stats for all/successful/failed tasks
-      task_stats['all_tasks'].add_task(task)
-      if task.get('successful') is True:
-        task_stats['successful_tasks'].add_task(task)
-      elif task.get('successful') is False:
-        task_stats['failed_tasks'].add_task(task)
+        ('tasks_per_user', 'requester', 'User {0!s}'),
+    ]
+    for name, column, description in groups:
+      task_stats[name] = {}
+      for key, summary in table.summarize_by(column).items():
+        task_stats[name][key] = TurbiniaStats(description.format(key))
+        task_stats[name][key].set_summary(summary)
 
-      # Stats for Tasks per Task type.
-      if task_type in task_stats['tasks_per_type']:
-        task_type_stats = task_stats['tasks_per_type'].get(task_type)
-      else:
-        task_type_stats = TurbiniaStats('Task type {0:s}'.format(task_type))
-        task_stats['tasks_per_type'][task_type] = task_type_stats
-      task_type_stats.add_task(task)
+    if trend:
+      task_stats['trend'] = self._get_trend_stats(
+          trend, table.summarize_trend(trend))
 
-      # Stats per worker.
-      if worker in task_stats['tasks_per_worker']:
-        worker_stats = task_stats['tasks_per_worker'].get(worker)
-      else:
-        worker_stats = TurbiniaStats('Worker {0:s}'.format(worker))
-        task_stats['tasks_per_worker'][worker] = worker_stats
-      worker_stats.add_task(task)
-
-      # Stats per submitting User.
-      if user in task_stats['tasks_per_user']:
-        user_stats = task_stats['tasks_per_user'].get(user)
-      else:
-        user_stats = TurbiniaStats('User {0:s}'.format(user))
-        task_stats['tasks_per_user'][user] = user_stats
-      user_stats.add_task(task)
-
-      # Stats for the total request.  This will, for each request, calculate the
-      # start time of the earliest task and the stop time of the latest task.
-      # This will give the overall run time covering all tasks in the request.
-      task_start_time = task['last_update'] - task['run_time']
-      task_stop_time = task['last_update']
-      if request_id in requests:
-        start_time, stop_time = requests[request_id]
-        if task_start_time < start_time:
-          requests[request_id][0] = task_start_time
-        if task_stop_time > stop_time:
-          requests[request_id][1] = task_stop_time
-      else:
-        requests[request_id] = [task_start_time, task_stop_time]
+    return task_stats
 
-    # Add a fake task result for each request with our calculated times to the
-    # stats module
-    for min_time, max_time in requests.values():
-      task = {}
-      task['run_time'] = max_time - min_time
-      task_stats['requests'].add_task(task)
+  @staticmethod
+  def _get_trend_stats(trend, summaries):
+    """Creates statistics objects for a trend.
 
-    # Go over all stat objects and calculate them
-    for stat_obj in task_stats.values():
-      if isinstance(stat_obj, dict):
-        for inner_stat_obj in stat_obj.values():
-          inner_stat_obj.calculate_stats()
-      else:
-        stat_obj.calculate_stats()
+    Args:
+      trend (string): The bucket size ('hour' or 'day').
+      summaries (list[tuple(datetime, task_statistics.RunTimeSummary)]): The
+          start time of each bucket and its summary, in time order.
 
-    return task_stats
+    Returns:
+      list[TurbiniaStats]: The statistics for each bucket.
+    """
+    time_format = '%Y-%m-%d %H:00' if trend == 'hour' else '%Y-%m-%d'
+    trend_stats = []
+    for bucket_start, summary in summaries:
+      bucket_stats = TurbiniaStats(
+          '{0:s} {1:s}'.format(
+              trend.capitalize(), bucket_start.strftime(time_format)))
+      bucket_stats.set_summary(summary)
+      trend_stats.append(bucket_stats)
+    return trend_stats
 
   def format_task_statistics(
       self, instance, project, region, days=0, task_id=None, request_id=None,
-      user=None, csv=False):
+      user=None, csv=False, trend=None):
     """Formats statistics for Turbinia execution data.
 
     Args:
@@ -706,12 +867,14 @@ class BaseTurbiniaClient(object):
       request_id (string): The Id of the request we want tasks for.
       user (string): The user of the request we want tasks for.
       csv (bool): Whether we want the output in CSV format.
+      trend (string): Also report statistics per time bucket ('hour' or
+          'day').
 
     Returns:
       String of task statistics report
     """
     task_stats = self.get_task_statistics(
-        instance, project, region, days, task_id, request_id, user)
+        instance, project, region, days, task_id, request_id, user, trend=trend)
     if not task_stats:
       return 'No tasks found'
 
@@ -721,11 +884,15 @@ class BaseTurbiniaClient(object):
     ]
 
     if csv:
-      report = ['stat_type, count, min, mean, max']
+      report = [
+          'stat_type, count, min, mean, max, p50, p90, p99, stddev, total'
+      ]
     else:
       report = ['Execution time statistics for Turbinia:', '']
     for stat_name in stats_order:
-      stat_obj = task_stats[stat_name]
+      stat_obj = task_stats.get(stat_name)
+      if stat_obj is None:
+        continue
       if isinstance(stat_obj, dict):
         # Sort by description so that we get consistent report output
         inner_stat_objs = sorted(
@@ -741,6 +908,13 @@ class BaseTurbiniaClient(object):
         else:
           report.append(stat_obj.format_stats())
 
+    # Trends are already in time order
+    for stat_obj in task_stats.get('trend', []):
+      if csv:
+        report.append(stat_obj.format_stats_csv())
+      else:
+        report.append(stat_obj.format_stats())
+
     report.append('')
     return '\n'.join(report)
 
@@ -762,7 +936,8 @@ class BaseTurbiniaClient(object):
     num_days = 7
     if days != 0:
       num_days = days
-    task_results = self.get_task_data(instance, project, region, days=num_days)
+    task_results = self.get_cached_task_data(
+        instance, project, region, days=num_days)
     if not task_results:
       return ''
 
@@ -800,6 +975,13 @@ class BaseTurbiniaClient(object):
         # Track scheduled/unassigned Tasks for reporting.
         scheduled_counter += 1
 
+    # Counts and run times of the finished Tasks per Worker are read from the
+    # Task aggregates when they cover the window.  The aggregates only hold
+    # finished Tasks, so running and queued Tasks still come from the records.
+    history = self.get_worker_history(instance, num_days)
+    for worker_node in history or {}:
+      workers_dict.setdefault(worker_node, [])
+
     # Generate report header
     report = []
     report.append(
@@ -831,6 +1013,11 @@ class BaseTurbiniaClient(object):
       report.append('')
       report.append(fmt.heading3('Queued Tasks'))
       report.extend(queued_status if queued_status else not_found)
+      if history is not None:
+        report.append('')
+        report.append(fmt.heading3('Finished Tasks Summary'))
+        report.extend(
+            self.format_worker_history(history.get(worker_node)) or not_found)
       # Add Historical Tasks
       if all_fields:
         report.append('')
@@ -857,7 +1044,8 @@ class BaseTurbiniaClient(object):
     num_days = 7
     if days != 0:
       num_days = days
-    task_results = self.get_task_data(instance, project, region, days=num_days)
+    task_results = self.get_cached_task_data(
+        instance, project, region, days=num_days)
     if not task_results:
       return ''
 
@@ -940,9 +1128,13 @@ class BaseTurbiniaClient(object):
     """
     if user and days == 0:
       days = 1000
-    task_results = self.get_task_data(
-        instance, project, region, days, task_id, request_id, user,
-        output_json=output_json)
+    if output_json:
+      task_results = self.get_task_data(
+          instance, project, region, days, task_id, request_id, user,
+          output_json=output_json)
+    else:
+      task_results = self.get_cached_task_data(
+          instance, project, region, days, task_id, request_id, user)
     if not task_results:
       return ''
 
@@ -1064,12 +1256,12 @@ class TurbiniaCeleryClient(BaseTurbiniaClient):
   Overriding some things specific to Celery operation.
 
   Attributes:
-    redis (RedisStateManager): Redis datastore object
+    state_manager (RedisStateManager|SQLiteStateManager): State manager object
   """
 
   def __init__(self, *args, **kwargs):
     super(TurbiniaCeleryClient, self).__init__(*args, **kwargs)
-    self.redis = RedisStateManager()
+    self.state_manager = state_manager.get_state_manager()
 
   def send_request(self, request):
     """Sends a TurbiniaRequest message.
@@ -1081,7 +1273,7 @@ class TurbiniaCeleryClient(BaseTurbiniaClient):
 
   # pylint: disable=arguments-differ
   def get_task_data(
-      self, instance, _, __, days=0, task_id=None, request_id=None,
+      self, instance, _, __, days=0, task_id=None, request_id=None, user=None,
       function_name=None, output_json=False):
     """Gets task data from Redis.
 
@@ -1093,11 +1285,159 @@ class TurbiniaCeleryClient(BaseTurbiniaClient):
       days (int): The number of days we want history for.
       task_id (string): The Id of the task.
       request_id (string): The Id of the request we want tasks for.
+      user (string): The user of the request we want tasks for.
 
     Returns:
       List of Task dict objects.
     """
-    return self.redis.get_task_data(instance, days, task_id, request_id)
+    return self.state_manager.get_task_data(
+        instance, days, task_id, request_id, requester=user)
+
+  def _aggregates_cover(self, instance, days):
+    """Checks whether the Task aggregates can be used for the given days.
+
+    Args:
+      instance (string): The Turbinia instance name (by default the same as the
+          INSTANCE_ID in the config).
+      days (int): The number of days we want history for.
+
+    Returns:
+      bool: True if aggregates are maintained and go back far enough.
+    """
+    return self.state_manager.aggregates_enabled() and task_aggregates.covers(
+        self.state_manager.get_oldest_aggregate_bucket(instance), days)
+
+  def get_worker_history(self, instance, days=0):
+    if not self._aggregates_cover(instance, days):
+      return None
+    merged = task_aggregates.merge_aggregates(
+        self.state_manager.get_task_aggregates(instance, days))
+    return {
+        value: aggregate
+        for (dimension, value), aggregate in merged.items()
+        if dimension == 'worker' and value
+    }
+
+  def get_task_statistics(
+      self, instance, project, region, days=0, task_id=None, request_id=None,
+      user=None, trend=None):
+    """Gathers statistics for Turbinia execution data.
+
+    When the state manager maintains rolling aggregates of completed Tasks and
+    they go back far enough to cover the requested days, we read the
+    statistics from those, unless the Tasks are filtered by Task, request or
+    user.  The percentiles of the Task run times are estimates then.
+    Otherwise, when the state manager can aggregate statistics including the
+    percentiles itself (e.g. with SQL) we use that instead of loading all of
+    the Task data, unless trends are needed.
+
+    Args:
+      instance (string): The Turbinia instance name (by default the same as the
+          INSTANCE_ID in the config).
+      project (string): The name of the project.
+      region (string): The name of the zone to execute in.
+      days (int): The number of days we want history for.
+      task_id (string): The Id of the task.
+      request_id (string): The Id of the request we want tasks for.
+      user (string): The user of the request we want tasks for.
+      trend (string): Also gather statistics per time bucket ('hour' or 'day')
+          as a list in the 'trend' key.
+
+    Returns:
+      task_stats(dict): Mapping of statistic names to values
+    """
+    if (not (task_id or request_id or user) and
+        self._aggregates_cover(instance, days)):
+      return self._get_aggregate_statistics(instance, days, trend)
+    if trend or not hasattr(self.state_manager, 'get_task_statistics'):
+      return super(TurbiniaCeleryClient, self).get_task_statistics(
+          instance, project, region, days, task_id, request_id, user, trend)
+
+    stats_data = self.state_manager.get_task_statistics(
+        instance, days, task_id, request_id, requester=user)
+    if not stats_data['all_tasks'][0]:
+      return {}
+
+    descriptions = {
+        'all_tasks': 'All Tasks',
+        'successful_tasks': 'Successful Tasks',
+        'failed_tasks': 'Failed Tasks',
+        'requests': 'Total Request Time'
+    }
+    group_descriptions = {
+        'tasks_per_type': 'Task type {0!s}',
+        'tasks_per_worker': 'Worker {0!s}',
+        'tasks_per_user': 'User {0!s}'
+    }
+    task_stats = {}
+    for name, description in descriptions.items():
+      task_stats[name] = TurbiniaStats(description)
+      task_stats[name].set_stats(*stats_data[name])
+    for name, description in group_descriptions.items():
+      task_stats[name] = {}
+      for key, values in stats_data[name].items():
+        task_stats[name][key] = TurbiniaStats(description.format(key))
+        task_stats[name][key].set_stats(*values)
+    return task_stats
+
+  def _get_aggregate_statistics(self, instance, days=0, trend=None):
+    """Gathers statistics from the rolling Task aggregates.
+
+    Args:
+      instance (string): The Turbinia instance name (by default the same as the
+          INSTANCE_ID in the config).
+      days (int): The number of days we want history for.
+      trend (string): Also gather statistics per time bucket ('hour' or 'day')
+          as a list in the 'trend' key.
+
+    Returns:
+      task_stats(dict): Mapping of statistic names to values
+    """
+    aggregates = self.state_manager.get_task_aggregates(instance, days)
+    merged = task_aggregates.merge_aggregates(aggregates)
+    if not merged:
+      return {}
+
+    descriptions = {
+        'all_tasks': (('all', ''), 'All Tasks'),
+        'successful_tasks': (('status', 'successful'), 'Successful Tasks'),
+        'failed_tasks': (('status', 'failed'), 'Failed Tasks')
+    }
+    group_descriptions = {
+        'type': ('tasks_per_type', 'Task type {0!s}'),
+        'worker': ('tasks_per_worker', 'Worker {0!s}'),
+        'requester': ('tasks_per_user', 'User {0!s}')
+    }
+    task_stats = {}
+    for name, (key, description) in descriptions.items():
+      task_stats[name] = TurbiniaStats(description)
+      if key in merged:
+        task_stats[name].set_summary(merged[key].get_summary())
+    spans = self.state_manager.get_request_spans(instance, days)
+    task_stats['requests'] = TurbiniaStats('Total Request Time')
+    task_stats['requests'].set_summary(
+        task_statistics.summarize_values(
+            [end - start for start, end in spans.values()]))
+    for name, _ in group_descriptions.values():
+      task_stats[name] = {}
+    for (dimension, value), aggregate in merged.items():
+      if dimension not in group_descriptions:
+        continue
+      name, description = group_descriptions[dimension]
+      task_stats[name][value] = TurbiniaStats(description.format(value))
+      task_stats[name][value].set_summary(aggregate.get_summary())
+
+    if trend:
+      buckets = task_aggregates.merge_aggregates(
+          aggregates, task_statistics.TREND_BUCKETS[trend])
+      summaries = [(
+          task_aggregates.EPOCH + timedelta(seconds=bucket),
+          aggregate.get_summary())
+                   for (bucket, dimension, _), aggregate in sorted(
+                       buckets.items(), key=lambda item: item[0][0])
+                   if dimension == 'all']
+      task_stats['trend'] = self._get_trend_stats(trend, summaries)
+    return task_stats
 
 
 class TurbiniaServer(object):
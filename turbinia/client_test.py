@@ -36,6 +36,8 @@ from turbinia.client import check_system_dependencies
 from turbinia.client import check_docker_dependencies
 from turbinia.jobs import manager
 from turbinia.jobs import manager_test
+from turbinia import task_aggregates
+from turbinia import task_statistics
 from turbinia import TurbiniaException
 
 DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%fZ'
@@ -184,38 +186,40 @@ LONG_REPORT_WORKERS = textwrap.dedent(
 
 """)
 
+# pylint: disable=line-too-long
 STATISTICS_REPORT = textwrap.dedent(
     """\
     Execution time statistics for Turbinia:
 
-    All Tasks: Count: 3, Min: 0:01:00, Mean: 0:03:00, Max: 0:05:00
-    Successful Tasks: Count: 2, Min: 0:01:00, Mean: 0:05:00, Max: 0:05:00
-    Failed Tasks: Count: 1, Min: 0:03:00, Mean: 0:03:00, Max: 0:03:00
-    Total Request Time: Count: 2, Min: 0:03:00, Mean: 0:21:00, Max: 0:21:00
-    Task type TaskName: Count: 1, Min: 0:01:00, Mean: 0:01:00, Max: 0:01:00
-    Task type TaskName2: Count: 1, Min: 0:05:00, Mean: 0:05:00, Max: 0:05:00
-    Task type TaskName3: Count: 1, Min: 0:03:00, Mean: 0:03:00, Max: 0:03:00
-    Worker fake_worker: Count: 2, Min: 0:01:00, Mean: 0:03:00, Max: 0:03:00
-    Worker fake_worker2: Count: 1, Min: 0:05:00, Mean: 0:05:00, Max: 0:05:00
-    User myuser: Count: 2, Min: 0:01:00, Mean: 0:05:00, Max: 0:05:00
-    User myuser2: Count: 1, Min: 0:03:00, Mean: 0:03:00, Max: 0:03:00
+    All Tasks: Count: 3, Min: 0:01:00, Mean: 0:03:00, Max: 0:05:00, P50: 0:03:00, P90: 0:05:00, P99: 0:05:00, Stddev: 0:01:37, Total: 0:09:00
+    Successful Tasks: Count: 2, Min: 0:01:00, Mean: 0:03:00, Max: 0:05:00, P50: 0:01:00, P90: 0:05:00, P99: 0:05:00, Stddev: 0:02:00, Total: 0:06:00
+    Failed Tasks: Count: 1, Min: 0:03:00, Mean: 0:03:00, Max: 0:03:00, P50: 0:03:00, P90: 0:03:00, P99: 0:03:00, Stddev: 0:00:00, Total: 0:03:00
+    Total Request Time: Count: 2, Min: 0:03:00, Mean: 0:12:00, Max: 0:21:00, P50: 0:03:00, P90: 0:21:00, P99: 0:21:00, Stddev: 0:09:00, Total: 0:24:00
+    Task type TaskName: Count: 1, Min: 0:01:00, Mean: 0:01:00, Max: 0:01:00, P50: 0:01:00, P90: 0:01:00, P99: 0:01:00, Stddev: 0:00:00, Total: 0:01:00
+    Task type TaskName2: Count: 1, Min: 0:05:00, Mean: 0:05:00, Max: 0:05:00, P50: 0:05:00, P90: 0:05:00, P99: 0:05:00, Stddev: 0:00:00, Total: 0:05:00
+    Task type TaskName3: Count: 1, Min: 0:03:00, Mean: 0:03:00, Max: 0:03:00, P50: 0:03:00, P90: 0:03:00, P99: 0:03:00, Stddev: 0:00:00, Total: 0:03:00
+    Worker fake_worker: Count: 2, Min: 0:01:00, Mean: 0:02:00, Max: 0:03:00, P50: 0:01:00, P90: 0:03:00, P99: 0:03:00, Stddev: 0:01:00, Total: 0:04:00
+    Worker fake_worker2: Count: 1, Min: 0:05:00, Mean: 0:05:00, Max: 0:05:00, P50: 0:05:00, P90: 0:05:00, P99: 0:05:00, Stddev: 0:00:00, Total: 0:05:00
+    User myuser: Count: 2, Min: 0:01:00, Mean: 0:03:00, Max: 0:05:00, P50: 0:01:00, P90: 0:05:00, P99: 0:05:00, Stddev: 0:02:00, Total: 0:06:00
+    User myuser2: Count: 1, Min: 0:03:00, Mean: 0:03:00, Max: 0:03:00, P50: 0:03:00, P90: 0:03:00, P99: 0:03:00, Stddev: 0:00:00, Total: 0:03:00
 """)
 
 STATISTICS_REPORT_CSV = textwrap.dedent(
     """\
-    stat_type, count, min, mean, max
-    All Tasks, 3, 0:01:00, 0:03:00, 0:05:00
-    Successful Tasks, 2, 0:01:00, 0:05:00, 0:05:00
-    Failed Tasks, 1, 0:03:00, 0:03:00, 0:03:00
-    Total Request Time, 2, 0:03:00, 0:21:00, 0:21:00
-    Task type TaskName, 1, 0:01:00, 0:01:00, 0:01:00
-    Task type TaskName2, 1, 0:05:00, 0:05:00, 0:05:00
-    Task type TaskName3, 1, 0:03:00, 0:03:00, 0:03:00
-    Worker fake_worker, 2, 0:01:00, 0:03:00, 0:03:00
-    Worker fake_worker2, 1, 0:05:00, 0:05:00, 0:05:00
-    User myuser, 2, 0:01:00, 0:05:00, 0:05:00
-    User myuser2, 1, 0:03:00, 0:03:00, 0:03:00
+    stat_type, count, min, mean, max, p50, p90, p99, stddev, total
+    All Tasks, 3, 0:01:00, 0:03:00, 0:05:00, 0:03:00, 0:05:00, 0:05:00, 0:01:37, 0:09:00
+    Successful Tasks, 2, 0:01:00, 0:03:00, 0:05:00, 0:01:00, 0:05:00, 0:05:00, 0:02:00, 0:06:00
+    Failed Tasks, 1, 0:03:00, 0:03:00, 0:03:00, 0:03:00, 0:03:00, 0:03:00, 0:00:00, 0:03:00
+    Total Request Time, 2, 0:03:00, 0:12:00, 0:21:00, 0:03:00, 0:21:00, 0:21:00, 0:09:00, 0:24:00
+    Task type TaskName, 1, 0:01:00, 0:01:00, 0:01:00, 0:01:00, 0:01:00, 0:01:00, 0:00:00, 0:01:00
+    Task type TaskName2, 1, 0:05:00, 0:05:00, 0:05:00, 0:05:00, 0:05:00, 0:05:00, 0:00:00, 0:05:00
+    Task type TaskName3, 1, 0:03:00, 0:03:00, 0:03:00, 0:03:00, 0:03:00, 0:03:00, 0:00:00, 0:03:00
+    Worker fake_worker, 2, 0:01:00, 0:02:00, 0:03:00, 0:01:00, 0:03:00, 0:03:00, 0:01:00, 0:04:00
+    Worker fake_worker2, 1, 0:05:00, 0:05:00, 0:05:00, 0:05:00, 0:05:00, 0:05:00, 0:00:00, 0:05:00
+    User myuser, 2, 0:01:00, 0:03:00, 0:05:00, 0:01:00, 0:05:00, 0:05:00, 0:02:00, 0:06:00
+    User myuser2, 1, 0:03:00, 0:03:00, 0:03:00, 0:03:00, 0:03:00, 0:03:00, 0:00:00, 0:03:00
 """)
+# pylint: enable=line-too-long
 
 
 class TestTurbiniaClient(unittest.TestCase):
@@ -383,6 +387,114 @@ class TestTurbiniaClient(unittest.TestCase):
     self.assertEqual(
         task_stats['tasks_per_type']['TaskName2'].mean, timedelta(minutes=5))
 
+  @mock.patch('turbinia.client.task_manager.get_task_manager')
+  @mock.patch('turbinia.client.state_manager', create=True)
+  def testCeleryClientGetTaskStatistics(self, mock_state_manager, _):
+    """Tests get_task_statistics() percentiles from the state manager."""
+    table = task_statistics.TaskStatsTable(self.task_data)
+    state_manager = mock_state_manager.get_state_manager.return_value
+    state_manager.aggregates_enabled.return_value = False
+    state_manager.get_task_statistics.return_value = {
+        'all_tasks': table.summarize(),
+        'successful_tasks': table.summarize(successful=True),
+        'failed_tasks': table.summarize(successful=False),
+        'requests': table.summarize_requests(),
+        'tasks_per_type': table.summarize_by('name'),
+        'tasks_per_worker': table.summarize_by('worker_name'),
+        'tasks_per_user': table.summarize_by('requester')
+    }
+    client = TurbiniaClientProvider.TurbiniaCeleryClient()
+    client.get_task_data = mock.MagicMock()
+    task_stats = client.get_task_statistics('inst', 'proj', 'reg')
+
+    client.get_task_data.assert_not_called()
+    self.assertEqual(task_stats['all_tasks'].count, 3)
+    self.assertEqual(task_stats['all_tasks'].p50, timedelta(minutes=3))
+    self.assertEqual(task_stats['all_tasks'].p99, timedelta(minutes=5))
+    self.assertEqual(task_stats['requests'].p90, timedelta(minutes=21))
+    self.assertEqual(
+        task_stats['tasks_per_user']['myuser'].p50, timedelta(minutes=1))
+    self.assertIn('P50: 0:03:00', task_stats['all_tasks'].format_stats())
+
+  @mock.patch('turbinia.client.task_manager.get_task_manager')
+  @mock.patch('turbinia.client.state_manager', create=True)
+  def testCeleryClientGetTaskStatisticsAggregates(self, mock_state_manager, _):
+    """Tests get_task_statistics() only uses aggregates covering the days."""
+    state_manager = mock_state_manager.get_state_manager.return_value
+    state_manager.aggregates_enabled.return_value = True
+    state_manager.get_oldest_aggregate_bucket.return_value = (
+        task_aggregates.get_start_bucket(1))
+    aggregates = {}
+    for task in self.task_data:
+      bucket = task_aggregates.get_bucket(task['last_update'])
+      for dimension, value in task_aggregates.get_dimensions(task):
+        key = (bucket, dimension, value)
+        aggregates.setdefault(key, task_aggregates.TaskAggregate())
+        aggregates[key].add_task(task)
+    state_manager.get_task_aggregates.return_value = aggregates
+    state_manager.get_request_spans.return_value = {
+        '0xFakeRequestId': (0.0, 1260.0),
+        '0xFakeRequestId2': (0.0, 180.0)
+    }
+    state_manager.get_task_statistics.return_value = {
+        'all_tasks': (0, None, None, None)
+    }
+    client = TurbiniaClientProvider.TurbiniaCeleryClient()
+    self.assertEqual(
+        client.get_task_statistics('inst', 'proj', 'reg', days=7), {})
+    state_manager.get_task_statistics.assert_called_once()
+
+    task_stats = client.get_task_statistics('inst', 'proj', 'reg', days=1)
+    state_manager.get_task_statistics.assert_called_once()
+    state_manager.get_request_spans.assert_called_once_with('inst', 1)
+    self.assertEqual(task_stats['all_tasks'].count, 3)
+    self.assertEqual(len(task_stats['tasks_per_type']), 3)
+    self.assertEqual(task_stats['requests'].count, 2)
+    self.assertEqual(task_stats['requests'].max, timedelta(minutes=21))
+
+  @mock.patch('turbinia.client.task_manager.get_task_manager')
+  @mock.patch('turbinia.client.state_manager', create=True)
+  def testCeleryClientFormatWorkerStatusAggregates(self, mock_state_manager, _):
+    """Tests format_worker_status() reads Worker history from aggregates."""
+    state_manager = mock_state_manager.get_state_manager.return_value
+    state_manager.aggregates_enabled.return_value = True
+    state_manager.get_oldest_aggregate_bucket.return_value = (
+        task_aggregates.get_start_bucket(7))
+    aggregates = {}
+    for task in self.task_data:
+      bucket = task_aggregates.get_bucket(task['last_update'])
+      for dimension, value in task_aggregates.get_dimensions(task):
+        key = (bucket, dimension, value)
+        aggregates.setdefault(key, task_aggregates.TaskAggregate())
+        aggregates[key].add_task(task)
+    state_manager.get_task_aggregates.return_value = aggregates
+    state_manager.get_task_data.return_value = self.task_data
+    client = TurbiniaClientProvider.TurbiniaCeleryClient()
+    result = client.format_worker_status('inst', 'proj', 'reg')
+    state_manager.get_task_aggregates.assert_called_once_with('inst', 7)
+    self.assertIn('Finished Tasks Summary', result)
+    self.assertIn('2 Task(s) finished: 1 successful, 1 failed', result)
+    # The p90 is an estimate from the sketch.
+    self.assertIn('Run Time: mean 0:02:00, p90 0:02:59, max 0:03:00', result)
+
+    state_manager.aggregates_enabled.return_value = False
+    result = client.format_worker_status('inst', 'proj', 'reg')
+    self.assertNotIn('Finished Tasks Summary', result)
+
+  @mock.patch('turbinia.client.task_manager.PSQTaskManager._backend_setup')
+  @mock.patch('turbinia.state_manager.get_state_manager')
+  def testClientGetTaskStatisticsTrend(self, _, __):
+    """Tests get_task_statistics() with statistics per hour."""
+    client = TurbiniaClientProvider.get_turbinia_client()
+    client.get_task_data = mock.MagicMock()
+    client.get_task_data.return_value = self.task_data
+    task_stats = client.get_task_statistics('inst', 'proj', 'reg', trend='hour')
+    self.assertEqual(len(task_stats['trend']), 1)
+    self.assertEqual(
+        task_stats['trend'][0].description, 'Hour 2020-08-04 16:00')
+    self.assertEqual(task_stats['trend'][0].count, 3)
+    self.assertEqual(task_stats['trend'][0].total, timedelta(minutes=9))
+
   @mock.patch('libcloudforensics.providers.gcp.internal.function.GoogleCloudFunction.ExecuteFunction')  # yapf: disable
   @mock.patch('turbinia.client.task_manager.PSQTaskManager._backend_setup')
   @mock.patch('turbinia.state_manager.get_state_manager')
@@ -522,6 +634,65 @@ class TestTurbiniaClient(unittest.TestCase):
     result = client.format_worker_status('inst', 'proj', 'reg', all_fields=True)
     self.assertEqual(result.strip(), LONG_REPORT_WORKERS.strip())
 
+  @mock.patch('turbinia.client.time.sleep')
+  @mock.patch('turbinia.client.task_manager.PSQTaskManager._backend_setup')
+  @mock.patch('turbinia.state_manager.get_state_manager')
+  def testWaitForRequestEvents(self, _, __, mock_sleep):
+    """Tests wait_for_request() waits for Task events instead of polling."""
+    client = TurbiniaClientProvider.get_turbinia_client()
+    running = dict(self.task_data[0], successful=None)
+    client.get_task_data = mock.MagicMock()
+    client.get_task_data.side_effect = [[running], [running], self.task_data]
+    subscriber = mock.MagicMock()
+    subscriber.wait.return_value = [{'id': '0xfakeTaskId'}]
+    client.get_task_event_subscriber = mock.MagicMock(return_value=subscriber)
+
+    client.wait_for_request('inst', 'proj', 'reg', request_id='0xFakeRequestId')
+    self.assertEqual(client.get_task_data.call_count, 3)
+    self.assertEqual(subscriber.wait.call_count, 2)
+    subscriber.close.assert_called_once_with()
+    mock_sleep.assert_not_called()
+
+  @mock.patch('turbinia.client.time.sleep')
+  @mock.patch('turbinia.client.task_manager.PSQTaskManager._backend_setup')
+  @mock.patch('turbinia.state_manager.get_state_manager')
+  def testWaitForRequestEventsFallback(self, _, __, mock_sleep):
+    """Tests wait_for_request() polls when the event subscription fails."""
+    client = TurbiniaClientProvider.get_turbinia_client()
+    running = dict(self.task_data[0], successful=None)
+    client.get_task_data = mock.MagicMock()
+    client.get_task_data.side_effect = [[running], [running], self.task_data]
+    subscriber = mock.MagicMock()
+    subscriber.wait.side_effect = TurbiniaException('Connection lost')
+    client.get_task_event_subscriber = mock.MagicMock(return_value=subscriber)
+
+    client.wait_for_request('inst', 'proj', 'reg', poll_interval=5)
+    self.assertEqual(client.get_task_data.call_count, 3)
+    subscriber.wait.assert_called_once_with(5)
+    subscriber.close.assert_called_once_with()
+    mock_sleep.assert_called_once_with(5)
+
+  @mock.patch('turbinia.client.task_manager.PSQTaskManager._backend_setup')
+  @mock.patch('turbinia.state_manager.get_state_manager')
+  def testGetCachedTaskData(self, _, __):
+    """Tests get_cached_task_data() only fetches Tasks since the last sync."""
+    tmp_dir = tempfile.mkdtemp(prefix='turbinia-test-client-cache')
+    self.addCleanup(shutil.rmtree, tmp_dir)
+    client = TurbiniaClientProvider.get_turbinia_client()
+    task = dict(self.task_data[0], last_update=datetime.now())
+    client.get_task_data = mock.MagicMock(return_value=[task])
+    with mock.patch.object(config, 'TASK_CACHE_DIR', tmp_dir):
+      tasks = client.get_cached_task_data('inst', 'proj', 'reg', days=7)
+      self.assertEqual(tasks, [task])
+      self.assertAlmostEqual(
+          client.get_task_data.call_args[1]['days'], 7, places=3)
+
+      client.get_task_data.return_value = []
+      tasks = client.get_cached_task_data(
+          'inst', 'proj', 'reg', days=7, request_id='0xFakeRequestId')
+      self.assertEqual(tasks, [task])
+      self.assertLess(client.get_task_data.call_args[1]['days'], 1)
+
 
 class TestTurbiniaStats(unittest.TestCase):
   """Test TurbiniaStats class."""
@@ -559,11 +730,21 @@ class TestTurbiniaStats(unittest.TestCase):
     self.assertEqual(stats.count, 0)
     self.assertEqual(stats.min, None)
 
+  def testTurbiniaStatsSetStats(self):
+    """Tests TurbiniaStats.set_stats() with pre-calculated statistics."""
+    stats = TurbiniaStats('Test Task Results')
+    stats.set_stats(3, 60.0, 180.5, 300.0)
+    self.assertEqual(stats.count, 3)
+    self.assertEqual(stats.min, timedelta(minutes=1))
+    self.assertEqual(stats.mean, timedelta(minutes=3))
+    self.assertEqual(stats.max, timedelta(minutes=5))
+
   def testTurbiniaStatsFormatStats(self):
     """Tests TurbiniaStats.format_stats() returns valid output."""
     test_output = (
         'Test Task Results: Count: 1, Min: 0:03:00, Mean: 0:03:00, '
-        'Max: 0:03:00')
+        'Max: 0:03:00, P50: 0:03:00, P90: 0:03:00, P99: 0:03:00, '
+        'Stddev: 0:00:00, Total: 0:03:00')
     test_task1 = {
         'run_time': timedelta(minutes=3),
         'last_update': datetime.now()
@@ -576,7 +757,9 @@ class TestTurbiniaStats(unittest.TestCase):
 
   def testTurbiniaStatsFormatStatsCsv(self):
     """Tests TurbiniaStats.format_stats() returns valid CSV output."""
-    test_output = ('Test Task Results, 1, 0:03:00, 0:03:00, 0:03:00')
+    test_output = (
+        'Test Task Results, 1, 0:03:00, 0:03:00, 0:03:00, 0:03:00, 0:03:00, '
+        '0:03:00, 0:00:00, 0:03:00')
     test_task1 = {
         'run_time': timedelta(minutes=3),
         'last_update': datetime.now()
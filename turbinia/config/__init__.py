@@ -77,12 +77,20 @@ OPTIONAL_VARS = [
     'REDIS_HOST',
     'REDIS_PORT',
     'REDIS_DB',
+    # SQLITE CONFIG
+    'SQLITE_PATH',
     # Celery config
     'CELERY_BROKER',
     'CELERY_BACKEND',
+    'CELERY_COMPRESSION_THRESHOLD',
     'KOMBU_BROKER',
     'KOMBU_CHANNEL',
     'KOMBU_DURABLE',
+    # Request intake config
+    'MESSAGE_BATCH_SIZE',
+    'MESSAGE_PREFETCH',
+    'REQUEST_DEDUP_TTL',
+    'REQUEST_DEDUP_IMPLICIT_KEYS',
     # Email config
     'EMAIL_NOTIFICATIONS',
     'EMAIL_HOST_ADDRESS',
@@ -91,7 +99,32 @@ OPTIONAL_VARS = [
     'EMAIL_PASSWORD',
     # Prometheus config
     'PROMETHEUS_ADDR',
-    'PROMETHEUS_PORT'
+    'PROMETHEUS_PORT',
+    # Output storage config
+    'OUTPUT_DEDUPLICATION',
+    'SHARDED_OUTPUT_DIRS',
+    # Worker disk space config
+    'TMP_DIR_QUOTA',
+    'MIN_FREE_SPACE',
+    'SPACE_WAIT_TIME',
+    # State blob store config
+    'STATE_BLOB_STORE',
+    'STATE_BLOB_PATH',
+    'STATE_BLOB_THRESHOLD',
+    # Recipe interning config
+    'RECIPE_INTERN_THRESHOLD',
+    'RECIPE_RETENTION_DAYS',
+    # Task events config
+    'TASK_EVENTS',
+    # Task aggregates config
+    'TASK_AGGREGATES',
+    'TASK_AGGREGATE_RETENTION_DAYS',
+    # Client config
+    'TASK_CACHE_DIR',
+    # Task processing config
+    'STRINGS_SHARDS',
+    'STRINGS_COMPRESSION',
+    'GREP_SHARDS',
 ]
 
 # Environment variable to look for path data in
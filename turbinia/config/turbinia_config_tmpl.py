@@ -26,9 +26,10 @@ from __future__ import unicode_literals
 # separate when running with the same Cloud projects or backend servers.
 INSTANCE_ID = 'turbinia-instance1'
 
-# Which state manager to use. Valid options are 'Datastore' or 'Redis'.  Use
-# 'Datastore' for Cloud (GCP) or hybrid installations, and 'Redis' for local
-# installations.
+# Which state manager to use. Valid options are 'Datastore', 'Redis' or
+# 'SQLite'.  Use 'Datastore' for Cloud (GCP) or hybrid installations, and
+# 'Redis' for local installations.  'SQLite' can be used for local installations
+# where the server and workers all run on a single machine.
 STATE_MANAGER = 'Datastore'
 
 # Which Task manager to use. Valid options are 'PSQ' and 'Celery'.  Use 'PSQ'
@@ -54,6 +55,31 @@ LOCK_FILE = '%s/turbinia-worker.lock' % OUTPUT_DIR
 # Time in seconds to sleep in task management loops
 SLEEP_TIME = 10
 
+# Maximum number of new requests the server processes in each task management
+# loop, so that a burst of requests does not hold up processing Task results.
+MESSAGE_BATCH_SIZE = 100
+
+# Maximum number of requests the server will receive before their evidence has
+# been added.  Request messages are only acknowledged after their Tasks have
+# been created, so unprocessed requests are delivered again after a restart.
+MESSAGE_PREFETCH = 100
+
+# Number of seconds the server remembers the idempotency key of each request it
+# has received.  Requests with the same key as an earlier request are dropped
+# as duplicates in that time, so that retried `turbiniactl` submissions don't
+# process the same Evidence twice.  Keys are given with `turbiniactl -k`, and
+# `turbiniactl --no_dedup` makes the server process a request regardless.  A
+# dropped duplicate is recorded as a completed DuplicateRequest Task for its
+# request ID, with the ID of the original request in its status, so that
+# clients waiting for it return.  The keys are kept in the state backend.  Set
+# to None to process every request.
+REQUEST_DEDUP_TTL = 86400
+
+# Whether requests without an idempotency key are deduplicated with a hash of
+# their Evidence and recipe as the key.  This also drops intentional re-runs of
+# the same Evidence within REQUEST_DEDUP_TTL, so it is off by default.
+REQUEST_DEDUP_IMPLICIT_KEYS = False
+
 # Whether to run as a single run, or to keep server running indefinitely
 SINGLE_RUN = False
 
@@ -73,6 +99,139 @@ SHARED_FILESYSTEM = False
 # problems.
 DEBUG_TASKS = False
 
+################################################################################
+#                              Output Storage
+#
+# Options in this section are optional and control how output is stored.
+################################################################################
+
+# Whether to store output files by their content hash so that identical files
+# written by different Tasks are only stored locally (and uploaded to GCS) once.
+# Local Task output paths will be hardlinks pointing to the shared copy, and
+# local output will be indexed in OUTPUT_DIR/blobs/index.jsonl.  Local blobs
+# that are no longer linked from any output directory are removed when the
+# space manager evicts output (see TMP_DIR_QUOTA below), or can be removed with
+# LocalDedupOutputWriter.collect_garbage().  GCS has no links, so for GCS this
+# only saves upload time and bandwidth, not storage: output objects with
+# contents that were already uploaded are copied within the bucket instead.
+# GCS output is indexed under GCS_OUTPUT_PATH/index/, and stale index entries
+# can be removed with GCSDedupOutputWriter.collect_garbage().
+OUTPUT_DEDUPLICATION = False
+
+# Whether to lay out Task output and temp directories as
+# '{request_id}/{task_id prefix}/{task_id}-{task_name}' instead of creating a
+# directory for every Task directly under OUTPUT_DIR and TMP_DIR.  Existing
+# directories can be moved out of the old layout with
+# tools/output_dir_migrate.py, and paths to them will still be resolved.
+SHARDED_OUTPUT_DIRS = False
+
+# Maximum size in GB that the temp (and when GCS_OUTPUT_PATH is set, local
+# output) directories of Tasks can use in total on a worker.  When this is
+# exceeded, directories from finished Tasks are evicted starting with the least
+# recently used.  Set to None to disable.
+TMP_DIR_QUOTA = None
+
+# Minimum free disk space in GB to keep on the TMP_DIR and OUTPUT_DIR
+# filesystems of workers.  Before a Task runs, data from finished Tasks is
+# evicted until the free space minus the space used by previous runs of the
+# same Task is above this.  Set to None to disable.
+MIN_FREE_SPACE = None
+
+# Seconds a worker will wait for disk space to become available before refusing
+# to run a Task when TMP_DIR_QUOTA or MIN_FREE_SPACE can't be met.  The wait
+# happens before the worker lock is taken, so other Tasks on the host keep
+# running in the meantime.
+SPACE_WAIT_TIME = 300
+
+# Where to store Task state fields (e.g. report_data) that are larger than
+# STATE_BLOB_THRESHOLD bytes.  Valid options are 'Local', 'GCS', 'Redis' or
+# None.  The state record will only keep a truncated preview of the field and a
+# reference to the full value, which the client fetches when generating a full
+# report.  With None, large fields are stored inline (or truncated when the
+# STATE_MANAGER is 'Datastore').
+STATE_BLOB_STORE = None
+
+# Path for the state blob store.  For 'Local' this is a directory (defaulting to
+# OUTPUT_DIR/state-blobs) that must be shared between the server, workers and
+# clients, and for 'GCS' this is a gs:// path.  'Redis' uses the Redis config
+# below.
+STATE_BLOB_PATH = None
+
+# Size in bytes above which Task state fields are moved to the blob store.
+STATE_BLOB_THRESHOLD = 65536
+
+# Size in bytes of JSON above which request recipes (the Evidence config) are
+# stored once in the state backend instead of being sent with every Task and
+# result.  Tasks then only carry the SHA256 hash of the recipe, and the server
+# and workers fetch and cache the recipe by that hash.  Set to None to always
+# send the full recipe.
+RECIPE_INTERN_THRESHOLD = 4096
+
+# Number of days to keep stored recipes for.  This should be longer than any
+# request takes to be processed, including the time its Tasks wait in the queue
+# and their results are kept in the Celery result backend, as Tasks whose
+# recipe has expired fail.  The server extends this while it sends the recipe.
+RECIPE_RETENTION_DAYS = 30
+
+################################################################################
+#                               Task Status
+#
+# Options in this section are optional and control how clients get Task state.
+################################################################################
+
+# Whether the state manager should publish an event whenever a Task is created
+# or changes status, so that clients waiting for requests to finish (e.g.
+# `turbiniactl status -w`) don't have to poll the state backend.  Events are
+# sent with Redis pub/sub when STATE_MANAGER is 'Redis', and to the PubSub topic
+# '{PUBSUB_TOPIC}-task-events' when it is 'Datastore'.  Clients fall back to
+# polling when events are unavailable.
+TASK_EVENTS = True
+
+# Whether the state manager should keep rolling hourly aggregates of completed
+# Tasks (counts, successes and failures, run time totals and a sketch for run
+# time percentiles) per Task type, worker and requester, and the time span of
+# each request.  `turbiniactl status -s` reads statistics from these instead of
+# every Task when it isn't filtered by Task, request or user.  Only Tasks
+# completed after aggregates were enabled are counted, so until the aggregates
+# go back to the start of the requested days (or the whole retention time when
+# no days are given) statistics are still calculated from every Task.
+# Supported when STATE_MANAGER is 'Redis' or 'SQLite'.
+TASK_AGGREGATES = False
+
+# Number of days to keep the Task aggregates for.
+TASK_AGGREGATE_RETENTION_DAYS = 90
+
+# Directory for the client's local cache of Task data, e.g.
+# '~/.turbinia/task_cache'.  When set, `turbiniactl status` queries for a number
+# of days only fetch Tasks that have been updated since the previous query, and
+# `turbiniactl status --refresh_cache` can be used to fetch everything again.
+# Set to None to disable the cache.
+TASK_CACHE_DIR = None
+
+################################################################################
+#                               Task Processing
+#
+# Options in this section are optional and control how some Tasks process
+# Evidence.
+################################################################################
+
+# Number of byte ranges that disks are split into for strings extraction.  Each
+# range is processed by a separate Task, so that a large disk can be processed
+# by several workers at once.  Offsets in the output are always from the start
+# of the disk.
+STRINGS_SHARDS = 1
+
+# Whether to gzip compress the output of strings extraction as it is written.
+# Compressed output is CompressedTextFile Evidence, which GrepJob does not
+# filter.
+STRINGS_COMPRESSION = False
+
+# Maximum number of byte ranges that GrepJob splits its input into.  Each range
+# is filtered by a separate grep process on the worker, and the outputs are
+# merged with the byte offsets and line numbers in the whole input.  Inputs are
+# only split into ranges of at least 64MB.
+GREP_SHARDS = 1
+
 ################################################################################
 #                         External Dependency Configurations
 #
@@ -111,10 +270,6 @@ DEPENDENCIES = [{
     'job': 'GrepJob',
     'programs': ['grep'],
     'docker_image': None
-}, {
-    'job': 'HadoopAnalysisJob',
-    'programs': ['strings'],
-    'docker_image': None
 }, {
     'job': 'HindsightJob',
     'programs': ['hindsight.py'],
@@ -135,10 +290,6 @@ DEPENDENCIES = [{
     'job': 'PsortJob',
     'programs': ['psort.py'],
     'docker_image': None
-}, {
-    'job': 'StringsJob',
-    'programs': ['strings'],
-    'docker_image': None
 }, {
     'job': 'VolatilityJob',
     'programs': ['vol.py'],
@@ -199,6 +350,13 @@ CELERY_BROKER = 'redis://localhost'
 # Storage for task results/status
 CELERY_BACKEND = 'redis://localhost'
 
+# Task and result messages of at least this many bytes are compressed with zlib
+# to save memory in the broker and result backend.  Set this to None to not
+# compress messages, in which case they are sent as plain JSON.  When this is
+# set, the server and workers must all run a version of Turbinia that supports
+# compressed messages.
+CELERY_COMPRESSION_THRESHOLD = 65536
+
 # Can be the same as CELERY_BROKER
 KOMBU_BROKER = CELERY_BROKER
 
@@ -214,6 +372,10 @@ REDIS_HOST = 'localhost'
 REDIS_PORT = '6379'
 REDIS_DB = '0'
 
+# Path to the SQLite database used when STATE_MANAGER is 'SQLite'.  Defaults to
+# OUTPUT_DIR/turbinia-state.db if not set.
+SQLITE_PATH = None
+
 ################################################################################
 #                           Email Config
 #
@@ -756,6 +756,11 @@ class FilteredTextFile(TextFile):
   pass
 
 
+class CompressedTextFile(TextFile):
+  """Gzip compressed text data."""
+  pass
+
+
 class ExportedFileArtifact(Evidence):
   """Exported file artifact."""
 
@@ -767,6 +772,21 @@ class ExportedFileArtifact(Evidence):
     self.artifact_name = artifact_name
 
 
+class ExportedFileArtifactCollection(CompressedDirectory):
+  """Directory of exported file artifacts, processed together in one Task.
+
+  Attributes:
+    artifact_name (str): The name of the exported artifact.
+  """
+
+  REQUIRED_ATTRIBUTES = ['artifact_name']
+
+  def __init__(self, artifact_name=None, *args, **kwargs):
+    """Initializes an exported file artifact collection."""
+    super(ExportedFileArtifactCollection, self).__init__(*args, **kwargs)
+    self.artifact_name = artifact_name
+
+
 class VolatilityReport(TextFile):
   """Volatility output file data."""
   pass
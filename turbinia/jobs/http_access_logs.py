@@ -23,6 +23,7 @@ from turbinia.evidence import RawDisk
 from turbinia.evidence import GoogleCloudDisk
 from turbinia.evidence import GoogleCloudDiskRawEmbedded
 from turbinia.evidence import ExportedFileArtifact
+from turbinia.evidence import ExportedFileArtifactCollection
 from turbinia.evidence import ReportText
 from turbinia.jobs import interface
 from turbinia.jobs import manager
@@ -41,7 +42,7 @@ class HTTPAccessLogExtractionJob(interface.TurbiniaJob):
       GoogleCloudDiskRawEmbedded
   ]
 
-  evidence_output = [ExportedFileArtifact]
+  evidence_output = [ExportedFileArtifactCollection]
 
   NAME = 'HTTPAccessLogExtractionJob'
 
@@ -55,9 +56,11 @@ class HTTPAccessLogExtractionJob(interface.TurbiniaJob):
         A list of tasks to schedule.
     """
     tasks = []
+    # All of the access logs for each artifact are analyzed in one Task.
     for artifact_name in ACCESS_LOG_ARTIFACTS:
       tasks.extend([
-          artifact.FileArtifactExtractionTask(artifact_name) for _ in evidence
+          artifact.FileArtifactExtractionTask(artifact_name, group_files=True)
+          for _ in evidence
       ])
     return tasks
 
@@ -65,7 +68,7 @@ class HTTPAccessLogExtractionJob(interface.TurbiniaJob):
 class HTTPAccessLogAnalysisJob(interface.TurbiniaJob):
   """HTTP Access log analysis job."""
 
-  evidence_input = [ExportedFileArtifact]
+  evidence_input = [ExportedFileArtifact, ExportedFileArtifactCollection]
   evidence_output = [ReportText]
 
   NAME = 'HTTPAccessLogAnalysisJob'
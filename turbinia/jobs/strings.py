@@ -16,26 +16,27 @@
 
 from __future__ import unicode_literals
 
+from turbinia import config
+from turbinia.evidence import CompressedTextFile
 from turbinia.evidence import GoogleCloudDisk
 from turbinia.evidence import GoogleCloudDiskRawEmbedded
 from turbinia.evidence import RawDisk
 from turbinia.evidence import TextFile
 from turbinia.jobs import interface
 from turbinia.jobs import manager
-from turbinia.workers.strings import StringsAsciiTask
-from turbinia.workers.strings import StringsUnicodeTask
+from turbinia.workers.strings import StringsTask
 
 
 class StringsJob(interface.TurbiniaJob):
   """Strings collection Job.
 
-  This will generate a Unicode and ASCII string collection task for each piece
-  of evidence.
+  This will generate a Unicode and ASCII string collection task for each byte
+  range of each piece of evidence.
   """
 
   # The types of evidence that this Job will process
   evidence_input = [RawDisk, GoogleCloudDisk, GoogleCloudDiskRawEmbedded]
-  evidence_output = [TextFile]
+  evidence_output = [TextFile, CompressedTextFile]
 
   NAME = 'StringsJob'
 
@@ -48,10 +49,12 @@ class StringsJob(interface.TurbiniaJob):
     Returns:
         A list of tasks to schedule.
     """
-    # Generate tasks for both types of Strings jobs
-    tasks = [StringsAsciiTask() for _ in evidence]
-    tasks.extend([StringsUnicodeTask() for _ in evidence])
-    return tasks
+    shard_count = config.STRINGS_SHARDS or 1
+    return [
+        StringsTask(shard_index=i, shard_count=shard_count)
+        for _ in evidence
+        for i in range(shard_count)
+    ]
 
 
 manager.JobsManager.RegisterJob(StringsJob)
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""In-process extraction of printable strings from files.
+
+This finds the same strings as `strings -a`: runs of at least 4 printable ASCII
+characters or tabs.  Files are memory mapped and scanned with a compiled
+expression, so no process is started per file and file contents are never
+copied into memory as a whole.
+
+Devices are read once with large sequential reads, finding both the ASCII and
+the UTF-16LE strings (as `strings -a -e l` does) in the same pass.  A byte range
+of a device can be processed on its own, so that large disks can be split over
+several workers.
+"""
+
+from __future__ import unicode_literals
+
+from concurrent import futures
+import mmap
+import multiprocessing
+import os
+import re
+
+# Minimum length of a string, as used by `strings`.
+DEFAULT_MIN_LENGTH = 4
+
+# Printable ASCII characters and tab, as used by `strings`.
+ASCII_CHARACTERS = b'\t\x20-\x7e'
+
+# Size in bytes of the reads from devices.
+DEFAULT_BLOCK_SIZE = 16 * 2**20
+
+ENCODING_ASCII = 'ascii'
+ENCODING_UTF16LE = 'utf-16-le'
+
+
+def get_ascii_regex(min_length=DEFAULT_MIN_LENGTH):
+  """Gets the expression matching ASCII strings.
+
+  Args:
+    min_length (int): The minimum length of a string.
+
+  Returns:
+    re.Pattern: The compiled bytes expression.
+  """
+  return re.compile(
+      b'[' + ASCII_CHARACTERS + b']{' + str(min_length).encode('ascii') + b',}')
+
+
+def get_utf16le_regex(min_length=DEFAULT_MIN_LENGTH):
+  """Gets the expression matching UTF-16LE strings.
+
+  Args:
+    min_length (int): The minimum length of a string in characters.
+
+  Returns:
+    re.Pattern: The compiled bytes expression.
+  """
+  return re.compile(
+      b'(?:[' + ASCII_CHARACTERS + b']\x00){' +
+      str(min_length).encode('ascii') + b',}')
+
+
+def iter_file_strings(path, regex=None):
+  """Extracts the strings from a file.
+
+  Args:
+    path (str): The path to the file.
+    regex (re.Pattern): The bytes expression matching strings, or None for
+        ASCII strings of the default minimum length.
+
+  Yields:
+    tuple(int, bytes): The offset and contents of each string.
+  """
+  regex = regex or get_ascii_regex()
+  with open(path, 'rb') as file_handle:
+    # Empty files can't be memory mapped.
+    if not os.fstat(file_handle.fileno()).st_size:
+      return
+    mapped_file = mmap.mmap(file_handle.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+      for match in regex.finditer(mapped_file):
+        yield match.start(), match.group()
+    finally:
+      mapped_file.close()
+
+
+def search_file_strings(path, keywords):
+  """Extracts the strings from a file and finds those containing keywords.
+
+  Args:
+    path (str): The path to the file.
+    keywords (list[bytes]): The keywords to look for.
+
+  Returns:
+    tuple(int, list[str]): The number of strings in the file, and the strings
+        containing any of the keywords.
+  """
+  strings_count = 0
+  matches = []
+  for _, string in iter_file_strings(path):
+    strings_count += 1
+    if any(keyword in string for keyword in keywords):
+      matches.append(string.decode('ascii'))
+  return strings_count, matches
+
+
+def map_files(function, paths, processes=None, chunksize=16):
+  """Runs a function for each file in a process pool.
+
+  Args:
+    function (function): A module level function that takes a path.
+    paths (list[str]): The paths of the files.
+    processes (int): The maximum number of processes, or None for one per CPU.
+    chunksize (int): The number of files to send to a process at a time.
+
+  Yields:
+    tuple(str, object): Each path with the return value of the function, in
+        the order of the paths, as soon as the function has returned.
+  """
+  processes = min(len(paths), processes or multiprocessing.cpu_count())
+  if processes <= 1:
+    for path in paths:
+      yield path, function(path)
+    return
+  with futures.ProcessPoolExecutor(processes) as executor:
+    for path, value in zip(paths, executor.map(function, paths,
+                                               chunksize=chunksize)):
+      yield path, value
+
+
+def iter_strings(
+    file_handle, start=0, end=None, min_length=DEFAULT_MIN_LENGTH,
+    block_size=DEFAULT_BLOCK_SIZE):
+  """Extracts the ASCII and UTF-16LE strings from a byte range of a file.
+
+  The range is read sequentially once.  Strings belong to the range they start
+  in, so strings that start in the range are read to their end even when that
+  is past the end of the range, and strings that started before the range are
+  skipped.  Strings longer than the block size are split into several strings.
+
+  Args:
+    file_handle (file): The file, opened in binary mode.
+    start (int): The offset to start at.
+    end (int): The offset to end at, or None to read to the end of the file.
+    min_length (int): The minimum length of a string in characters.
+    block_size (int): The number of bytes to read at a time.
+
+  Yields:
+    tuple(int, str, str): The offset, encoding and contents of each string.
+        Strings of each encoding are yielded in the order of their offsets.
+  """
+  encodings = [(ENCODING_ASCII, 1, get_ascii_regex(min_length)),
+               (ENCODING_UTF16LE, 2, get_utf16le_regex(min_length))]
+  # Include the bytes before the range, so that strings that started before it
+  # are matched as a whole and skipped.
+  base = max(0, start - 2)
+  file_handle.seek(base)
+  buffer = b''
+  # Offsets in the buffer to continue matching from for each encoding.
+  positions = [0] * len(encodings)
+  while end is None or base + min(positions) < end:
+    data = file_handle.read(block_size)
+    final = not data
+    buffer += data
+    for index, (encoding, width, regex) in enumerate(encodings):
+      position = positions[index]
+      # Bytes at the end of the buffer that could start a string that
+      # continues in the next block.
+      partial = len(buffer) - (min_length * width - 1)
+      for match in regex.finditer(buffer, position):
+        offset = base + match.start()
+        if end is not None and offset >= end:
+          position = match.start()
+          break
+        # Keep strings that may continue in the next block, unless they are
+        # too long to keep in memory.
+        if (not final and match.end() > len(buffer) - width and
+            len(buffer) - match.start() <= block_size):
+          position = match.start()
+          break
+        position = match.end()
+        if offset >= start:
+          yield offset, encoding, match.group().decode(encoding)
+      else:
+        position = max(position, partial)
+      positions[index] = position
+    if final:
+      return
+    cut = min(positions)
+    buffer = buffer[cut:]
+    base += cut
+    positions = [position - cut for position in positions]
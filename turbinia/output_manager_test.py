@@ -16,17 +16,20 @@
 
 from __future__ import unicode_literals
 
+import errno
 import json
 import unittest
 import os
 import shutil
 import tempfile
+import time
 
 import mock
 
 from turbinia import config
 from turbinia import evidence
 from turbinia import output_manager
+from turbinia import TurbiniaException
 from turbinia import workers
 
 
@@ -68,6 +71,102 @@ class TestLocalOutputManager(unittest.TestCase):
     for writer in writers:
       self.assertIsInstance(writer, output_manager.OutputWriter)
 
+  def testGetUniqueDir(self):
+    """Tests get_unique_dir for the flat and sharded layouts."""
+    sharded_save = config.SHARDED_OUTPUT_DIRS
+    try:
+      config.SHARDED_OUTPUT_DIRS = False
+      unique_dir = output_manager.OutputManager.get_unique_dir(
+          'FooTask', 'abcdef', request_id='req1')
+      self.assertRegex(unique_dir, r'^\d+-abcdef-FooTask$')
+
+      config.SHARDED_OUTPUT_DIRS = True
+      unique_dir = output_manager.OutputManager.get_unique_dir(
+          'FooTask', 'abcdef', request_id='req1')
+      self.assertEqual(unique_dir, os.path.join('req1', 'ab', 'abcdef-FooTask'))
+      unique_dir = output_manager.OutputManager.get_unique_dir(
+          'FooTask', 'abcdef')
+      self.assertEqual(
+          unique_dir,
+          os.path.join(output_manager.NO_REQUEST_DIR, 'ab', 'abcdef-FooTask'))
+    finally:
+      config.SHARDED_OUTPUT_DIRS = sharded_save
+
+  def testSetupSharded(self):
+    """Tests that sharded output and temp directories are created."""
+    output_manager.storage = mock.MagicMock()
+    sharded_save = config.SHARDED_OUTPUT_DIRS
+    config.SHARDED_OUTPUT_DIRS = True
+    try:
+      self.task.output_manager.setup(
+          self.task.name, self.task.id, request_id='req1')
+      tmp_dir, local_dir = self.task.output_manager.get_local_output_dirs()
+    finally:
+      config.SHARDED_OUTPUT_DIRS = sharded_save
+
+    expected = os.path.join(
+        'req1', self.task.id[:2], '{0:s}-{1:s}'.format(
+            self.task.id, self.task.name))
+    self.assertEqual(local_dir, os.path.join(self.base_output_dir, expected))
+    self.assertEqual(tmp_dir, os.path.join(self.tmp_dir, expected))
+    self.assertTrue(os.path.isdir(local_dir))
+    self.assertTrue(os.path.isdir(tmp_dir))
+
+  def testMigrateOutputDirs(self):
+    """Tests migrating flat layout dirs and resolving their old paths."""
+    old_dir = os.path.join(self.base_output_dir, '1600000000-abcdef-FooTask')
+    empty_dir = os.path.join(self.base_output_dir, '1600000000-123456-BarTask')
+    other_dir = os.path.join(self.base_output_dir, 'other')
+    sharded_dir = os.path.join(self.base_output_dir, 'req1', 'ab', 'abcd-Foo')
+    for path in (old_dir, empty_dir, other_dir, sharded_dir):
+      os.makedirs(path)
+    old_file = os.path.join(old_dir, 'worker-log.txt')
+    with open(old_file, 'w') as file_handle:
+      file_handle.write('log')
+
+    migrated, removed = output_manager.migrate_output_dirs(
+        self.base_output_dir, remove_empty=True)
+
+    self.assertEqual(migrated, 1)
+    self.assertEqual(removed, 2)
+    self.assertFalse(os.path.exists(old_dir))
+    self.assertFalse(os.path.exists(os.path.join(self.base_output_dir, 'req1')))
+    self.assertFalse(os.path.exists(empty_dir))
+    self.assertTrue(os.path.exists(other_dir))
+    new_file = os.path.join(
+        self.base_output_dir, output_manager.LEGACY_DIR, 'ab',
+        '1600000000-abcdef-FooTask', 'worker-log.txt')
+    self.assertTrue(os.path.exists(new_file))
+    self.assertEqual(output_manager.resolve_output_path(old_file), new_file)
+    missing_file = os.path.join(self.base_output_dir, 'missing')
+    self.assertEqual(
+        output_manager.resolve_output_path(missing_file), missing_file)
+
+  def testMigrateOutputDirsMinAge(self):
+    """Tests that recently modified dirs are not migrated."""
+    os.makedirs(os.path.join(self.base_output_dir, '1600000000-abcdef-Foo'))
+    migrated, removed = output_manager.migrate_output_dirs(
+        self.base_output_dir, remove_empty=True, min_age=3600)
+    self.assertEqual((migrated, removed), (0, 0))
+
+    # New sharded dirs are kept even when the Task dir in them is old.
+    task_dir = os.path.join(self.base_output_dir, 'req1', 'ab', 'abcd-Foo')
+    os.makedirs(task_dir)
+    os.utime(task_dir, (1600000000, 1600000000))
+    migrated, removed = output_manager.migrate_output_dirs(
+        self.base_output_dir, remove_empty=True, min_age=3600)
+    self.assertEqual((migrated, removed), (0, 1))
+    self.assertTrue(os.path.exists(os.path.dirname(task_dir)))
+
+  @mock.patch('turbinia.output_manager.os.rmdir')
+  def testMigrateOutputDirsConcurrentTask(self, mock_rmdir):
+    """Tests dirs that a worker writes to while removing them are skipped."""
+    mock_rmdir.side_effect = OSError(errno.ENOTEMPTY, 'Directory not empty')
+    os.makedirs(os.path.join(self.base_output_dir, 'req1', 'ab', 'abcd-Foo'))
+    migrated, removed = output_manager.migrate_output_dirs(
+        self.base_output_dir, remove_empty=True)
+    self.assertEqual((migrated, removed), (0, 0))
+
   def testGetLocalOutputDirs(self):
     """Tests get_local_output_dirs function for valid response."""
     output_manager.storage = mock.MagicMock()
@@ -103,6 +202,79 @@ class TestLocalOutputManager(unittest.TestCase):
     self.assertIn(dst_file, self.task.result.saved_paths)
     self.assertEqual(local_file, dst_file)
 
+  def testSaveLocalFileTwice(self):
+    """Test that a temp file can be saved again after it was saved."""
+    config.GCS_OUTPUT_PATH = None
+    self.task.output_manager.setup(self.task.name, self.task.id)
+    tmp_dir, _ = self.task.output_manager.get_local_output_dirs()
+    remote_writer = mock.MagicMock()
+    remote_writer.copy_to.side_effect = os.path.getsize
+    # pylint: disable=protected-access
+    self.task.output_manager._output_writers.append(remote_writer)
+    src_file = os.path.join(tmp_dir, 'test-file.out')
+    with open(src_file, 'w') as fh:
+      fh.write('test_contents')
+
+    self.task.output_manager.save_local_file(src_file, None)
+    self.task.output_manager.save_local_file(src_file, None)
+    self.assertEqual(remote_writer.copy_to.call_count, 2)
+    self.assertTrue(os.path.exists(src_file))
+
+  def testSaveDeferred(self):
+    """Test that deferred saves are only written by save_deferred."""
+    # Set path to None so we don't try to initialize GCS outout writer.
+    config.GCS_OUTPUT_PATH = None
+    self.task.output_manager.setup(self.task.name, self.task.id)
+    tmp_dir, local_dir = self.task.output_manager.get_local_output_dirs()
+    self.task.result = mock.MagicMock()
+    self.task.result.saved_paths = []
+    src_file = os.path.join(tmp_dir, 'test-file.out')
+    dst_file = os.path.join(local_dir, 'test-file.out')
+    with open(src_file, 'w') as fh:
+      fh.write('test_contents')
+
+    self.task.output_manager.defer_saves = True
+    self.task.output_manager.save_local_file(src_file, self.task.result)
+    self.assertFalse(os.path.exists(dst_file))
+    self.assertEqual(self.task.result.saved_paths, [])
+
+    errors = self.task.output_manager.save_deferred()
+    self.assertEqual(errors, [])
+    self.assertTrue(os.path.exists(dst_file))
+    self.assertIn(dst_file, self.task.result.saved_paths)
+    self.assertFalse(self.task.output_manager.defer_saves)
+
+  def testSaveDeferredErrors(self):
+    """Test that errors from deferred saves are returned."""
+    config.GCS_OUTPUT_PATH = None
+    self.task.output_manager.setup(self.task.name, self.task.id)
+    self.task.output_manager.defer_saves = True
+    test_evidence = evidence.Evidence()
+    test_evidence.local_path = '/does/not/exist'
+    test_evidence.save_metadata = True
+    test_evidence.config = {}
+    self.task.output_manager.save_evidence(test_evidence)
+
+    errors = self.task.output_manager.save_deferred()
+    self.assertEqual(len(errors), 1)
+
+  def testSaveDeferredOrder(self):
+    """Test that deferred saves of the same file are run in order."""
+    saved = []
+
+    def _save(path, name, delay):
+      time.sleep(delay)
+      saved.append((path, name))
+
+    # pylint: disable=protected-access
+    self.task.output_manager._deferred_saves = [(_save, ('/a', 'first', 0.1)),
+                                                (_save, ('/b', 'other', 0)),
+                                                (_save, ('/a', 'second', 0))]
+    self.assertEqual(self.task.output_manager.save_deferred(), [])
+    self.assertEqual([name for path, name in saved if path == '/a'],
+                     ['first', 'second'])
+    self.assertEqual(len(saved), 3)
+
   def testSaveEvidence(self):
     """Test the save_evidence method."""
     # Set path to None so we don't try to initialize GCS outout writer.
@@ -120,6 +292,8 @@ class TestLocalOutputManager(unittest.TestCase):
     with open(src_file, 'w') as fh:
       fh.write(test_contents)
     test_evidence.local_path = src_file
+    # TurbiniaTaskResult.close() records the source path before saving.
+    self.task.result.saved_paths = [src_file]
 
     self.assertFalse(os.path.exists(dst_file))
     return_evidence = self.task.output_manager.save_evidence(
@@ -127,6 +301,10 @@ class TestLocalOutputManager(unittest.TestCase):
     self.assertTrue(os.path.exists(dst_file))
     self.assertIsInstance(return_evidence, evidence.Evidence)
     self.assertIn(dst_file, return_evidence.saved_path)
+    self.assertEqual(self.task.result.saved_paths, [src_file, dst_file])
+    # The temp file is linked rather than moved so it can be saved again.
+    self.assertTrue(os.path.samefile(src_file, dst_file))
+    self.assertEqual(return_evidence.local_path, dst_file)
     # Makes sure evidence without save_metadata set does not generate a
     # metadata file
     self.assertFalse(os.path.exists('{0:s}.metadata.json'.format(dst_file)))
@@ -206,6 +384,72 @@ class TestLocalOutputWriter(unittest.TestCase):
     self.assertTrue(os.path.exists(dst))
     self.assertEqual(contents, open(dst).read())
 
+  def testWriteHardlinkTmpFile(self):
+    """Test that files in the Task temp dir are hardlinked, not moved."""
+    writer = output_manager.LocalOutputWriter(
+        base_output_dir=self.base_output_dir, unique_dir='unique_dir')
+    output_dir = writer.create_output_dir()
+    self.remove_dirs.append(output_dir)
+    self.remove_dirs.append(writer.tmp_dir)
+    src = os.path.join(writer.tmp_dir, 'test.txt')
+    dst = os.path.join(output_dir, 'test.txt')
+    self.remove_files.append(src)
+    self.remove_files.append(dst)
+    with open(src, 'w') as file_handle:
+      file_handle.write('test contents')
+
+    self.assertEqual(writer.copy_to(src), dst)
+    self.assertTrue(os.path.samefile(src, dst))
+    self.assertEqual('test contents', open(dst).read())
+    self.assertEqual(writer.copy_methods[dst], 'hardlink')
+    # Saving the same file again leaves the source in place.
+    self.assertIsNone(writer.copy_to(src))
+    self.assertTrue(os.path.exists(src))
+
+  def testWriteNoLinkOutsideTmpDir(self):
+    """Test that files outside the Task temp dir are copied, not linked."""
+    writer = output_manager.LocalOutputWriter(
+        base_output_dir=self.base_output_dir, unique_dir='unique_dir')
+    output_dir = writer.create_output_dir()
+    self.remove_dirs.append(output_dir)
+    src = os.path.join(self.base_output_dir, 'test.txt')
+    dst = os.path.join(output_dir, 'test.txt')
+    self.remove_files.append(src)
+    self.remove_files.append(dst)
+    with open(src, 'w') as file_handle:
+      file_handle.write('test contents')
+
+    self.assertEqual(writer.copy_to(src), dst)
+    self.assertTrue(os.path.exists(src))
+    self.assertFalse(os.path.samefile(src, dst))
+    self.assertEqual('test contents', open(dst).read())
+    self.assertIn(
+        writer.copy_methods[dst],
+        ('reflink', 'copy_file_range', 'sendfile', 'copy'))
+
+  @mock.patch('turbinia.output_manager.fcntl.ioctl')
+  @mock.patch('turbinia.output_manager.os.link')
+  def testWriteCopyFallback(self, mock_link, mock_ioctl):
+    """Test that files are copied when links and reflinks fail."""
+    mock_link.side_effect = OSError('Cross-device link')
+    mock_ioctl.side_effect = IOError('Operation not supported')
+    writer = output_manager.LocalOutputWriter(
+        base_output_dir=self.base_output_dir, unique_dir='unique_dir')
+    output_dir = writer.create_output_dir()
+    self.remove_dirs.append(output_dir)
+    src = os.path.join(self.base_output_dir, 'test.txt')
+    dst = os.path.join(output_dir, 'test.txt')
+    self.remove_files.append(src)
+    self.remove_files.append(dst)
+    with open(src, 'w') as file_handle:
+      file_handle.write('test contents')
+
+    self.assertEqual(writer.copy_to(src), dst)
+    self.assertFalse(os.path.samefile(src, dst))
+    self.assertEqual('test contents', open(dst).read())
+    self.assertIn(
+        writer.copy_methods[dst], ('copy_file_range', 'sendfile', 'copy'))
+
   def testNoFileWrite(self):
     """Test that write fails when no source file exists."""
     test_file = 'test.txt'
@@ -240,3 +484,320 @@ class TestLocalOutputWriter(unittest.TestCase):
 
     self.assertFalse(writer.copy_to(src))
     self.assertEqual(other_contents, open(dst).read())
+
+
+class TestGCSOutputWriter(unittest.TestCase):
+  """Test GCSOutputWriter module."""
+
+  def setUp(self):
+    self.storage_save = getattr(output_manager, 'storage', None)
+    self.exceptions_save = getattr(output_manager, 'exceptions', None)
+    output_manager.storage = mock.MagicMock()
+    output_manager.exceptions = mock.MagicMock()
+    output_manager.exceptions.GoogleCloudError = IOError
+    output_manager.exceptions.RequestRangeNotSatisfiable = IOError
+    output_manager.GCSOutputWriter._clients = {}
+    output_manager.GCSOutputWriter._buckets = {}
+    self.tmp_dir = tempfile.mkdtemp(prefix='turbinia-test-gcs')
+    self.writer = output_manager.GCSOutputWriter(
+        gcs_path='gs://fake_bucket/output', unique_dir='unique_dir',
+        local_output_dir=self.tmp_dir)
+
+  def tearDown(self):
+    output_manager.storage = self.storage_save
+    output_manager.exceptions = self.exceptions_save
+    output_manager.GCSOutputWriter._clients = {}
+    output_manager.GCSOutputWriter._buckets = {}
+    shutil.rmtree(self.tmp_dir)
+
+  def testClientReuse(self):
+    """Test that storage clients and buckets are shared between writers."""
+    writer = output_manager.GCSOutputWriter(
+        gcs_path='gs://fake_bucket/output', unique_dir='other_dir',
+        local_output_dir=self.tmp_dir)
+    self.assertIs(writer.client, self.writer.client)
+    # pylint: disable=protected-access
+    self.assertIs(writer._get_bucket(), self.writer._get_bucket())
+    self.assertEqual(output_manager.storage.Client.call_count, 1)
+    self.writer.client.get_bucket.assert_not_called()
+
+  def testGetChunkSize(self):
+    """Test that chunk sizes are scaled and aligned."""
+    writer = output_manager.GCSOutputWriter
+    # pylint: disable=protected-access
+    self.assertEqual(writer._get_chunk_size(1024), writer.CHUNK_SIZE)
+    self.assertEqual(
+        writer._get_chunk_size(100 * writer.MAX_CHUNK_SIZE),
+        writer.MAX_CHUNK_SIZE)
+    chunk_size = writer._get_chunk_size(3 * writer.CHUNK_SIZE * 16 + 1)
+    self.assertEqual(chunk_size % writer.CHUNK_SIZE_MULTIPLE, 0)
+    self.assertGreater(chunk_size, writer.CHUNK_SIZE)
+
+  def testGetRanges(self):
+    """Test that files are split into contiguous ranges."""
+    writer = output_manager.GCSOutputWriter
+    # pylint: disable=protected-access
+    self.assertEqual(writer._get_ranges(1024), [(0, 1024)])
+    size = writer.MIN_PART_SIZE * (writer.MAX_PARTS + 10) + 7
+    ranges = writer._get_ranges(size)
+    self.assertEqual(len(ranges), writer.MAX_PARTS)
+    self.assertEqual(sum(length for _, length in ranges), size)
+    offset = 0
+    for start, length in ranges:
+      self.assertEqual(start, offset)
+      offset += length
+
+  def testCopyToParallel(self):
+    """Test that large files are uploaded in parts and composed."""
+    src = os.path.join(self.tmp_dir, 'test.out')
+    with open(src, 'wb') as file_handle:
+      file_handle.write(b'A' * 100)
+    ranges = [(0, 40), (40, 40), (80, 20)]
+    # pylint: disable=protected-access
+    with mock.patch.object(self.writer, '_get_ranges', return_value=ranges):
+      with mock.patch.object(self.writer, '_upload_part') as upload_part:
+        path = self.writer.copy_to(src)
+
+    self.assertEqual(path, 'gs://fake_bucket/output/unique_dir/test.out')
+    self.assertEqual(upload_part.call_count, 3)
+    offsets = sorted((c[0][3], c[0][4]) for c in upload_part.call_args_list)
+    self.assertEqual(offsets, ranges)
+    output_manager.storage.Blob.return_value.compose.assert_called_once()
+    self.assertEqual(upload_part.return_value.delete.call_count, 3)
+
+  def testCopyToParallelPartFailure(self):
+    """Test that uploaded parts are deleted when another part fails."""
+    src = os.path.join(self.tmp_dir, 'test.out')
+    with open(src, 'wb') as file_handle:
+      file_handle.write(b'A' * 100)
+    ranges = [(0, 40), (40, 40), (80, 20)]
+    part_blob = mock.MagicMock()
+
+    def _upload_part(bucket, source_path, part_path, offset, length):
+      # pylint: disable=unused-argument
+      if offset == 40:
+        raise IOError('Upload failed')
+      return part_blob
+
+    # pylint: disable=protected-access
+    with mock.patch.object(self.writer, '_get_ranges', return_value=ranges):
+      with mock.patch.object(self.writer, '_upload_part', _upload_part):
+        self.assertRaises(TurbiniaException, self.writer.copy_to, src)
+
+    output_manager.storage.Blob.return_value.compose.assert_not_called()
+    self.assertEqual(part_blob.delete.call_count, 2)
+
+
+class TestLocalDedupOutputWriter(unittest.TestCase):
+  """Test LocalDedupOutputWriter module."""
+
+  def setUp(self):
+    self.base_output_dir = tempfile.mkdtemp(prefix='turbinia-test-dedup')
+    self.source_dir = tempfile.mkdtemp(prefix='turbinia-test-source')
+
+  def tearDown(self):
+    shutil.rmtree(self.base_output_dir)
+    shutil.rmtree(self.source_dir)
+
+  def _write_source(self, name, contents):
+    """Writes a test source file."""
+    path = os.path.join(self.source_dir, name)
+    with open(path, 'w') as file_handle:
+      file_handle.write(contents)
+    return path
+
+  def testIdenticalFilesShareBlob(self):
+    """Test that identical files from different Tasks share one blob."""
+    writer1 = output_manager.LocalDedupOutputWriter(
+        base_output_dir=self.base_output_dir, unique_dir='task1')
+    writer2 = output_manager.LocalDedupOutputWriter(
+        base_output_dir=self.base_output_dir, unique_dir='task2')
+    dst1 = writer1.copy_to(self._write_source('config.xml', 'contents'))
+    dst2 = writer2.copy_to(self._write_source('config2.xml', 'contents'))
+
+    self.assertTrue(os.path.samefile(dst1, dst2))
+    self.assertEqual(writer1.copy_methods[dst1], 'blob')
+    blobs = [
+        f for _, _, files in os.walk(writer1.blob_dir) for f in files
+        if f != writer1.INDEX_FILE
+    ]
+    self.assertEqual(len(blobs), 1)
+
+    index_path = os.path.join(writer1.blob_dir, writer1.INDEX_FILE)
+    with open(index_path) as index:
+      entries = [json.loads(line) for line in index]
+    self.assertEqual(len(entries), 2)
+    self.assertEqual(entries[0]['sha256'], entries[1]['sha256'])
+    self.assertEqual(entries[1]['path'], dst2)
+
+  def testDeduplicateFileInOutputDir(self):
+    """Test that files written into the output dir are deduplicated."""
+    writer1 = output_manager.LocalDedupOutputWriter(
+        base_output_dir=self.base_output_dir, unique_dir='task1')
+    writer2 = output_manager.LocalDedupOutputWriter(
+        base_output_dir=self.base_output_dir, unique_dir='task2')
+    dst1 = writer1.copy_to(self._write_source('file.bin', 'contents'))
+    local_file = os.path.join(writer2.local_output_dir, 'file.bin')
+    with open(local_file, 'w') as file_handle:
+      file_handle.write('contents')
+
+    self.assertIsNone(writer2.copy_to(local_file))
+    self.assertTrue(os.path.samefile(dst1, local_file))
+    self.assertEqual(open(local_file).read(), 'contents')
+
+  def testSourceNotLinked(self):
+    """Test that blobs are copies that don't change the source file."""
+    writer = output_manager.LocalDedupOutputWriter(
+        base_output_dir=self.base_output_dir, unique_dir='task1')
+    source = self._write_source('file.bin', 'contents')
+    os.chmod(source, 0o640)
+    dst = writer.copy_to(source)
+
+    self.assertFalse(os.path.samefile(source, dst))
+    self.assertEqual(os.stat(source).st_mode & 0o777, 0o640)
+    with open(source, 'w') as file_handle:
+      file_handle.write('changed')
+    self.assertEqual(open(dst).read(), 'contents')
+
+  def testTmpFileCopied(self):
+    """Test that blobs for Task temp files are copies instead of links."""
+    writer = output_manager.LocalDedupOutputWriter(
+        base_output_dir=self.base_output_dir, unique_dir='task1')
+    self.addCleanup(shutil.rmtree, writer.tmp_dir)
+    source = os.path.join(writer.tmp_dir, 'file.bin')
+    with open(source, 'w') as file_handle:
+      file_handle.write('contents')
+    dst = writer.copy_to(source)
+
+    self.assertNotEqual(os.stat(source).st_ino, os.stat(dst).st_ino)
+    self.assertEqual(writer.copy_methods[dst], 'blob')
+    # Writing to the temp file must not change the saved output.
+    with open(source, 'w') as file_handle:
+      file_handle.write('changed')
+    self.assertEqual(open(dst).read(), 'contents')
+
+  def testCollectGarbage(self):
+    """Test that only blobs without output links are removed."""
+    writer1 = output_manager.LocalDedupOutputWriter(
+        base_output_dir=self.base_output_dir, unique_dir='task1')
+    writer2 = output_manager.LocalDedupOutputWriter(
+        base_output_dir=self.base_output_dir, unique_dir='task2')
+    dst1 = writer1.copy_to(self._write_source('file1.bin', 'contents1'))
+    dst2 = writer2.copy_to(self._write_source('file2.bin', 'contents2'))
+
+    shutil.rmtree(writer1.local_output_dir)
+    self.assertEqual(
+        output_manager.LocalDedupOutputWriter.collect_garbage(
+            self.base_output_dir), len('contents1'))
+    blobs = [
+        f for _, _, files in os.walk(writer1.blob_dir) for f in files
+        if f != writer1.INDEX_FILE
+    ]
+    self.assertEqual(len(blobs), 1)
+    self.assertFalse(os.path.exists(dst1))
+    self.assertEqual(open(dst2).read(), 'contents2')
+
+
+class TestGCSDedupOutputWriter(unittest.TestCase):
+  """Test GCSDedupOutputWriter module."""
+
+  def setUp(self):
+    self.storage_save = getattr(output_manager, 'storage', None)
+    self.exceptions_save = getattr(output_manager, 'exceptions', None)
+    output_manager.storage = mock.MagicMock()
+    output_manager.exceptions = mock.MagicMock()
+    output_manager.exceptions.GoogleCloudError = IOError
+    output_manager.GCSOutputWriter._clients = {}
+    output_manager.GCSOutputWriter._buckets = {}
+    self.tmp_dir = tempfile.mkdtemp(prefix='turbinia-test-gcs')
+    self.writer = output_manager.GCSDedupOutputWriter(
+        gcs_path='gs://fake_bucket/output', unique_dir='unique_dir',
+        local_output_dir=self.tmp_dir)
+    self.source = os.path.join(self.tmp_dir, 'test.out')
+    with open(self.source, 'wb') as file_handle:
+      file_handle.write(b'test contents')
+
+  def tearDown(self):
+    output_manager.storage = self.storage_save
+    output_manager.exceptions = self.exceptions_save
+    output_manager.GCSOutputWriter._clients = {}
+    output_manager.GCSOutputWriter._buckets = {}
+    shutil.rmtree(self.tmp_dir)
+
+  def _get_indexed_blob(self, digest):
+    """Gets a mock output object with the given content hash."""
+    blob = mock.MagicMock()
+    blob.name = 'output/other_dir/other.out'
+    blob.metadata = {self.writer.SHA256_METADATA_KEY: digest}
+    return blob
+
+  def testCopyToExistingObject(self):
+    """Test that indexed contents are copied, not uploaded again."""
+    # pylint: disable=protected-access
+    bucket = self.writer._get_bucket()
+    digest = output_manager._hash_file(self.source)
+    entry = mock.MagicMock()
+    entry.name = 'output/index/{0:s}/other_dir/other.out'.format(digest)
+    bucket.list_blobs.return_value = [entry]
+    existing_blob = self._get_indexed_blob(digest)
+    bucket.get_blob.return_value = existing_blob
+    destination_blob = output_manager.storage.Blob.return_value
+    destination_blob.rewrite.side_effect = [('token', 1, 2), (None, 2, 2)]
+    with mock.patch.object(self.writer, '_upload') as upload:
+      path = self.writer.copy_to(self.source)
+    upload.assert_not_called()
+    self.assertEqual(path, 'gs://fake_bucket/output/unique_dir/test.out')
+    bucket.list_blobs.assert_called_with(
+        prefix='output/index/{0:s}/'.format(digest), client=self.writer.client)
+    bucket.get_blob.assert_called_with(
+        'output/other_dir/other.out', client=self.writer.client)
+    self.assertEqual(destination_blob.rewrite.call_count, 2)
+    destination_blob.rewrite.assert_called_with(
+        existing_blob, token='token', client=self.writer.client)
+    self.assertEqual(
+        destination_blob.metadata, {self.writer.SHA256_METADATA_KEY: digest})
+    output_manager.storage.Blob.assert_called_with(
+        'output/index/{0:s}/unique_dir/test.out'.format(digest), bucket)
+    entry_data = json.loads(destination_blob.upload_from_string.call_args[0][0])
+    self.assertEqual(entry_data['path'], path)
+    self.assertEqual(entry_data['sha256'], digest)
+
+  def testCopyToNewObject(self):
+    """Test that contents that aren't indexed are uploaded."""
+    # pylint: disable=protected-access
+    bucket = self.writer._get_bucket()
+    entry = mock.MagicMock()
+    entry.name = 'output/index/abc/other_dir/other.out'
+    bucket.list_blobs.return_value = [entry]
+    # The indexed object was overwritten with different contents.
+    bucket.get_blob.return_value = self._get_indexed_blob('abc')
+    destination_blob = output_manager.storage.Blob.return_value
+    with mock.patch.object(self.writer, '_upload') as upload:
+      self.writer.copy_to(self.source)
+    upload.assert_called_once()
+    self.assertEqual(upload.call_args[0][1], 'output/unique_dir/test.out')
+    destination_blob.rewrite.assert_not_called()
+    destination_blob.patch.assert_called_once()
+    destination_blob.upload_from_string.assert_called_once()
+
+  def testCollectGarbage(self):
+    """Test that index entries of missing or changed objects are removed."""
+    client = output_manager.storage.Client.return_value
+    bucket = client.bucket.return_value
+    entries = []
+    for name in ('kept', 'missing', 'changed'):
+      entry = mock.MagicMock()
+      entry.name = 'output/index/abc/task/{0:s}'.format(name)
+      entries.append(entry)
+    bucket.list_blobs.return_value = entries
+    bucket.get_blob.side_effect = [
+        self._get_indexed_blob('abc'), None,
+        self._get_indexed_blob('def')
+    ]
+    removed = output_manager.GCSDedupOutputWriter.collect_garbage(
+        'gs://fake_bucket/output')
+    self.assertEqual(removed, 2)
+    entries[0].delete.assert_not_called()
+    entries[1].delete.assert_called_once()
+    entries[2].delete.assert_called_once()
+    bucket.get_blob.assert_any_call('output/task/missing', client=client)
@@ -19,9 +19,6 @@ from __future__ import unicode_literals
 import codecs
 import logging
 
-from six.moves import queue
-from six.moves import xrange
-
 from google.cloud import exceptions
 from google.cloud import pubsub
 
@@ -35,7 +32,6 @@ class TurbiniaPubSub(TurbiniaMessageBase):
   """PubSub client object for Google Cloud.
 
   Attributes:
-    _queue: A Queue object for storing pubsub messages
     publisher: The pubsub publisher client object
     subscriber: The pubsub subscriber client object
     subscription: The pubsub subscription object
@@ -45,7 +41,7 @@ class TurbiniaPubSub(TurbiniaMessageBase):
 
   def __init__(self, topic_name):
     """Initialization for PubSubClient."""
-    self._queue = queue.Queue()
+    super(TurbiniaPubSub, self).__init__()
     self.publisher = None
     self.subscriber = None
     self.subscription = None
@@ -88,39 +84,34 @@ class TurbiniaPubSub(TurbiniaMessageBase):
       log.debug('Subscription {0:s} already exists.'.format(subscription_path))
 
     log.debug('Setup PubSub Subscription {0:s}'.format(subscription_path))
+    # Limit the number of messages the subscriber leases at once, since they
+    # are held until their requests have been processed.
+    flow_control = pubsub.types.FlowControl(max_messages=self.prefetch)
     self.subscription = self.subscriber.subscribe(
-        subscription_path, self._callback)
+        subscription_path, self._callback, flow_control=flow_control)
 
   def _callback(self, message):
-    """Callback function that places messages in the queue.
+    """Callback function that validates messages and places them in the queue.
+
+    This is called from the subscriber threads.  Valid messages are only
+    acknowledged once their requests have been processed, and invalid messages
+    are acknowledged straight away so they are not delivered again.
 
     Args:
       message: A pubsub message object
     """
     data = codecs.decode(message.data, 'utf-8')
-    log.debug('Received pubsub message: {0:s}'.format(data))
+    log.debug(
+        'Received pubsub message {0!s}: {1:s}'.format(message.message_id, data))
+    request = self._validate_message(data)
+    if not request:
+      log.error('Error processing PubSub message: {0:s}'.format(data))
+      message.ack()
+      return
+    self._requests.put((request, message))
+
+  def _ack_message(self, message):
     message.ack()
-    self._queue.put(message)
-
-  def check_messages(self):
-    """Checks for pubsub messages.
-
-    Returns:
-      A list of any TurbiniaRequest objects received, else an empty list
-    """
-    requests = []
-    for _ in xrange(self._queue.qsize()):
-      message = self._queue.get()
-      data = message.data
-      log.info('Processing PubSub message {0:s}'.format(message.message_id))
-
-      request = self._validate_message(data)
-      if request:
-        requests.append(request)
-      else:
-        log.error('Error processing PubSub message: {0:s}'.format(data))
-
-    return requests
 
   def send_message(self, message):
     """Send a pubsub message.
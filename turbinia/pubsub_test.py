@@ -18,6 +18,7 @@ from __future__ import unicode_literals
 
 import unittest
 
+from kombu.exceptions import DecodeError
 import mock
 
 from six.moves import queue
@@ -46,8 +47,13 @@ class MockPubSubMessage(object):
   """This is a mock of a PubSub message."""
 
   def __init__(self, data='fake data', message_id='12345'):
-    self.data = data if data else ''
+    self.data = data.encode('utf-8') if data else b''
     self.message_id = message_id
+    self.acked = False
+
+  def ack(self):
+    """Acknowledges the message."""
+    self.acked = True
 
 
 class TestTurbiniaRequest(unittest.TestCase):
@@ -69,6 +75,27 @@ class TestTurbiniaRequest(unittest.TestCase):
     self.assertTrue(isinstance(request_new.evidence[0], evidence.RawDisk))
     self.assertEqual(request_new.evidence[0].name, 'My Evidence')
 
+  def testGetIdempotencyKey(self):
+    """Tests resubmitted requests get the same idempotency key."""
+    request = getTurbiniaRequest()
+    resubmitted = message.TurbiniaRequest()
+    resubmitted.from_json(getTurbiniaRequest().to_json())
+    resubmitted.request_id = 'cafebabe'
+    resubmitted.evidence[0].request_id = 'cafebabe'
+    self.assertEqual(
+        request.get_idempotency_key(), resubmitted.get_idempotency_key())
+
+    resubmitted.recipe['jobs_denylist'] = ['PlasoJob']
+    self.assertNotEqual(
+        request.get_idempotency_key(), resubmitted.get_idempotency_key())
+    other_evidence = getTurbiniaRequest()
+    other_evidence.evidence[0].source_path = '/tmp/bar'
+    self.assertNotEqual(
+        request.get_idempotency_key(), other_evidence.get_idempotency_key())
+
+    request.idempotency_key = 'key1'
+    self.assertEqual(request.get_idempotency_key(), 'key1')
+
   def testTurbiniaRequestSerializationBadData(self):
     """Tests that TurbiniaRequest will raise error on non-json data."""
     request_new = message.TurbiniaRequest()
@@ -92,9 +119,9 @@ class TestTurbiniaPubSub(unittest.TestCase):
   def setUp(self):
     request = getTurbiniaRequest()
     self.pubsub = pubsub.TurbiniaPubSub('fake_topic')
-    pub_sub_message = MockPubSubMessage(request.to_json(), 'msg id')
+    self.pub_sub_message = MockPubSubMessage(request.to_json(), 'msg id')
     # pylint: disable=protected-access
-    self.pubsub._queue.put(pub_sub_message)
+    self.pubsub._callback(self.pub_sub_message)
     self.pubsub.topic_path = 'faketopicpath'
 
   def testCheckMessages(self):
@@ -115,10 +142,29 @@ class TestTurbiniaPubSub(unittest.TestCase):
     pub_sub_message = MockPubSubMessage('non-json-data', 'msg id2')
     # Clear the queue so we can add an invalid message
     # pylint: disable=protected-access
-    self.pubsub._queue.get()
-    self.pubsub._queue.put(pub_sub_message)
+    self.pubsub._requests.get()
+    self.pubsub._callback(pub_sub_message)
 
     self.assertListEqual(self.pubsub.check_messages(), [])
+    # Invalid messages are dropped straight away.
+    self.assertTrue(pub_sub_message.acked)
+
+  def testAckRequests(self):
+    """Test messages are only acknowledged after processing."""
+    results = self.pubsub.check_messages()
+    self.assertFalse(self.pub_sub_message.acked)
+    self.pubsub.ack_requests(results)
+    self.assertTrue(self.pub_sub_message.acked)
+
+  def testCheckMessagesBatchSize(self):
+    """Test check_messages returns at most batch_size requests."""
+    self.pubsub.batch_size = 2
+    for _ in range(2):
+      # pylint: disable=protected-access
+      self.pubsub._callback(
+          MockPubSubMessage(getTurbiniaRequest().to_json(), 'msg id'))
+    self.assertEqual(len(self.pubsub.check_messages()), 2)
+    self.assertEqual(len(self.pubsub.check_messages()), 1)
 
   def testSendMessage(self):
     """Test sending a message."""
@@ -143,6 +189,8 @@ class TestTurbiniaKombu(unittest.TestCase):
 
   def testCheckMessages(self):
     """Test check_messages method."""
+    # pylint: disable=protected-access
+    self.assertEqual(self.kombu._fetch_messages(), 1)
     results = self.kombu.check_messages()
     self.assertTrue(len(results) == 1)
     request_new = results[0]
@@ -160,4 +208,63 @@ class TestTurbiniaKombu(unittest.TestCase):
     result.payload = 'non-json-data'
     self.kombu.queue.get.side_effect = [result, queue.Empty('Empty Queue')]
 
+    # pylint: disable=protected-access
+    self.kombu._fetch_messages()
     self.assertListEqual(self.kombu.check_messages(), [])
+    result.ack.assert_called_once_with()
+
+  def testUndecodableMessage(self):
+    """Test messages that can't be decoded are rejected."""
+    result = mock.MagicMock()
+    type(result).payload = mock.PropertyMock(
+        side_effect=DecodeError('Bad payload'))
+    good_result = mock.MagicMock()
+    good_result.payload = getTurbiniaRequest().to_json()
+    self.kombu.queue.get.side_effect = [
+        result, good_result, queue.Empty('Empty Queue')
+    ]
+
+    # pylint: disable=protected-access
+    self.assertEqual(self.kombu._fetch_messages(), 2)
+    result.reject.assert_called_once_with()
+    result.ack.assert_not_called()
+    self.assertEqual(len(self.kombu.check_messages()), 1)
+
+  @mock.patch('turbinia.celery.time.sleep')
+  def testConsumeRetriesErrors(self, mock_sleep):
+    """Test the consumer thread keeps fetching after unexpected errors."""
+    # pylint: disable=protected-access
+    self.kombu._fetch_messages = mock.MagicMock(
+        side_effect=[RuntimeError('Unexpected'), 0,
+                     KeyboardInterrupt()])
+    self.assertRaises(KeyboardInterrupt, self.kombu._consume)
+    self.assertEqual(self.kombu._fetch_messages.call_count, 3)
+    mock_sleep.assert_called_with(self.kombu.POLL_INTERVAL)
+
+  def testCheckMessagesDeadConsumer(self):
+    """Test check_messages reports a consumer thread that has stopped."""
+    # pylint: disable=protected-access
+    self.kombu._consumer_thread = mock.MagicMock()
+    self.kombu._consumer_thread.is_alive.return_value = False
+    self.assertRaises(TurbiniaException, self.kombu.check_messages)
+
+  def testAckRequests(self):
+    """Test messages are acknowledged by the consumer after processing."""
+    # pylint: disable=protected-access
+    self.kombu._fetch_messages()
+    result = self.kombu._requests.queue[0][1]
+    results = self.kombu.check_messages()
+    self.kombu.ack_requests(results)
+    result.ack.assert_not_called()
+    self.kombu.queue.get.side_effect = queue.Empty('Empty Queue')
+    self.kombu._fetch_messages()
+    result.ack.assert_called_once_with()
+
+  def testFetchMessagesPrefetch(self):
+    """Test no more than prefetch requests are queued."""
+    # pylint: disable=protected-access
+    self.kombu._requests = queue.Queue(maxsize=1)
+    self.kombu.queue.get.side_effect = None
+    self.kombu.queue.get.return_value.payload = getTurbiniaRequest().to_json()
+    self.assertEqual(self.kombu._fetch_messages(), 1)
+    self.assertEqual(self.kombu._fetch_messages(), 0)
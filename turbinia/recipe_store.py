@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Interning of request recipes in Task messages and results.
+
+All of the Evidence in a request is processed with the same recipe (the
+Evidence config), so rather than sending the full recipe with every Task and
+result, large recipes are stored once in the state backend under the SHA256
+hash of their contents.  Serialized Evidence then only carries a reference
+with that hash, which doubles as the recipe ID, and the server and workers
+cache the recipes they have fetched.  Stored recipes expire after the recipe
+retention time, which the server extends while it keeps sending them.
+"""
+
+from __future__ import unicode_literals
+
+import collections
+import copy
+import hashlib
+import json
+import logging
+import time
+
+from turbinia import config
+from turbinia import state_manager
+from turbinia import TurbiniaException
+
+log = logging.getLogger('turbinia')
+
+# Key of the reference that replaces an interned recipe.
+RECIPE_REF_KEY = 'turbinia_recipe_sha256'
+
+# Number of days to keep recipes for when RECIPE_RETENTION_DAYS isn't set.
+DEFAULT_RETENTION_DAYS = 30
+
+_RECIPE_STORE = None
+
+
+def get_recipe_store():
+  """Gets the recipe store for this process.
+
+  Returns:
+    RecipeStore: The recipe store.
+  """
+  global _RECIPE_STORE
+  if _RECIPE_STORE is None:
+    _RECIPE_STORE = RecipeStore()
+  return _RECIPE_STORE
+
+
+def get_retention():
+  """Gets how long stored recipes are kept for.
+
+  Returns:
+    int: The retention time in seconds.
+  """
+  config.LoadConfig()
+  days = config.RECIPE_RETENTION_DAYS or DEFAULT_RETENTION_DAYS
+  return int(days * 86400)
+
+
+def is_recipe_ref(recipe):
+  """Checks whether a recipe is a reference to an interned recipe.
+
+  Args:
+    recipe (dict): The recipe or reference.
+
+  Returns:
+    bool: True if this is a reference.
+  """
+  return isinstance(recipe, dict) and list(recipe) == [RECIPE_REF_KEY]
+
+
+class RecipeStore(object):
+  """Interns recipes in the state backend and caches them locally.
+
+  Attributes:
+    retention (int): Seconds to keep stored recipes for.
+    threshold (int): Recipes of at least this many bytes of JSON are interned,
+        or None to not intern recipes.
+  """
+
+  # Maximum number of recipes to keep in the local cache.
+  MAX_CACHED_RECIPES = 100
+
+  def __init__(self, state_manager_=None, threshold=None):
+    config.LoadConfig()
+    self.threshold = threshold or config.RECIPE_INTERN_THRESHOLD
+    self.retention = get_retention()
+    self._state_manager = state_manager_
+    # Recipe hashes mapped to recipes, least recently used first.
+    self._recipes = collections.OrderedDict()
+    # Recipe hashes mapped to the time we last stored them.
+    self._written = {}
+
+  @property
+  def state_manager(self):
+    """Gets the state manager the recipes are stored with."""
+    if self._state_manager is None:
+      self._state_manager = state_manager.get_state_manager()
+    return self._state_manager
+
+  def _cache(self, recipe_hash, recipe):
+    """Adds a recipe to the local cache.
+
+    Args:
+      recipe_hash (str): The SHA256 hex digest of the recipe.
+      recipe (dict): The recipe.
+    """
+    self._recipes[recipe_hash] = recipe
+    while len(self._recipes) > self.MAX_CACHED_RECIPES:
+      evicted_hash, _ = self._recipes.popitem(last=False)
+      self._written.pop(evicted_hash, None)
+
+  def intern(self, recipe):
+    """Stores a recipe if it is large enough to be worth interning.
+
+    Args:
+      recipe (dict): The recipe.
+
+    Returns:
+      dict: A reference to the interned recipe, or the recipe itself if it is
+          not interned.
+    """
+    if not self.threshold or not recipe or is_recipe_ref(recipe):
+      return recipe
+    data = json.dumps(recipe, sort_keys=True)
+    if len(data) < self.threshold:
+      return recipe
+
+    recipe_hash = hashlib.sha256(data.encode('utf-8')).hexdigest()
+    # The recipe is stored again once half of its retention time has passed,
+    # so that it doesn't expire while it is still being sent.
+    written = self._written.get(recipe_hash)
+    if written is not None and time.time() - written < self.retention / 2:
+      self._recipes[recipe_hash] = self._recipes.pop(recipe_hash)
+    else:
+      log.debug(
+          'Storing {0:d} byte recipe {1:s}'.format(len(data), recipe_hash))
+      self.state_manager.write_recipe(recipe_hash, data, self.retention)
+      self._recipes.pop(recipe_hash, None)
+      self._cache(recipe_hash, json.loads(data))
+      self._written[recipe_hash] = time.time()
+    return {RECIPE_REF_KEY: recipe_hash}
+
+  def resolve(self, recipe):
+    """Gets the recipe that a reference refers to.
+
+    Args:
+      recipe (dict): The recipe or reference.
+
+    Returns:
+      dict: The recipe.
+
+    Raises:
+      TurbiniaException: When the recipe doesn't exist or fails verification.
+    """
+    if not is_recipe_ref(recipe):
+      return recipe
+    recipe_hash = recipe[RECIPE_REF_KEY]
+    if recipe_hash in self._recipes:
+      self._recipes[recipe_hash] = self._recipes.pop(recipe_hash)
+    else:
+      data = self.state_manager.read_recipe(recipe_hash)
+      if data is None:
+        raise TurbiniaException(
+            'Recipe {0:s} does not exist'.format(recipe_hash))
+      if hashlib.sha256(data.encode('utf-8')).hexdigest() != recipe_hash:
+        raise TurbiniaException(
+            'Recipe {0:s} failed hash verification'.format(recipe_hash))
+      self._cache(recipe_hash, json.loads(data))
+    # Tasks may change their recipe, so they get their own copy.
+    return copy.deepcopy(self._recipes[recipe_hash])
+
+  def intern_evidence(self, evidence_dict):
+    """Interns the recipes of serialized Evidence and its parents.
+
+    Args:
+      evidence_dict (dict): The serialized Evidence.  This is changed in place.
+
+    Returns:
+      dict: The serialized Evidence.
+    """
+    parent = evidence_dict
+    while isinstance(parent, dict):
+      parent['config'] = self.intern(parent.get('config'))
+      parent = parent.get('parent_evidence')
+    return evidence_dict
+
+  def resolve_evidence(self, evidence_dict):
+    """Replaces recipe references in serialized Evidence and its parents.
+
+    Args:
+      evidence_dict (dict): The serialized Evidence.  This is changed in place.
+
+    Returns:
+      dict: The serialized Evidence.
+
+    Raises:
+      TurbiniaException: When a recipe can't be resolved.
+    """
+    parent = evidence_dict
+    while isinstance(parent, dict):
+      parent['config'] = self.resolve(parent.get('config'))
+      parent = parent.get('parent_evidence')
+    return evidence_dict
+
+  def serialize_evidence(self, evidence_):
+    """Serializes Evidence with its recipes interned.
+
+    Args:
+      evidence_ (Evidence): The Evidence to serialize.
+
+    Returns:
+      dict: The serialized Evidence.
+    """
+    return self.intern_evidence(evidence_.serialize())
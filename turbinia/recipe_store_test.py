@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the recipe store."""
+
+from __future__ import unicode_literals
+
+import unittest
+
+import mock
+
+from turbinia import evidence
+from turbinia import recipe_store
+from turbinia import TurbiniaException
+
+
+class TestRecipeStore(unittest.TestCase):
+  """Test RecipeStore class."""
+
+  def setUp(self):
+    self.recipes = {}
+    self.state_manager = mock.MagicMock()
+    self.state_manager.write_recipe.side_effect = (
+        lambda recipe_hash, recipe, _: self.recipes.setdefault(
+            recipe_hash, recipe))
+    self.state_manager.read_recipe.side_effect = self.recipes.get
+    self.store = recipe_store.RecipeStore(self.state_manager, threshold=100)
+    self.recipe = {'jobs_denylist': ['PlasoJob'], 'filter': 'x' * 100}
+
+  def testInternAndResolve(self):
+    """Tests large recipes are stored once and resolved by reference."""
+    ref = self.store.intern(self.recipe)
+    self.assertTrue(recipe_store.is_recipe_ref(ref))
+    self.assertEqual(self.store.intern(dict(self.recipe)), ref)
+    self.assertEqual(self.state_manager.write_recipe.call_count, 1)
+
+    # A new store (e.g. on a worker) fetches the recipe once.
+    store = recipe_store.RecipeStore(self.state_manager, threshold=100)
+    self.assertEqual(store.resolve(ref), self.recipe)
+    store.resolve(ref)['jobs_denylist'].append('StringsJob')
+    self.assertEqual(store.resolve(ref), self.recipe)
+    self.assertEqual(self.state_manager.read_recipe.call_count, 1)
+
+  @mock.patch('turbinia.recipe_store.time.time')
+  def testRetention(self, mock_time):
+    """Tests recipes are stored again before they expire."""
+    mock_time.return_value = 1000.0
+    ref = self.store.intern(self.recipe)
+    self.state_manager.write_recipe.assert_called_once_with(
+        ref[recipe_store.RECIPE_REF_KEY], mock.ANY, self.store.retention)
+    mock_time.return_value += self.store.retention / 2 - 1
+    self.store.intern(self.recipe)
+    self.assertEqual(self.state_manager.write_recipe.call_count, 1)
+    mock_time.return_value += 1
+    self.assertEqual(self.store.intern(self.recipe), ref)
+    self.assertEqual(self.state_manager.write_recipe.call_count, 2)
+
+  def testSmallRecipes(self):
+    """Tests small recipes aren't interned."""
+    small = {'jobs_denylist': []}
+    self.assertEqual(self.store.intern(small), small)
+    self.assertEqual(self.store.resolve(small), small)
+    self.assertIsNone(self.store.intern(None))
+    with mock.patch.object(self.store, 'threshold', None):
+      self.assertEqual(self.store.intern(self.recipe), self.recipe)
+    self.state_manager.write_recipe.assert_not_called()
+
+  def testResolveErrors(self):
+    """Tests missing and modified recipes can't be resolved."""
+    ref = {recipe_store.RECIPE_REF_KEY: 'abc123'}
+    self.assertRaises(TurbiniaException, self.store.resolve, ref)
+    self.recipes['abc123'] = '{"jobs_denylist": []}'
+    self.assertRaises(TurbiniaException, self.store.resolve, ref)
+
+  def testCacheSize(self):
+    """Tests the least recently used recipes are dropped from the cache."""
+    self.store.MAX_CACHED_RECIPES = 2
+    refs = []
+    for i in range(3):
+      self.recipe['filter'] = str(i) * 100
+      refs.append(self.store.intern(self.recipe))
+    self.assertEqual(len(self.store._recipes), 2)  # pylint: disable=protected-access
+    self.store.resolve(refs[0])
+    self.assertEqual(self.state_manager.read_recipe.call_count, 1)
+
+  def testEvidence(self):
+    """Tests the recipes of Evidence and its parents are interned."""
+    parent = evidence.RawDisk(source_path='/path/disk.raw')
+    parent.config = self.recipe
+    evidence_ = evidence.PlasoFile(source_path='/path/plaso.file')
+    evidence_.config = self.recipe
+    evidence_.parent_evidence = parent
+    evidence_dict = self.store.serialize_evidence(evidence_)
+    self.assertTrue(recipe_store.is_recipe_ref(evidence_dict['config']))
+    self.assertTrue(
+        recipe_store.is_recipe_ref(evidence_dict['parent_evidence']['config']))
+    self.assertEqual(evidence_.config, self.recipe)
+
+    decoded = evidence.evidence_decode(
+        self.store.resolve_evidence(evidence_dict))
+    self.assertEqual(decoded.config, self.recipe)
+    self.assertEqual(decoded.parent_evidence.config, self.recipe)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,496 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Manages worker disk space used by Task temp and output directories."""
+
+from __future__ import unicode_literals
+
+import errno
+import json
+import logging
+import os
+import shutil
+import socket
+import time
+
+from turbinia import config
+from turbinia import output_manager
+from turbinia import state_manager
+from turbinia import TurbiniaException
+
+log = logging.getLogger('turbinia')
+
+GB = 2**30
+
+
+def get_dirs_size(paths):
+  """Gets the total size of the files in a set of directories.
+
+  Files hardlinked more than once within the directories (e.g. Task temp files
+  that are linked into the output directory) are only counted once.  Files
+  that also have hardlinks outside of the directories (e.g. deduplicated
+  output that links to a shared blob) are not counted, because removing the
+  directories doesn't free them.
+
+  Args:
+    paths (list[str]): Paths to the directories.
+
+  Returns:
+    int: The size in bytes of the files only linked from the directories.
+  """
+  # Maps (device, inode) to the stat result and the links seen so far.
+  inodes = {}
+  for path in paths:
+    for root, _, files in os.walk(path):
+      for file_ in files:
+        try:
+          stat = os.lstat(os.path.join(root, file_))
+        except OSError:
+          continue
+        key = (stat.st_dev, stat.st_ino)
+        links = inodes[key][1] + 1 if key in inodes else 1
+        inodes[key] = (stat, links)
+  return sum(
+      stat.st_size for stat, links in inodes.values() if links >= stat.st_nlink)
+
+
+class SpaceManager(object):
+  """Manages disk space used by Task temp and output directories on workers.
+
+  Every Task that runs on the worker gets a usage record in the record
+  directory.  Records are marked as in use while the Task runs, and once the
+  Task has finished the size of its directories is recorded.  Records are kept
+  per host, because whether a Task is still running is checked with its process
+  ID, so hosts that share a TMP_DIR only track and evict their own Tasks.  The
+  recent sizes of each Task type are kept separately from the records so that
+  they are still used to estimate the space Tasks need after eviction.  When
+  the tracked usage goes over the TMP_DIR_QUOTA, or the free space would drop
+  below MIN_FREE_SPACE, the directories of finished Tasks are evicted starting
+  with the least recently used.  Output directories are only evicted when
+  output is also saved to GCS, because otherwise the local output is the only
+  copy.
+
+  Tasks that are still queued or running can use Evidence from the directories
+  of earlier Tasks in the same Request, so directories of Requests that have
+  unfinished Tasks in the state store are not evicted.  This is only done for
+  MAX_PIN_TIME after a Task finished, so that Tasks that never finish (e.g.
+  because their worker died) don't keep data around forever.
+
+  Attributes:
+    evict_output (bool): Whether Task output directories can be evicted.
+    min_free_space (int): Minimum free space in bytes to keep on disk.
+    quota (int): Maximum bytes that Task directories can use in total.
+    record_dir (str): Path to the directory that usage records for this host
+        are kept in.
+    tmp_dir (str): The base temp directory.
+    wait_time (int): Seconds to wait for space to become available before
+        refusing to run a Task.
+  """
+
+  RECORD_DIR = '.turbinia-space'
+  # Number of recent sizes to keep for each Task type.
+  HISTORY_LENGTH = 10
+  # Seconds to sleep between checks while waiting for space to free up.
+  POLL_INTERVAL = 10
+  # Seconds after a Task finished that its directories are kept while other
+  # Tasks in its Request are unfinished.
+  MAX_PIN_TIME = 24 * 60 * 60
+
+  def __init__(self, tmp_dir=None):
+    config.LoadConfig()
+    self.tmp_dir = tmp_dir if tmp_dir else config.TMP_DIR
+    self.record_dir = os.path.join(
+        self.tmp_dir, self.RECORD_DIR, socket.gethostname())
+    self.quota = int((config.TMP_DIR_QUOTA or 0) * GB)
+    self.min_free_space = int((config.MIN_FREE_SPACE or 0) * GB)
+    self.wait_time = config.SPACE_WAIT_TIME or 0
+    self.evict_output = bool(
+        config.GCS_OUTPUT_PATH and not config.SHARED_FILESYSTEM)
+    if not os.path.exists(self.record_dir):
+      try:
+        os.makedirs(self.record_dir)
+      except OSError as exception:
+        if exception.errno != errno.EEXIST:
+          raise TurbiniaException(
+              'Could not create space record directory {0:s}: {1!s}'.format(
+                  self.record_dir, exception))
+
+  @staticmethod
+  def enabled():
+    """Checks whether disk space management is configured.
+
+    Returns:
+      bool: True if a quota or minimum free space is configured.
+    """
+    config.LoadConfig()
+    return bool(config.TMP_DIR_QUOTA or config.MIN_FREE_SPACE)
+
+  def _get_record_path(self, task_id):
+    """Gets the path to the usage record for a Task."""
+    return os.path.join(self.record_dir, '{0:s}.json'.format(task_id))
+
+  def _read_records(self):
+    """Reads all usage records.
+
+    Returns:
+      list[dict]: The usage records.
+    """
+    records = []
+    for name in os.listdir(self.record_dir):
+      if not name.endswith('.json'):
+        continue
+      try:
+        with open(os.path.join(self.record_dir, name)) as file_handle:
+          records.append(json.load(file_handle))
+      except (IOError, OSError, ValueError) as exception:
+        log.warning(
+            'Could not read space record {0:s}: {1!s}'.format(name, exception))
+    return records
+
+  @staticmethod
+  def _write_json(path, data):
+    """Atomically writes data to a JSON file.
+
+    Args:
+      path (str): The path to write to.
+      data (object): The data to write.
+    """
+    tmp_path = '{0:s}.{1:d}.tmp'.format(path, os.getpid())
+    with open(tmp_path, 'w') as file_handle:
+      json.dump(data, file_handle)
+    os.rename(tmp_path, path)
+
+  def _write_record(self, record):
+    """Atomically writes a usage record.
+
+    Args:
+      record (dict): The usage record to write.
+    """
+    self._write_json(self._get_record_path(record['task_id']), record)
+
+  def _get_history_path(self, task_name):
+    """Gets the path to the size history for a Task type."""
+    return os.path.join(self.record_dir, '{0:s}.history'.format(task_name))
+
+  def _read_history(self, task_name):
+    """Reads the recent sizes of finished Tasks of a type.
+
+    Args:
+      task_name (str): The name of the Task.
+
+    Returns:
+      list[int]: The sizes in bytes, oldest first.
+    """
+    try:
+      with open(self._get_history_path(task_name)) as file_handle:
+        return json.load(file_handle)
+    except (IOError, OSError, ValueError):
+      return []
+
+  def _add_history(self, task_name, size):
+    """Adds the size of a finished Task to the history of its type.
+
+    Args:
+      task_name (str): The name of the Task.
+      size (int): The size in bytes of the Task directories.
+    """
+    if not task_name:
+      return
+    history = self._read_history(task_name) + [size]
+    try:
+      self._write_json(
+          self._get_history_path(task_name), history[-self.HISTORY_LENGTH:])
+    except (IOError, OSError) as exception:
+      log.warning(
+          'Could not write space history for {0:s}: {1!s}'.format(
+              task_name, exception))
+
+  def _get_dirs(self, record):
+    """Gets the directories of a record that count towards usage."""
+    dirs = [record.get('tmp_dir')]
+    if self.evict_output:
+      dirs.append(record.get('output_dir'))
+    return [d for d in dirs if d]
+
+  @staticmethod
+  def _is_in_use(record):
+    """Checks whether the Task for a usage record is still running.
+
+    Records are kept per host, so the process ID is from this host.
+
+    Args:
+      record (dict): The usage record to check.
+
+    Returns:
+      bool: True if the Task is marked as in use and its process is alive.
+    """
+    if not record.get('in_use'):
+      return False
+    try:
+      os.kill(record['pid'], 0)
+    except OSError as exception:
+      return exception.errno == errno.EPERM
+    return True
+
+  def acquire(self, task_id, task_name, tmp_dir, output_dir, request_id=None):
+    """Records that a Task is using its directories.
+
+    Each worker process only runs one Task at a time, so any other records
+    still marked in use by this process are from Tasks that returned early and
+    are released here.
+
+    Args:
+      task_id (str): The ID of the Task.
+      task_name (str): The name of the Task.
+      tmp_dir (str): The temp directory of the Task.
+      output_dir (str): The local output directory of the Task.
+      request_id (str): The ID of the Request the Task belongs to.
+    """
+    pid = os.getpid()
+    for record in self._read_records():
+      if record.get('in_use') and record.get('pid') == pid:
+        self.release(record['task_id'], record=record)
+
+    self._write_record({
+        'task_id': task_id,
+        'task_name': task_name,
+        'request_id': request_id,
+        'tmp_dir': tmp_dir,
+        'output_dir': output_dir,
+        'pid': pid,
+        'in_use': True,
+        'last_used': time.time(),
+        'size': 0
+    })
+
+  def release(self, task_id, record=None):
+    """Records that a Task has finished and how much space it is using.
+
+    Args:
+      task_id (str): The ID of the Task.
+      record (dict): The usage record of the Task if it has already been read.
+    """
+    if not record:
+      try:
+        with open(self._get_record_path(task_id)) as file_handle:
+          record = json.load(file_handle)
+      except (IOError, OSError, ValueError) as exception:
+        log.warning(
+            'Could not read space record for Task {0:s}: {1!s}'.format(
+                task_id, exception))
+        return
+
+    record['in_use'] = False
+    record['last_used'] = time.time()
+    record['size'] = get_dirs_size(self._get_dirs(record))
+    self._write_record(record)
+    self._add_history(record.get('task_name'), record['size'])
+    log.debug(
+        'Task {0:s} released {1:d} bytes of disk usage'.format(
+            task_id, record['size']))
+
+  def get_usage(self, records=None):
+    """Gets the total disk usage of all tracked Tasks.
+
+    Args:
+      records (list[dict]): Usage records to sum.  Defaults to all records.
+
+    Returns:
+      int: The usage in bytes.
+    """
+    if records is None:
+      records = self._read_records()
+    usage = 0
+    for record in records:
+      if self._is_in_use(record):
+        usage += get_dirs_size(self._get_dirs(record))
+      else:
+        usage += record.get('size', 0)
+    return usage
+
+  def get_free_space(self):
+    """Gets the free space on the temp and output filesystems.
+
+    Returns:
+      int: The lowest free space in bytes of the filesystems.
+    """
+    paths = [self.tmp_dir]
+    if config.OUTPUT_DIR and os.path.exists(config.OUTPUT_DIR):
+      paths.append(config.OUTPUT_DIR)
+    return min(shutil.disk_usage(path).free for path in paths)
+
+  def estimate_usage(self, task_name, records):
+    """Estimates the space a Task will need from previous runs.
+
+    Args:
+      task_name (str): The name of the Task.
+      records (list[dict]): The usage records.
+
+    Returns:
+      int: The largest usage in bytes of recent finished Tasks with the same
+          name, including Tasks whose data has been evicted.
+    """
+    sizes = [
+        r.get('size', 0)
+        for r in records
+        if r.get('task_name') == task_name and not r.get('in_use')
+    ]
+    sizes.extend(self._read_history(task_name))
+    return max(sizes) if sizes else 0
+
+  def _get_required_space(self, task_name, records):
+    """Gets the number of bytes that need to be freed before a Task can run.
+
+    Args:
+      task_name (str): The name of the Task to run.
+      records (list[dict]): The usage records.
+
+    Returns:
+      int: The number of bytes to free, or 0 if there is enough space.
+    """
+    estimate = self.estimate_usage(task_name, records)
+    required = 0
+    if self.quota:
+      required = max(required, self.get_usage(records) + estimate - self.quota)
+    if self.min_free_space:
+      required = max(
+          required, self.min_free_space + estimate - self.get_free_space())
+    return required
+
+  def _remove_dir(self, path):
+    """Removes a Task directory and any empty parents left behind."""
+    if not os.path.exists(path):
+      return
+    shutil.rmtree(path, ignore_errors=True)
+    base_paths = [os.path.abspath(p) for p in (self.tmp_dir, config.OUTPUT_DIR)]
+    parent = os.path.dirname(os.path.abspath(path))
+    while parent not in base_paths and parent != os.path.dirname(parent):
+      try:
+        os.rmdir(parent)
+      except OSError:
+        break
+      parent = os.path.dirname(parent)
+
+  def _get_active_requests(self, records):
+    """Gets the Requests of finished Tasks that still have unfinished Tasks.
+
+    Args:
+      records (list[dict]): Usage records of finished Tasks.
+
+    Returns:
+      set(str): The IDs of the Requests with unfinished Tasks.
+    """
+    min_last_used = time.time() - self.MAX_PIN_TIME
+    request_ids = set()
+    for record in records:
+      last_used = record.get('last_used', 0)
+      if record.get('request_id') and last_used > min_last_used:
+        request_ids.add(record['request_id'])
+    active_requests = set()
+    if not request_ids:
+      return active_requests
+
+    try:
+      state_manager_ = state_manager.get_state_manager()
+      for request_id in request_ids:
+        tasks = state_manager_.get_task_data(
+            config.INSTANCE_ID, request_id=request_id)
+        if any(task.get('successful') is None for task in tasks):
+          active_requests.add(request_id)
+    # Not being able to check shouldn't stop Tasks from running, so this
+    # falls back to evicting by age only.
+    # pylint: disable=broad-except
+    except Exception as exception:
+      log.warning(
+          'Could not check for unfinished Tasks, evicting data without '
+          'checking if it is still needed: {0!s}'.format(exception))
+    return active_requests
+
+  def evict(self, required, records=None):
+    """Evicts directories of finished Tasks, least recently used first.
+
+    Args:
+      required (int): The number of bytes to free.
+      records (list[dict]): Usage records.  Defaults to all records.
+
+    Returns:
+      int: The number of bytes freed.
+    """
+    if records is None:
+      records = self._read_records()
+    candidates = [r for r in records if not self._is_in_use(r)]
+    active_requests = self._get_active_requests(candidates)
+    if active_requests:
+      log.info(
+          'Not evicting data from {0:d} Requests with unfinished Tasks'.format(
+              len(active_requests)))
+      candidates = [
+          r for r in candidates if r.get('request_id') not in active_requests
+      ]
+    candidates.sort(key=lambda r: r.get('last_used', 0))
+
+    freed = 0
+    for record in candidates:
+      if freed >= required:
+        break
+      size = get_dirs_size(self._get_dirs(record))
+      log.info(
+          'Evicting {0:d} bytes of data from Task {1:s} {2:s}'.format(
+              size, record.get('task_name'), record['task_id']))
+      for path in self._get_dirs(record):
+        self._remove_dir(path)
+      try:
+        os.remove(self._get_record_path(record['task_id']))
+      except OSError:
+        pass
+      freed += size
+
+    # Deduplicated output is only freed once no output directory links to its
+    # blob anymore.
+    if freed < required and self.evict_output and config.OUTPUT_DEDUPLICATION:
+      freed += output_manager.LocalDedupOutputWriter.collect_garbage(
+          config.OUTPUT_DIR)
+    return freed
+
+  def ensure_space(self, task_name):
+    """Makes sure there is enough disk space for a Task to run.
+
+    Directories from finished Tasks are evicted as needed, and if that does
+    not free enough space we wait up to SPACE_WAIT_TIME seconds for other Tasks
+    to finish.
+
+    Args:
+      task_name (str): The name of the Task to run.
+
+    Raises:
+      TurbiniaException: If there is not enough space to run the Task.
+    """
+    start_time = time.time()
+    while True:
+      records = self._read_records()
+      required = self._get_required_space(task_name, records)
+      if required <= 0:
+        return
+      freed = self.evict(required, records)
+      if freed >= required:
+        return
+      if time.time() - start_time >= self.wait_time:
+        raise TurbiniaException(
+            'Not enough disk space to run {0:s}: {1:d} more bytes are needed '
+            'after evicting {2:d} bytes'.format(
+                task_name, required - freed, freed))
+      log.info(
+          'Waiting for {0:d} bytes of disk space to run {1:s}'.format(
+              required - freed, task_name))
+      time.sleep(self.POLL_INTERVAL)
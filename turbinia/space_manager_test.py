@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests the space manager module."""
+
+from __future__ import unicode_literals
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from turbinia import config
+from turbinia import space_manager
+from turbinia import TurbiniaException
+
+
+class TestSpaceManager(unittest.TestCase):
+  """Test SpaceManager class."""
+
+  def setUp(self):
+    self.tmp_dir = tempfile.mkdtemp(prefix='turbinia-test-space')
+    self.config_save = {
+        var: getattr(config, var, None) for var in (
+            'TMP_DIR_QUOTA', 'MIN_FREE_SPACE', 'SPACE_WAIT_TIME',
+            'GCS_OUTPUT_PATH', 'SHARED_FILESYSTEM', 'OUTPUT_DIR')
+    }
+    config.LoadConfig()
+    config.TMP_DIR_QUOTA = 1000.0 / space_manager.GB
+    config.MIN_FREE_SPACE = None
+    config.SPACE_WAIT_TIME = 0
+    config.GCS_OUTPUT_PATH = None
+    config.SHARED_FILESYSTEM = False
+    config.OUTPUT_DIR = self.tmp_dir
+    self.manager = space_manager.SpaceManager(tmp_dir=self.tmp_dir)
+
+  def tearDown(self):
+    for var, value in self.config_save.items():
+      setattr(config, var, value)
+    shutil.rmtree(self.tmp_dir)
+
+  def _run_task(self, task_id, task_name, size):
+    """Simulates running a Task that writes size bytes to its temp dir."""
+    task_dir = os.path.join(self.tmp_dir, task_id)
+    os.makedirs(task_dir)
+    self.manager.acquire(task_id, task_name, task_dir, None)
+    with open(os.path.join(task_dir, 'data'), 'wb') as file_handle:
+      file_handle.write(b'\x00' * size)
+    self.manager.release(task_id)
+    return task_dir
+
+  def testGetDirSizeSkipsLinkedFiles(self):
+    """Tests files with other hardlinks don't count towards usage."""
+    task_dir = os.path.join(self.tmp_dir, 'task')
+    os.makedirs(task_dir)
+    with open(os.path.join(task_dir, 'data'), 'wb') as file_handle:
+      file_handle.write(b'x' * 100)
+    with open(os.path.join(task_dir, 'linked'), 'wb') as file_handle:
+      file_handle.write(b'x' * 50)
+    os.link(
+        os.path.join(task_dir, 'linked'), os.path.join(self.tmp_dir, 'blob'))
+    self.assertEqual(space_manager.get_dirs_size([task_dir]), 100)
+
+  def testTmpFileLinkedToOutput(self):
+    """Tests temp files hardlinked into the output dir are counted once."""
+    config.GCS_OUTPUT_PATH = 'gs://fake/path'
+    manager = space_manager.SpaceManager(tmp_dir=self.tmp_dir)
+    task_dir = os.path.join(self.tmp_dir, 'task')
+    output_dir = os.path.join(self.tmp_dir, 'output')
+    os.makedirs(task_dir)
+    os.makedirs(output_dir)
+    manager.acquire('task1', 'FooTask', task_dir, output_dir)
+    with open(os.path.join(task_dir, 'data'), 'wb') as file_handle:
+      file_handle.write(b'x' * 100)
+    os.link(os.path.join(task_dir, 'data'), os.path.join(output_dir, 'data'))
+    self.assertEqual(space_manager.get_dirs_size([task_dir, output_dir]), 100)
+    self.assertEqual(manager.get_usage(), 100)
+
+    manager.release('task1')
+    # pylint: disable=protected-access
+    records = manager._read_records()
+    self.assertEqual(records[0]['size'], 100)
+    self.assertEqual(manager.estimate_usage('FooTask', records), 100)
+
+  def testAcquireRelease(self):
+    """Tests that usage is tracked for released Tasks."""
+    self._run_task('task1', 'FooTask', 300)
+    # pylint: disable=protected-access
+    records = self.manager._read_records()
+    self.assertEqual(len(records), 1)
+    self.assertFalse(records[0]['in_use'])
+    self.assertEqual(records[0]['size'], 300)
+    self.assertEqual(self.manager.get_usage(), 300)
+    self.assertEqual(self.manager.estimate_usage('FooTask', records), 300)
+    self.assertEqual(self.manager.estimate_usage('BarTask', records), 0)
+
+  def testEstimateUsageAfterEviction(self):
+    """Tests that the sizes of evicted Tasks are still used for estimates."""
+    self._run_task('task1', 'FooTask', 600)
+    self._run_task('task2', 'FooTask', 100)
+    self.manager.evict(1000)
+    # pylint: disable=protected-access
+    records = self.manager._read_records()
+    self.assertEqual(records, [])
+    self.assertEqual(self.manager.estimate_usage('FooTask', records), 600)
+
+  def testRecordsPerHost(self):
+    """Tests that records of other hosts are not seen."""
+    self._run_task('task1', 'FooTask', 300)
+    with mock.patch('socket.gethostname', return_value='other-host'):
+      manager = space_manager.SpaceManager(tmp_dir=self.tmp_dir)
+    self.assertEqual(manager.get_usage(), 0)
+    self.assertEqual(manager.evict(1000), 0)
+    self.assertEqual(self.manager.get_usage(), 300)
+
+  def testAcquireReleasesStaleRecords(self):
+    """Tests that older records in use by this process are released."""
+    self.manager.acquire('task1', 'FooTask', self.tmp_dir, None)
+    self.manager.acquire('task2', 'FooTask', self.tmp_dir, None)
+    # pylint: disable=protected-access
+    records = {r['task_id']: r for r in self.manager._read_records()}
+    self.assertFalse(records['task1']['in_use'])
+    self.assertTrue(records['task2']['in_use'])
+
+  def testEnsureSpaceEvictsLeastRecentlyUsed(self):
+    """Tests that the least recently used Task data is evicted first."""
+    old_dir = self._run_task('task1', 'FooTask', 400)
+    new_dir = self._run_task('task2', 'BarTask', 400)
+    in_use_dir = os.path.join(self.tmp_dir, 'task3')
+    os.makedirs(in_use_dir)
+    self.manager.acquire('task3', 'FooTask', in_use_dir, None)
+
+    # Usage is 800 and FooTask is estimated at 400 with a quota of 1000.
+    self.manager.ensure_space('FooTask')
+    self.assertFalse(os.path.exists(old_dir))
+    self.assertTrue(os.path.exists(new_dir))
+    self.assertTrue(os.path.exists(in_use_dir))
+    self.assertEqual(self.manager.get_usage(), 400)
+
+  @mock.patch('turbinia.space_manager.state_manager.get_state_manager')
+  def testEvictSkipsActiveRequests(self, mock_get_state_manager):
+    """Tests that data of Requests with unfinished Tasks is not evicted."""
+    active_dir = os.path.join(self.tmp_dir, 'task1')
+    done_dir = os.path.join(self.tmp_dir, 'task2')
+    for task_id, task_dir, request_id in (('task1', active_dir, 'request1'),
+                                          ('task2', done_dir, 'request2')):
+      os.makedirs(task_dir)
+      self.manager.acquire(task_id, 'FooTask', task_dir, None, request_id)
+      with open(os.path.join(task_dir, 'data'), 'wb') as file_handle:
+        file_handle.write(b'\x00' * 100)
+      self.manager.release(task_id)
+    successful = {'request1': (True, None), 'request2': (True, False)}
+
+    def _get_task_data(instance, request_id):
+      # pylint: disable=unused-argument
+      return [dict(successful=value) for value in successful[request_id]]
+
+    state_manager_ = mock_get_state_manager.return_value
+    state_manager_.get_task_data.side_effect = _get_task_data
+
+    self.assertEqual(self.manager.evict(1000), 100)
+    self.assertTrue(os.path.exists(active_dir))
+    self.assertFalse(os.path.exists(done_dir))
+
+    # Data is evicted by age only when the state can't be checked.
+    state_manager_.get_task_data.side_effect = TurbiniaException('Down')
+    self.assertEqual(self.manager.evict(1000), 100)
+    self.assertFalse(os.path.exists(active_dir))
+
+  def testEnsureSpaceRefuses(self):
+    """Tests that Tasks are refused when not enough space can be freed."""
+    config.TMP_DIR_QUOTA = None
+    config.MIN_FREE_SPACE = 1.0
+    manager = space_manager.SpaceManager(tmp_dir=self.tmp_dir)
+    with mock.patch.object(manager, 'get_free_space', return_value=0):
+      self.assertRaises(TurbiniaException, manager.ensure_space, 'FooTask')
+
+  def testOutputOnlyEvictedWithGCS(self):
+    """Tests that local output is only evicted when it is also in GCS."""
+    output_dir = os.path.join(self.tmp_dir, 'output')
+    os.makedirs(output_dir)
+    # pylint: disable=protected-access
+    record = {'tmp_dir': self.tmp_dir, 'output_dir': output_dir}
+    self.assertEqual(self.manager._get_dirs(record), [self.tmp_dir])
+    config.GCS_OUTPUT_PATH = 'gs://fake/path'
+    manager = space_manager.SpaceManager(tmp_dir=self.tmp_dir)
+    self.assertEqual(manager._get_dirs(record), [self.tmp_dir, output_dir])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -21,15 +21,25 @@ storage.
 from __future__ import unicode_literals
 
 import codecs
+import collections
 import json
 import logging
+import math
+import os
 from datetime import datetime
 from datetime import timedelta
+from datetime import timezone
 
+from prometheus_client import Counter
+from prometheus_client import Histogram
 import six
 
+from turbinia import blob_store
 from turbinia import config
 from turbinia.config import DATETIME_FORMAT
+from turbinia import task_aggregates
+from turbinia import task_events
+from turbinia import task_statistics
 from turbinia import TurbiniaException
 
 config.LoadConfig()
@@ -38,6 +48,8 @@ if config.STATE_MANAGER.lower() == 'datastore':
   from google.cloud import exceptions
 elif config.STATE_MANAGER.lower() == 'redis':
   import redis
+elif config.STATE_MANAGER.lower() == 'sqlite':
+  import sqlite3
 else:
   msg = 'State Manager type "{0:s}" not implemented'.format(
       config.STATE_MANAGER)
@@ -46,6 +58,15 @@ else:
 MAX_DATASTORE_STRLEN = 1500
 log = logging.getLogger('turbinia')
 
+# Define metrics
+DATASTORE_RPC_LATENCY = Histogram(
+    'datastore_rpc_latency_seconds', 'Turbinia Datastore RPC latency',
+    ['operation'])
+DATASTORE_RPC_ERRORS = Counter(
+    'datastore_rpc_errors', 'Turbinia Datastore RPC errors', ['operation'])
+DATASTORE_ENTITIES_WRITTEN = Counter(
+    'datastore_entities_written', 'Turbinia Datastore entities written')
+
 
 def get_state_manager():
   """Return state manager object based on config.
@@ -62,6 +83,8 @@ def get_state_manager():
     return DatastoreStateManager()
   elif config.STATE_MANAGER.lower() == 'redis':
     return RedisStateManager()
+  elif config.STATE_MANAGER.lower() == 'sqlite':
+    return SQLiteStateManager()
   else:
     msg = 'State Manager type "{0:s}" not implemented'.format(
         config.STATE_MANAGER)
@@ -71,6 +94,126 @@ def get_state_manager():
 class BaseStateManager(object):
   """Class to manage Turbinia state persistence."""
 
+  # Maximum size of string fields the backend can store inline, or None if
+  # there is no limit.  Larger fields are moved to the blob store if one is
+  # configured.
+  MAX_FIELD_SIZE = None
+  _blob_store = None
+  # The task_events publisher class for this backend, or None if the backend
+  # doesn't support Task events.
+  EVENT_PUBLISHER = None
+  _event_publisher = None
+  _event_publisher_checked = False
+  # Whether the backend maintains rolling aggregates of completed Tasks (see
+  # task_aggregates).
+  SUPPORTS_AGGREGATES = False
+
+  def get_blob_store(self):
+    """Gets the blob store used for large Task fields.
+
+    Returns:
+      blob_store.BaseBlobStore: The blob store, or None if none is configured.
+    """
+    if self._blob_store is None:
+      self._blob_store = blob_store.get_blob_store()
+    return self._blob_store
+
+  def get_event_publisher(self):
+    """Gets the publisher for Task state change events.
+
+    Returns:
+      task_events.BaseTaskEventPublisher: The publisher, or None if events are
+          disabled or the publisher could not be set up.
+    """
+    if not self._event_publisher_checked:
+      self._event_publisher_checked = True
+      config.LoadConfig()
+      if not config.TASK_EVENTS or not self.EVENT_PUBLISHER:
+        return None
+      try:
+        self._event_publisher = self.EVENT_PUBLISHER()
+      except TurbiniaException as exception:
+        log.warning(
+            'Could not set up Task event publisher, clients will poll for '
+            'Task state instead: {0!s}'.format(exception))
+    return self._event_publisher
+
+  def aggregates_enabled(self):
+    """Checks whether rolling Task aggregates are maintained.
+
+    Returns:
+      bool: True if the backend supports aggregates and they are enabled.
+    """
+    return self.SUPPORTS_AGGREGATES and task_aggregates.enabled()
+
+  def get_task_aggregates(self, instance, days=0):
+    """Gets the rolling aggregates of completed Tasks.
+
+    Args:
+      instance (string): The Turbinia instance name (by default the same as the
+          INSTANCE_ID in the config).
+      days (int): The number of days we want history for.  This is rounded to
+          whole time buckets.
+
+    Returns:
+      dict: (bucket, dimension, value) tuples mapped to
+          task_aggregates.TaskAggregate objects.
+    """
+    raise NotImplementedError
+
+  def get_oldest_aggregate_bucket(self, instance):
+    """Gets the oldest time bucket that has Task aggregates.
+
+    Args:
+      instance (string): The Turbinia instance name (by default the same as the
+          INSTANCE_ID in the config).
+
+    Returns:
+      int: The start of the bucket in seconds since the epoch, or None if there
+          are no aggregates.
+    """
+    raise NotImplementedError
+
+  def get_request_spans(self, instance, days=0):
+    """Gets the time spans of requests with aggregated Tasks.
+
+    The span of a request covers the start of its earliest completed Task to
+    the end of its latest one.
+
+    Args:
+      instance (string): The Turbinia instance name (by default the same as the
+          INSTANCE_ID in the config).
+      days (int): The number of days we want history for.  This is rounded to
+          whole time buckets.
+
+    Returns:
+      dict: Request IDs mapped to (start, end) tuples in seconds since the
+          epoch.
+    """
+    raise NotImplementedError
+
+  def get_task_data(
+      self, instance, days=0, task_id=None, request_id=None, requester=None,
+      worker_name=None):
+    """Gets task data from the state store.
+
+    Args:
+      instance (string): The Turbinia instance name (by default the same as the
+          INSTANCE_ID in the config).
+      days (int): The number of days we want history for.
+      task_id (string): The Id of the task.
+      request_id (string): The Id of the request we want tasks for.
+      requester (string): The user of the request we want tasks for.
+      worker_name (string): The name of the worker we want tasks for.
+
+    Returns:
+      List of Task dict objects.
+
+    Raises:
+      TurbiniaException: When the task data can't be read.
+    """
+    raise NotImplementedError
+
   def get_task_dict(self, task):
     """Creates a dict of the fields we want to persist into storage.
 
@@ -117,6 +260,11 @@ class BaseStateManager(object):
     all_attrs = set(
         TurbiniaTask.STORED_ATTRIBUTES + TurbiniaTaskResult.STORED_ATTRIBUTES)
     task_dict.update({k: None for k in all_attrs if k not in task_dict})
+    store = self.get_blob_store()
+    if store:
+      task_dict = store.offload_fields(task_dict, self.MAX_FIELD_SIZE)
+    else:
+      task_dict['blob_refs'] = None
     task_dict = self._validate_data(task_dict)
 
     # Using the pubsub topic as an instance attribute in order to have a unique
@@ -147,6 +295,17 @@ class BaseStateManager(object):
     """
     raise NotImplementedError
 
+  def update_tasks(self, tasks):
+    """Updates data for many existing tasks.
+
+    State managers that can batch writes should override this.
+
+    Args:
+      tasks (list[TurbiniaTask]): The Tasks to update.
+    """
+    for task in tasks:
+      self.update_task(task)
+
   def write_new_task(self, task):
     """Writes data for new task.
 
@@ -158,14 +317,76 @@ class BaseStateManager(object):
     """
     raise NotImplementedError
 
+  def write_recipe(self, recipe_hash, recipe, ttl):
+    """Stores a recipe that Task messages refer to (see recipe_store).
+
+    Recipes are stored under the hash of their contents, so writing the same
+    recipe again only extends the time it is kept for.
+
+    Args:
+      recipe_hash (str): The SHA256 hex digest of the recipe.
+      recipe (str): The JSON encoded recipe.
+      ttl (int): Seconds until the recipe expires.
+
+    Raises:
+      TurbiniaException: When the recipe can't be stored.
+    """
+    raise NotImplementedError
+
+  def read_recipe(self, recipe_hash):
+    """Reads a stored recipe.
+
+    Args:
+      recipe_hash (str): The SHA256 hex digest of the recipe.
+
+    Returns:
+      str: The JSON encoded recipe, or None if it doesn't exist.
+
+    Raises:
+      TurbiniaException: When the recipe can't be read.
+    """
+    raise NotImplementedError
+
+  def register_request_key(self, idempotency_key, request_id, ttl):
+    """Registers a request in the deduplication index.
+
+    The first request registered with an idempotency key keeps it until it
+    expires, and later requests with the same key are duplicates of it.
+
+    Args:
+      idempotency_key (str): The idempotency key of the request.
+      request_id (str): The ID of the request.
+      ttl (int): Seconds until the key expires.
+
+    Returns:
+      str: The ID of the request registered with the key, which is request_id
+          unless the request is a duplicate.
+
+    Raises:
+      TurbiniaException: When the deduplication index can't be updated.
+    """
+    raise NotImplementedError
+
 
 class DatastoreStateManager(BaseStateManager):
   """Datastore State Manager.
 
+  Task state is written with blind upserts because every write contains the
+  full set of Task attributes, so there is no need to read the entity first.
+  Set DATASTORE_EMULATOR_HOST in the environment to use the Datastore emulator.
+
   Attributes:
     client: A Datastore client object.
   """
 
+  # Maximum number of entities Datastore allows in one commit.
+  MAX_BATCH_SIZE = 500
+  # Attributes that are never filtered on, so they don't need to be indexed.
+  UNINDEXED_ATTRIBUTES = ('report_data', 'saved_paths', 'blob_refs')
+  # Datastore truncates strings of MAX_DATASTORE_STRLEN or more characters.
+  MAX_FIELD_SIZE = MAX_DATASTORE_STRLEN - 1
+  EVENT_PUBLISHER = task_events.PubSubTaskEventPublisher
+
   def __init__(self):
     config.LoadConfig()
     try:
@@ -189,53 +410,515 @@ class DatastoreStateManager(BaseStateManager):
 
     return data
 
+  def _get_entity(self, task):
+    """Creates a new entity with the current state of a Task.
+
+    Args:
+      task: A TurbiniaTask object
+
+    Returns:
+      datastore.Entity: The Task entity.
+    """
+    key = self.client.key('TurbiniaTask', task.id)
+    entity = datastore.Entity(
+        key, exclude_from_indexes=self.UNINDEXED_ATTRIBUTES)
+    entity.update(self.get_task_dict(task))
+    return entity
+
+  def _put_multi(self, entities):
+    """Writes entities in batches.
+
+    Args:
+      entities (list[datastore.Entity]): The entities to write.
+
+    Returns:
+      bool: True if all entities were written.
+    """
+    success = True
+    for i in range(0, len(entities), self.MAX_BATCH_SIZE):
+      batch = entities[i:i + self.MAX_BATCH_SIZE]
+      try:
+        with DATASTORE_RPC_LATENCY.labels('put_multi').time():
+          self.client.put_multi(batch)
+        DATASTORE_ENTITIES_WRITTEN.inc(len(batch))
+      except exceptions.GoogleCloudError as e:
+        DATASTORE_RPC_ERRORS.labels('put_multi').inc()
+        log.error(
+            'Failed to write {0:d} tasks to datastore: {1!s}'.format(
+                len(batch), e))
+        success = False
+    return success
+
   def update_task(self, task):
-    task.touch()
+    self.update_tasks([task])
+
+  def update_tasks(self, tasks):
+    """Updates many Tasks with batched blind upserts.
+
+    Args:
+      tasks (list[TurbiniaTask]): The Tasks to update.
+    """
+    entities = []
+    for task in tasks:
+      task.touch()
+      entities.append(self._get_entity(task))
+      log.debug('Updating Task {0:s} in Datastore'.format(task.name))
+    if not entities:
+      return
+    if self._put_multi(entities):
+      for task, entity in zip(tasks, entities):
+        task.state_key = entity.key
+      publisher = self.get_event_publisher()
+      if publisher:
+        publisher.publish(entities)
+
+  def write_new_task(self, task):
+    entity = self._get_entity(task)
+    log.info('Writing new task {0:s} into Datastore'.format(task.name))
+    if self._put_multi([entity]):
+      task.state_key = entity.key
+      publisher = self.get_event_publisher()
+      if publisher:
+        publisher.publish([entity], new=True)
+    return entity.key
+
+  def get_task_data(
+      self, instance, days=0, task_id=None, request_id=None, requester=None,
+      worker_name=None):
+    query = self.client.query(kind='TurbiniaTask')
+    query.add_filter('instance', '=', instance)
+    if days:
+      start_time = datetime.now() - timedelta(days=days)
+      query.add_filter('last_update', '>=', start_time)
+    for attribute, value in (('id', task_id), ('request_id', request_id),
+                             ('requester', requester), ('worker_name',
+                                                        worker_name)):
+      if value:
+        query.add_filter(attribute, '=', value)
     try:
-      with self.client.transaction():
-        entity = self.client.get(task.state_key)
-        if not entity:
-          self.write_new_task(task)
-          return
-        entity.update(self.get_task_dict(task))
-        log.debug('Updating Task {0:s} in Datastore'.format(task.name))
+      with DATASTORE_RPC_LATENCY.labels('query_tasks').time():
+        return [dict(entity) for entity in query.fetch()]
+    except exceptions.GoogleCloudError as e:
+      DATASTORE_RPC_ERRORS.labels('query_tasks').inc()
+      raise TurbiniaException(
+          'Failed to read tasks from datastore: {0!s}'.format(e))
+
+  def write_recipe(self, recipe_hash, recipe, ttl):
+    entity = datastore.Entity(
+        self.client.key('TurbiniaRecipe', recipe_hash),
+        exclude_from_indexes=('recipe',))
+    entity['recipe'] = recipe
+    # Expired recipes are ignored, and can be deleted with a Datastore TTL
+    # policy on the expires property.
+    entity['expires'] = datetime.now(timezone.utc) + timedelta(seconds=ttl)
+    try:
+      with DATASTORE_RPC_LATENCY.labels('put_recipe').time():
         self.client.put(entity)
     except exceptions.GoogleCloudError as e:
-      log.error(
-          'Failed to update task {0:s} in datastore: {1!s}'.format(
-              task.name, e))
+      DATASTORE_RPC_ERRORS.labels('put_recipe').inc()
+      raise TurbiniaException(
+          'Failed to write recipe {0:s} to datastore: {1!s}'.format(
+              recipe_hash, e))
 
-  def write_new_task(self, task):
-    key = self.client.key('TurbiniaTask', task.id)
+  def read_recipe(self, recipe_hash):
     try:
-      entity = datastore.Entity(key)
-      entity.update(self.get_task_dict(task))
-      log.info('Writing new task {0:s} into Datastore'.format(task.name))
-      self.client.put(entity)
-      task.state_key = key
+      with DATASTORE_RPC_LATENCY.labels('get_recipe').time():
+        entity = self.client.get(self.client.key('TurbiniaRecipe', recipe_hash))
     except exceptions.GoogleCloudError as e:
-      log.error(
-          'Failed to update task {0:s} in datastore: {1!s}'.format(
-              task.name, e))
-    return key
+      DATASTORE_RPC_ERRORS.labels('get_recipe').inc()
+      raise TurbiniaException(
+          'Failed to read recipe {0:s} from datastore: {1!s}'.format(
+              recipe_hash, e))
+    if not entity:
+      return None
+    expires = entity.get('expires')
+    if expires and expires <= datetime.now(timezone.utc):
+      return None
+    return entity.get('recipe')
+
+  def register_request_key(self, idempotency_key, request_id, ttl):
+    key = self.client.key('TurbiniaRequestKey', idempotency_key)
+    # Datastore returns timezone aware datetimes, so this must be one too.
+    now = datetime.now(timezone.utc)
+    try:
+      with DATASTORE_RPC_LATENCY.labels('register_request_key').time():
+        with self.client.transaction():
+          entity = self.client.get(key)
+          if entity and entity['expires'] > now:
+            return entity['request_id']
+          entity = datastore.Entity(key)
+          entity.update({
+              'request_id': request_id,
+              'expires': now + timedelta(seconds=ttl)
+          })
+          self.client.put(entity)
+    # pylint: disable=broad-except
+    except Exception as e:
+      DATASTORE_RPC_ERRORS.labels('register_request_key').inc()
+      raise TurbiniaException(
+          'Failed to register request {0:s} in datastore: {1!s}'.format(
+              request_id, e))
+    return request_id
 
 
 class RedisStateManager(BaseStateManager):
   """Use redis for task state storage.
 
+  Task data is stored as hashes under 'TurbiniaTask:<task_id>' keys with one
+  JSON encoded value per field, so that updates only need to write the fields
+  that have changed.  Creates and updates are done atomically with Lua scripts
+  in the same pipeline as the index updates.  To avoid scanning the whole
+  keyspace when querying, we also maintain indexes per instance: a sorted set
+  of Task keys scored by last_update time, and sets of Task keys per
+  request_id, requester and worker name.  Task state changes are published as
+  events on Redis pub/sub channels (see task_events).
+
   Attributes:
     client: Redis database object.
   """
 
+  # Creates the Task hash if it doesn't already exist.  Returns 1 if the hash
+  # was created and 0 if the key already exists.
+  CREATE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+  return 0
+end
+redis.call('HSET', KEYS[1], unpack(ARGV))
+return 1
+"""
+  # Sets fields in an existing Task hash.  Returns 1 if the hash was updated, 0
+  # if the key doesn't exist and -1 if the key holds legacy JSON string data.
+  UPDATE_SCRIPT = """
+local key_type = redis.call('TYPE', KEYS[1]).ok
+if key_type == 'none' then
+  return 0
+elseif key_type ~= 'hash' then
+  return -1
+end
+if #ARGV > 0 then
+  redis.call('HSET', KEYS[1], unpack(ARGV))
+end
+return 1
+"""
+
+  # Adds a completed Task to its aggregates, unless it has already been added.
+  # KEYS are the marker key for the Task, the sorted set of buckets, the set of
+  # aggregates in the bucket and then the aggregate hashes.  ARGV are the
+  # bucket, the retention time, the field to count the Task status in, the run
+  # time and its square (or empty strings), the sketch bin field and then the
+  # member name for each aggregate hash.
+  AGGREGATE_SCRIPT = """
+if not redis.call('SET', KEYS[1], '1', 'NX', 'EX', ARGV[2]) then
+  return 0
+end
+local run_time = tonumber(ARGV[4])
+redis.call('ZADD', KEYS[2], ARGV[1], ARGV[1])
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', ARGV[1] - ARGV[2])
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+if run_time then
+  local start = tonumber(redis.call('HGET', KEYS[4], ARGV[7]))
+  if not start or tonumber(ARGV[8]) < start then
+    redis.call('HSET', KEYS[4], ARGV[7], ARGV[8])
+  end
+  local stop = tonumber(redis.call('ZSCORE', KEYS[5], ARGV[7]))
+  if not stop or tonumber(ARGV[9]) > stop then
+    redis.call('ZADD', KEYS[5], ARGV[9], ARGV[7])
+  end
+  local expired = redis.call(
+      'ZRANGEBYSCORE', KEYS[5], '-inf', ARGV[1] - ARGV[2])
+  for _, request_id in ipairs(expired) do
+    redis.call('HDEL', KEYS[4], request_id)
+  end
+  redis.call('ZREMRANGEBYSCORE', KEYS[5], '-inf', ARGV[1] - ARGV[2])
+  redis.call('EXPIRE', KEYS[4], ARGV[2])
+  redis.call('EXPIRE', KEYS[5], ARGV[2])
+end
+for i = 6, #KEYS do
+  local key = KEYS[i]
+  redis.call('SADD', KEYS[3], ARGV[i + 4])
+  redis.call('HINCRBY', key, 'count', 1)
+  redis.call('HINCRBY', key, ARGV[3], 1)
+  if run_time then
+    redis.call('HINCRBY', key, 'run_time_count', 1)
+    redis.call('HINCRBYFLOAT', key, 'run_time_total', ARGV[4])
+    redis.call('HINCRBYFLOAT', key, 'run_time_squares', ARGV[5])
+    local min = tonumber(redis.call('HGET', key, 'run_time_min'))
+    if not min or run_time < min then
+      redis.call('HSET', key, 'run_time_min', ARGV[4])
+    end
+    local max = tonumber(redis.call('HGET', key, 'run_time_max'))
+    if not max or run_time > max then
+      redis.call('HSET', key, 'run_time_max', ARGV[4])
+    end
+    redis.call('HINCRBY', key, ARGV[6], 1)
+  end
+  redis.call('EXPIRE', key, ARGV[2])
+end
+redis.call('EXPIRE', KEYS[3], ARGV[2])
+return 1
+"""
+
+  TASK_KEY_PREFIX = 'TurbiniaTask'
+  INDEX_KEY_PREFIX = 'TurbiniaIndex'
+  AGGREGATE_KEY_PREFIX = 'TurbiniaAggregate'
+  # Prefix of the keys for recipes that Task messages refer to.
+  RECIPE_KEY_PREFIX = 'TurbiniaRecipe'
+  # Prefix of the keys for the request deduplication index.
+  REQUEST_KEY_PREFIX = 'TurbiniaRequestKey'
+  # Prefix of the sketch bin fields in aggregate hashes.
+  BIN_FIELD_PREFIX = 'bin:'
+  # Set of all instances that have indexed Tasks.
+  INSTANCES_KEY = 'TurbiniaIndex:instances'
+  # Set once indexes have been built for Tasks written before they existed.
+  INDEX_VERSION_KEY = 'TurbiniaIndex:version'
+  INDEX_VERSION = '2'
+  # Maps index names to the Task attribute that they index.
+  SET_INDEXES = {
+      'request': 'request_id',
+      'requester': 'requester',
+      'worker': 'worker_name'
+  }
+  # Number of keys to fetch with each batch of reads.
+  MGET_BATCH_SIZE = 1000
+  # Number of Tasks to remember the last written fields for.
+  MAX_CACHED_TASKS = 10000
+  EVENT_PUBLISHER = task_events.RedisTaskEventPublisher
+  SUPPORTS_AGGREGATES = True
+
   def __init__(self):
     config.LoadConfig()
     self.client = redis.StrictRedis(
         host=config.REDIS_HOST, port=config.REDIS_PORT, db=config.REDIS_DB)
+    self._create_script = self.client.register_script(self.CREATE_SCRIPT)
+    self._update_script = self.client.register_script(self.UPDATE_SCRIPT)
+    self._aggregate_script = self.client.register_script(self.AGGREGATE_SCRIPT)
+    self._indexes_checked = False
+    # Maps Task IDs to the encoded fields that were last written for them.
+    self._written_fields = collections.OrderedDict()
 
   def _validate_data(self, data):
     return data
 
-  def get_task_data(self, instance, days=0, task_id=None, request_id=None):
+  def _get_task_key(self, task_id):
+    """Gets the key Task data is stored under."""
+    return ':'.join([self.TASK_KEY_PREFIX, task_id])
+
+  def _get_index_key(self, instance, index, value=None):
+    """Gets the key of an index.
+
+    Args:
+      instance (string): The Turbinia instance name.
+      index (string): The index name ('last_update' or a SET_INDEXES name).
+      value (string): The indexed value for set indexes.
+
+    Returns:
+      string: The index key.
+    """
+    parts = [self.INDEX_KEY_PREFIX, instance or '', index]
+    if value is not None:
+      parts.append(value)
+    return ':'.join(parts)
+
+  def _get_aggregate_key(self, instance, *parts):
+    """Gets the key of aggregate data.
+
+    Args:
+      instance (string): The Turbinia instance name.
+      parts (list[object]): The rest of the key, e.g. the bucket, dimension and
+          value for an aggregate hash.
+
+    Returns:
+      string: The aggregate key.
+    """
+    key_parts = [self.AGGREGATE_KEY_PREFIX, instance or '']
+    key_parts.extend('{0!s}'.format(part) for part in parts)
+    return ':'.join(key_parts)
+
+  @staticmethod
+  def _decode(values):
+    """Decodes values returned by Redis into a list of strings."""
+    return [
+        codecs.decode(v, 'utf-8') if isinstance(v, six.binary_type) else v
+        for v in values
+    ]
+
+  @staticmethod
+  def _get_timestamp(datetime_):
+    """Converts a datetime to a sorted set score."""
+    return (datetime_ - datetime(1970, 1, 1)).total_seconds()
+
+  def _index_task(self, pipeline, key, task_data):
+    """Adds index updates for a Task to a pipeline.
+
+    Args:
+      pipeline (redis.client.Pipeline): The pipeline to add commands to.
+      key (string): The key the Task data is stored under.
+      task_data (dict): The serializable Task data.
+    """
+    instance = task_data.get('instance') or ''
+    pipeline.sadd(self.INSTANCES_KEY, instance)
+    if task_data.get('last_update'):
+      last_update = datetime.strptime(task_data['last_update'], DATETIME_FORMAT)
+      pipeline.zadd(
+          self._get_index_key(instance, 'last_update'),
+          {key: self._get_timestamp(last_update)})
+    for index, attribute in self.SET_INDEXES.items():
+      if task_data.get(attribute):
+        pipeline.sadd(
+            self._get_index_key(instance, index, task_data[attribute]), key)
+
+  @staticmethod
+  def _encode_fields(task_data):
+    """Encodes Task data into hash fields.
+
+    Args:
+      task_data (dict): The serializable Task data.
+
+    Returns:
+      dict: Field names mapped to JSON encoded values.
+    """
+    return {field: json.dumps(value) for field, value in task_data.items()}
+
+  def _decode_fields(self, fields):
+    """Decodes Task hash fields into Task data.
+
+    Args:
+      fields (dict): Field names mapped to JSON encoded values from Redis.
+
+    Returns:
+      dict: The Task data.
+    """
+    names = self._decode(fields.keys())
+    return {
+        name: json.loads(value) for name, value in zip(names, fields.values())
+    }
+
+  @staticmethod
+  def _flatten(fields):
+    """Flattens fields into a list of alternating names and values."""
+    args = []
+    for item in fields.items():
+      args.extend(item)
+    return args
+
+  def _get_tasks(self, keys):
+    """Gets the Task data for a list of keys with batched pipelines.
+
+    Args:
+      keys (list): Task keys to get.
+
+    Returns:
+      List of Task dicts for the keys that exist.
+    """
+    tasks = []
+    for i in range(0, len(keys), self.MGET_BATCH_SIZE):
+      batch = keys[i:i + self.MGET_BATCH_SIZE]
+      pipeline = self.client.pipeline(transaction=False)
+      for key in batch:
+        pipeline.hgetall(key)
+      legacy_keys = []
+      for key, fields in zip(batch, pipeline.execute(raise_on_error=False)):
+        # Tasks written before they were stored as hashes are JSON strings, and
+        # trying to read them as hashes returns a wrong type error.
+        if isinstance(fields, Exception):
+          legacy_keys.append(key)
+        elif fields:
+          tasks.append(self._decode_fields(fields))
+      if legacy_keys:
+        for data in self.client.mget(legacy_keys):
+          if data:
+            tasks.append(json.loads(data))
+    return tasks
+
+  def build_indexes(self):
+    """Builds the indexes for all existing Tasks.
+
+    Tasks stored as legacy JSON strings are also converted to hashes.
+
+    Returns:
+      int: The number of Tasks indexed.
+    """
+    log.info('Building Redis Task indexes')
+    count = 0
+    keys = []
+    match = '{0:s}:*'.format(self.TASK_KEY_PREFIX)
+    for key in self.client.scan_iter(match, count=self.MGET_BATCH_SIZE):
+      keys.append(key)
+      if len(keys) >= self.MGET_BATCH_SIZE:
+        count += self._build_indexes_batch(keys)
+        keys = []
+    if keys:
+      count += self._build_indexes_batch(keys)
+    self.client.set(self.INDEX_VERSION_KEY, self.INDEX_VERSION)
+    log.info('Indexed {0:d} Tasks in Redis'.format(count))
+    return count
+
+  def _build_indexes_batch(self, keys):
+    """Indexes a batch of Task keys.
+
+    Args:
+      keys (list): The Task keys to index.
+
+    Returns:
+      int: The number of Tasks indexed.
+    """
+    keys = self._decode(keys)
+    pipeline = self.client.pipeline()
+    count = 0
+    for task_data in self._get_tasks(keys):
+      key = self._get_task_key(task_data['id'])
+      self._index_task(pipeline, key, task_data)
+      count += 1
+    legacy_data = [(key, json.loads(data))
+                   for key, data in zip(keys, self._get_legacy_data(keys))
+                   if data]
+    for key, task_data in legacy_data:
+      self._convert_legacy_task(pipeline, key, task_data)
+    pipeline.execute()
+    return count
+
+  def _get_legacy_data(self, keys):
+    """Gets the data for keys that are still legacy JSON strings.
+
+    Args:
+      keys (list): Task keys to check.
+
+    Returns:
+      list: The JSON data for each key, or None if the key is not a string.
+    """
+    pipeline = self.client.pipeline(transaction=False)
+    for key in keys:
+      pipeline.get(key)
+    return [
+        None if isinstance(data, Exception) else data
+        for data in pipeline.execute(raise_on_error=False)
+    ]
+
+  def _convert_legacy_task(self, pipeline, key, task_data):
+    """Adds commands to convert a legacy JSON string Task into a hash.
+
+    Args:
+      pipeline (redis.client.Pipeline): The pipeline to add commands to.
+      key (string): The key of the Task.
+      task_data (dict): The Task data.
+    """
+    pipeline.delete(key)
+    self._create_script(
+        keys=[key], args=self._flatten(self._encode_fields(task_data)),
+        client=pipeline)
+
+  def _check_indexes(self):
+    """Builds the indexes if they haven't been built yet."""
+    if self._indexes_checked:
+      return
+    version = self.client.get(self.INDEX_VERSION_KEY)
+    if self._decode([version])[0] != self.INDEX_VERSION:
+      self.build_indexes()
+    self._indexes_checked = True
+
+  def get_task_data(
+      self, instance, days=0, task_id=None, request_id=None, requester=None,
+      worker_name=None):
     """Gets task data from Redis.
 
     Args:
@@ -244,16 +927,51 @@ class RedisStateManager(BaseStateManager):
       days (int): The number of days we want history for.
       task_id (string): The Id of the task.
       request_id (string): The Id of the request we want tasks for.
+      requester (string): The user of the request we want tasks for.
+      worker_name (string): The name of the worker we want tasks for.
 
     Returns:
       List of Task dict objects.
     """
+    self._check_indexes()
+    if instance:
+      instances = [instance]
+    else:
+      instances = self._decode(self.client.smembers(self.INSTANCES_KEY))
+
+    keys = []
+    for instance_ in instances:
+      last_update_key = self._get_index_key(instance_, 'last_update')
+      if days:
+        start_time = datetime.now() - timedelta(days=days)
+        instance_keys = self._decode(
+            self.client.zrangebyscore(
+                last_update_key, self._get_timestamp(start_time), '+inf'))
+      elif task_id:
+        instance_keys = [self._get_task_key(task_id)]
+      elif request_id:
+        instance_keys = self._decode(
+            self.client.smembers(
+                self._get_index_key(instance_, 'request', request_id)))
+      else:
+        instance_keys = self._decode(self.client.zrange(last_update_key, 0, -1))
+
+      for index, value in (('requester', requester), ('worker', worker_name)):
+        if value:
+          members = set(
+              self._decode(
+                  self.client.smembers(
+                      self._get_index_key(instance_, index, value))))
+          instance_keys = [k for k in instance_keys if k in members]
+      keys.extend(instance_keys)
+
     tasks = [
-        json.loads(self.client.get(task))
-        for task in self.client.scan_iter('TurbiniaTask:*')
-        if json.loads(self.client.get(task)).get('instance') == instance or
-        not instance
+        task for task in self._get_tasks(keys)
+        if task.get('instance') == instance or not instance
     ]
+    if task_id:
+      # Task keys don't depend on the instance, so only return them once.
+      tasks = list({task.get('id'): task for task in tasks}.values())
 
     # Convert relevant date attributes back into dates/timedeltas
     for task in tasks:
@@ -263,44 +981,757 @@ class RedisStateManager(BaseStateManager):
       if task.get('run_time'):
         task['run_time'] = timedelta(seconds=task['run_time'])
 
-    # pylint: disable=no-else-return
-    if days:
-      start_time = datetime.now() - timedelta(days=days)
-      # Redis only supports strings; we convert to/from datetime here and below
-      return [task for task in tasks if task.get('last_update') > start_time]
-    elif task_id:
-      return [task for task in tasks if task.get('task_id') == task_id]
-    elif request_id:
-      return [task for task in tasks if task.get('request_id') == request_id]
     return tasks
 
-  def update_task(self, task):
-    task.touch()
-    key = task.state_key
-    if not self.client.get(key):
-      self.write_new_task(task)
-      return
-    log.info('Updating task {0:s} in Redis'.format(task.name))
+  def _serialize_task(self, task):
+    """Gets the serializable Task data to store.
+
+    Args:
+      task: A TurbiniaTask object
+
+    Returns:
+      dict: The Task data.
+    """
     task_data = self.get_task_dict(task)
     task_data['last_update'] = task_data['last_update'].strftime(
         DATETIME_FORMAT)
-    # Need to use json.dumps, else redis returns single quoted string which
-    # is invalid json
-    if not self.client.set(key, json.dumps(task_data)):
-      log.error(
-          'Unsuccessful in updating task {0:s} in Redis'.format(task.name))
+    return task_data
+
+  def _aggregate_task(self, pipeline, task_data, last_update):
+    """Adds a completed Task to the aggregates in a pipeline.
+
+    The script only counts each Task once, so this is safe to call for every
+    write of a completed Task.
+
+    Args:
+      pipeline (redis.client.Pipeline): The pipeline to add commands to.
+      task_data (dict): The Task data.
+      last_update (datetime): The last update time of the Task.
+    """
+    instance = task_data.get('instance')
+    bucket = task_aggregates.get_bucket(last_update)
+    run_time = task_aggregates.get_run_time(task_data)
+    members = [
+        '{0:s}:{1:s}'.format(dimension, value)
+        for dimension, value in task_aggregates.get_dimensions(task_data)
+    ]
+    end_time = (last_update - task_aggregates.EPOCH).total_seconds()
+    keys = [
+        self._get_aggregate_key(instance, 'task', task_data.get('id')),
+        self._get_aggregate_key(instance, 'buckets'),
+        self._get_aggregate_key(instance, bucket),
+        self._get_aggregate_key(instance, 'request_starts'),
+        self._get_aggregate_key(instance, 'request_ends')
+    ]
+    keys.extend(
+        self._get_aggregate_key(instance, bucket, member) for member in members)
+    args = [
+        bucket,
+        task_aggregates.get_retention(),
+        'successful' if task_data.get('successful') else 'failed',
+        repr(run_time) if run_time else '',
+        repr(run_time * run_time) if run_time else '', '{0:s}{1:d}'.format(
+            self.BIN_FIELD_PREFIX,
+            task_aggregates.RunTimeSketch.get_bin(run_time or 0)),
+        task_data.get('request_id') or '',
+        repr(end_time - (run_time or 0)),
+        repr(end_time)
+    ]
+    args.extend(members)
+    self._aggregate_script(keys=keys, args=args, client=pipeline)
+
+  def get_task_aggregates(self, instance, days=0):
+    start_bucket = task_aggregates.get_start_bucket(days)
+    buckets = self._decode(
+        self.client.zrangebyscore(
+            self._get_aggregate_key(instance, 'buckets'), start_bucket, '+inf'))
+    pipeline = self.client.pipeline()
+    for bucket in buckets:
+      pipeline.smembers(self._get_aggregate_key(instance, bucket))
+    keys = []
+    for bucket, members in zip(buckets, pipeline.execute()):
+      for member in self._decode(members):
+        dimension, value = member.split(':', 1)
+        keys.append((int(bucket), dimension, value))
+
+    aggregates = {}
+    for i in range(0, len(keys), self.MGET_BATCH_SIZE):
+      batch = keys[i:i + self.MGET_BATCH_SIZE]
+      pipeline = self.client.pipeline()
+      for bucket, dimension, value in batch:
+        pipeline.hgetall(
+            self._get_aggregate_key(
+                instance, bucket, '{0:s}:{1:s}'.format(dimension, value)))
+      for key, fields in zip(batch, pipeline.execute()):
+        if not fields:
+          # The aggregate has expired.
+          continue
+        counters = {}
+        bins = {}
+        for field, value in zip(self._decode(fields.keys()), self._decode(
+            fields.values())):
+          if field.startswith(self.BIN_FIELD_PREFIX):
+            bins[int(field[len(self.BIN_FIELD_PREFIX):])] = int(value)
+          else:
+            counters[field] = value
+        aggregates[key] = task_aggregates.TaskAggregate.from_counters(
+            counters, bins)
+    return aggregates
+
+  def get_oldest_aggregate_bucket(self, instance):
+    buckets = self._decode(
+        self.client.zrange(self._get_aggregate_key(instance, 'buckets'), 0, 0))
+    return int(buckets[0]) if buckets else None
+
+  def get_request_spans(self, instance, days=0):
+    ends = self.client.zrangebyscore(
+        self._get_aggregate_key(instance, 'request_ends'),
+        task_aggregates.get_start_bucket(days), '+inf', withscores=True)
+    request_ids = self._decode([request_id for request_id, _ in ends])
+    end_times = [end_time for _, end_time in ends]
+    spans = {}
+    for i in range(0, len(request_ids), self.MGET_BATCH_SIZE):
+      batch = request_ids[i:i + self.MGET_BATCH_SIZE]
+      start_times = self.client.hmget(
+          self._get_aggregate_key(instance, 'request_starts'), batch)
+      for request_id, start_time, end_time in zip(
+          batch, start_times, end_times[i:i + self.MGET_BATCH_SIZE]):
+        if start_time is not None:
+          spans[request_id] = (float(start_time), float(end_time))
+    return spans
+
+  def _cache_fields(self, task_id, fields):
+    """Remembers the fields that were last written for a Task.
+
+    Args:
+      task_id (string): The ID of the Task.
+      fields (dict): The encoded fields that were written.
+    """
+    cached = self._written_fields.pop(task_id, {})
+    cached.update(fields)
+    self._written_fields[task_id] = cached
+    while len(self._written_fields) > self.MAX_CACHED_TASKS:
+      self._written_fields.popitem(last=False)
+
+  def update_task(self, task):
+    self.update_tasks([task])
+
+  def update_tasks(self, tasks):
+    """Updates data for many existing Tasks in one round trip.
+
+    Only the fields that have changed since we last wrote each Task are sent.
+    Tasks that don't exist yet are written as new Tasks.
+
+    Args:
+      tasks (list[TurbiniaTask]): The Tasks to update.
+    """
+    pipeline = self.client.pipeline()
+    updates = []
+    aggregate = self.aggregates_enabled()
+    for task in tasks:
+      task.touch()
+      key = task.state_key or self._get_task_key(task.id)
+      task_data = self._serialize_task(task)
+      fields = self._encode_fields(task_data)
+      cached = self._written_fields.get(task.id, {})
+      changed = {k: v for k, v in fields.items() if cached.get(k) != v}
+      log.info('Updating task {0:s} in Redis'.format(task.name))
+      updates.append((task, key, task_data, changed, len(pipeline)))
+      self._update_script(
+          keys=[key], args=self._flatten(changed), client=pipeline)
+      self._index_task(pipeline, key, task_data)
+      if aggregate and task_aggregates.is_completed(task_data):
+        self._aggregate_task(pipeline, task_data, task.last_update)
+    if not updates:
+      return
+    publisher = self.get_event_publisher()
+    if publisher:
+      # Events are sent in the same pipeline after the updates, so subscribers
+      # will see the new state when they get the event.
+      publisher.publish([update[2] for update in updates], client=pipeline)
+    results = pipeline.execute()
+
+    new_tasks = []
+    legacy_pipeline = None
+    for task, key, task_data, changed, position in updates:
+      if results[position] == 0:
+        new_tasks.append(task)
+        continue
+      if results[position] == -1:
+        # The Task is stored in the legacy JSON string format, so we convert it
+        # to a hash with all the current data.
+        legacy_pipeline = legacy_pipeline or self.client.pipeline()
+        self._convert_legacy_task(legacy_pipeline, key, task_data)
+        changed = self._encode_fields(task_data)
+      self._cache_fields(task.id, changed)
+    if legacy_pipeline:
+      legacy_pipeline.execute()
+    for task in new_tasks:
+      self.write_new_task(task)
 
   def write_new_task(self, task):
-    key = ':'.join(['TurbiniaTask', task.id])
+    key = self._get_task_key(task.id)
     log.info('Writing new task {0:s} into Redis'.format(task.name))
-    task_data = self.get_task_dict(task)
-    task_data['last_update'] = task_data['last_update'].strftime(
-        DATETIME_FORMAT)
-    if task_data['run_time']:
-      task_data['run_time'] = task_data['run_time'].total_seconds()
-    # nx=True prevents overwriting (i.e. no unintentional task clobbering)
-    if not self.client.set(key, json.dumps(task_data), nx=True):
+    task_data = self._serialize_task(task)
+    fields = self._encode_fields(task_data)
+    pipeline = self.client.pipeline()
+    # The create script will not overwrite existing Tasks (i.e. no
+    # unintentional task clobbering)
+    self._create_script(keys=[key], args=self._flatten(fields), client=pipeline)
+    self._index_task(pipeline, key, task_data)
+    if self.aggregates_enabled() and task_aggregates.is_completed(task_data):
+      self._aggregate_task(pipeline, task_data, task.last_update)
+    publisher = self.get_event_publisher()
+    if publisher:
+      publisher.publish([task_data], client=pipeline, new=True)
+    if not pipeline.execute()[0]:
       log.error(
           'Unsuccessful in writing new task {0:s} into Redis'.format(task.name))
+    else:
+      self._cache_fields(task.id, fields)
     task.state_key = key
     return key
+
+  def write_recipe(self, recipe_hash, recipe, ttl):
+    self.client.set(
+        ':'.join([self.RECIPE_KEY_PREFIX, recipe_hash]), recipe, ex=int(ttl))
+
+  def read_recipe(self, recipe_hash):
+    recipe = self.client.get(':'.join([self.RECIPE_KEY_PREFIX, recipe_hash]))
+    return codecs.decode(recipe, 'utf-8') if recipe is not None else None
+
+  def register_request_key(self, idempotency_key, request_id, ttl):
+    key = ':'.join([self.REQUEST_KEY_PREFIX, idempotency_key])
+    try:
+      if self.client.set(key, request_id, nx=True, ex=int(ttl)):
+        return request_id
+      existing = self.client.get(key)
+    except redis.RedisError as exception:
+      raise TurbiniaException(
+          'Failed to register request {0:s} in redis: {1!s}'.format(
+              request_id, exception))
+    # The key may have expired since we tried to set it.
+    return codecs.decode(existing, 'utf-8') if existing else request_id
+
+
+class SQLiteStateManager(BaseStateManager):
+  """Use an embedded SQLite database for task state storage.
+
+  This is meant for single node deployments.  The database uses WAL mode so
+  that clients can read while the server and workers write, and the columns
+  used for filtering are indexed so that status and statistics queries can be
+  done with SQL instead of loading every Task.
+
+  Attributes:
+    connection (sqlite3.Connection): The database connection.
+    path (str): Path to the database file.
+  """
+
+  # Columns of the tasks table and their types.
+  COLUMNS = collections.OrderedDict([('id', 'TEXT PRIMARY KEY'),
+                                     ('instance', 'TEXT'), ('job_id', 'TEXT'),
+                                     ('name', 'TEXT'), ('request_id', 'TEXT'),
+                                     ('requester', 'TEXT'),
+                                     ('worker_name', 'TEXT'),
+                                     ('status', 'TEXT'),
+                                     ('successful', 'INTEGER'),
+                                     ('run_time', 'REAL'),
+                                     ('last_update', 'REAL'),
+                                     ('report_priority', 'INTEGER'),
+                                     ('report_data', 'TEXT'),
+                                     ('saved_paths', 'TEXT'),
+                                     ('blob_refs', 'TEXT')])
+  INDEXES = {
+      'tasks_instance_last_update': ('instance', 'last_update'),
+      'tasks_request_id': ('request_id',),
+      'tasks_requester': ('requester',),
+      'tasks_worker_name': ('worker_name',),
+      'tasks_successful': ('successful',)
+  }
+  # Tables for the rolling Task aggregates (see task_aggregates).  Tasks are
+  # recorded in aggregated_tasks so that they are only counted once, and the
+  # bucket of request_spans is the one its latest Task completed in.
+  AGGREGATE_TABLES = collections.OrderedDict(
+      [(
+          'task_aggregates',
+          'instance TEXT, bucket INTEGER, dimension TEXT, value TEXT, '
+          'count INTEGER, successful INTEGER, failed INTEGER, '
+          'run_time_count INTEGER, run_time_total REAL, run_time_squares REAL, '
+          'run_time_min REAL, run_time_max REAL, '
+          'PRIMARY KEY (instance, bucket, dimension, value)'),
+       (
+           'task_aggregate_bins',
+           'instance TEXT, bucket INTEGER, dimension TEXT, value TEXT, '
+           'bin INTEGER, count INTEGER, '
+           'PRIMARY KEY (instance, bucket, dimension, value, bin)'),
+       ('aggregated_tasks', 'id TEXT PRIMARY KEY, bucket INTEGER'),
+       (
+           'request_spans',
+           'instance TEXT, request_id TEXT, bucket INTEGER, start_time REAL, '
+           'end_time REAL, PRIMARY KEY (instance, request_id)')])
+  SUPPORTS_AGGREGATES = True
+  # Table for recipes that Task messages refer to (see recipe_store).
+  RECIPE_TABLE = ('recipes', 'hash TEXT PRIMARY KEY, recipe TEXT, expires REAL')
+  # Table for the request deduplication index.
+  REQUEST_KEY_TABLE = (
+      'request_keys', 'key TEXT PRIMARY KEY, request_id TEXT, expires REAL')
+  # Seconds to wait for other writers to release their lock.
+  TIMEOUT = 30
+
+  def __init__(self, path=None):
+    config.LoadConfig()
+    self.path = path if path else config.SQLITE_PATH
+    # The oldest bucket we have pruned expired aggregates for.
+    self._pruned_bucket = None
+    if not self.path:
+      self.path = os.path.join(config.OUTPUT_DIR, 'turbinia-state.db')
+    try:
+      self.connection = sqlite3.connect(
+          self.path, timeout=self.TIMEOUT, isolation_level=None)
+      self.connection.execute('PRAGMA journal_mode=WAL')
+      self.connection.execute('PRAGMA synchronous=NORMAL')
+      self._create_tables()
+    except sqlite3.Error as exception:
+      raise TurbiniaException(
+          'Could not open SQLite database {0:s}: {1!s}'.format(
+              self.path, exception))
+
+  def _create_tables(self):
+    """Creates the tasks table and indexes if they don't exist."""
+    columns = ', '.join(
+        '{0:s} {1:s}'.format(name, type_)
+        for name, type_ in self.COLUMNS.items())
+    self.connection.execute(
+        'CREATE TABLE IF NOT EXISTS tasks ({0:s})'.format(columns))
+    # Add any columns missing from databases created by older versions.
+    existing = {
+        row[1] for row in self.connection.execute('PRAGMA table_info(tasks)')
+    }
+    for name, type_ in self.COLUMNS.items():
+      if name not in existing:
+        self.connection.execute(
+            'ALTER TABLE tasks ADD COLUMN {0:s} {1:s}'.format(name, type_))
+    for name, columns in self.INDEXES.items():
+      self.connection.execute(
+          'CREATE INDEX IF NOT EXISTS {0:s} ON tasks ({1:s})'.format(
+              name, ', '.join(columns)))
+    for name, columns in list(self.AGGREGATE_TABLES.items()) + [
+        self.RECIPE_TABLE, self.REQUEST_KEY_TABLE
+    ]:
+      self.connection.execute(
+          'CREATE TABLE IF NOT EXISTS {0:s} ({1:s})'.format(name, columns))
+    existing = {
+        row[1] for row in self.connection.execute('PRAGMA table_info(recipes)')
+    }
+    if 'expires' not in existing:
+      self.connection.execute('ALTER TABLE recipes ADD COLUMN expires REAL')
+
+  def _validate_data(self, data):
+    return data
+
+  @staticmethod
+  def _get_timestamp(datetime_):
+    """Converts a datetime to seconds since the epoch."""
+    return (datetime_ - datetime(1970, 1, 1)).total_seconds()
+
+  def _get_row(self, task):
+    """Gets the column values to store for a Task.
+
+    Args:
+      task: A TurbiniaTask object
+
+    Returns:
+      tuple: The values in the same order as COLUMNS.
+    """
+    task_data = self.get_task_dict(task)
+    if task_data.get('last_update'):
+      task_data['last_update'] = self._get_timestamp(task_data['last_update'])
+    if task_data.get('successful') is not None:
+      task_data['successful'] = int(task_data['successful'])
+    task_data['saved_paths'] = json.dumps(task_data.get('saved_paths'))
+    task_data['blob_refs'] = json.dumps(task_data.get('blob_refs'))
+    return tuple(task_data.get(column) for column in self.COLUMNS)
+
+  def _get_task_dict_from_row(self, row):
+    """Converts a database row into a Task dict.
+
+    Args:
+      row (tuple): The values in the same order as COLUMNS.
+
+    Returns:
+      dict: The Task data.
+    """
+    task = dict(zip(self.COLUMNS, row))
+    if task.get('last_update') is not None:
+      task['last_update'] = datetime(
+          1970, 1, 1) + timedelta(seconds=task['last_update'])
+    if task.get('run_time'):
+      task['run_time'] = timedelta(seconds=task['run_time'])
+    if task.get('successful') is not None:
+      task['successful'] = bool(task['successful'])
+    task['saved_paths'] = json.loads(task['saved_paths'] or 'null')
+    task['blob_refs'] = json.loads(task['blob_refs'] or 'null')
+    return task
+
+  def _get_filters(
+      self, instance, days=0, task_id=None, request_id=None, requester=None,
+      worker_name=None):
+    """Gets the SQL WHERE clause for Task queries.
+
+    Args:
+      instance (string): The Turbinia instance name.
+      days (int): The number of days we want history for.
+      task_id (string): The Id of the task.
+      request_id (string): The Id of the request we want tasks for.
+      requester (string): The user of the request we want tasks for.
+      worker_name (string): The name of the worker we want tasks for.
+
+    Returns:
+      Tuple(str, list): The WHERE clause and its parameters.
+    """
+    clauses = []
+    params = []
+    if instance:
+      clauses.append('instance = ?')
+      params.append(instance)
+    # This is in the same order of precedence as the other state managers.
+    if days:
+      start_time = datetime.now() - timedelta(days=days)
+      clauses.append('last_update > ?')
+      params.append(self._get_timestamp(start_time))
+    elif task_id:
+      clauses.append('id = ?')
+      params.append(task_id)
+    elif request_id:
+      clauses.append('request_id = ?')
+      params.append(request_id)
+    if requester:
+      clauses.append('requester = ?')
+      params.append(requester)
+    if worker_name:
+      clauses.append('worker_name = ?')
+      params.append(worker_name)
+
+    where = ' WHERE ' + ' AND '.join(clauses) if clauses else ''
+    return where, params
+
+  def get_task_data(
+      self, instance, days=0, task_id=None, request_id=None, requester=None,
+      worker_name=None):
+    """Gets task data from SQLite.
+
+    Args:
+      instance (string): The Turbinia instance name (by default the same as the
+          INSTANCE_ID in the config).
+      days (int): The number of days we want history for.
+      task_id (string): The Id of the task.
+      request_id (string): The Id of the request we want tasks for.
+      requester (string): The user of the request we want tasks for.
+      worker_name (string): The name of the worker we want tasks for.
+
+    Returns:
+      List of Task dict objects.
+    """
+    where, params = self._get_filters(
+        instance, days, task_id, request_id, requester, worker_name)
+    query = 'SELECT {0:s} FROM tasks{1:s} ORDER BY last_update'.format(
+        ', '.join(self.COLUMNS), where)
+    rows = self.connection.execute(query, params).fetchall()
+    return [self._get_task_dict_from_row(row) for row in rows]
+
+  def get_task_statistics(
+      self, instance, days=0, task_id=None, request_id=None, requester=None):
+    """Gets Task run time statistics with SQL aggregation.
+
+    Tasks without a run time are ignored.  The percentiles use the nearest-rank
+    method like task_statistics.TaskStatsTable, and are calculated with window
+    functions so that the run times don't need to be loaded.
+
+    Args:
+      instance (string): The Turbinia instance name (by default the same as the
+          INSTANCE_ID in the config).
+      days (int): The number of days we want history for.
+      task_id (string): The Id of the task.
+      request_id (string): The Id of the request we want tasks for.
+      requester (string): The user of the request we want tasks for.
+
+    Returns:
+      dict: Statistic names mapped to task_statistics.RunTimeSummary tuples of
+          run times in seconds.  The 'tasks_per_type', 'tasks_per_worker' and
+          'tasks_per_user' values are dicts mapping names to these tuples.
+    """
+    where, params = self._get_filters(
+        instance, days, task_id, request_id, requester)
+    where = where + (' AND'
+                     if where else ' WHERE') + (' run_time > 0 AND name != ?')
+    params.append(task_statistics.DUPLICATE_REQUEST_TASK)
+    # The nearest rank of percentile p in n run times is ceil(n * p / 100).
+    percentiles = ''.join(
+        ', MAX(CASE WHEN run_rank = (run_count * {0:d} + 99) / 100 '
+        'THEN run_time END)'.format(percentile)
+        for percentile in task_statistics.PERCENTILES)
+    summary_query = (
+        'SELECT grp, COUNT(*), MIN(run_time), AVG(run_time), MAX(run_time), '
+        'SUM(run_time), AVG(run_time * run_time){0:s} FROM (SELECT grp, '
+        'run_time, ROW_NUMBER() OVER (PARTITION BY grp ORDER BY run_time) '
+        'AS run_rank, COUNT(*) OVER (PARTITION BY grp) AS run_count '
+        'FROM ({{0:s}})) GROUP BY grp'.format(percentiles))
+
+    def _get_summary(row):
+      """Replaces the mean of the squared run times with the stddev."""
+      count, min_, mean, max_, total, mean_squares = row[:6]
+      stddev = math.sqrt(max(mean_squares - mean * mean, 0))
+      return task_statistics.RunTimeSummary(
+          count, min_, mean, max_, total, stddev, *row[6:])
+
+    def _query_groups(group_by, extra_where=''):
+      source = 'SELECT {0:s} AS grp, run_time FROM tasks{1:s}{2:s}'.format(
+          group_by, where, extra_where)
+      rows = self.connection.execute(summary_query.format(source), params)
+      return {row[0]: _get_summary(row[1:]) for row in rows}
+
+    empty_summary = task_statistics.RunTimeSummary._make(
+        [0] + [None] * (len(task_statistics.RunTimeSummary._fields) - 1))
+
+    def _query(extra_where=''):
+      return _query_groups('NULL', extra_where).get(None, empty_summary)
+
+    task_stats = {
+        'all_tasks': _query(),
+        'successful_tasks': _query(' AND successful = 1'),
+        'failed_tasks': _query(' AND successful = 0'),
+        'tasks_per_type': _query_groups('name'),
+        'tasks_per_worker': _query_groups('worker_name'),
+        'tasks_per_user': _query_groups('requester')
+    }
+    # The total request time covers the start of the earliest Task to the end
+    # of the latest Task in each request.
+    request_source = (
+        'SELECT NULL AS grp, MAX(last_update) - MIN(last_update - run_time) '
+        'AS run_time FROM tasks{0:s} GROUP BY request_id'.format(where))
+    task_stats['requests'] = empty_summary
+    for row in self.connection.execute(summary_query.format(request_source),
+                                       params):
+      task_stats['requests'] = _get_summary(row[1:])
+    return task_stats
+
+  def _aggregate_rows(self, rows):
+    """Adds completed Tasks to the aggregates.
+
+    This must be called inside the transaction that writes the Tasks.  Tasks
+    that have already been added are skipped.
+
+    Args:
+      rows (list[tuple]): The Task rows in the same order as COLUMNS.
+    """
+    aggregate_query = (
+        'INSERT INTO task_aggregates (instance, bucket, dimension, value, '
+        'count, successful, failed, run_time_count, run_time_total, '
+        'run_time_squares, run_time_min, run_time_max) '
+        'VALUES (?, ?, ?, ?, 1, ?, ?, ?, ?, ?, ?, ?) '
+        'ON CONFLICT (instance, bucket, dimension, value) DO UPDATE SET '
+        'count = count + 1, successful = successful + excluded.successful, '
+        'failed = failed + excluded.failed, '
+        'run_time_count = run_time_count + excluded.run_time_count, '
+        'run_time_total = run_time_total + excluded.run_time_total, '
+        'run_time_squares = run_time_squares + excluded.run_time_squares, '
+        'run_time_min = COALESCE(MIN(run_time_min, excluded.run_time_min), '
+        'run_time_min, excluded.run_time_min), '
+        'run_time_max = COALESCE(MAX(run_time_max, excluded.run_time_max), '
+        'run_time_max, excluded.run_time_max)')
+    bin_query = (
+        'INSERT INTO task_aggregate_bins (instance, bucket, dimension, value, '
+        'bin, count) VALUES (?, ?, ?, ?, ?, 1) '
+        'ON CONFLICT (instance, bucket, dimension, value, bin) DO UPDATE SET '
+        'count = count + 1')
+    span_query = (
+        'INSERT INTO request_spans (instance, request_id, bucket, start_time, '
+        'end_time) VALUES (?, ?, ?, ?, ?) '
+        'ON CONFLICT (instance, request_id) DO UPDATE SET '
+        'bucket = MAX(bucket, excluded.bucket), '
+        'start_time = MIN(start_time, excluded.start_time), '
+        'end_time = MAX(end_time, excluded.end_time)')
+    for row in rows:
+      task_data = dict(zip(self.COLUMNS, row))
+      if not task_aggregates.is_completed(task_data):
+        continue
+      last_update = datetime(1970, 1,
+                             1) + timedelta(seconds=task_data['last_update'])
+      bucket = task_aggregates.get_bucket(last_update)
+      cursor = self.connection.execute(
+          'INSERT OR IGNORE INTO aggregated_tasks (id, bucket) VALUES (?, ?)',
+          (task_data['id'], bucket))
+      if not cursor.rowcount:
+        continue
+      successful = 1 if task_data.get('successful') else 0
+      run_time = task_aggregates.get_run_time(task_data)
+      if run_time:
+        self.connection.execute(
+            span_query, (
+                task_data.get('instance'), task_data.get('request_id'), bucket,
+                task_data['last_update'] - run_time, task_data['last_update']))
+      for dimension, value in task_aggregates.get_dimensions(task_data):
+        key = (task_data.get('instance'), bucket, dimension, value)
+        if run_time:
+          self.connection.execute(
+              aggregate_query, key + (
+                  successful, 1 - successful, 1, run_time, run_time * run_time,
+                  run_time, run_time))
+          self.connection.execute(
+              bin_query,
+              key + (task_aggregates.RunTimeSketch.get_bin(run_time),))
+        else:
+          self.connection.execute(
+              aggregate_query,
+              key + (successful, 1 - successful, 0, 0.0, 0.0, None, None))
+    self._prune_aggregates()
+
+  def _prune_aggregates(self):
+    """Deletes aggregates older than the retention time.
+
+    This is done at most once per bucket.
+    """
+    oldest_bucket = task_aggregates.get_bucket(
+        datetime.now() - timedelta(seconds=task_aggregates.get_retention()))
+    if self._pruned_bucket == oldest_bucket:
+      return
+    for table in self.AGGREGATE_TABLES:
+      self.connection.execute(
+          'DELETE FROM {0:s} WHERE bucket < ?'.format(table), (oldest_bucket,))
+    self._pruned_bucket = oldest_bucket
+
+  def get_task_aggregates(self, instance, days=0):
+    start_bucket = task_aggregates.get_start_bucket(days)
+    counters = list(task_aggregates.COUNTERS) + ['run_time_min', 'run_time_max']
+    bins = collections.defaultdict(dict)
+    rows = self.connection.execute(
+        'SELECT bucket, dimension, value, bin, count FROM task_aggregate_bins '
+        'WHERE instance = ? AND bucket >= ?', (instance, start_bucket))
+    for bucket, dimension, value, bin_, count in rows:
+      bins[(bucket, dimension, value)][bin_] = count
+    aggregates = {}
+    rows = self.connection.execute(
+        'SELECT bucket, dimension, value, {0:s} FROM task_aggregates '
+        'WHERE instance = ? AND bucket >= ?'.format(', '.join(counters)),
+        (instance, start_bucket))
+    for row in rows:
+      key = tuple(row[:3])
+      aggregates[key] = task_aggregates.TaskAggregate.from_counters(
+          dict(zip(counters, row[3:])), bins.get(key))
+    return aggregates
+
+  def get_oldest_aggregate_bucket(self, instance):
+    return self.connection.execute(
+        'SELECT MIN(bucket) FROM task_aggregates WHERE instance = ?',
+        (instance,)).fetchone()[0]
+
+  def get_request_spans(self, instance, days=0):
+    rows = self.connection.execute(
+        'SELECT request_id, start_time, end_time FROM request_spans '
+        'WHERE instance = ? AND bucket >= ?',
+        (instance, task_aggregates.get_start_bucket(days)))
+    return {row[0]: (row[1], row[2]) for row in rows}
+
+  def update_task(self, task):
+    self.update_tasks([task])
+
+  def update_tasks(self, tasks):
+    """Updates or creates many Tasks in a single transaction.
+
+    Args:
+      tasks (list[TurbiniaTask]): The Tasks to update.
+    """
+    if not tasks:
+      return
+    rows = []
+    for task in tasks:
+      task.touch()
+      rows.append(self._get_row(task))
+      task.state_key = task.id
+    updates = ', '.join(
+        '{0:s} = excluded.{0:s}'.format(column)
+        for column in self.COLUMNS
+        if column != 'id')
+    query = (
+        'INSERT INTO tasks ({0:s}) VALUES ({1:s}) ON CONFLICT(id) DO UPDATE '
+        'SET {2:s}'.format(
+            ', '.join(self.COLUMNS), ', '.join('?' * len(self.COLUMNS)),
+            updates))
+    log.info('Updating {0:d} tasks in SQLite'.format(len(rows)))
+    self._execute_many(query, rows, aggregate=True)
+
+  def write_new_task(self, task):
+    log.info('Writing new task {0:s} into SQLite'.format(task.name))
+    # OR IGNORE prevents overwriting (i.e. no unintentional task clobbering)
+    query = 'INSERT OR IGNORE INTO tasks ({0:s}) VALUES ({1:s})'.format(
+        ', '.join(self.COLUMNS), ', '.join('?' * len(self.COLUMNS)))
+    self._execute_many(query, [self._get_row(task)], aggregate=True)
+    task.state_key = task.id
+    return task.id
+
+  def write_recipe(self, recipe_hash, recipe, ttl):
+    now = self._get_timestamp(datetime.now())
+    try:
+      with self.connection:
+        self.connection.execute(
+            'DELETE FROM recipes WHERE expires <= ?', (now,))
+        # Recipes stored by older versions don't have an expiry time yet.
+        self.connection.execute(
+            'UPDATE recipes SET expires = ? WHERE expires IS NULL',
+            (now + ttl,))
+        self.connection.execute(
+            'INSERT INTO recipes (hash, recipe, expires) VALUES (?, ?, ?) '
+            'ON CONFLICT (hash) DO UPDATE SET '
+            'expires = MAX(expires, excluded.expires)',
+            (recipe_hash, recipe, now + ttl))
+    except sqlite3.Error as exception:
+      raise TurbiniaException(
+          'Failed to write recipe {0:s} to SQLite: {1!s}'.format(
+              recipe_hash, exception))
+
+  def read_recipe(self, recipe_hash):
+    try:
+      row = self.connection.execute(
+          'SELECT recipe FROM recipes WHERE hash = ? AND '
+          '(expires IS NULL OR expires > ?)',
+          (recipe_hash, self._get_timestamp(datetime.now()))).fetchone()
+    except sqlite3.Error as exception:
+      raise TurbiniaException(
+          'Failed to read recipe {0:s} from SQLite: {1!s}'.format(
+              recipe_hash, exception))
+    return row[0] if row else None
+
+  def register_request_key(self, idempotency_key, request_id, ttl):
+    now = self._get_timestamp(datetime.now())
+    try:
+      with self.connection:
+        self.connection.execute(
+            'DELETE FROM request_keys WHERE expires <= ?', (now,))
+        self.connection.execute(
+            'INSERT OR IGNORE INTO request_keys (key, request_id, expires) '
+            'VALUES (?, ?, ?)', (idempotency_key, request_id, now + ttl))
+        row = self.connection.execute(
+            'SELECT request_id FROM request_keys WHERE key = ?',
+            (idempotency_key,)).fetchone()
+    except sqlite3.Error as exception:
+      raise TurbiniaException(
+          'Failed to register request {0:s} in SQLite: {1!s}'.format(
+              request_id, exception))
+    return row[0]
+
+  def _execute_many(self, query, rows, aggregate=False):
+    """Executes a query for many rows in one transaction.
+
+    Args:
+      query (str): The SQL query.
+      rows (list[tuple]): Parameters for each row.
+      aggregate (bool): Whether the rows are Tasks to add to the aggregates.
+    """
+    try:
+      with self.connection:
+        self.connection.execute('BEGIN IMMEDIATE')
+        self.connection.executemany(query, rows)
+        if aggregate and self.aggregates_enabled():
+          self._aggregate_rows(rows)
+    except sqlite3.Error as exception:
+      log.error('Failed to write tasks to SQLite: {0!s}'.format(exception))
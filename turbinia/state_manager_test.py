@@ -17,12 +17,20 @@
 from __future__ import unicode_literals
 
 import copy
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+import json
 import os
+import shutil
+import sqlite3
 import tempfile
 import unittest
 import mock
 
+from turbinia import blob_store
 from turbinia import config
+from turbinia import task_aggregates
 from turbinia.workers import TurbiniaTask
 from turbinia.workers import TurbiniaTaskResult
 
@@ -35,6 +43,7 @@ class TestPSQStateManager(unittest.TestCase):
   def _get_state_manager(self):
     """Gets a Datastore State Manager object for test."""
     config.STATE_MANAGER = 'Datastore'
+    config.TASK_EVENTS = False
     return state_manager.get_state_manager()
 
   @mock.patch('turbinia.state_manager.datastore.Client')
@@ -110,3 +119,635 @@ class TestPSQStateManager(unittest.TestCase):
     self.assertNotEqual(test_data['status'], self.test_data['status'])
     self.assertLessEqual(
         len(test_data['status']), state_manager.MAX_DATASTORE_STRLEN)
+
+  @mock.patch('turbinia.state_manager.datastore.Entity')
+  @mock.patch('turbinia.state_manager.datastore.Client')
+  def testStateManagerUpdateTasksBatched(self, _, mock_entity):
+    """Test that Task updates are written as batched blind upserts."""
+    self.state_manager = self._get_state_manager()
+    self.state_manager.MAX_BATCH_SIZE = 2
+    tasks = [self.task]
+    for name in ('Task2', 'Task3'):
+      task = TurbiniaTask(
+          base_output_dir=self.base_output_dir, name=name,
+          request_id=self.test_data['request_id'])
+      task.result = self.result
+      tasks.append(task)
+
+    self.state_manager.update_tasks(tasks)
+
+    client = self.state_manager.client
+    client.get.assert_not_called()
+    client.transaction.assert_not_called()
+    self.assertEqual(client.put_multi.call_count, 2)
+    self.assertEqual(len(client.put_multi.call_args_list[0][0][0]), 2)
+    self.assertEqual(len(client.put_multi.call_args_list[1][0][0]), 1)
+    self.assertEqual(
+        mock_entity.call_args[1]['exclude_from_indexes'],
+        self.state_manager.UNINDEXED_ATTRIBUTES)
+    self.assertEqual(self.task.state_key, mock_entity.return_value.key)
+
+  @mock.patch('turbinia.state_manager.datastore.Entity')
+  @mock.patch('turbinia.state_manager.datastore.Client')
+  def testStateManagerUpdateTaskError(self, _, __):
+    """Test that Datastore errors are logged and not raised."""
+    self.state_manager = self._get_state_manager()
+    self.state_manager.client.put_multi.side_effect = (
+        state_manager.exceptions.GoogleCloudError('error'))
+    self.state_manager.update_task(self.task)
+    self.assertIsNone(self.task.state_key)
+
+  @mock.patch('turbinia.state_manager.datastore.Client')
+  def testStateManagerRecipes(self, _):
+    """Test recipes are written with an expiry time and expired ones ignored."""
+    self.state_manager = self._get_state_manager()
+    client = self.state_manager.client
+    self.state_manager.write_recipe('abc123', '{"jobs_allowlist": []}', 60)
+    entity = client.put.call_args[0][0]
+    self.assertEqual(entity['recipe'], '{"jobs_allowlist": []}')
+    self.assertGreater(entity['expires'], datetime.now(timezone.utc))
+
+    client.get.return_value = entity
+    self.assertEqual(
+        self.state_manager.read_recipe('abc123'), '{"jobs_allowlist": []}')
+    entity['expires'] = datetime.now(timezone.utc) - timedelta(seconds=1)
+    self.assertIsNone(self.state_manager.read_recipe('abc123'))
+
+  @mock.patch('turbinia.state_manager.datastore.Client')
+  def testRegisterRequestKey(self, _):
+    """Test request keys are compared with timezone aware expiry times."""
+    self.state_manager = self._get_state_manager()
+    client = self.state_manager.client
+    client.get.return_value = None
+    self.assertEqual(
+        self.state_manager.register_request_key('key1', 'req1', 60), 'req1')
+    entity = client.put.call_args[0][0]
+    self.assertEqual(entity['request_id'], 'req1')
+    self.assertGreater(entity['expires'], datetime.now(timezone.utc))
+
+    client.get.return_value = entity
+    self.assertEqual(
+        self.state_manager.register_request_key('key1', 'req2', 60), 'req1')
+    entity['expires'] = datetime.now(timezone.utc) - timedelta(seconds=1)
+    self.assertEqual(
+        self.state_manager.register_request_key('key1', 'req3', 60), 'req3')
+
+    client.get.side_effect = state_manager.exceptions.GoogleCloudError('error')
+    self.assertRaises(
+        state_manager.TurbiniaException,
+        self.state_manager.register_request_key, 'key1', 'req4', 60)
+
+
+@unittest.skipUnless(
+    os.environ.get('DATASTORE_EMULATOR_HOST'),
+    'DATASTORE_EMULATOR_HOST is not set')
+class TestDatastoreStateManagerEmulator(unittest.TestCase):
+  """Test DatastoreStateManager against the Datastore emulator.
+
+  Start the emulator with `gcloud beta emulators datastore start` and set the
+  environment with `$(gcloud beta emulators datastore env-init)` to run these.
+  """
+
+  def setUp(self):
+    config.LoadConfig()
+    self.project_save = config.TURBINIA_PROJECT
+    config.TURBINIA_PROJECT = os.environ.get(
+        'DATASTORE_PROJECT_ID', 'turbinia-test')
+    self.state_manager = state_manager.DatastoreStateManager()
+    self.base_output_dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    config.TURBINIA_PROJECT = self.project_save
+    os.rmdir(self.base_output_dir)
+
+  def testUpdateTasks(self):
+    """Test writing Tasks and reading them back."""
+    tasks = [
+        TurbiniaTask(
+            base_output_dir=self.base_output_dir, name='Task{0:d}'.format(i),
+            request_id='EmulatorRequest') for i in range(3)
+    ]
+    self.state_manager.write_new_task(tasks[0])
+    self.state_manager.update_tasks(tasks)
+
+    keys = [task.state_key for task in tasks]
+    entities = self.state_manager.client.get_multi(keys)
+    self.assertEqual(len(entities), 3)
+    for entity in entities:
+      self.assertEqual(entity['request_id'], 'EmulatorRequest')
+    self.state_manager.client.delete_multi(keys)
+
+
+class TestRedisStateManager(unittest.TestCase):
+  """Test RedisStateManager class."""
+
+  @mock.patch('turbinia.state_manager.redis', create=True)
+  def setUp(self, _):
+    config.LoadConfig()
+    config.TASK_EVENTS = False
+    self.state_manager = state_manager.RedisStateManager()
+    # pylint: disable=protected-access
+    self.state_manager._create_script = mock.MagicMock()
+    self.state_manager._update_script = mock.MagicMock()
+    self.client = self.state_manager.client
+    self.pipeline = self.client.pipeline.return_value
+    self.instance = config.INSTANCE_ID
+    self.task_data = {
+        'id': 'abc',
+        'instance': self.instance,
+        'request_id': 'TestRequestId',
+        'requester': 'testuser',
+        'worker_name': 'testworker',
+        'last_update': '2020-01-02T03:04:05.000000Z',
+        'run_time': 10
+    }
+    self.task_hash = {
+        k.encode('utf-8'): json.dumps(v).encode('utf-8')
+        for k, v in self.task_data.items()
+    }
+
+  def _get_task(self):
+    """Gets a Task to write."""
+    task = TurbiniaTask(name='TestTask', request_id='TestRequestId')
+    task.result = None
+    return task
+
+  @mock.patch.object(config, 'TASK_AGGREGATES', True)
+  def testUpdateTasksAggregates(self):
+    """Test that completed Tasks are added to the aggregates."""
+    # pylint: disable=protected-access
+    self.state_manager._aggregate_script = mock.MagicMock()
+    task = self._get_task()
+    self.state_manager.update_tasks([task])
+    self.state_manager._aggregate_script.assert_not_called()
+
+    task.result = TurbiniaTaskResult()
+    task.result.successful = True
+    task.result.run_time = timedelta(seconds=10)
+    task.result.worker_name = 'testworker'
+    self.state_manager.update_tasks([task])
+    call = self.state_manager._aggregate_script.call_args[1]
+    self.assertEqual(call['client'], self.pipeline)
+    prefix = 'TurbiniaAggregate:{0:s}:'.format(self.instance)
+    bucket = task_aggregates.get_bucket(task.last_update)
+    self.assertEqual(call['keys'][0], prefix + 'task:' + task.id)
+    self.assertIn(
+        '{0:s}{1:d}:worker:testworker'.format(prefix, bucket), call['keys'])
+    self.assertEqual(call['keys'][4], prefix + 'request_ends')
+    self.assertEqual(call['args'][0], bucket)
+    self.assertEqual(call['args'][2:5], ['successful', '10.0', '100.0'])
+    end_time = (task.last_update - task_aggregates.EPOCH).total_seconds()
+    self.assertEqual(
+        call['args'][6:9],
+        ['TestRequestId',
+         repr(end_time - 10.0),
+         repr(end_time)])
+    self.assertIn('type:TestTask', call['args'])
+    # The members are added for the keys after the request span keys.
+    self.assertEqual(len(call['keys']) - 5, len(call['args']) - 9)
+
+  def testGetRequestSpans(self):
+    """Test reading the request spans."""
+    prefix = 'TurbiniaAggregate:{0:s}:'.format(self.instance)
+    self.client.zrange.return_value = [b'3600']
+    self.assertEqual(
+        self.state_manager.get_oldest_aggregate_bucket(self.instance), 3600)
+    self.client.zrangebyscore.return_value = [(b'req1', 50.0), (b'req2', 90.0)]
+    self.client.hmget.return_value = [b'10.0', None]
+    spans = self.state_manager.get_request_spans(self.instance)
+    self.client.zrangebyscore.assert_called_once_with(
+        prefix + 'request_ends', 0, '+inf', withscores=True)
+    self.client.hmget.assert_called_once_with(
+        prefix + 'request_starts', ['req1', 'req2'])
+    self.assertEqual(spans, {'req1': (10.0, 50.0)})
+
+  def testGetTaskAggregates(self):
+    """Test reading the aggregates."""
+    prefix = 'TurbiniaAggregate:{0:s}:'.format(self.instance)
+    self.client.zrangebyscore.return_value = [b'3600']
+    self.pipeline.execute.side_effect = [[{b'all:', b'type:TestTask'}],
+                                         [{
+                                             b'count': b'2',
+                                             b'successful': b'1',
+                                             b'run_time_count': b'1',
+                                             b'run_time_total': b'10.0',
+                                             b'run_time_max': b'10.0',
+                                             b'bin:116': b'1'
+                                         }, {}]]
+    aggregates = self.state_manager.get_task_aggregates(self.instance)
+    self.client.zrangebyscore.assert_called_once_with(
+        prefix + 'buckets', 0, '+inf')
+    self.assertEqual(len(aggregates), 1)
+    aggregate = list(aggregates.values())[0]
+    self.assertEqual(aggregate.count, 2)
+    self.assertEqual(aggregate.run_time_total, 10.0)
+    self.assertEqual(aggregate.sketch.bins, {116: 1})
+
+  def testRecipes(self):
+    """Test recipes are written with an expiry and read by their hash."""
+    self.state_manager.write_recipe('abc123', '{"jobs_allowlist": []}', 60)
+    self.client.set.assert_called_with(
+        'TurbiniaRecipe:abc123', '{"jobs_allowlist": []}', ex=60)
+    self.client.get.return_value = b'{"jobs_allowlist": []}'
+    self.assertEqual(
+        self.state_manager.read_recipe('abc123'), '{"jobs_allowlist": []}')
+    self.client.get.return_value = None
+    self.assertIsNone(self.state_manager.read_recipe('def456'))
+
+  def testRegisterRequestKey(self):
+    """Test request keys are registered with an expiry."""
+    self.client.set.return_value = True
+    self.assertEqual(
+        self.state_manager.register_request_key('key1', 'req1', 60), 'req1')
+    self.client.set.assert_called_with(
+        'TurbiniaRequestKey:key1', 'req1', nx=True, ex=60)
+    self.client.set.return_value = None
+    self.client.get.return_value = b'req1'
+    self.assertEqual(
+        self.state_manager.register_request_key('key1', 'req2', 60), 'req1')
+
+    class RedisError(Exception):
+      pass
+
+    self.client.set.side_effect = RedisError('error')
+    with mock.patch('turbinia.state_manager.redis', create=True) as redis:
+      redis.RedisError = RedisError
+      self.assertRaises(
+          state_manager.TurbiniaException,
+          self.state_manager.register_request_key, 'key1', 'req3', 60)
+
+  def testIndexTask(self):
+    """Test that Task writes maintain the indexes."""
+    # pylint: disable=protected-access
+    self.state_manager._index_task(
+        self.pipeline, 'TurbiniaTask:abc', self.task_data)
+    prefix = 'TurbiniaIndex:{0:s}:'.format(self.instance)
+    self.pipeline.zadd.assert_called_once_with(
+        prefix + 'last_update', {'TurbiniaTask:abc': 1577934245.0})
+    self.pipeline.sadd.assert_has_calls([
+        mock.call(self.state_manager.INSTANCES_KEY, self.instance),
+        mock.call(prefix + 'request:TestRequestId', 'TurbiniaTask:abc'),
+        mock.call(prefix + 'requester:testuser', 'TurbiniaTask:abc'),
+        mock.call(prefix + 'worker:testworker', 'TurbiniaTask:abc')
+    ], any_order=True)
+
+  def testWriteNewTask(self):
+    """Test that new Tasks are written with their indexes in a pipeline."""
+    task = self._get_task()
+    self.pipeline.execute.return_value = [1]
+    key = self.state_manager.write_new_task(task)
+    self.assertEqual(key, 'TurbiniaTask:{0:s}'.format(task.id))
+    self.assertEqual(task.state_key, key)
+    # pylint: disable=protected-access
+    create_script = self.state_manager._create_script
+    create_script.assert_called_once()
+    self.assertEqual(create_script.call_args[1]['keys'], [key])
+    self.assertEqual(create_script.call_args[1]['client'], self.pipeline)
+    args = create_script.call_args[1]['args']
+    fields = dict(zip(args[::2], args[1::2]))
+    self.assertEqual(fields['request_id'], '"TestRequestId"')
+    self.pipeline.zadd.assert_called_once()
+    self.pipeline.execute.assert_called_once()
+
+  def testUpdateTasksPublishesEvents(self):
+    """Test that Task state changes are published in the update pipeline."""
+    task = self._get_task()
+    self.pipeline.execute.return_value = [1]
+    publisher = mock.MagicMock()
+    with mock.patch.object(self.state_manager, 'get_event_publisher',
+                           return_value=publisher):
+      self.state_manager.update_tasks([task])
+    publisher.publish.assert_called_once()
+    task_dicts = publisher.publish.call_args[0][0]
+    self.assertEqual(task_dicts[0]['id'], task.id)
+    self.assertEqual(publisher.publish.call_args[1]['client'], self.pipeline)
+
+  def testUpdateTasksOnlyChangedFields(self):
+    """Test that updates only write the fields that have changed."""
+    task = self._get_task()
+    self.pipeline.execute.return_value = [1]
+    self.state_manager.write_new_task(task)
+    task.requester = 'newuser'
+    self.state_manager.update_tasks([task])
+
+    # pylint: disable=protected-access
+    update_script = self.state_manager._update_script
+    update_script.assert_called_once()
+    args = update_script.call_args[1]['args']
+    self.assertEqual(sorted(args[::2]), ['last_update', 'requester'])
+    self.assertIn('"newuser"', args)
+
+  def testUpdateTasksMissing(self):
+    """Test that updating Tasks that don't exist writes new Tasks."""
+    task = self._get_task()
+    self.pipeline.execute.return_value = [0]
+    self.state_manager.update_tasks([task])
+    # pylint: disable=protected-access
+    self.state_manager._create_script.assert_called_once()
+    self.assertEqual(task.state_key, 'TurbiniaTask:{0:s}'.format(task.id))
+
+  def testUpdateTasksLegacy(self):
+    """Test that updating legacy JSON string Tasks converts them to hashes."""
+    task = self._get_task()
+    task.state_key = 'TurbiniaTask:{0:s}'.format(task.id)
+    self.pipeline.execute.return_value = [-1]
+    self.state_manager.update_tasks([task])
+    self.pipeline.delete.assert_called_once_with(task.state_key)
+    # pylint: disable=protected-access
+    self.state_manager._create_script.assert_called_once()
+
+  def testGetTaskDataByRequest(self):
+    """Test that Tasks are looked up by index instead of scanning."""
+    self.client.get.return_value = self.state_manager.INDEX_VERSION
+    self.client.smembers.return_value = {b'TurbiniaTask:abc'}
+    self.pipeline.execute.return_value = [self.task_hash]
+
+    tasks = self.state_manager.get_task_data(
+        self.instance, request_id='TestRequestId')
+
+    self.client.scan_iter.assert_not_called()
+    self.client.smembers.assert_called_with(
+        'TurbiniaIndex:{0:s}:request:TestRequestId'.format(self.instance))
+    self.pipeline.hgetall.assert_called_once_with('TurbiniaTask:abc')
+    self.assertEqual(len(tasks), 1)
+    self.assertEqual(tasks[0]['id'], 'abc')
+    self.assertEqual(tasks[0]['run_time'], timedelta(seconds=10))
+    self.assertIsInstance(tasks[0]['last_update'], datetime)
+
+  def testGetTaskDataLegacy(self):
+    """Test that Tasks stored as legacy JSON strings can be read."""
+    self.client.get.return_value = self.state_manager.INDEX_VERSION
+    self.client.smembers.return_value = {b'TurbiniaTask:abc'}
+    self.pipeline.execute.return_value = [Exception('WRONGTYPE')]
+    self.client.mget.return_value = [json.dumps(self.task_data)]
+
+    tasks = self.state_manager.get_task_data(
+        self.instance, request_id='TestRequestId')
+
+    self.client.mget.assert_called_once_with(['TurbiniaTask:abc'])
+    self.assertEqual(len(tasks), 1)
+    self.assertEqual(tasks[0]['id'], 'abc')
+
+  def testGetTaskDataByDays(self):
+    """Test getting Tasks by time filtered by requester."""
+    self.client.get.return_value = self.state_manager.INDEX_VERSION
+    self.client.zrangebyscore.return_value = [
+        b'TurbiniaTask:abc', b'TurbiniaTask:def'
+    ]
+    self.client.smembers.return_value = {b'TurbiniaTask:abc'}
+    self.pipeline.execute.return_value = [self.task_hash]
+
+    tasks = self.state_manager.get_task_data(
+        self.instance, days=1, requester='testuser')
+
+    self.pipeline.hgetall.assert_called_once_with('TurbiniaTask:abc')
+    self.assertEqual(len(tasks), 1)
+
+  def testBuildIndexes(self):
+    """Test that indexes are built for existing Tasks on first query."""
+    self.client.get.return_value = None
+    self.client.scan_iter.return_value = [b'TurbiniaTask:abc']
+    self.client.zrange.return_value = []
+    self.pipeline.execute.side_effect = [[self.task_hash],
+                                         [Exception('WRONGTYPE')], []]
+
+    self.state_manager.get_task_data(self.instance)
+    self.state_manager.get_task_data(self.instance)
+
+    self.client.scan_iter.assert_called_once()
+    self.pipeline.zadd.assert_called_once()
+    # pylint: disable=protected-access
+    self.state_manager._create_script.assert_not_called()
+    self.client.set.assert_called_once_with(
+        self.state_manager.INDEX_VERSION_KEY, self.state_manager.INDEX_VERSION)
+
+
+class TestSQLiteStateManager(unittest.TestCase):
+  """Test SQLiteStateManager class."""
+
+  def setUp(self):
+    config.LoadConfig()
+    self.sqlite_patcher = mock.patch.object(
+        state_manager, 'sqlite3', sqlite3, create=True)
+    self.sqlite_patcher.start()
+    self.tmp_dir = tempfile.mkdtemp(prefix='turbinia-test-sqlite')
+    self.state_manager = state_manager.SQLiteStateManager(
+        path=os.path.join(self.tmp_dir, 'state.db'))
+
+  def tearDown(self):
+    self.state_manager.connection.close()
+    self.sqlite_patcher.stop()
+    shutil.rmtree(self.tmp_dir)
+
+  def _get_task(self, name, request_id, requester, run_time, successful):
+    """Gets a Task with a result to write."""
+    task = TurbiniaTask(
+        name=name, request_id=request_id, requester=requester,
+        base_output_dir=self.tmp_dir)
+    task.output_manager = mock.MagicMock()
+    task.output_manager.get_local_output_dirs.return_value = (
+        self.tmp_dir, self.tmp_dir)
+    task.result = TurbiniaTaskResult(base_output_dir=self.tmp_dir)
+    with mock.patch('turbinia.state_manager.get_state_manager'):
+      task.result.setup(task)
+    task.result.run_time = timedelta(seconds=run_time)
+    task.result.successful = successful
+    task.result.saved_paths = ['/path/{0:s}'.format(name)]
+    return task
+
+  def testWalMode(self):
+    """Test that the database uses WAL mode and indexes."""
+    mode = self.state_manager.connection.execute(
+        'PRAGMA journal_mode').fetchone()[0]
+    self.assertEqual(mode, 'wal')
+    indexes = [
+        row[1] for row in self.state_manager.connection.execute(
+            'PRAGMA index_list(tasks)')
+    ]
+    for index in self.state_manager.INDEXES:
+      self.assertIn(index, indexes)
+
+  def testWriteAndGetTaskData(self):
+    """Test writing and querying Tasks."""
+    task1 = self._get_task('Task1', 'request1', 'user1', 10, True)
+    task2 = self._get_task('Task2', 'request2', 'user2', 20, False)
+    self.state_manager.write_new_task(task1)
+    self.state_manager.update_tasks([task1, task2])
+
+    instance = config.INSTANCE_ID
+    tasks = self.state_manager.get_task_data(instance)
+    self.assertEqual(len(tasks), 2)
+    tasks = self.state_manager.get_task_data(instance, request_id='request2')
+    self.assertEqual(len(tasks), 1)
+    self.assertEqual(tasks[0]['id'], task2.id)
+    self.assertIs(tasks[0]['successful'], False)
+    self.assertEqual(tasks[0]['run_time'], timedelta(seconds=20))
+    self.assertEqual(tasks[0]['saved_paths'], ['/path/Task2'])
+    self.assertIsInstance(tasks[0]['last_update'], datetime)
+    self.assertEqual(
+        len(self.state_manager.get_task_data(instance, requester='user1')), 1)
+    self.assertEqual(
+        len(self.state_manager.get_task_data(instance, task_id=task1.id)), 1)
+    self.assertEqual(len(self.state_manager.get_task_data(instance, days=1)), 2)
+    self.assertEqual(len(self.state_manager.get_task_data('other')), 0)
+
+  def testLargeFieldsInBlobStore(self):
+    """Test large fields are stored in the blob store with a reference."""
+    # pylint: disable=protected-access
+    blob_dir = os.path.join(self.tmp_dir, 'blobs')
+    self.state_manager._blob_store = blob_store.LocalBlobStore(path=blob_dir)
+    self.state_manager._blob_store.threshold = 100
+    task = self._get_task('Task1', 'request1', 'user1', 10, True)
+    task.result.report_data = 'A' * 1000
+    self.state_manager.update_task(task)
+
+    task_dict = self.state_manager.get_task_data(config.INSTANCE_ID)[0]
+    self.assertLessEqual(len(task_dict['report_data']), 100)
+    self.assertIn('report_data', task_dict['blob_refs'])
+    task_dict = blob_store.resolve_task_fields(
+        task_dict, self.state_manager._blob_store)
+    self.assertEqual(task_dict['report_data'], 'A' * 1000)
+
+  def testAddsMissingColumns(self):
+    """Test that columns are added to databases from older versions."""
+    path = os.path.join(self.tmp_dir, 'old.db')
+    connection = sqlite3.connect(path)
+    connection.execute('CREATE TABLE tasks (id TEXT PRIMARY KEY)')
+    connection.close()
+    manager = state_manager.SQLiteStateManager(path=path)
+    columns = [
+        row[1]
+        for row in manager.connection.execute('PRAGMA table_info(tasks)')
+    ]
+    manager.connection.close()
+    self.assertEqual(columns, list(manager.COLUMNS))
+
+  def testWriteNewTaskDoesNotClobber(self):
+    """Test that writing an existing new Task doesn't overwrite it."""
+    task = self._get_task('Task1', 'request1', 'user1', 10, True)
+    self.state_manager.update_task(task)
+    task.result.status = 'changed'
+    self.state_manager.write_new_task(task)
+    tasks = self.state_manager.get_task_data(config.INSTANCE_ID)
+    self.assertEqual(len(tasks), 1)
+    self.assertNotEqual(tasks[0]['status'], 'changed')
+
+  @mock.patch.object(config, 'TASK_AGGREGATES', True)
+  def testTaskAggregates(self):
+    """Test completed Tasks are counted once in the aggregates."""
+    tasks = [
+        self._get_task('Task1', 'request1', 'user1', 10, True),
+        self._get_task('Task1', 'request1', 'user1', 30, False),
+        self._get_task('Task2', 'request2', 'user2', 20, True),
+        self._get_task('Task2', 'request2', 'user2', 20, None)
+    ]
+    self.state_manager.update_tasks(tasks)
+    self.state_manager.update_tasks(tasks)
+    aggregates = task_aggregates.merge_aggregates(
+        self.state_manager.get_task_aggregates(config.INSTANCE_ID, days=1))
+    self.assertEqual(aggregates[('all', '')].count, 3)
+    self.assertEqual(aggregates[('all', '')].successful, 2)
+    self.assertEqual(aggregates[('all', '')].run_time_total, 60.0)
+    self.assertEqual(aggregates[('status', 'failed')].run_time_max, 30.0)
+    self.assertEqual(aggregates[('type', 'Task1')].run_time_min, 10.0)
+    self.assertEqual(aggregates[('type', 'Task1')].run_time_max, 30.0)
+    self.assertEqual(aggregates[('requester', 'user2')].count, 1)
+    self.assertEqual(aggregates[('all', '')].sketch.count, 3)
+    self.assertEqual(
+        self.state_manager.get_task_aggregates('other', days=1), {})
+    self.assertEqual(
+        self.state_manager.get_oldest_aggregate_bucket(config.INSTANCE_ID),
+        task_aggregates.get_bucket(tasks[0].last_update))
+    self.assertIsNone(self.state_manager.get_oldest_aggregate_bucket('other'))
+
+    spans = self.state_manager.get_request_spans(config.INSTANCE_ID, days=1)
+    self.assertEqual(set(spans), {'request1', 'request2'})
+    start_time, end_time = spans['request1']
+    self.assertAlmostEqual(
+        end_time,
+        (tasks[1].last_update - task_aggregates.EPOCH).total_seconds(), delta=1)
+    self.assertAlmostEqual(start_time, end_time - 30, delta=1)
+
+  def testTaskAggregatesDisabled(self):
+    """Test no aggregates are kept when they are disabled."""
+    with mock.patch.object(config, 'TASK_AGGREGATES', False):
+      self.state_manager.update_task(
+          self._get_task('Task1', 'request1', 'user1', 10, True))
+    self.assertEqual(
+        self.state_manager.get_task_aggregates(config.INSTANCE_ID), {})
+
+  def testRecipes(self):
+    """Test recipes are written once and read by their hash until expiry."""
+    self.assertIsNone(self.state_manager.read_recipe('abc123'))
+    self.state_manager.write_recipe('abc123', '{"jobs_allowlist": []}', 60)
+    self.state_manager.write_recipe('abc123', '{"jobs_allowlist": []}', 60)
+    self.assertEqual(
+        self.state_manager.read_recipe('abc123'), '{"jobs_allowlist": []}')
+    # Expired recipes are ignored, and deleted when another one is written.
+    self.state_manager.write_recipe('def456', '{"jobs_denylist": []}', -1)
+    self.assertIsNone(self.state_manager.read_recipe('def456'))
+    self.state_manager.write_recipe('abc123', '{"jobs_allowlist": []}', 60)
+    self.assertEqual(
+        self.state_manager.connection.execute(
+            'SELECT COUNT(*) FROM recipes').fetchone()[0], 1)
+
+  def testRecipesWithoutExpiry(self):
+    """Test recipes stored by older versions are given an expiry time."""
+    self.state_manager.connection.execute(
+        'INSERT INTO recipes (hash, recipe) VALUES (?, ?)',
+        ('abc123', '{"jobs_allowlist": []}'))
+    self.assertEqual(
+        self.state_manager.read_recipe('abc123'), '{"jobs_allowlist": []}')
+    self.state_manager.write_recipe('def456', '{"jobs_denylist": []}', 60)
+    self.assertIsNotNone(
+        self.state_manager.connection.execute(
+            'SELECT expires FROM recipes WHERE hash = ?',
+            ('abc123',)).fetchone()[0])
+
+  def testRegisterRequestKey(self):
+    """Test the first request registered with a key keeps it until expiry."""
+    self.assertEqual(
+        self.state_manager.register_request_key('key1', 'req1', 60), 'req1')
+    self.assertEqual(
+        self.state_manager.register_request_key('key1', 'req2', 60), 'req1')
+    self.assertEqual(
+        self.state_manager.register_request_key('key2', 'req2', 60), 'req2')
+    # Expired keys can be registered again.
+    self.assertEqual(
+        self.state_manager.register_request_key('key3', 'req3', -1), 'req3')
+    self.assertEqual(
+        self.state_manager.register_request_key('key3', 'req4', 60), 'req4')
+
+  def testGetTaskStatistics(self):
+    """Test SQL aggregated statistics."""
+    self.state_manager.update_tasks([
+        self._get_task('Task1', 'request1', 'user1', 10, True),
+        self._get_task('Task1', 'request1', 'user1', 30, False),
+        self._get_task('Task2', 'request2', 'user2', 20, True)
+    ])
+    stats = self.state_manager.get_task_statistics(config.INSTANCE_ID)
+    self.assertEqual(stats['all_tasks'][:5], (3, 10.0, 20.0, 30.0, 60.0))
+    self.assertAlmostEqual(stats['all_tasks'].stddev, 8.16496, places=4)
+    self.assertEqual(stats['all_tasks'][6:], (20.0, 30.0, 30.0))
+    self.assertEqual(
+        stats['successful_tasks'],
+        (2, 10.0, 15.0, 20.0, 30.0, 5.0, 10.0, 20.0, 20.0))
+    self.assertEqual(
+        stats['failed_tasks'],
+        (1, 30.0, 30.0, 30.0, 30.0, 0.0, 30.0, 30.0, 30.0))
+    self.assertEqual(
+        stats['tasks_per_type']['Task1'],
+        (2, 10.0, 20.0, 30.0, 40.0, 10.0, 10.0, 30.0, 30.0))
+    self.assertEqual(
+        stats['tasks_per_user']['user2'],
+        (1, 20.0, 20.0, 20.0, 20.0, 0.0, 20.0, 20.0, 20.0))
+    self.assertEqual(stats['requests'].count, 2)
+    self.assertIsNotNone(stats['requests'].p50)
+
+  def testGetTaskStatisticsEmpty(self):
+    """Test SQL aggregated statistics without any Tasks."""
+    stats = self.state_manager.get_task_statistics(config.INSTANCE_ID)
+    self.assertEqual(stats['all_tasks'].count, 0)
+    self.assertIsNone(stats['all_tasks'].p50)
+    self.assertEqual(stats['requests'].count, 0)
+    self.assertEqual(stats['tasks_per_type'], {})
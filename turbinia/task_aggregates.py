@@ -0,0 +1,400 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Rolling aggregates of completed Tasks maintained by the state manager.
+
+When a Task completes, the state manager adds it to counters for the hour it
+completed in: one for all Tasks, and one each for its Task type, worker and
+requester.  Statistics can then be read from the aggregates in time
+proportional to the number of hour buckets rather than the number of Tasks.
+
+Run time percentiles are estimated with a sketch that counts run times in
+logarithmically sized bins (as in DDSketch).  Unlike a t-digest, each update
+is a plain counter increment, so sketches can be updated atomically by the
+storage backend and merged by adding the counts.
+"""
+
+from __future__ import unicode_literals
+
+import collections
+from datetime import datetime
+from datetime import timedelta
+import math
+
+from turbinia import config
+from turbinia import task_statistics
+
+EPOCH = datetime(1970, 1, 1)
+
+# Size of the time buckets in seconds.
+BUCKET_SECONDS = 3600
+
+# Aggregate dimension names mapped to the Task attribute they group by.  The
+# 'all' dimension has a single value of '' and counts all Tasks, and the
+# 'status' dimension has the values 'successful' and 'failed'.
+DIMENSIONS = collections.OrderedDict([('all', None), ('status', 'successful'),
+                                      ('type', 'name'),
+                                      ('worker', 'worker_name'),
+                                      ('requester', 'requester')])
+
+# Counters kept for every aggregate, mapped to their type.  The run_time_min
+# and run_time_max are kept as well.
+COUNTERS = collections.OrderedDict([('count', int), ('successful', int),
+                                    ('failed', int), ('run_time_count', int),
+                                    ('run_time_total', float),
+                                    ('run_time_squares', float)])
+
+
+def enabled():
+  """Checks whether Task aggregates are enabled in the config.
+
+  Returns:
+    bool: True if aggregates should be maintained.
+  """
+  config.LoadConfig()
+  return bool(config.TASK_AGGREGATES)
+
+
+def get_retention():
+  """Gets how long aggregates are kept for.
+
+  Returns:
+    int: The retention time in seconds.
+  """
+  config.LoadConfig()
+  return int(config.TASK_AGGREGATE_RETENTION_DAYS * 86400)
+
+
+def get_bucket(datetime_):
+  """Gets the time bucket for a time.
+
+  Args:
+    datetime_ (datetime): The time.
+
+  Returns:
+    int: The start of the bucket in seconds since the epoch.
+  """
+  timestamp = (datetime_ - EPOCH).total_seconds()
+  return int(timestamp // BUCKET_SECONDS) * BUCKET_SECONDS
+
+
+def get_start_bucket(days):
+  """Gets the first time bucket covering a number of days of history.
+
+  Args:
+    days (int): The number of days we want history for, or 0 for all history.
+
+  Returns:
+    int: The start of the first bucket, or 0 for all buckets.
+  """
+  if not days:
+    return 0
+  return get_bucket(datetime.now() - timedelta(days=days))
+
+
+def covers(oldest_bucket, days):
+  """Checks whether aggregates cover a number of days of history.
+
+  Only Tasks completed after aggregates were enabled are counted, so the
+  aggregates can only be used for statistics once they go back to the start of
+  the time window.
+
+  Args:
+    oldest_bucket (int): The oldest bucket with aggregates, or None if there
+        are none.
+    days (int): The number of days we want history for, or 0 for all history
+        that is kept in the aggregates.
+
+  Returns:
+    bool: True if the aggregates cover the time window.
+  """
+  if oldest_bucket is None:
+    return False
+  if not days:
+    return oldest_bucket <= get_bucket(
+        datetime.now() - timedelta(seconds=get_retention()))
+  return oldest_bucket <= get_start_bucket(days)
+
+
+def is_completed(task_dict):
+  """Checks whether a Task should be added to the aggregates.
+
+  Args:
+    task_dict (dict): The Task data.
+
+  Returns:
+    bool: True if the Task has completed and is counted in statistics.
+  """
+  return (
+      task_dict.get('successful') is not None and
+      bool(task_dict.get('last_update')) and
+      task_statistics.is_counted(task_dict))
+
+
+def get_dimensions(task_dict):
+  """Gets the aggregates a Task is counted in.
+
+  Args:
+    task_dict (dict): The Task data.
+
+  Returns:
+    list[tuple(str, str)]: (dimension, value) tuples.
+  """
+  dimensions = []
+  for dimension, attribute in DIMENSIONS.items():
+    if attribute is None:
+      value = ''
+    elif dimension == 'status':
+      value = 'successful' if task_dict.get(attribute) else 'failed'
+    else:
+      value = task_dict.get(attribute)
+    dimensions.append((dimension, '' if value is None else str(value)))
+  return dimensions
+
+
+def get_run_time(task_dict):
+  """Gets the run time of a Task in seconds.
+
+  Args:
+    task_dict (dict): The Task data.
+
+  Returns:
+    float: The run time, or None if it is not set.
+  """
+  run_time = task_dict.get('run_time')
+  if isinstance(run_time, timedelta):
+    run_time = run_time.total_seconds()
+  return float(run_time) if run_time else None
+
+
+class RunTimeSketch(object):
+  """Mergeable sketch of run times for estimating percentiles.
+
+  Run times are counted in bins whose bounds grow by a factor of GAMMA, so a
+  run time estimated from its bin is within RELATIVE_ACCURACY of the real one.
+
+  Attributes:
+    bins (dict): Bin indexes mapped to counts.
+  """
+
+  RELATIVE_ACCURACY = 0.01
+  GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+  # Run times below this many seconds are all counted in the same bin.
+  MIN_VALUE = 0.001
+
+  def __init__(self, bins=None):
+    self.bins = collections.Counter(bins or {})
+
+  @property
+  def count(self):
+    """Gets the number of run times in the sketch."""
+    return sum(self.bins.values())
+
+  @classmethod
+  def get_bin(cls, value):
+    """Gets the bin index for a run time.
+
+    Args:
+      value (float): The run time in seconds.
+
+    Returns:
+      int: The bin index.
+    """
+    value = max(value, cls.MIN_VALUE)
+    return int(math.ceil(math.log(value) / math.log(cls.GAMMA)))
+
+  @classmethod
+  def get_bin_value(cls, index):
+    """Gets the run time that represents a bin.
+
+    Args:
+      index (int): The bin index.
+
+    Returns:
+      float: The run time in seconds.
+    """
+    return 2 * cls.GAMMA**index / (cls.GAMMA + 1)
+
+  def add(self, value, count=1):
+    """Adds a run time to the sketch.
+
+    Args:
+      value (float): The run time in seconds.
+      count (int): The number of times to add it.
+    """
+    self.bins[self.get_bin(value)] += count
+
+  def merge(self, other):
+    """Adds the counts of another sketch to this one.
+
+    Args:
+      other (RunTimeSketch): The sketch to merge.
+    """
+    self.bins.update(other.bins)
+
+  def quantile(self, percentile):
+    """Estimates a run time percentile with the nearest rank method.
+
+    Args:
+      percentile (float): The percentile (0-100).
+
+    Returns:
+      float: The estimated run time, or None if the sketch is empty.
+    """
+    count = self.count
+    if not count:
+      return None
+    rank = max(int(math.ceil(count * percentile / 100.0)), 1)
+    seen = 0
+    for index in sorted(self.bins):
+      seen += self.bins[index]
+      if seen >= rank:
+        return self.get_bin_value(index)
+    return None
+
+
+class TaskAggregate(object):
+  """Counters for the Tasks completed in an aggregate.
+
+  Attributes:
+    count (int): The number of completed Tasks.
+    successful (int): The number of successful Tasks.
+    failed (int): The number of failed Tasks.
+    run_time_count (int): The number of Tasks with a run time.
+    run_time_total (float): The sum of the run times in seconds.
+    run_time_squares (float): The sum of the squared run times.
+    run_time_min (float): The minimum run time in seconds.
+    run_time_max (float): The maximum run time in seconds.
+    sketch (RunTimeSketch): Sketch of the run times.
+  """
+
+  def __init__(self):
+    self.count = 0
+    self.successful = 0
+    self.failed = 0
+    self.run_time_count = 0
+    self.run_time_total = 0.0
+    self.run_time_squares = 0.0
+    self.run_time_min = None
+    self.run_time_max = None
+    self.sketch = RunTimeSketch()
+
+  @classmethod
+  def from_counters(cls, counters, bins=None):
+    """Creates an aggregate from stored counters.
+
+    Args:
+      counters (dict): Counter names mapped to values, including
+          run_time_min and run_time_max.  Missing counters are 0.
+      bins (dict): Sketch bin indexes mapped to counts.
+
+    Returns:
+      TaskAggregate: The aggregate.
+    """
+    aggregate = cls()
+    for name, type_ in COUNTERS.items():
+      setattr(aggregate, name, type_(counters.get(name) or 0))
+    for name in ('run_time_min', 'run_time_max'):
+      if counters.get(name) is not None:
+        setattr(aggregate, name, float(counters[name]))
+    aggregate.sketch = RunTimeSketch(bins)
+    return aggregate
+
+  def add_task(self, task_dict):
+    """Adds a completed Task to the aggregate.
+
+    Args:
+      task_dict (dict): The Task data.
+    """
+    self.count += 1
+    if task_dict.get('successful'):
+      self.successful += 1
+    else:
+      self.failed += 1
+    run_time = get_run_time(task_dict)
+    if run_time is None:
+      return
+    self.run_time_count += 1
+    self.run_time_total += run_time
+    self.run_time_squares += run_time * run_time
+    if self.run_time_min is None or run_time < self.run_time_min:
+      self.run_time_min = run_time
+    if self.run_time_max is None or run_time > self.run_time_max:
+      self.run_time_max = run_time
+    self.sketch.add(run_time)
+
+  def merge(self, other):
+    """Adds the counters of another aggregate to this one.
+
+    Args:
+      other (TaskAggregate): The aggregate to merge.
+    """
+    for name in COUNTERS:
+      setattr(self, name, getattr(self, name) + getattr(other, name))
+    for name, function in (('run_time_min', min), ('run_time_max', max)):
+      values = [
+          value for value in (getattr(self, name), getattr(other, name))
+          if value is not None
+      ]
+      setattr(self, name, function(values) if values else None)
+    self.sketch.merge(other.sketch)
+
+  def get_summary(self):
+    """Gets a run time summary of the aggregate.
+
+    Percentiles are estimates from the sketch, and all other values are exact.
+
+    Returns:
+      task_statistics.RunTimeSummary: The summary, or None if no Tasks had a
+          run time.
+    """
+    if not self.run_time_count:
+      return None
+    mean = self.run_time_total / self.run_time_count
+    stddev = math.sqrt(
+        max(self.run_time_squares / self.run_time_count - mean * mean, 0))
+    # Estimates are clamped to the exact min and max.
+    percentiles = [
+        min(
+            max(self.sketch.quantile(percentile), self.run_time_min),
+            self.run_time_max) for percentile in task_statistics.PERCENTILES
+    ]
+    return task_statistics.RunTimeSummary(
+        self.run_time_count, self.run_time_min, mean, self.run_time_max,
+        self.run_time_total, stddev, *percentiles)
+
+
+def merge_aggregates(aggregates, bucket_seconds=None):
+  """Merges aggregates over time buckets.
+
+  Args:
+    aggregates (dict): (bucket, dimension, value) tuples mapped to
+        TaskAggregate objects, as returned by the state manager.
+    bucket_seconds (int): Merge into buckets of this many seconds (e.g. 86400
+        for days), or None to merge all buckets.
+
+  Returns:
+    dict: (dimension, value) tuples mapped to TaskAggregate objects, or
+        (bucket, dimension, value) tuples when bucket_seconds is set.
+  """
+  merged = {}
+  for (bucket, dimension, value), aggregate in aggregates.items():
+    if bucket_seconds:
+      key = (bucket // bucket_seconds * bucket_seconds, dimension, value)
+    else:
+      key = (dimension, value)
+    if key not in merged:
+      merged[key] = TaskAggregate()
+    merged[key].merge(aggregate)
+  return merged
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests the Task aggregates module."""
+
+from __future__ import unicode_literals
+
+from datetime import datetime
+from datetime import timedelta
+import unittest
+
+from turbinia import task_aggregates
+from turbinia import task_statistics
+
+
+class TestRunTimeSketch(unittest.TestCase):
+  """Test RunTimeSketch class."""
+
+  def testQuantile(self):
+    """Tests percentile estimates are within the relative accuracy."""
+    sketch = task_aggregates.RunTimeSketch()
+    self.assertIsNone(sketch.quantile(50))
+    for value in range(1, 1001):
+      sketch.add(float(value))
+    self.assertEqual(sketch.count, 1000)
+    for percentile, expected in ((50, 500.0), (90, 900.0), (99, 990.0)):
+      self.assertAlmostEqual(
+          sketch.quantile(percentile), expected,
+          delta=expected * sketch.RELATIVE_ACCURACY)
+
+  def testMerge(self):
+    """Tests merged sketches are the same as a single sketch."""
+    sketch = task_aggregates.RunTimeSketch()
+    other = task_aggregates.RunTimeSketch()
+    combined = task_aggregates.RunTimeSketch()
+    for value in range(1, 101):
+      (sketch if value % 2 else other).add(float(value))
+      combined.add(float(value))
+    sketch.merge(other)
+    self.assertEqual(sketch.bins, combined.bins)
+
+  def testSmallValues(self):
+    """Tests tiny run times share the smallest bin."""
+    sketch = task_aggregates.RunTimeSketch()
+    sketch.add(0.0)
+    sketch.add(0.0001)
+    self.assertEqual(len(sketch.bins), 1)
+
+
+class TestTaskAggregate(unittest.TestCase):
+  """Test TaskAggregate class and helpers."""
+
+  def setUp(self):
+    self.last_update = datetime(2020, 8, 4, 16, 32, 38, 390390)
+    self.tasks = [
+        self._get_task('Task1', 10, True),
+        self._get_task('Task1', 30, False),
+        self._get_task('Task2', 20, True),
+        self._get_task('Task2', None, False)
+    ]
+
+  def _get_task(self, name, run_time, successful):
+    """Gets Task data that ran for run_time seconds."""
+    return {
+        'id': name,
+        'name': name,
+        'worker_name': 'worker1',
+        'requester': None,
+        'run_time': timedelta(seconds=run_time) if run_time else None,
+        'successful': successful,
+        'last_update': self.last_update
+    }
+
+  def testGetBucket(self):
+    """Tests times are rounded down to the hour."""
+    bucket = task_aggregates.get_bucket(self.last_update)
+    self.assertEqual(
+        task_aggregates.EPOCH + timedelta(seconds=bucket),
+        datetime(2020, 8, 4, 16, 0))
+    self.assertEqual(task_aggregates.get_start_bucket(0), 0)
+
+  def testCovers(self):
+    """Tests aggregates are only used once they cover the time window."""
+    week_ago = task_aggregates.get_start_bucket(7)
+    self.assertFalse(task_aggregates.covers(None, 7))
+    self.assertTrue(task_aggregates.covers(week_ago, 7))
+    self.assertFalse(task_aggregates.covers(week_ago + 3600, 7))
+    self.assertFalse(task_aggregates.covers(week_ago, 0))
+    retention_start = task_aggregates.get_start_bucket(
+        task_aggregates.get_retention() / 86400.0)
+    self.assertTrue(task_aggregates.covers(retention_start, 0))
+
+  def testGetDimensions(self):
+    """Tests the aggregates a Task is counted in."""
+    self.assertEqual(
+        task_aggregates.get_dimensions(self.tasks[1]), [('all', ''),
+                                                        ('status', 'failed'),
+                                                        ('type', 'Task1'),
+                                                        ('worker', 'worker1'),
+                                                        ('requester', '')])
+    self.assertTrue(task_aggregates.is_completed(self.tasks[1]))
+    self.tasks[1]['successful'] = None
+    self.assertFalse(task_aggregates.is_completed(self.tasks[1]))
+    self.tasks[0]['name'] = task_statistics.DUPLICATE_REQUEST_TASK
+    self.assertFalse(task_aggregates.is_completed(self.tasks[0]))
+
+  def testAddTask(self):
+    """Tests counters and summaries of added Tasks."""
+    aggregate = task_aggregates.TaskAggregate()
+    self.assertIsNone(aggregate.get_summary())
+    for task in self.tasks:
+      aggregate.add_task(task)
+    self.assertEqual(aggregate.count, 4)
+    self.assertEqual(aggregate.successful, 2)
+    self.assertEqual(aggregate.failed, 2)
+    self.assertEqual(aggregate.run_time_count, 3)
+    summary = aggregate.get_summary()
+    self.assertEqual(summary.count, 3)
+    self.assertEqual(summary.min, 10.0)
+    self.assertEqual(summary.mean, 20.0)
+    self.assertEqual(summary.max, 30.0)
+    self.assertEqual(summary.total, 60.0)
+    self.assertAlmostEqual(summary.stddev, 8.16496, places=4)
+    self.assertAlmostEqual(summary.p50, 20.0, delta=0.2)
+    # Estimates are never above the real maximum.
+    self.assertEqual(summary.p99, 30.0)
+
+  def testFromCounters(self):
+    """Tests aggregates created from stored counters."""
+    aggregate = task_aggregates.TaskAggregate.from_counters({
+        'count': '2',
+        'run_time_count': '1',
+        'run_time_total': '5.5',
+        'run_time_min': '5.5'
+    }, {10: 1})
+    self.assertEqual(aggregate.count, 2)
+    self.assertEqual(aggregate.failed, 0)
+    self.assertEqual(aggregate.run_time_total, 5.5)
+    self.assertEqual(aggregate.run_time_min, 5.5)
+    self.assertIsNone(aggregate.run_time_max)
+    self.assertEqual(aggregate.sketch.count, 1)
+
+  def testMergeAggregates(self):
+    """Tests merging aggregates over time buckets."""
+    aggregates = {}
+    for bucket, task in zip((0, 3600, 7200, 90000), self.tasks):
+      aggregate = task_aggregates.TaskAggregate()
+      aggregate.add_task(task)
+      aggregates[(bucket, 'all', '')] = aggregate
+    merged = task_aggregates.merge_aggregates(aggregates)
+    self.assertEqual(list(merged), [('all', '')])
+    self.assertEqual(merged[('all', '')].count, 4)
+    self.assertEqual(merged[('all', '')].run_time_min, 10.0)
+    self.assertEqual(merged[('all', '')].run_time_max, 30.0)
+
+    merged = task_aggregates.merge_aggregates(aggregates, 86400)
+    self.assertEqual(sorted(merged), [(0, 'all', ''), (86400, 'all', '')])
+    self.assertEqual(merged[(0, 'all', '')].count, 3)
+    self.assertEqual(merged[(86400, 'all', '')].run_time_count, 0)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Client side on-disk cache of Task data for status queries."""
+
+from __future__ import unicode_literals
+
+from datetime import datetime
+from datetime import timedelta
+import errno
+import json
+import logging
+import os
+
+from turbinia import config
+from turbinia import TurbiniaException
+
+log = logging.getLogger('turbinia')
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def enabled():
+  """Checks whether the Task cache is configured.
+
+  Returns:
+    bool: True if a TASK_CACHE_DIR is configured.
+  """
+  config.LoadConfig()
+  return bool(config.TASK_CACHE_DIR)
+
+
+class TaskCache(object):
+  """On-disk cache of Task data for one Turbinia instance.
+
+  The cache remembers the Tasks for the time window that has been queried,
+  and the last_update time of the most recently updated Task as a high-water
+  mark.  Later queries only need to fetch the Tasks that have been updated
+  since the high-water mark and merge them into the cache.  The cache only
+  covers a single contiguous window from start_time up to the high-water mark,
+  and Tasks older than the widest window that has been queried are pruned.
+  Times are stored as seconds since the epoch so that loading the cache is
+  cheap.
+
+  Attributes:
+    high_water_mark (datetime): The last_update time of the most recently
+        updated Task in the cache.
+    instance (str): The Turbinia instance name.
+    max_window (timedelta): The widest time window that has been queried.
+    path (str): Path to the cache file.
+    start_time (datetime): The start of the time window the cache covers.
+    tasks (dict): Task dicts keyed by Task Id.
+  """
+
+  VERSION = 2
+  # Tasks updated this long before the high-water mark are fetched again when
+  # syncing, to pick up writes that were in flight or came from workers with
+  # slightly different clocks.
+  SYNC_OVERLAP = timedelta(minutes=5)
+
+  def __init__(self, instance, cache_dir=None):
+    config.LoadConfig()
+    cache_dir = cache_dir or config.TASK_CACHE_DIR
+    if not cache_dir:
+      raise TurbiniaException('No TASK_CACHE_DIR is configured')
+    self.instance = instance
+    self.path = os.path.join(
+        os.path.expanduser(cache_dir), '{0:s}.json'.format(instance))
+    self.tasks = {}
+    self.high_water_mark = None
+    self.max_window = None
+    self.start_time = None
+
+  @staticmethod
+  def _to_timestamp(datetime_):
+    """Converts a datetime to seconds since the epoch."""
+    return (datetime_ - EPOCH).total_seconds() if datetime_ else None
+
+  @staticmethod
+  def _from_timestamp(timestamp):
+    """Converts seconds since the epoch to a datetime."""
+    return EPOCH + timedelta(seconds=timestamp) if timestamp else None
+
+  def load(self):
+    """Loads the cache from disk.
+
+    An unreadable cache is ignored, and will be replaced on the next sync.
+    """
+    if not os.path.exists(self.path):
+      return
+    try:
+      with open(self.path) as file_handle:
+        data = json.load(file_handle)
+    except (IOError, OSError, ValueError) as exception:
+      log.warning(
+          'Could not load Task cache {0:s}, ignoring it: {1!s}'.format(
+              self.path, exception))
+      return
+    if data.get('version') != self.VERSION:
+      log.info('Ignoring Task cache {0:s} from old version'.format(self.path))
+      return
+
+    self.start_time = self._from_timestamp(data.get('start_time'))
+    self.high_water_mark = self._from_timestamp(data.get('high_water_mark'))
+    if data.get('max_window') is not None:
+      self.max_window = timedelta(seconds=data['max_window'])
+    self.tasks = {}
+    for task in data.get('tasks', []):
+      task['last_update'] = self._from_timestamp(task.get('last_update'))
+      if task.get('run_time') is not None:
+        task['run_time'] = timedelta(seconds=task['run_time'])
+      self.tasks[task.get('id')] = task
+
+  def save(self):
+    """Atomically writes the cache to disk."""
+    tasks = []
+    for task in self.tasks.values():
+      task = dict(task)
+      task['last_update'] = self._to_timestamp(task.get('last_update'))
+      if isinstance(task.get('run_time'), timedelta):
+        task['run_time'] = task['run_time'].total_seconds()
+      tasks.append(task)
+    max_window = self.max_window.total_seconds() if self.max_window else None
+    data = {
+        'version': self.VERSION,
+        'instance': self.instance,
+        'start_time': self._to_timestamp(self.start_time),
+        'high_water_mark': self._to_timestamp(self.high_water_mark),
+        'max_window': max_window,
+        'tasks': tasks
+    }
+
+    tmp_path = '{0:s}.{1:d}.tmp'.format(self.path, os.getpid())
+    try:
+      if not os.path.exists(os.path.dirname(self.path)):
+        try:
+          os.makedirs(os.path.dirname(self.path))
+        except OSError as exception:
+          if exception.errno != errno.EEXIST:
+            raise
+      with open(tmp_path, 'w') as file_handle:
+        json.dump(data, file_handle)
+      os.rename(tmp_path, self.path)
+    except (IOError, OSError, TypeError, ValueError) as exception:
+      log.warning(
+          'Could not save Task cache {0:s}: {1!s}'.format(self.path, exception))
+
+  def clear(self):
+    """Removes all cached data so the next sync fetches everything again."""
+    self.tasks = {}
+    self.high_water_mark = None
+    self.max_window = None
+    self.start_time = None
+    if os.path.exists(self.path):
+      try:
+        os.remove(self.path)
+      except OSError as exception:
+        raise TurbiniaException(
+            'Could not remove Task cache {0:s}: {1!s}'.format(
+                self.path, exception))
+
+  def get_sync_start(self, start_time):
+    """Gets the time from which Tasks need to be fetched to sync the cache.
+
+    Args:
+      start_time (datetime): The start of the time window being queried.
+
+    Returns:
+      datetime: The last_update time to fetch Tasks from.
+    """
+    if not self._covers(start_time):
+      return start_time
+    return max(start_time, self.high_water_mark - self.SYNC_OVERLAP)
+
+  def _covers(self, start_time):
+    """Checks whether a time window can be synced from the high-water mark.
+
+    Args:
+      start_time (datetime): The start of the time window being queried.
+
+    Returns:
+      bool: True if the cache covers the time window from start_time up to the
+          high-water mark.
+    """
+    return bool(
+        self.start_time and self.high_water_mark and
+        self.start_time <= start_time <= self.high_water_mark)
+
+  def merge(self, tasks, start_time, now=None):
+    """Merges fetched Tasks into the cache.
+
+    The Tasks must have been fetched from get_sync_start(start_time).  If that
+    was not from within the window the cache already covers, the fetched
+    window replaces the cached one, so that the cache never has gaps.
+
+    Args:
+      tasks (list[dict]): The Tasks that have been fetched.
+      start_time (datetime): The start of the time window the Tasks were
+          fetched for.
+      now (datetime): The end of the time window the Tasks were fetched for.
+          Defaults to the current time.
+    """
+    now = now or datetime.now()
+    if not self._covers(start_time):
+      self.start_time = start_time
+      self.high_water_mark = None
+    window = now - start_time
+    if not self.max_window or window > self.max_window:
+      self.max_window = window
+    # Drop Tasks outside of the window covered by the cache, either because
+    # they are older than any window we query, or because they are from before
+    # a gap in the synced data and may be stale.
+    self.start_time = max(self.start_time, now - self.max_window)
+    self.tasks = {
+        task_id: task
+        for task_id, task in self.tasks.items()
+        if task.get('last_update') and task['last_update'] >= self.start_time
+    }
+
+    for task in tasks:
+      cached = self.tasks.get(task.get('id'))
+      last_update = task.get('last_update')
+      if (cached and cached.get('last_update') and last_update and
+          cached['last_update'] > last_update):
+        continue
+      self.tasks[task.get('id')] = task
+      if last_update and (not self.high_water_mark or
+                          last_update > self.high_water_mark):
+        self.high_water_mark = last_update
+
+  def get_tasks(self, start_time, task_id=None, request_id=None, user=None):
+    """Gets Tasks from the cache.
+
+    Args:
+      start_time (datetime): The start of the time window to get Tasks for.
+      task_id (string): The Id of the task.
+      request_id (string): The Id of the request we want tasks for.
+      user (string): The user of the request we want tasks for.
+
+    Returns:
+      list[dict]: The matching Tasks, most recently updated first.
+    """
+    tasks = []
+    for task in self.tasks.values():
+      if not task.get('last_update') or task['last_update'] < start_time:
+        continue
+      if task_id and task.get('id') != task_id:
+        continue
+      if request_id and task.get('request_id') != request_id:
+        continue
+      if user and task.get('requester') != user:
+        continue
+      tasks.append(dict(task))
+    tasks.sort(key=lambda task: task['last_update'], reverse=True)
+    return tasks
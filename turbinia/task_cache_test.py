@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests the Task cache module."""
+
+from __future__ import unicode_literals
+
+from datetime import datetime
+from datetime import timedelta
+import os
+import shutil
+import tempfile
+import unittest
+
+from turbinia import task_cache
+
+
+class TestTaskCache(unittest.TestCase):
+  """Test TaskCache class."""
+
+  def setUp(self):
+    self.tmp_dir = tempfile.mkdtemp(prefix='turbinia-test-task-cache')
+    self.cache = task_cache.TaskCache('inst', cache_dir=self.tmp_dir)
+    self.now = datetime(2020, 8, 4, 16, 32, 38, 390390)
+    self.start_time = self.now - timedelta(days=7)
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp_dir)
+
+  def _get_task(self, task_id, minutes_ago, **kwargs):
+    """Gets Task data last updated minutes_ago minutes before now."""
+    task = {
+        'id': task_id,
+        'last_update': self.now - timedelta(minutes=minutes_ago),
+        'run_time': timedelta(seconds=10),
+        'request_id': 'req1',
+        'requester': 'user1',
+        'successful': None
+    }
+    task.update(kwargs)
+    return task
+
+  def testMergeHighWaterMark(self):
+    """Tests merging Tasks keeps the newest data and high-water mark."""
+    self.cache.merge([self._get_task('a', 30),
+                      self._get_task('b', 10)], self.start_time, self.now)
+    self.assertEqual(
+        self.cache.high_water_mark, self.now - timedelta(minutes=10))
+    self.assertEqual(self.cache.start_time, self.start_time)
+
+    # Older data for a Task is ignored.
+    self.cache.merge([self._get_task('a', 40, successful=True)],
+                     self.start_time, self.now)
+    self.assertIsNone(self.cache.tasks['a']['successful'])
+    self.cache.merge([self._get_task('a', 5, successful=True)], self.start_time,
+                     self.now)
+    self.assertTrue(self.cache.tasks['a']['successful'])
+    self.assertEqual(
+        self.cache.high_water_mark, self.now - timedelta(minutes=5))
+    self.assertEqual(self.cache.start_time, self.start_time)
+
+  def testGetSyncStart(self):
+    """Tests that only Tasks since the high-water mark are synced."""
+    self.assertEqual(
+        self.cache.get_sync_start(self.start_time), self.start_time)
+    self.cache.merge([self._get_task('a', 30)], self.start_time, self.now)
+    self.assertEqual(
+        self.cache.get_sync_start(self.start_time),
+        self.now - timedelta(minutes=30) - self.cache.SYNC_OVERLAP)
+    # A larger time window than the cache covers needs a full sync.
+    older_start_time = self.start_time - timedelta(days=1)
+    self.assertEqual(
+        self.cache.get_sync_start(older_start_time), older_start_time)
+
+  def testSyncAfterGap(self):
+    """Tests that the cache does not cover a window with unsynced Tasks."""
+    day1 = self.now
+    self.cache.merge([self._get_task('a', 30)], day1 - timedelta(days=7), day1)
+
+    # Ten days later only the last day is queried, which skips days 2 to 9.
+    day10 = day1 + timedelta(days=9)
+    start_time = day10 - timedelta(days=1)
+    self.assertEqual(self.cache.get_sync_start(start_time), start_time)
+    self.cache.merge([self._get_task('b', -60 * 24 * 9)], start_time, day10)
+    self.assertEqual(self.cache.start_time, start_time)
+
+    # A week on day 10 now needs a full sync to pick up days 4 to 9.
+    start_time = day10 - timedelta(days=7)
+    self.assertEqual(self.cache.get_sync_start(start_time), start_time)
+    self.cache.merge(
+        [self._get_task('b', -60 * 24 * 9),
+         self._get_task('c', -60 * 24 * 5)], start_time, day10)
+    tasks = self.cache.get_tasks(start_time)
+    self.assertEqual([t['id'] for t in tasks], ['b', 'c'])
+    self.assertEqual(
+        self.cache.get_sync_start(start_time),
+        self.cache.high_water_mark - self.cache.SYNC_OVERLAP)
+
+  def testMergePrunesOldTasks(self):
+    """Tests that Tasks older than the widest queried window are pruned."""
+    self.cache.merge(
+        [self._get_task('a', 60 * 24),
+         self._get_task('b', 60 * 24 * 6)], self.start_time, self.now)
+    later = self.now + timedelta(days=5)
+    start_time = later - timedelta(days=7)
+    self.cache.merge([self._get_task('c', -60 * 24 * 5)], start_time, later)
+    self.assertEqual(self.cache.max_window, timedelta(days=7))
+    self.assertEqual(self.cache.start_time, start_time)
+    self.assertEqual(sorted(self.cache.tasks), ['a', 'c'])
+
+  def testSaveLoad(self):
+    """Tests the cache can be saved and loaded again."""
+    self.cache.merge([self._get_task('a', 30)], self.start_time, self.now)
+    self.cache.save()
+    cache = task_cache.TaskCache('inst', cache_dir=self.tmp_dir)
+    cache.load()
+    self.assertEqual(cache.tasks, self.cache.tasks)
+    self.assertEqual(cache.high_water_mark, self.cache.high_water_mark)
+    self.assertEqual(cache.start_time, self.start_time)
+    self.assertEqual(cache.max_window, timedelta(days=7))
+
+    cache.clear()
+    self.assertFalse(os.path.exists(cache.path))
+    self.assertEqual(cache.tasks, {})
+
+  def testLoadCorrupt(self):
+    """Tests that a corrupt cache is ignored."""
+    with open(self.cache.path, 'w') as file_handle:
+      file_handle.write('{bad json')
+    self.cache.load()
+    self.assertEqual(self.cache.tasks, {})
+    self.assertIsNone(self.cache.high_water_mark)
+
+  def testGetTasks(self):
+    """Tests getting Tasks from the cache with filters."""
+    self.cache.merge([
+        self._get_task('a', 30),
+        self._get_task('b', 10, request_id='req2'),
+        self._get_task('c', 60 * 24 * 2, requester='user2')
+    ], self.start_time, self.now)
+    tasks = self.cache.get_tasks(self.start_time)
+    self.assertEqual([t['id'] for t in tasks], ['b', 'a', 'c'])
+    tasks = self.cache.get_tasks(self.now - timedelta(days=1))
+    self.assertEqual([t['id'] for t in tasks], ['b', 'a'])
+    tasks = self.cache.get_tasks(self.start_time, request_id='req2')
+    self.assertEqual([t['id'] for t in tasks], ['b'])
+    tasks = self.cache.get_tasks(self.start_time, user='user2')
+    self.assertEqual([t['id'] for t in tasks], ['c'])
+    tasks = self.cache.get_tasks(self.start_time, task_id='a')
+    self.assertEqual([t['id'] for t in tasks], ['a'])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,431 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Task state change events.
+
+The state managers publish an event whenever a Task is created or its status
+changes, so that clients waiting for a request to finish can block on events
+instead of repeatedly querying the state backend.  Events are published with
+Redis pub/sub when the STATE_MANAGER is 'Redis', and to a Google Cloud PubSub
+topic when it is 'Datastore'.
+"""
+
+from __future__ import unicode_literals
+
+import codecs
+import collections
+import json
+import logging
+import time
+import uuid
+
+from six.moves import queue
+
+from turbinia import config
+from turbinia import TurbiniaException
+
+log = logging.getLogger('turbinia')
+
+CHANNEL_PREFIX = 'TurbiniaTaskEvents'
+# Task attributes that are sent with events.
+EVENT_ATTRIBUTES = (
+    'id', 'name', 'request_id', 'requester', 'worker_name', 'status',
+    'successful')
+
+
+def enabled():
+  """Checks whether Task events are configured.
+
+  Returns:
+    bool: True if events are enabled and supported by the configured state
+        manager.
+  """
+  config.LoadConfig()
+  return bool(
+      config.TASK_EVENTS and
+      config.STATE_MANAGER.lower() in ('redis', 'datastore'))
+
+
+def get_subscriber(instance, request_id=None):
+  """Gets a Task event subscriber for the configured state manager.
+
+  Args:
+    instance (string): The Turbinia instance name.
+    request_id (string): The Id of the request we want events for.  Defaults
+        to events for all requests.
+
+  Returns:
+    BaseTaskEventSubscriber: The subscriber, or None if events are disabled.
+
+  Raises:
+    TurbiniaException: When the subscription can't be created.
+  """
+  if not enabled():
+    return None
+  # pylint: disable=no-else-return
+  if config.STATE_MANAGER.lower() == 'redis':
+    return RedisTaskEventSubscriber(instance, request_id)
+  else:
+    return PubSubTaskEventSubscriber(instance, request_id)
+
+
+def get_channel(instance, request_id=None):
+  """Gets the Redis channel that events for a request are published to.
+
+  Args:
+    instance (string): The Turbinia instance name.
+    request_id (string): The Id of the request, or None to get a pattern
+        matching the channels of all requests.
+
+  Returns:
+    string: The channel name or pattern.
+  """
+  return ':'.join([CHANNEL_PREFIX, instance, request_id or '*'])
+
+
+def get_event(task_dict):
+  """Gets the event data for a Task.
+
+  Args:
+    task_dict (dict): The Task data from the state manager.
+
+  Returns:
+    dict: The event data.
+  """
+  event = {attr: task_dict.get(attr) for attr in EVENT_ATTRIBUTES}
+  event['instance'] = task_dict.get('instance') or config.INSTANCE_ID
+  return event
+
+
+class BaseTaskEventPublisher(object):
+  """Base class for publishing Task events.
+
+  State managers write all Tasks on every update, so publishers remember the
+  last status that was published for each Task and only publish events when
+  it has changed.
+  """
+
+  # Number of Tasks to remember the last published status for.
+  MAX_CACHED_TASKS = 10000
+
+  def __init__(self):
+    self._published = collections.OrderedDict()
+
+  def get_transitions(self, task_dicts, new=False):
+    """Gets events for Tasks that have changed state since last published.
+
+    Args:
+      task_dicts (list[dict]): The Task data that was written.
+      new (bool): Whether the Tasks were just created, in which case events
+          are always returned.
+
+    Returns:
+      list[dict]: The events to publish.
+    """
+    events = []
+    for task_dict in task_dicts:
+      event = get_event(task_dict)
+      state = (event.get('status'), event.get('successful'))
+      last_state = self._published.pop(event['id'], None)
+      self._published[event['id']] = state
+      if new or state != last_state:
+        events.append(event)
+    while len(self._published) > self.MAX_CACHED_TASKS:
+      self._published.popitem(last=False)
+    return events
+
+  def _send(self, event, client=None):
+    """Sends an event.
+
+    Args:
+      event (dict): The event to send.
+      client: Backend specific client to send the event with.
+    """
+    raise NotImplementedError
+
+  def publish(self, task_dicts, client=None, new=False):
+    """Publishes events for Tasks that have changed state.
+
+    Failing to publish events is logged but not raised, because clients will
+    fall back to polling for the Task state.
+
+    Args:
+      task_dicts (list[dict]): The Task data that was written.
+      client: Backend specific client to send the events with.
+      new (bool): Whether the Tasks were just created.
+    """
+    for event in self.get_transitions(task_dicts, new=new):
+      try:
+        self._send(event, client)
+      except TurbiniaException as exception:
+        log.warning(
+            'Could not publish event for Task {0!s}: {1!s}'.format(
+                event.get('id'), exception))
+
+
+class RedisTaskEventPublisher(BaseTaskEventPublisher):
+  """Publishes Task events with Redis pub/sub.
+
+  Attributes:
+    client: Redis database object.
+  """
+
+  def __init__(self):
+    super(RedisTaskEventPublisher, self).__init__()
+    # pylint: disable=import-outside-toplevel
+    import redis
+    self._redis = redis
+    self.client = redis.StrictRedis(
+        host=config.REDIS_HOST, port=config.REDIS_PORT, db=config.REDIS_DB)
+
+  def _send(self, event, client=None):
+    """Sends an event.
+
+    Args:
+      event (dict): The event to send.
+      client (redis.client.Pipeline): Pipeline to send the event in, so that it
+          is published after the Task state is written.
+    """
+    channel = get_channel(event['instance'], event.get('request_id'))
+    try:
+      (client or self.client).publish(channel, json.dumps(event))
+    except self._redis.RedisError as exception:
+      raise TurbiniaException(
+          'Could not publish to {0:s}: {1!s}'.format(channel, exception))
+
+
+class PubSubTaskEventPublisher(BaseTaskEventPublisher):
+  """Publishes Task events to a Google Cloud PubSub topic.
+
+  Attributes:
+    publisher: The pubsub publisher client object
+    topic_path (str): The full path of the pubsub topic
+  """
+
+  def __init__(self):
+    super(PubSubTaskEventPublisher, self).__init__()
+    # pylint: disable=import-outside-toplevel
+    from google.api_core import exceptions
+    from google.auth import exceptions as auth_exceptions
+    from google.cloud import pubsub
+    self._exceptions = exceptions
+    self.topic_path = pubsub.PublisherClient.topic_path(
+        config.TURBINIA_PROJECT, PubSubTaskEventSubscriber.get_topic_name())
+    try:
+      self.publisher = pubsub.PublisherClient()
+      self.publisher.create_topic(self.topic_path)
+    except exceptions.AlreadyExists:
+      log.debug('PubSub topic {0:s} already exists.'.format(self.topic_path))
+    except (exceptions.GoogleAPIError,
+            auth_exceptions.GoogleAuthError) as exception:
+      raise TurbiniaException(
+          'Could not create PubSub topic {0:s}: {1!s}'.format(
+              self.topic_path, exception))
+
+  def _send(self, event, client=None):
+    data = json.dumps(event).encode('utf-8')
+    try:
+      # We don't wait for the result as events are only a latency optimization.
+      self.publisher.publish(
+          self.topic_path, data, instance=event['instance'],
+          request_id=event.get('request_id') or '')
+    except self._exceptions.GoogleAPIError as exception:
+      raise TurbiniaException(
+          'Could not publish to {0:s}: {1!s}'.format(
+              self.topic_path, exception))
+
+
+class BaseTaskEventSubscriber(object):
+  """Base class for subscribing to Task events.
+
+  Attributes:
+    instance (string): The Turbinia instance name.
+    request_id (string): The Id of the request to get events for, or None for
+        all requests.
+  """
+
+  def __init__(self, instance, request_id=None):
+    self.instance = instance
+    self.request_id = request_id
+
+  def wait(self, timeout):
+    """Waits for Task events.
+
+    Args:
+      timeout (int): Maximum number of seconds to wait.
+
+    Returns:
+      list[dict]: The events received, or an empty list on timeout.
+
+    Raises:
+      TurbiniaException: When the subscription fails.
+    """
+    raise NotImplementedError
+
+  def close(self):
+    """Closes the subscription."""
+    raise NotImplementedError
+
+
+class RedisTaskEventSubscriber(BaseTaskEventSubscriber):
+  """Subscribes to Task events with Redis pub/sub.
+
+  Attributes:
+    client: Redis database object.
+    pubsub (redis.client.PubSub): The Redis subscription.
+  """
+
+  def __init__(self, instance, request_id=None):
+    super(RedisTaskEventSubscriber, self).__init__(instance, request_id)
+    # pylint: disable=import-outside-toplevel
+    import redis
+    self._redis = redis
+    self.client = redis.StrictRedis(
+        host=config.REDIS_HOST, port=config.REDIS_PORT, db=config.REDIS_DB)
+    self.pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+    channel = get_channel(instance, request_id)
+    try:
+      if request_id:
+        self.pubsub.subscribe(channel)
+      else:
+        self.pubsub.psubscribe(channel)
+    except redis.RedisError as exception:
+      raise TurbiniaException(
+          'Could not subscribe to {0:s}: {1!s}'.format(channel, exception))
+
+  def wait(self, timeout):
+    events = []
+    deadline = time.time() + timeout
+    try:
+      # Subscribe confirmations are returned as None, so keep waiting until we
+      # get an actual message or the timeout expires.
+      message = None
+      while not message and time.time() < deadline:
+        message = self.pubsub.get_message(timeout=deadline - time.time())
+      # Drain any other pending events so that a burst of Task updates only
+      # wakes the caller up once.
+      while message:
+        if message.get('type') in ('message', 'pmessage'):
+          events.append(json.loads(codecs.decode(message['data'], 'utf-8')))
+        message = self.pubsub.get_message()
+    except (self._redis.RedisError, ValueError) as exception:
+      raise TurbiniaException(
+          'Could not get Task events: {0!s}'.format(exception))
+    return events
+
+  def close(self):
+    try:
+      self.pubsub.close()
+    except self._redis.RedisError as exception:
+      log.debug('Could not close Redis subscription: {0!s}'.format(exception))
+
+
+class PubSubTaskEventSubscriber(BaseTaskEventSubscriber):
+  """Subscribes to Task events from a Google Cloud PubSub topic.
+
+  A temporary subscription is created for every subscriber, and deleted again
+  when it is closed.  Subscriptions also expire after SUBSCRIPTION_TTL seconds
+  without any subscriber, so they are cleaned up even when the client exits
+  without closing them.
+
+  Attributes:
+    subscriber: The pubsub subscriber client object
+    subscription_path (str): The full path of the pubsub subscription
+  """
+
+  TOPIC_SUFFIX = 'task-events'
+  # The shortest expiration time PubSub allows for a subscription.
+  SUBSCRIPTION_TTL = 24 * 60 * 60
+
+  def __init__(self, instance, request_id=None):
+    super(PubSubTaskEventSubscriber, self).__init__(instance, request_id)
+    # pylint: disable=import-outside-toplevel
+    from google.api_core import exceptions
+    from google.auth import exceptions as auth_exceptions
+    from google.cloud import pubsub
+    self._exceptions = exceptions
+    self._queue = queue.Queue()
+    self._future = None
+    self.subscriber = None
+    topic_name = self.get_topic_name()
+    topic_path = pubsub.SubscriberClient.topic_path(
+        config.TURBINIA_PROJECT, topic_name)
+    self.subscription_path = pubsub.SubscriberClient.subscription_path(
+        config.TURBINIA_PROJECT, '{0:s}-{1:s}'.format(
+            topic_name,
+            uuid.uuid4().hex))
+    try:
+      self.subscriber = pubsub.SubscriberClient()
+      self.subscriber.create_subscription(
+          self.subscription_path, topic_path,
+          expiration_policy={'ttl': {
+              'seconds': self.SUBSCRIPTION_TTL
+          }})
+      self._future = self.subscriber.subscribe(
+          self.subscription_path, self._callback)
+    except (exceptions.GoogleAPIError,
+            auth_exceptions.GoogleAuthError) as exception:
+      self.close()
+      raise TurbiniaException(
+          'Could not subscribe to {0:s}: {1!s}'.format(topic_path, exception))
+
+  @classmethod
+  def get_topic_name(cls):
+    """Gets the name of the PubSub topic for Task events."""
+    config.LoadConfig()
+    return '{0:s}-{1:s}'.format(config.PUBSUB_TOPIC, cls.TOPIC_SUFFIX)
+
+  def _callback(self, message):
+    """Callback function that places matching events in the queue.
+
+    Args:
+      message: A pubsub message object
+    """
+    message.ack()
+    attributes = message.attributes
+    if attributes.get('instance') != self.instance:
+      return
+    if self.request_id and attributes.get('request_id') != self.request_id:
+      return
+    self._queue.put(message.data)
+
+  def wait(self, timeout):
+    events = []
+    try:
+      data = self._queue.get(timeout=timeout)
+      while data:
+        events.append(json.loads(codecs.decode(data, 'utf-8')))
+        data = self._queue.get_nowait() if not self._queue.empty() else None
+    except queue.Empty:
+      pass
+    except ValueError as exception:
+      raise TurbiniaException(
+          'Could not decode Task event: {0!s}'.format(exception))
+    if not events and self._future and self._future.done():
+      raise TurbiniaException(
+          'PubSub subscription {0:s} has stopped: {1!s}'.format(
+              self.subscription_path, self._future.exception()))
+    return events
+
+  def close(self):
+    if self._future:
+      self._future.cancel()
+    if not self.subscriber:
+      return
+    try:
+      self.subscriber.delete_subscription(self.subscription_path)
+    except self._exceptions.GoogleAPIError as exception:
+      log.debug(
+          'Could not delete subscription {0:s}: {1!s}'.format(
+              self.subscription_path, exception))
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests the Task events module."""
+
+from __future__ import unicode_literals
+
+import json
+import unittest
+
+import mock
+
+from turbinia import config
+from turbinia import task_events
+from turbinia import TurbiniaException
+
+
+class TestTaskEvents(unittest.TestCase):
+  """Test Task event publishers and subscribers."""
+
+  def setUp(self):
+    config.LoadConfig()
+    self.task_events_save = config.TASK_EVENTS
+    self.redis = mock.MagicMock()
+    self.redis.RedisError = type(str('RedisError'), (Exception,), {})
+    self.redis_patcher = mock.patch.dict('sys.modules', {'redis': self.redis})
+    self.redis_patcher.start()
+    self.task_dict = {
+        'id': 'abc',
+        'instance': 'inst',
+        'name': 'TestTask',
+        'request_id': 'req1',
+        'status': 'Running',
+        'successful': None,
+        'report_data': 'Not sent'
+    }
+
+  def tearDown(self):
+    config.TASK_EVENTS = self.task_events_save
+    self.redis_patcher.stop()
+
+  def testGetChannel(self):
+    """Tests channel names for requests and all requests."""
+    self.assertEqual(
+        task_events.get_channel('inst', 'req1'), 'TurbiniaTaskEvents:inst:req1')
+    self.assertEqual(
+        task_events.get_channel('inst'), 'TurbiniaTaskEvents:inst:*')
+
+  def testGetTransitions(self):
+    """Tests that events are only published when the Task state changes."""
+    publisher = task_events.BaseTaskEventPublisher()
+    events = publisher.get_transitions([self.task_dict])
+    self.assertEqual(len(events), 1)
+    self.assertEqual(events[0]['status'], 'Running')
+    self.assertNotIn('report_data', events[0])
+
+    self.assertEqual(publisher.get_transitions([self.task_dict]), [])
+    self.assertEqual(len(publisher.get_transitions([self.task_dict], True)), 1)
+    self.task_dict['successful'] = True
+    self.assertEqual(len(publisher.get_transitions([self.task_dict])), 1)
+
+  def testRedisPublish(self):
+    """Tests Redis events are published to the request channel."""
+    publisher = task_events.RedisTaskEventPublisher()
+    pipeline = mock.MagicMock()
+    publisher.publish([self.task_dict], client=pipeline)
+    publisher.publish([self.task_dict], client=pipeline)
+    pipeline.publish.assert_called_once()
+    channel, data = pipeline.publish.call_args[0]
+    self.assertEqual(channel, 'TurbiniaTaskEvents:inst:req1')
+    self.assertEqual(json.loads(data)['id'], 'abc')
+
+  def testRedisSubscriberWait(self):
+    """Tests Redis subscribers drain all pending events."""
+    pubsub = self.redis.StrictRedis.return_value.pubsub.return_value
+    data = json.dumps({'id': 'abc'}).encode('utf-8')
+    pubsub.get_message.side_effect = [{
+        'type': 'message',
+        'data': data
+    }, {
+        'type': 'message',
+        'data': data
+    }, None]
+    subscriber = task_events.RedisTaskEventSubscriber('inst', 'req1')
+    pubsub.subscribe.assert_called_once_with('TurbiniaTaskEvents:inst:req1')
+    self.assertEqual(subscriber.wait(10), [{'id': 'abc'}, {'id': 'abc'}])
+    self.assertLessEqual(pubsub.get_message.call_args_list[0][1]['timeout'], 10)
+
+    pubsub.get_message.side_effect = self.redis.RedisError('Connection lost')
+    self.assertRaises(TurbiniaException, subscriber.wait, 10)
+
+  def testRedisSubscriberAllRequests(self):
+    """Tests Redis subscribers without a request use a pattern."""
+    pubsub = self.redis.StrictRedis.return_value.pubsub.return_value
+    task_events.RedisTaskEventSubscriber('inst')
+    pubsub.psubscribe.assert_called_once_with('TurbiniaTaskEvents:inst:*')
+
+  @mock.patch('google.cloud.pubsub.SubscriberClient')
+  def testPubSubSubscriberExpires(self, mock_subscriber_client):
+    """Tests PubSub subscriptions expire and are deleted on close."""
+    mock_subscriber_client.subscription_path.return_value = 'subscription'
+    subscriber = task_events.PubSubTaskEventSubscriber('inst')
+    client = mock_subscriber_client.return_value
+    self.assertEqual(
+        client.create_subscription.call_args[1]['expiration_policy'],
+        {'ttl': {
+            'seconds': subscriber.SUBSCRIPTION_TTL
+        }})
+    subscriber.close()
+    client.delete_subscription.assert_called_once_with('subscription')
+
+  def testGetSubscriberDisabled(self):
+    """Tests no subscriber is returned when events are disabled."""
+    config.TASK_EVENTS = False
+    self.assertIsNone(task_events.get_subscriber('inst'))
+    config.TASK_EVENTS = True
+    with mock.patch.object(config, 'STATE_MANAGER', 'SQLite'):
+      self.assertIsNone(task_events.get_subscriber('inst'))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -19,13 +19,17 @@ from __future__ import unicode_literals, absolute_import
 import logging
 import time
 
+from prometheus_client import Counter
 from prometheus_client import Gauge
 
 import turbinia
 from turbinia import workers
 from turbinia import evidence
 from turbinia import config
+from turbinia import recipe_store
 from turbinia import state_manager
+from turbinia import task_aggregates
+from turbinia import task_statistics
 from turbinia import TurbiniaException
 from turbinia.jobs import manager as jobs_manager
 
@@ -50,6 +54,15 @@ PSQ_QUEUE_WAIT_SECONDS = 2
 
 # Define metrics
 SERVER_TASKS = Gauge('server_tasks', 'Turbinia Server Total Tasks')
+SERVER_DUPLICATE_REQUESTS = Counter(
+    'server_duplicate_requests', 'Turbinia Server Duplicate Requests Dropped')
+WORKER_TASKS_FINISHED = Gauge(
+    'worker_tasks_finished',
+    'Turbinia Tasks finished per Worker in the last day', ['worker', 'status'])
+WORKER_TASK_RUN_TIME = Gauge(
+    'worker_task_run_time_seconds',
+    'Turbinia Task run times per Worker in the last day',
+    ['worker', 'statistic'])
 
 
 def get_task_manager():
@@ -104,10 +117,16 @@ class BaseTaskManager(object):
     tasks (list[TurbiniaTask]): Running tasks.
   """
 
+  # Seconds between exports of the Task aggregates to Prometheus.
+  AGGREGATE_METRICS_INTERVAL = 60
+
   def __init__(self):
     self.jobs = []
     self.running_jobs = []
+    # Requests from get_evidence() that have not been acknowledged yet.
+    self.received_requests = []
     self.state_manager = state_manager.get_state_manager()
+    self.last_metrics_export = 0
 
   @property
   def tasks(self):
@@ -265,6 +284,89 @@ class BaseTaskManager(object):
 
     return request_finalized and self.check_request_done(request_id)
 
+  def ack_requests(self):
+    """Acknowledges the requests that new evidence was received in.
+
+    This is called after the evidence has been added, when the new Tasks have
+    been written to the state manager and enqueued.  Until then, requests
+    will be delivered again if the server stops.
+    """
+    self.received_requests = []
+
+  def filter_duplicate_requests(self, requests):
+    """Removes requests that duplicate earlier requests.
+
+    Requests are looked up by their idempotency key in the deduplication index
+    kept by the state manager for REQUEST_DEDUP_TTL seconds, so that retried
+    submissions of the same request are only processed once.  Requests without
+    a client specified key are only deduplicated when
+    REQUEST_DEDUP_IMPLICIT_KEYS is set.  Duplicates are still acknowledged with
+    the other received requests.
+
+    Args:
+      requests (list[TurbiniaRequest]): Received requests.
+
+    Returns:
+      list[TurbiniaRequest]: The requests that are not duplicates.
+    """
+    ttl = config.REQUEST_DEDUP_TTL
+    if not ttl:
+      return requests
+
+    new_requests = []
+    for request in requests:
+      # Requests from older clients don't have these attributes.
+      if (not getattr(request, 'deduplicate', True) or
+          (not getattr(request, 'idempotency_key', None) and
+           not config.REQUEST_DEDUP_IMPLICIT_KEYS)):
+        new_requests.append(request)
+        continue
+      idempotency_key = request.get_idempotency_key()
+      try:
+        request_id = self.state_manager.register_request_key(
+            idempotency_key, request.request_id, ttl)
+      except (NotImplementedError, TurbiniaException) as exception:
+        log.warning(
+            'Could not check request {0:s} for duplicates: {1!s}'.format(
+                request.request_id, exception))
+        request_id = request.request_id
+      if request_id != request.request_id:
+        log.info(
+            'Request {0:s} is a duplicate of request {1:s} (idempotency key '
+            '{2:s}), so it will not be processed again'.format(
+                request.request_id, request_id, idempotency_key))
+        SERVER_DUPLICATE_REQUESTS.inc()
+        self.write_duplicate_request(request, request_id)
+        continue
+      new_requests.append(request)
+    return new_requests
+
+  def write_duplicate_request(self, request, original_request_id):
+    """Records a dropped duplicate request in the state manager.
+
+    The request is stored as a single completed placeholder Task, so that
+    clients waiting for the request return and can see which request it
+    duplicates.  Placeholders are left out of Task statistics and aggregates.
+
+    Args:
+      request (TurbiniaRequest): The duplicate request.
+      original_request_id (str): The ID of the request it duplicates.
+    """
+    task = workers.TurbiniaTask(
+        name=task_statistics.DUPLICATE_REQUEST_TASK,
+        request_id=request.request_id, requester=request.requester)
+    task.result = workers.TurbiniaTaskResult(request_id=request.request_id)
+    task.result.successful = True
+    task.result.status = (
+        'Not processed because it is a duplicate of request {0:s}'.format(
+            original_request_id))
+    try:
+      self.state_manager.write_new_task(task)
+    except TurbiniaException as exception:
+      log.warning(
+          'Could not record duplicate request {0:s}: {1!s}'.format(
+              request.request_id, exception))
+
   def get_evidence(self):
     """Checks for new evidence to process.
 
@@ -489,12 +591,51 @@ class BaseTaskManager(object):
     """
     raise NotImplementedError
 
+  def export_aggregate_metrics(self):
+    """Exports the Task aggregates of the last day per Worker to Prometheus.
+
+    This is done at most every AGGREGATE_METRICS_INTERVAL seconds, and only
+    when the state manager maintains Task aggregates.
+    """
+    now = time.time()
+    if now - self.last_metrics_export < self.AGGREGATE_METRICS_INTERVAL:
+      return
+    self.last_metrics_export = now
+    try:
+      if not self.state_manager.aggregates_enabled():
+        return
+      aggregates = self.state_manager.get_task_aggregates(
+          config.INSTANCE_ID, days=1)
+    except (NotImplementedError, TurbiniaException) as exception:
+      log.warning(
+          'Could not export Task aggregates to Prometheus: {0!s}'.format(
+              exception))
+      return
+
+    merged = task_aggregates.merge_aggregates(aggregates)
+    # Workers that have no finished Tasks in the last day are dropped.
+    WORKER_TASKS_FINISHED.clear()
+    WORKER_TASK_RUN_TIME.clear()
+    for (dimension, worker), aggregate in merged.items():
+      if dimension != 'worker' or not worker:
+        continue
+      WORKER_TASKS_FINISHED.labels(worker, 'successful').set(
+          aggregate.successful)
+      WORKER_TASKS_FINISHED.labels(worker, 'failed').set(aggregate.failed)
+      summary = aggregate.get_summary()
+      if not summary:
+        continue
+      for statistic in ('mean', 'max', 'p50', 'p90', 'p99'):
+        WORKER_TASK_RUN_TIME.labels(worker, statistic).set(
+            getattr(summary, statistic))
+
   def run(self, under_test=False):
     """Main run loop for TaskManager."""
     log.info('Starting Task Manager run loop')
     while True:
       # pylint: disable=expression-not-assigned
       [self.add_evidence(x) for x in self.get_evidence()]
+      self.ack_requests()
 
       for task in self.process_tasks():
         if task.result:
@@ -502,7 +643,8 @@ class BaseTaskManager(object):
           if job:
             self.process_job(job, task)
 
-      [self.state_manager.update_task(t) for t in self.tasks]
+      self.state_manager.update_tasks(self.tasks)
+      self.export_aggregate_metrics()
       if config.SINGLE_RUN and self.check_done():
         log.info('No more tasks to process.  Exiting now.')
         return
@@ -534,31 +676,42 @@ class CeleryTaskManager(BaseTaskManager):
     self.celery.setup()
     self.kombu = turbinia_celery.TurbiniaKombu(config.KOMBU_CHANNEL)
     self.kombu.setup()
+    self.kombu.start_consumer()
     self.celery_runner = self.celery.app.task(task_runner, name="task_runner")
 
   def process_tasks(self):
     """Determine the current state of our tasks.
 
+    The states and results of all outstanding tasks are fetched from the
+    Celery result backend in bulk.
+
     Returns:
       list[TurbiniaTask]: all completed tasks
     """
     completed_tasks = []
-    for task in self.tasks:
+    tasks = self.tasks
+    results = self.celery.get_task_results(
+        [task.stub.id for task in tasks if task.stub])
+    for task in tasks:
       celery_task = task.stub
       if not celery_task:
-        log.debug('Task {0:s} not yet created'.format(task.stub.task_id))
-      elif celery_task.status == celery_states.STARTED:
+        log.debug('Task {0:s} not yet created'.format(task.id))
+        continue
+      celery_result = results.get(celery_task.id, {})
+      status = celery_result.get('status')
+      if status == celery_states.STARTED:
         log.debug('Task {0:s} not finished'.format(celery_task.id))
-      elif celery_task.status == celery_states.FAILURE:
+      elif status == celery_states.FAILURE:
         log.warning('Task {0:s} failed.'.format(celery_task.id))
         completed_tasks.append(task)
-      elif celery_task.status == celery_states.SUCCESS:
-        task.result = workers.TurbiniaTaskResult.deserialize(celery_task.result)
+      elif status == celery_states.SUCCESS:
+        task.result = workers.TurbiniaTaskResult.deserialize(
+            celery_result.get('result'))
         completed_tasks.append(task)
       else:
         log.debug('Task {0:s} status unknown'.format(celery_task.id))
 
-    outstanding_task_count = len(self.tasks) - len(completed_tasks)
+    outstanding_task_count = len(tasks) - len(completed_tasks)
     if outstanding_task_count > 0:
       log.info('{0:d} Tasks still outstanding.'.format(outstanding_task_count))
     return completed_tasks
@@ -570,6 +723,8 @@ class CeleryTaskManager(BaseTaskManager):
       list[Evidence]: evidence to process.
     """
     requests = self.kombu.check_messages()
+    self.received_requests.extend(requests)
+    requests = self.filter_duplicate_requests(requests)
     evidence_list = []
     for request in requests:
       for evidence_ in request.evidence:
@@ -583,12 +738,17 @@ class CeleryTaskManager(BaseTaskManager):
         evidence_list.append(evidence_)
     return evidence_list
 
+  def ack_requests(self):
+    self.kombu.ack_requests(self.received_requests)
+    super(CeleryTaskManager, self).ack_requests()
+
   def enqueue_task(self, task, evidence_):
     log.info(
         'Adding Celery task {0:s} with evidence {1:s} to queue'.format(
             task.name, evidence_.name))
     task.stub = self.celery_runner.delay(
-        task.serialize(), evidence_.serialize())
+        task.serialize(),
+        recipe_store.get_recipe_store().serialize_evidence(evidence_))
 
 
 class PSQTaskManager(BaseTaskManager):
@@ -659,6 +819,8 @@ class PSQTaskManager(BaseTaskManager):
 
   def get_evidence(self):
     requests = self.server_pubsub.check_messages()
+    self.received_requests.extend(requests)
+    requests = self.filter_duplicate_requests(requests)
     evidence_list = []
     for request in requests:
       for evidence_ in request.evidence:
@@ -672,10 +834,15 @@ class PSQTaskManager(BaseTaskManager):
         evidence_list.append(evidence_)
     return evidence_list
 
+  def ack_requests(self):
+    self.server_pubsub.ack_requests(self.received_requests)
+    super(PSQTaskManager, self).ack_requests()
+
   def enqueue_task(self, task, evidence_):
     log.info(
         'Adding PSQ task {0:s} with evidence {1:s} to queue'.format(
             task.name, evidence_.name))
     task.stub = self.psq.enqueue(
-        task_runner, task.serialize(), evidence_.serialize())
+        task_runner, task.serialize(),
+        recipe_store.get_recipe_store().serialize_evidence(evidence_))
     time.sleep(PSQ_QUEUE_WAIT_SECONDS)
@@ -19,6 +19,8 @@ from __future__ import unicode_literals
 import mock
 
 from turbinia import config
+from turbinia import message
+from turbinia import task_aggregates
 from turbinia import TurbiniaException
 from turbinia import task_manager
 from turbinia.jobs import manager as jobs_manager
@@ -313,3 +315,145 @@ class TestTaskManager(TestTurbiniaTaskBase):
     self.manager.add_evidence.assert_called_with(self.evidence)
     self.manager.process_result.assert_called_with(self.result)
     self.manager.process_job.assert_called_with(self.job1, self.task)
+
+  def testRunAcksRequests(self):
+    """Test requests are acknowledged after their evidence is added."""
+    calls = mock.MagicMock()
+    self.manager.get_evidence = mock.MagicMock(return_value=[self.evidence])
+    self.manager.add_evidence = calls.add_evidence
+    self.manager.ack_requests = calls.ack_requests
+    self.manager.process_tasks = mock.MagicMock(return_value=[])
+    self.manager.run(under_test=True)
+    self.assertEqual(
+        calls.mock_calls,
+        [mock.call.add_evidence(self.evidence),
+         mock.call.ack_requests()])
+
+  def testExportAggregateMetrics(self):
+    """Test the Task aggregates per Worker are exported to Prometheus."""
+    aggregate = task_aggregates.TaskAggregate()
+    aggregate.add_task({'successful': True, 'run_time': 10})
+    aggregate.add_task({'successful': False, 'run_time': 30})
+    state_manager = self.manager.state_manager
+    state_manager.aggregates_enabled.return_value = True
+    state_manager.get_task_aggregates.return_value = {(0, 'worker', 'worker1'):
+                                                          aggregate,
+                                                      (0, 'all', ''):
+                                                          aggregate}
+    self.manager.export_aggregate_metrics()
+    state_manager.get_task_aggregates.assert_called_once_with(
+        config.INSTANCE_ID, days=1)
+    self.assertEqual(
+        task_manager.WORKER_TASKS_FINISHED.labels('worker1',
+                                                  'failed')._value.get(), 1)
+    self.assertEqual(
+        task_manager.WORKER_TASK_RUN_TIME.labels('worker1',
+                                                 'mean')._value.get(), 20)
+
+    # Exports are rate limited.
+    self.manager.export_aggregate_metrics()
+    state_manager.get_task_aggregates.assert_called_once()
+
+  def testFilterDuplicateRequests(self):
+    """Test requests registered with another request ID are dropped."""
+    registered = {}
+    self.manager.state_manager.register_request_key.side_effect = (
+        lambda key, request_id, ttl: registered.setdefault(key, request_id))
+    requests = [
+        message.TurbiniaRequest(request_id=request_id, idempotency_key=key)
+        for request_id, key in (('req1', 'key1'), ('req2', 'key1'),
+                                ('req3', 'key2'), ('req1', 'key1'))
+    ]
+    self.assertEqual(
+        self.manager.filter_duplicate_requests(requests),
+        [requests[0], requests[2], requests[3]])
+    # The duplicate is recorded as completed so that waiting clients return.
+    task = self.manager.state_manager.write_new_task.call_args[0][0]
+    self.assertEqual(task.request_id, 'req2')
+    self.assertTrue(task.result.successful)
+    self.assertIn('req1', task.result.status)
+
+    # Requests can opt out of deduplication.
+    requests[1].deduplicate = False
+    self.assertEqual(
+        self.manager.filter_duplicate_requests(requests[:2]), requests[:2])
+
+    with mock.patch.object(config, 'REQUEST_DEDUP_TTL', None):
+      self.assertEqual(
+          self.manager.filter_duplicate_requests(requests), requests)
+
+    # Requests are processed when the index is unavailable.
+    self.manager.state_manager.register_request_key.side_effect = (
+        TurbiniaException('Connection refused'))
+    self.assertEqual(self.manager.filter_duplicate_requests(requests), requests)
+
+  def testFilterDuplicateRequestsImplicitKeys(self):
+    """Test requests without a key are only deduplicated when configured."""
+    registered = {}
+    self.manager.state_manager.register_request_key.side_effect = (
+        lambda key, request_id, ttl: registered.setdefault(key, request_id))
+    requests = [
+        message.TurbiniaRequest(
+            request_id=request_id, evidence_=[self.evidence])
+        for request_id in ('req1', 'req2')
+    ]
+    self.assertEqual(self.manager.filter_duplicate_requests(requests), requests)
+    self.manager.state_manager.register_request_key.assert_not_called()
+
+    with mock.patch.object(config, 'REQUEST_DEDUP_IMPLICIT_KEYS', True):
+      self.assertEqual(
+          self.manager.filter_duplicate_requests(requests), requests[:1])
+
+  @mock.patch('turbinia.task_manager.state_manager.get_state_manager')
+  def testCeleryAckRequests(self, _):
+    """Test Celery requests are acknowledged through Kombu."""
+    manager = task_manager.CeleryTaskManager()
+    manager.kombu = mock.MagicMock()
+    manager.state_manager.register_request_key.side_effect = (
+        lambda key, request_id, ttl: request_id)
+    request = mock.MagicMock(request_id='req1', evidence=[self.evidence])
+    request.recipe = {}
+    manager.kombu.check_messages.return_value = [request]
+    self.assertEqual(manager.get_evidence(), [self.evidence])
+    manager.ack_requests()
+    manager.kombu.ack_requests.assert_called_once_with([request])
+    self.assertEqual(manager.received_requests, [])
+
+  @mock.patch('turbinia.task_manager.state_manager.get_state_manager')
+  def testCeleryProcessTasks(self, _):
+    """Test Celery task states are fetched in bulk."""
+    # pylint: disable=import-outside-toplevel
+    from celery import states as celery_states
+    manager = task_manager.CeleryTaskManager()
+    manager.celery = mock.MagicMock()
+    tasks = []
+    for status in (celery_states.SUCCESS, celery_states.FAILURE,
+                   celery_states.STARTED):
+      task = mock.MagicMock()
+      task.stub.id = status
+      tasks.append(task)
+    tasks.append(mock.MagicMock(id='uncreated', stub=None))
+    self.job1.tasks.extend(tasks)
+    manager.running_jobs.append(self.job1)
+    manager.celery.get_task_results.return_value = {
+        celery_states.SUCCESS: {
+            'status': celery_states.SUCCESS,
+            'result': self.result.serialize()
+        },
+        celery_states.FAILURE: {
+            'status': celery_states.FAILURE,
+            'result': None
+        },
+        celery_states.STARTED: {
+            'status': celery_states.STARTED,
+            'result': None
+        }
+    }
+
+    with mock.patch('turbinia.task_manager.celery_states', celery_states,
+                    create=True):
+      completed_tasks = manager.process_tasks()
+    manager.celery.get_task_results.assert_called_once_with(
+        [celery_states.SUCCESS, celery_states.FAILURE, celery_states.STARTED])
+    self.assertEqual(completed_tasks, tasks[:2])
+    self.assertEqual(tasks[0].result.id, self.result.id)
@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Columnar statistics engine for Task run times."""
+
+from __future__ import unicode_literals
+
+from collections import namedtuple
+from datetime import datetime
+from datetime import timedelta
+
+import numpy
+
+from turbinia import TurbiniaException
+
+EPOCH = datetime(1970, 1, 1)
+
+# Percentiles of the run time that are calculated for every summary.
+PERCENTILES = (50, 90, 99)
+
+# Codes for the successful column.  Tasks that have not completed are -1.
+SUCCESSFUL_CODES = {True: 1, False: 0}
+
+# Name of the placeholder Tasks that record dropped duplicate requests.  These
+# aren't real Tasks, so they are left out of all statistics.
+DUPLICATE_REQUEST_TASK = 'DuplicateRequest'
+
+# Widths in seconds of the time buckets that trends can be calculated for.
+TREND_BUCKETS = {'hour': 3600, 'day': 86400}
+
+# Run time statistics in seconds.  The stddev is the population standard
+# deviation, and the percentiles use the nearest-rank method so that they are
+# always one of the measured run times.
+RunTimeSummary = namedtuple(
+    'RunTimeSummary',
+    ['count', 'min', 'mean', 'max', 'total', 'stddev', 'p50', 'p90', 'p99'])
+
+
+def is_counted(task_dict):
+  """Checks whether a Task is counted in statistics.
+
+  Args:
+    task_dict (dict): The Task data.
+
+  Returns:
+    bool: False for duplicate request placeholders, otherwise True.
+  """
+  return task_dict.get('name') != DUPLICATE_REQUEST_TASK
+
+
+def summarize_values(values):
+  """Calculates a run time summary of a list of run times.
+
+  Args:
+    values (list[float]): The run times in seconds.
+
+  Returns:
+    RunTimeSummary: The summary, or None if there are no run times.
+  """
+  values = numpy.asarray(values, dtype=numpy.float64)
+  return TaskStatsTable.summarize_groups(
+      numpy.zeros(len(values), dtype=numpy.uint8), values, 1)[0]
+
+
+class TaskStatsTable(object):
+  """Task run times loaded into columns for vectorized aggregation.
+
+  Each grouping column (e.g. the Task name) is dictionary encoded into an array
+  of integer codes so that statistics for all groups can be calculated with a
+  single sort and a few array operations, rather than by building a list of
+  Tasks for every group.
+
+  Attributes:
+    run_times (numpy.ndarray): Task run times in seconds.
+    last_updates (numpy.ndarray): Task last_update times in seconds since the
+        epoch.
+    successful (numpy.ndarray): 1 for successful Tasks, 0 for failed Tasks and
+        -1 for Tasks that have not completed.
+    columns (dict): Grouping column names mapped to (labels, codes) tuples,
+        where labels is the list of distinct values and codes is an array of
+        indexes into labels for each Task.
+  """
+
+  # Task attributes that statistics can be grouped by.
+  GROUP_COLUMNS = ('name', 'worker_name', 'requester', 'request_id')
+
+  def __init__(self, tasks):
+    """Initializes the table.
+
+    Tasks without a run_time are ignored, because statistics can't be
+    calculated for them, and so are duplicate request placeholders.
+
+    Args:
+      tasks (list[dict]): Task dicts as returned by get_task_data().
+    """
+    tasks = [
+        task for task in tasks if task.get('run_time') and is_counted(task)
+    ]
+    count = len(tasks)
+    run_times = numpy.fromiter(
+        (task['run_time'].total_seconds() for task in tasks),
+        dtype=numpy.float64, count=count)
+    last_updates = numpy.array(
+        [((task.get('last_update') or EPOCH) - EPOCH).total_seconds()
+         for task in tasks], dtype=numpy.float64)
+    successful = numpy.array(
+        [SUCCESSFUL_CODES.get(task.get('successful'), -1) for task in tasks],
+        dtype=numpy.int8)
+
+    # The rows are kept sorted by run time, so that the values of any group
+    # taken out with a stable sort are already sorted too.
+    order = numpy.argsort(run_times, kind='stable')
+    self.run_times = run_times[order]
+    self.last_updates = last_updates[order]
+    self.successful = successful[order]
+    self.columns = {}
+    for column in self.GROUP_COLUMNS:
+      labels, codes = self._encode([task.get(column) for task in tasks])
+      self.columns[column] = (labels, codes[order])
+
+  def __len__(self):
+    return len(self.run_times)
+
+  @staticmethod
+  def _encode(values):
+    """Dictionary encodes a column.
+
+    Args:
+      values (list): The column values.
+
+    Returns:
+      tuple(list, numpy.ndarray): The distinct values, and the index of each
+          value in them.
+    """
+    labels = list(dict.fromkeys(values))
+    index = {value: code for code, value in enumerate(labels)}
+    # Small integer types can be sorted with a radix sort.
+    codes = numpy.array([index[value] for value in values],
+                        dtype=numpy.min_scalar_type(len(labels)))
+    return labels, codes
+
+  @staticmethod
+  def summarize_groups(codes, values, num_groups, presorted=False):
+    """Calculates run time summaries for every group in one pass.
+
+    Args:
+      codes (numpy.ndarray): The group index of each value.
+      values (numpy.ndarray): The run times in seconds.
+      num_groups (int): The number of groups.
+      presorted (bool): Whether the values are already sorted.
+
+    Returns:
+      list[RunTimeSummary]: Summaries indexed by group, or None for groups
+          without any values.
+    """
+    if not len(values):
+      return [None] * num_groups
+    counts = numpy.bincount(codes, minlength=num_groups)
+    totals = numpy.bincount(codes, weights=values, minlength=num_groups)
+    squares = numpy.bincount(
+        codes, weights=values * values, minlength=num_groups)
+    if not presorted:
+      order = numpy.argsort(values, kind='stable')
+      values = values[order]
+      codes = codes[order]
+    # A stable sort by group puts each group into a contiguous slice that is
+    # still sorted, so min, max and the percentiles are plain lookups.
+    sorted_values = values
+    if num_groups > 1:
+      sorted_values = values[numpy.argsort(codes, kind='stable')]
+    ends = numpy.cumsum(counts)
+    starts = ends - counts
+    present = counts > 0
+    safe_counts = numpy.maximum(counts, 1)
+    means = totals / safe_counts
+    stddevs = numpy.sqrt(numpy.maximum(squares / safe_counts - means**2, 0))
+    mins = sorted_values[numpy.where(present, starts, 0)]
+    maxs = sorted_values[numpy.where(present, ends - 1, 0)]
+    percentiles = []
+    for percentile in PERCENTILES:
+      ranks = numpy.ceil(counts * percentile / 100.0).astype(numpy.int64)
+      indexes = starts + numpy.maximum(ranks, 1) - 1
+      percentiles.append(sorted_values[numpy.where(present, indexes, 0)])
+
+    summaries = []
+    for i in range(num_groups):
+      if not counts[i]:
+        summaries.append(None)
+        continue
+      summaries.append(
+          RunTimeSummary(
+              int(counts[i]), float(mins[i]), float(means[i]), float(maxs[i]),
+              float(totals[i]), float(stddevs[i]),
+              *[float(values_[i]) for values_ in percentiles]))
+    return summaries
+
+  def summarize(self, successful=None):
+    """Calculates a run time summary of the Tasks.
+
+    Args:
+      successful (bool): Only include successful Tasks if True, and failed
+          Tasks if False.
+
+    Returns:
+      RunTimeSummary: The summary, or None if there are no matching Tasks.
+    """
+    values = self.run_times
+    if successful is not None:
+      values = values[self.successful == int(successful)]
+    codes = numpy.zeros(len(values), dtype=numpy.uint8)
+    return self.summarize_groups(codes, values, 1, presorted=True)[0]
+
+  def summarize_by(self, column):
+    """Calculates run time summaries grouped by a column.
+
+    Args:
+      column (str): One of GROUP_COLUMNS.
+
+    Returns:
+      dict: Column values mapped to RunTimeSummary objects.
+    """
+    if column not in self.columns:
+      raise TurbiniaException(
+          'Can not group statistics by unknown column {0:s}'.format(column))
+    labels, codes = self.columns[column]
+    summaries = self.summarize_groups(
+        codes, self.run_times, len(labels), presorted=True)
+    return dict(zip(labels, summaries))
+
+  def summarize_requests(self):
+    """Calculates a summary of the total run time of requests.
+
+    The total run time of a request covers the start of its earliest Task to
+    the end of its latest Task.
+
+    Returns:
+      RunTimeSummary: The summary, or None if there are no Tasks.
+    """
+    labels, codes = self.columns['request_id']
+    if not len(codes):
+      return None
+    order = numpy.argsort(codes, kind='stable')
+    counts = numpy.bincount(codes, minlength=len(labels))
+    starts = numpy.cumsum(counts) - counts
+    start_times = numpy.minimum.reduceat(
+        (self.last_updates - self.run_times)[order], starts)
+    stop_times = numpy.maximum.reduceat(self.last_updates[order], starts)
+    return summarize_values(stop_times - start_times)
+
+  def summarize_trend(self, bucket='day'):
+    """Calculates run time summaries for Tasks per time bucket.
+
+    Tasks are put in buckets by their last_update time.
+
+    Args:
+      bucket (str): The bucket size, one of TREND_BUCKETS.
+
+    Returns:
+      list[tuple(datetime, RunTimeSummary)]: The start time of each bucket with
+          Tasks and its summary, in time order.
+    """
+    if bucket not in TREND_BUCKETS:
+      raise TurbiniaException(
+          'Unknown trend bucket {0!s}, must be one of {1:s}'.format(
+              bucket, ', '.join(sorted(TREND_BUCKETS))))
+    width = TREND_BUCKETS[bucket]
+    buckets = numpy.floor(self.last_updates / width).astype(numpy.int64)
+    labels, codes = numpy.unique(buckets, return_inverse=True)
+    codes = codes.ravel().astype(numpy.min_scalar_type(len(labels)))
+    summaries = self.summarize_groups(
+        codes, self.run_times, len(labels), presorted=True)
+    return [(EPOCH + timedelta(seconds=int(label) * width), summary)
+            for label, summary in zip(labels, summaries)]
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests the Task statistics module."""
+
+from __future__ import unicode_literals
+
+from datetime import datetime
+from datetime import timedelta
+import unittest
+
+from turbinia import task_statistics
+from turbinia import TurbiniaException
+
+
+class TestTaskStatsTable(unittest.TestCase):
+  """Test TaskStatsTable class."""
+
+  def setUp(self):
+    self.last_update = datetime(2020, 8, 4, 16, 32, 38, 390390)
+    self.tasks = [
+        self._get_task('Task1', 'worker1', 'request1', 10, True),
+        self._get_task('Task1', 'worker1', 'request1', 30, False, 20),
+        self._get_task('Task2', 'worker2', 'request2', 20, True, 60 * 25),
+        self._get_task('Task2', 'worker2', 'request2', None, None)
+    ]
+    self.table = task_statistics.TaskStatsTable(self.tasks)
+
+  def _get_task(
+      self, name, worker, request_id, run_time, successful, minutes_ago=0):
+    """Gets Task data that ran for run_time seconds."""
+    return {
+        'name': name,
+        'worker_name': worker,
+        'request_id': request_id,
+        'requester': 'user1',
+        'run_time': timedelta(seconds=run_time) if run_time else None,
+        'successful': successful,
+        'last_update': self.last_update - timedelta(minutes=minutes_ago)
+    }
+
+  def testSummarize(self):
+    """Tests summaries of all, successful and failed Tasks."""
+    self.assertEqual(len(self.table), 3)
+    summary = self.table.summarize()
+    self.assertEqual(summary.count, 3)
+    self.assertEqual(summary.min, 10.0)
+    self.assertEqual(summary.mean, 20.0)
+    self.assertEqual(summary.max, 30.0)
+    self.assertEqual(summary.total, 60.0)
+    self.assertAlmostEqual(summary.stddev, 8.16496, places=4)
+    self.assertEqual(summary.p50, 20.0)
+    self.assertEqual(summary.p90, 30.0)
+    self.assertEqual(summary.p99, 30.0)
+
+    self.assertEqual(self.table.summarize(True).count, 2)
+    self.assertEqual(self.table.summarize(True).mean, 15.0)
+    self.assertEqual(self.table.summarize(False).total, 30.0)
+
+  def testDuplicateRequestsIgnored(self):
+    """Tests that duplicate request placeholders are left out."""
+    task = self._get_task(
+        task_statistics.DUPLICATE_REQUEST_TASK, 'worker1', 'request3', 5, True)
+    table = task_statistics.TaskStatsTable(self.tasks + [task])
+    self.assertEqual(len(table), len(self.table))
+    self.assertNotIn('request3', table.summarize_by('request_id'))
+
+  def testSummarizeEmpty(self):
+    """Tests summaries without Tasks."""
+    table = task_statistics.TaskStatsTable([])
+    self.assertIsNone(table.summarize())
+    self.assertIsNone(table.summarize_requests())
+    self.assertEqual(table.summarize_by('name'), {})
+    self.assertEqual(table.summarize_trend('hour'), [])
+
+  def testSummarizePercentiles(self):
+    """Tests percentiles use the nearest rank."""
+    tasks = [
+        self._get_task('Task1', 'worker1', 'request1', i, True)
+        for i in range(1, 101)
+    ]
+    summary = task_statistics.TaskStatsTable(tasks).summarize()
+    self.assertEqual(summary.p50, 50.0)
+    self.assertEqual(summary.p90, 90.0)
+    self.assertEqual(summary.p99, 99.0)
+
+  def testSummarizeBy(self):
+    """Tests summaries grouped by a column."""
+    summaries = self.table.summarize_by('name')
+    self.assertEqual(sorted(summaries), ['Task1', 'Task2'])
+    self.assertEqual(summaries['Task1'].count, 2)
+    self.assertEqual(summaries['Task1'].min, 10.0)
+    self.assertEqual(summaries['Task1'].max, 30.0)
+    self.assertEqual(summaries['Task2'].mean, 20.0)
+    self.assertRaises(TurbiniaException, self.table.summarize_by, 'bad')
+
+  def testSummarizeRequests(self):
+    """Tests total request times span the Tasks in each request."""
+    summary = self.table.summarize_requests()
+    self.assertEqual(summary.count, 2)
+    # request1 starts 20 minutes and 30 seconds before the last_update, and
+    # request2 only has a single Task.
+    self.assertEqual(summary.max, 20 * 60 + 30.0)
+    self.assertEqual(summary.min, 20.0)
+
+  def testSummarizeTrend(self):
+    """Tests summaries per time bucket."""
+    trend = self.table.summarize_trend('hour')
+    self.assertEqual([bucket for bucket, _ in trend],
+                     [datetime(2020, 8, 3, 15, 0),
+                      datetime(2020, 8, 4, 16, 0)])
+    self.assertEqual(trend[0][1].count, 1)
+    self.assertEqual(trend[1][1].count, 2)
+    trend = self.table.summarize_trend('day')
+    self.assertEqual(len(trend), 2)
+    self.assertRaises(TurbiniaException, self.table.summarize_trend, 'week')
+
+
+if __name__ == '__main__':
+  unittest.main()
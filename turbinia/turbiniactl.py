@@ -90,6 +90,15 @@ def main():
   parser.add_argument(
       '-r', '--request_id', help='Create new requests with this Request ID',
       required=False)
+  parser.add_argument(
+      '-k', '--idempotency_key', help='Key that identifies this request, so '
+      'that the server only processes the first of any requests sent with the '
+      'same key.  Defaults to a hash of the evidence and recipe if the server '
+      'has REQUEST_DEDUP_IMPLICIT_KEYS set.', required=False)
+  parser.add_argument(
+      '--no_dedup', action='store_true',
+      help='Process this request even if the server has already received a '
+      'request with the same idempotency key.', required=False)
   parser.add_argument(
       '-R', '--run_local', action='store_true',
       help='Run completely locally without any server or other infrastructure. '
@@ -124,7 +133,9 @@ def main():
       '--jobs_allowlist help for details on format and when it is applied.')
   parser.add_argument(
       '-p', '--poll_interval', default=60, type=int,
-      help='Number of seconds to wait between polling for task state info')
+      help='Number of seconds to wait between polling for task state info.  '
+      'When TASK_EVENTS are enabled this is the maximum time to wait for an '
+      'event before checking the task state.')
   parser.add_argument(
       '-t', '--task',
       help='The name of a single Task to run locally (must be used with '
@@ -370,9 +381,16 @@ def main():
       '-R', '--full_report',
       help='Generate full markdown report instead of just a summary',
       action='store_true', required=False)
+  parser_status.add_argument(
+      '--refresh_cache', action='store_true', required=False,
+      help='Clear the local Task cache (see TASK_CACHE_DIR in the config) and '
+      'fetch all Task data for the requested timeframe again')
   parser_status.add_argument(
       '-s', '--statistics', help='Generate statistics only',
       action='store_true', required=False)
+  parser_status.add_argument(
+      '--trend', choices=['hour', 'day'], default=None, required=False,
+      help='When used with --statistics, also show statistics per hour or day')
   parser_status.add_argument(
       '-t', '--task_id', help='Show task for given Task ID', required=False)
   parser_status.add_argument(
@@ -440,6 +458,7 @@ def main():
   from turbinia.client import TurbiniaCeleryWorker
   from turbinia.client import TurbiniaPsqWorker
   from turbinia import evidence
+  from turbinia import task_cache
   from turbinia.message import TurbiniaRequest
 
   # Print out config if requested
@@ -658,6 +677,9 @@ def main():
         )
         sys.exit(1)
 
+    if args.refresh_cache and task_cache.enabled():
+      task_cache.TaskCache(config.INSTANCE_ID).clear()
+
     if args.dump_json and (args.statistics or args.requests or args.workers):
       log.info(
           'The --dump_json flag is not compatible with --statistics, '
@@ -669,7 +691,8 @@ def main():
           client.format_task_statistics(
               instance=config.INSTANCE_ID, project=config.TURBINIA_PROJECT,
               region=region, days=args.days_history, task_id=args.task_id,
-              request_id=args.request_id, user=args.user, csv=args.csv))
+              request_id=args.request_id, user=args.user, csv=args.csv,
+              trend=args.trend))
       sys.exit(0)
 
     if args.wait and args.request_id:
@@ -752,7 +775,8 @@ def main():
     server.start()
   elif evidence_:
     request = TurbiniaRequest(
-        request_id=request_id, requester=getpass.getuser())
+        request_id=request_id, requester=getpass.getuser(),
+        idempotency_key=args.idempotency_key, deduplicate=not args.no_dedup)
     request.evidence.append(evidence_)
     if filter_patterns:
       request.recipe['filter_patterns'] = filter_patterns
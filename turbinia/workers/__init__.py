@@ -37,6 +37,8 @@ from turbinia import config
 from turbinia.config import DATETIME_FORMAT
 from turbinia.evidence import evidence_decode
 from turbinia import output_manager
+from turbinia import recipe_store
+from turbinia import space_manager
 from turbinia import state_manager
 from turbinia import TurbiniaException
 from turbinia import log_and_report
@@ -69,6 +71,8 @@ class TurbiniaTaskResult(object):
       id: Unique Id of result (string of hex)
       input_evidence: The evidence this task processed.
       job_id (str): The ID of the Job that generated this Task/TaskResult
+      log_deferred (bool): Whether saving the worker log is waiting on deferred
+          output saves.
       report_data (string): Markdown data that can be used in a Turbinia report.
       report_priority (int): Value between 0-100 (0 is the highest priority) to
           be used to order report sections.
@@ -123,6 +127,7 @@ class TurbiniaTaskResult(object):
     self.state_manager = None
     # TODO(aarontp): Create mechanism to grab actual python logging data.
     self._log = []
+    self.log_deferred = False
 
   def __str__(self):
     return pprint.pformat(vars(self), depth=3)
@@ -210,7 +215,23 @@ class TurbiniaTaskResult(object):
           'during Task execution and this may result in resources (e.g. '
           'mounted disks) accumulating on the Worker.', level=logging.WARNING)
 
-    # Write result log info to file
+    # When output saves are deferred, the worker log is saved by run_wrapper
+    # after the deferred saves have run so that it includes their errors.
+    if task.output_manager.defer_saves:
+      self.log_deferred = True
+    else:
+      self.save_log(task)
+
+    self.closed = True
+    log.debug('Result close successful. Status is [{0:s}]'.format(self.status))
+
+  def save_log(self, task):
+    """Writes the result log messages to the worker log file and saves it.
+
+    Args:
+      task (TurbiniaTask): The calling Task object
+    """
+    self.log_deferred = False
     logfile = os.path.join(self.output_dir, 'worker-log.txt')
     # Create default log text just so that the worker log is created to
     # avoid confusion if it doesn't exist.
@@ -223,9 +244,6 @@ class TurbiniaTaskResult(object):
       if not task.run_local:
         task.output_manager.save_local_file(logfile, self)
 
-    self.closed = True
-    log.debug('Result close successful. Status is [{0:s}]'.format(self.status))
-
   def log(self, message, level=logging.INFO, traceback_=None):
     """Log Task messages.
 
@@ -306,9 +324,13 @@ class TurbiniaTaskResult(object):
     else:
       result_copy['run_time'] = None
     result_copy['start_time'] = self.start_time.strftime(DATETIME_FORMAT)
+    recipes = recipe_store.get_recipe_store()
     if self.input_evidence:
-      result_copy['input_evidence'] = self.input_evidence.serialize()
-    result_copy['evidence'] = [x.serialize() for x in self.evidence]
+      result_copy['input_evidence'] = recipes.serialize_evidence(
+          self.input_evidence)
+    result_copy['evidence'] = [
+        recipes.serialize_evidence(x) for x in self.evidence
+    ]
 
     return result_copy
 
@@ -329,9 +351,26 @@ class TurbiniaTaskResult(object):
     if result.run_time:
       result.run_time = timedelta(seconds=result.run_time)
     result.start_time = datetime.strptime(result.start_time, DATETIME_FORMAT)
-    if result.input_evidence:
-      result.input_evidence = evidence_decode(result.input_evidence)
-    result.evidence = [evidence_decode(x) for x in result.evidence]
+    recipes = recipe_store.get_recipe_store()
+    try:
+      if result.input_evidence:
+        result.input_evidence = evidence_decode(
+            recipes.resolve_evidence(result.input_evidence))
+      result.evidence = [
+          evidence_decode(recipes.resolve_evidence(x)) for x in result.evidence
+      ]
+    except TurbiniaException as exception:
+      # The recipe may have expired or the Evidence may be invalid, so this is
+      # reported as a failed result rather than stopping the caller.
+      message = (
+          'Could not decode the Evidence of the Task result: '
+          '{0!s}'.format(exception))
+      log.error(message)
+      result.input_evidence = None
+      result.evidence = []
+      result.successful = False
+      result.status = message
+      result.set_error(message, traceback.format_exc())
 
     return result
 
@@ -586,7 +625,7 @@ class TurbiniaTask(object):
     Raises:
       TurbiniaException: If the evidence can not be found.
     """
-    self.output_manager.setup(self.name, self.id)
+    self.output_manager.setup(self.name, self.id, request_id=self.request_id)
     self.tmp_dir, self.output_dir = self.output_manager.get_local_output_dirs()
     if not self.result:
       self.result = self.create_result(input_evidence=evidence)
@@ -595,6 +634,12 @@ class TurbiniaTask(object):
       if evidence.copyable and not config.SHARED_FILESYSTEM:
         self.output_manager.retrieve_evidence(evidence)
 
+    # Evidence from older Tasks can reference output directories that have
+    # since been migrated out of the flat output directory layout.
+    evidence.local_path = output_manager.resolve_output_path(
+        evidence.local_path)
+    evidence.source_path = output_manager.resolve_output_path(
+        evidence.source_path)
     if evidence.source_path and not os.path.exists(evidence.source_path):
       raise TurbiniaException(
           'Evidence source path {0:s} does not exist'.format(
@@ -702,8 +747,9 @@ class TurbiniaTask(object):
     from turbinia.jobs import manager as job_manager
 
     log.debug('Task {0:s} {1:s} awaiting execution'.format(self.name, self.id))
-    evidence = evidence_decode(evidence)
     try:
+      evidence = evidence_decode(
+          recipe_store.get_recipe_store().resolve_evidence(evidence))
       self.result = self.setup(evidence)
       self.result.update_task_status(self, 'queued')
     except TurbiniaException as exception:
@@ -725,6 +771,26 @@ class TurbiniaTask(object):
             message=message, trace=traceback.format_exc())
       return self.result.serialize()
 
+    space_manager_ = None
+    if space_manager.SpaceManager.enabled():
+      space_manager_ = space_manager.SpaceManager()
+      space_manager_.acquire(
+          self.id, self.name, self.tmp_dir, self.output_dir,
+          request_id=self.request_id)
+      # Evicts data from previous Tasks if needed, and waits for or refuses
+      # to run this Task when there still isn't enough disk space.  This is
+      # done before taking the worker lock so that waiting for space doesn't
+      # stop other Tasks on this host from running and freeing space.
+      try:
+        space_manager_.ensure_space(self.name)
+      except TurbiniaException as exception:
+        message = '{0:s} Task can not run: [{1!s}]'.format(self.name, exception)
+        log.error(message)
+        self.result.set_error(message, traceback.format_exc())
+        self.result.close(self, success=False, status=message)
+        space_manager_.release(self.id)
+        return self.result.serialize()
+
     with filelock.FileLock(config.LOCK_FILE):
       log.info('Starting Task {0:s} {1:s}'.format(self.name, self.id))
       original_result_id = None
@@ -753,6 +819,11 @@ class TurbiniaTask(object):
 
         self.result.update_task_status(self, 'running')
         self._evidence_config = evidence.config
+        # Output is queued up during execution and saved below after the lock
+        # is released, so that other worker processes on this host can start
+        # Tasks while this output is saved.  This Task only returns once its
+        # output is saved, so a worker with a single process still waits.
+        self.output_manager.defer_saves = True
         self.result = self.run(evidence, self.result)
 
       # pylint: disable=broad-except
@@ -806,6 +877,24 @@ class TurbiniaTask(object):
         # Check the result again after closing to make sure it's still good.
         self.result = self.validate_result(self.result)
 
+    if self.result:
+      for message in self.output_manager.save_deferred():
+        self.result.log(message, level=logging.ERROR)
+        self.result.successful = False
+        self.result.status = '{0:s}. Previous status: [{1!s}]'.format(
+            message, self.result.status)
+      if self.result.log_deferred:
+        try:
+          self.result.save_log(self)
+        # Saving the log is best effort, and the result should still be
+        # returned if it fails.
+        # pylint: disable=broad-except
+        except Exception as exception:
+          log.error('Failed to save worker log: {0!s}'.format(exception))
+
+    if space_manager_:
+      space_manager_.release(self.id)
+
     if original_result_id != self.result.id:
       log.debug(
           'Result object {0:s} is different from original {1!s} after task '
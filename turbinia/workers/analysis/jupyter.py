@@ -25,6 +25,7 @@ from turbinia.evidence import ReportText
 from turbinia.lib import text_formatter as fmt
 from turbinia.workers import TurbiniaTask
 from turbinia.workers import Priority
+from turbinia.workers.analysis import log_analyzer
 
 
 class JupyterAnalysisTask(TurbiniaTask):
@@ -35,6 +36,40 @@ class JupyterAnalysisTask(TurbiniaTask):
       state.PARENT_MOUNTED
   ]
 
+  # Rules are checked in order, and later rules are skipped for a line that
+  # matched a final rule.
+  RULES = [
+      log_analyzer.Rule(
+          'xsrf_disabled', r'^(?=.*disable_check_xsrf).*True',
+          literals=['disable_check_xsrf'], final=True),
+      log_analyzer.Rule(
+          'allow_root', r'^(?=.*allow_root).*True', literals=['allow_root'],
+          final=True),
+      log_analyzer.Rule(
+          'password_not_required',
+          r'^(?=.*NotebookApp\.password)(?=.*required).*False',
+          literals=['NotebookApp.password'], final=True),
+      log_analyzer.Rule(
+          'no_password',
+          r"^(?!.*required)(?=.*NotebookApp\.password)[^=]*=\s*''\s*(=|$)",
+          literals=['NotebookApp.password']),
+      log_analyzer.Rule(
+          'remote_access', r'^(?=.*allow_remote_access).*True',
+          literals=['allow_remote_access'], final=True)
+  ]
+  FINDINGS = {
+      'xsrf_disabled':
+          'XSRF protection is disabled.',
+      'allow_root':
+          'Juypter Notebook allowed to run as root.',
+      'password_not_required':
+          'Password is not required to access this Jupyter Notebook.',
+      'no_password':
+          'There is no password set for this Jupyter Notebook.',
+      'remote_access':
+          'Remote access is enabled on this Jupyter Notebook.'
+  }
+
   def run(self, evidence, result):
     """Run the Jupyter worker.
 
@@ -53,9 +88,8 @@ class JupyterAnalysisTask(TurbiniaTask):
     # What type of evidence we should output.
     output_evidence = ReportText(source_path=output_file_path)
 
-    # Read the config file.
-
-    jupyter_config = open(evidence.local_path, 'r').read()
+    # Stream the config file.
+    jupyter_config = log_analyzer.open_lines(evidence.local_path)
 
     # Extract the config and return the report
     (report, priority, summary) = self.analyse_config(jupyter_config)
@@ -78,7 +112,8 @@ class JupyterAnalysisTask(TurbiniaTask):
     """Extract security related configs from Jupyter configuration files.
 
     Args:
-      config (str): configuration file content.
+      jupyter_config (iterable[str]|str): configuration file lines, or the
+          content.
 
     Returns:
       Tuple(
@@ -89,36 +124,10 @@ class JupyterAnalysisTask(TurbiniaTask):
     """
     findings = []
     num_misconfigs = 0
-    for line in jupyter_config.split('\n'):
-
-      if all(x in line for x in ['disable_check_xsrf', 'True']):
-        findings.append(fmt.bullet('XSRF protection is disabled.'))
-        num_misconfigs += 1
-        continue
-      if all(x in line for x in ['allow_root', 'True']):
-        findings.append(fmt.bullet('Juypter Notebook allowed to run as root.'))
-        num_misconfigs += 1
-        continue
-      if 'NotebookApp.password' in line:
-        if all(x in line for x in ['required', 'False']):
-          findings.append(
-              fmt.bullet(
-                  'Password is not required to access this Jupyter Notebook.'))
-          num_misconfigs += 1
-          continue
-        if 'required' not in line:
-          password_hash = line.split('=')
-          if len(password_hash) > 1:
-            if password_hash[1].strip() == "''":
-              findings.append(
-                  fmt.bullet(
-                      'There is no password set for this Jupyter Notebook.'))
-              num_misconfigs += 1
-      if all(x in line for x in ['allow_remote_access', 'True']):
-        findings.append(
-            fmt.bullet('Remote access is enabled on this Jupyter Notebook.'))
-        num_misconfigs += 1
-        continue
+    analyzer = log_analyzer.LogAnalyzer(self.RULES)
+    for finding in analyzer.scan(jupyter_config):
+      findings.append(fmt.bullet(self.FINDINGS[finding.rule]))
+      num_misconfigs += 1
 
     if findings:
       summary = 'Insecure Jupyter Notebook configuration found. Total misconfigs: {}'.format(
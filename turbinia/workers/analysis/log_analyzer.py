@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Single pass rule engine for analysis Tasks that read logs and configs.
+
+Tasks declare a list of rules, each with a regular expression and the literal
+strings any matching line must contain.  The analyzer streams the input one
+line at a time (decompressing gzip files transparently), so memory use does
+not depend on the size of the input.  A combined expression of all of the
+literals rejects most lines with a single search, and only the rules whose
+literals are in a line have their expressions evaluated.
+"""
+
+from __future__ import unicode_literals
+
+import collections
+import gzip
+import io
+import re
+
+import six
+
+# Magic bytes at the start of gzip files.
+GZIP_MAGIC = b'\x1f\x8b'
+
+Finding = collections.namedtuple(
+    'Finding', ['rule', 'line_number', 'line', 'match'])
+
+
+def open_lines(path, encoding='utf-8', errors='replace'):
+  """Reads the lines of a file that may be gzip compressed.
+
+  Args:
+    path (str): The path to the file.
+    encoding (str): The text encoding of the file.
+    errors (str): How to handle undecodable bytes (see codecs).
+
+  Yields:
+    str: The lines of the file without line endings.
+  """
+  with io.open(path, 'rb') as raw_file:
+    compressed = raw_file.read(len(GZIP_MAGIC)) == GZIP_MAGIC
+  binary_file = gzip.open(path, 'rb') if compressed else io.open(path, 'rb')
+  with io.TextIOWrapper(binary_file, encoding=encoding, errors=errors,
+                        newline='') as input_file:
+    for line in input_file:
+      yield line.rstrip('\r\n')
+
+
+class Rule(object):
+  """A rule that matches lines of the input.
+
+  Attributes:
+    name (str): The name of the rule, used to identify its findings.
+    regex (re.Pattern): The expression lines are matched with.
+    literals (list[str]): Strings that a line must contain one of for the
+        expression to match, or an empty list to evaluate every line.
+    final (bool): Whether rules after this one are skipped for lines this rule
+        matches.
+  """
+
+  def __init__(self, name, pattern, literals=None, flags=0, final=False):
+    """Initializes a rule.
+
+    Args:
+      name (str): The name of the rule.
+      pattern (str): The regular expression lines are matched with.  Matching
+          uses search(), so the expression can match anywhere in a line.
+      literals (list[str]): Strings that every line matched by the pattern
+          contains at least one of.  These must be correct for the rule to
+          find all matches.
+      flags (int): Regular expression flags.  With re.IGNORECASE the literals
+          are matched case insensitively too.
+      final (bool): Whether rules after this one are skipped for lines this
+          rule matches.
+    """
+    self.name = name
+    self.regex = re.compile(pattern, flags)
+    self.ignore_case = bool(flags & re.IGNORECASE)
+    self.literals = [
+        literal.lower() if self.ignore_case else literal
+        for literal in literals or []
+    ]
+    self.final = final
+
+  def check_literals(self, line, lower_line):
+    """Checks whether a line contains one of the literals of the rule.
+
+    Args:
+      line (str): The line.
+      lower_line (str): The line in lower case.
+
+    Returns:
+      bool: True if the expression of the rule needs to be evaluated.
+    """
+    if not self.literals:
+      return True
+    text = lower_line if self.ignore_case else line
+    return any(literal in text for literal in self.literals)
+
+
+class LogAnalyzer(object):
+  """Evaluates a set of rules over lines of input in a single pass.
+
+  Attributes:
+    rules (list[Rule]): The rules, in the order their findings are reported
+        for each line.
+  """
+
+  def __init__(self, rules):
+    self.rules = list(rules)
+    self._prefilter = None
+    # Without literals for every rule, each line has to be evaluated anyway.
+    if self.rules and all(rule.literals for rule in self.rules):
+      literals = sorted(
+          {literal for rule in self.rules for literal in rule.literals},
+          key=len, reverse=True)
+      flags = re.IGNORECASE if any(
+          rule.ignore_case for rule in self.rules) else 0
+      self._prefilter = re.compile(
+          '|'.join(re.escape(literal) for literal in literals), flags)
+
+  def scan(self, lines):
+    """Evaluates the rules over the input.
+
+    Args:
+      lines (iterable[str]|str): The lines of the input, or the whole input as
+          a string.
+
+    Yields:
+      Finding: The findings for each match, in input order.
+    """
+    if isinstance(lines, six.string_types):
+      lines = lines.split('\n')
+    prefilter = self._prefilter
+    for line_number, line in enumerate(lines, 1):
+      if prefilter and not prefilter.search(line):
+        continue
+      lower_line = line.lower()
+      for rule in self.rules:
+        if not rule.check_literals(line, lower_line):
+          continue
+        match = rule.regex.search(line)
+        if match:
+          yield Finding(rule.name, line_number, line, match)
+          if rule.final:
+            break
+
+  def scan_file(self, path, encoding='utf-8'):
+    """Evaluates the rules over a file, which may be gzip compressed.
+
+    Args:
+      path (str): The path to the file.
+      encoding (str): The text encoding of the file.  Undecodable bytes are
+          replaced rather than failing the analysis.
+
+    Yields:
+      Finding: The findings for each match, in file order.
+    """
+    for finding in self.scan(open_lines(path, encoding=encoding)):
+      yield finding
+
+  def get_matched_rules(self, lines):
+    """Gets the names of the rules that matched the input.
+
+    Args:
+      lines (iterable[str]|str): The lines of the input, or the whole input as
+          a string.
+
+    Returns:
+      set[str]: The names of the rules with at least one match.
+    """
+    return {finding.rule for finding in self.scan(lines)}
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the log analyzer."""
+
+from __future__ import unicode_literals
+
+import gzip
+import os
+import re
+import shutil
+import tempfile
+import unittest
+
+from turbinia.workers.analysis import log_analyzer
+
+
+class LogAnalyzerTest(unittest.TestCase):
+  """Tests for LogAnalyzer class."""
+
+  LOG = '\n'.join([
+      '1.2.3.4 - - "GET /index.php HTTP/1.1" 200',
+      '1.2.3.4 - - "POST /wp-login.php HTTP/1.1" 302',
+      '1.2.3.4 - - "get /WP-ADMIN/plugins.php HTTP/1.1" 200',
+      '1.2.3.4 - - "POST /wp-admin/plugins.php?action=upload HTTP/1.1" 200'
+  ])
+
+  def setUp(self):
+    self.tmp_dir = tempfile.mkdtemp(prefix='turbinia-test-log-analyzer')
+    self.rules = [
+        log_analyzer.Rule(
+            'login', r'POST /wp-login\.php', literals=['/wp-login.php']),
+        log_analyzer.Rule(
+            'admin', r'(GET|POST) /wp-admin/(?P<page>\S+)',
+            literals=['/wp-admin/'], flags=re.IGNORECASE),
+        log_analyzer.Rule('upload', r'action=upload', literals=['upload'])
+    ]
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp_dir)
+
+  def testScan(self):
+    """Tests all rules are evaluated in input order."""
+    analyzer = log_analyzer.LogAnalyzer(self.rules)
+    findings = list(analyzer.scan(self.LOG))
+    self.assertEqual(
+        [(finding.rule, finding.line_number) for finding in findings],
+        [('login', 2), ('admin', 3), ('admin', 4), ('upload', 4)])
+    self.assertEqual(findings[1].match.group('page'), 'plugins.php')
+    self.assertEqual(
+        analyzer.get_matched_rules(self.LOG.split('\n')[:2]), {'login'})
+
+  def testFinalRule(self):
+    """Tests later rules are skipped for lines matching a final rule."""
+    self.rules[1].final = True
+    analyzer = log_analyzer.LogAnalyzer(self.rules)
+    self.assertEqual([finding.rule for finding in analyzer.scan(self.LOG)],
+                     ['login', 'admin', 'admin'])
+
+  def testRuleWithoutLiterals(self):
+    """Tests rules without literals are evaluated for every line."""
+    self.rules.append(log_analyzer.Rule('status', r'" 200$'))
+    analyzer = log_analyzer.LogAnalyzer(self.rules)
+    # pylint: disable=protected-access
+    self.assertIsNone(analyzer._prefilter)
+    self.assertEqual(
+        sum(
+            1 for finding in analyzer.scan(self.LOG)
+            if finding.rule == 'status'), 3)
+
+  def testScanFile(self):
+    """Tests plain and gzip compressed files are read line by line."""
+    analyzer = log_analyzer.LogAnalyzer(self.rules)
+    data = self.LOG.replace('\n', '\r\n').encode('utf-8') + b'\n\xff\xfe'
+    plain_path = os.path.join(self.tmp_dir, 'access.log')
+    with open(plain_path, 'wb') as fh:
+      fh.write(data)
+    # Compressed files are detected by content rather than extension.
+    gzip_path = os.path.join(self.tmp_dir, 'access.log.1')
+    with gzip.open(gzip_path, 'wb') as fh:
+      fh.write(data)
+
+    for path in (plain_path, gzip_path):
+      lines = list(log_analyzer.open_lines(path))
+      self.assertEqual(len(lines), 5)
+      self.assertEqual(lines[0], self.LOG.split('\n')[0])
+      self.assertEqual(lines[4], '��')
+      self.assertEqual(
+          len(list(analyzer.scan_file(path))), len(
+              list(analyzer.scan(self.LOG))))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -16,7 +16,8 @@
 
 from __future__ import unicode_literals
 
-import gzip
+from concurrent import futures
+import multiprocessing
 import os
 import re
 
@@ -25,18 +26,34 @@ from turbinia.evidence import ReportText
 from turbinia.lib import text_formatter as fmt
 from turbinia.workers import TurbiniaTask
 from turbinia.workers import Priority
+from turbinia.workers.analysis import log_analyzer
 
 
 class WordpressAccessLogAnalysisTask(TurbiniaTask):
-  """Task to analyze Wordpress access logs."""
+  """Task to analyze Wordpress access logs.
+
+  The evidence can be a single access log, or a (compressed) directory of
+  access logs that are analyzed in parallel.  Logs are streamed, so memory use
+  does not depend on their size.
+  """
+
+  REQUIRED_STATES = [state.DECOMPRESSED]
+
+  # Maximum number of processes to analyze access log files with, or None for
+  # one per CPU.
+  MAX_PROCESSES = None
 
   timestamp_regex = re.compile(r'\[(?P<timestamp>.+)\]')
 
-  install_step_regex = re.compile(
-      r'POST /wp-admin/install\.php\?step=2', re.IGNORECASE)
-  theme_editor_regex = re.compile(
-      r'GET /wp-admin/theme-editor\.php\?file=(?P<edited_file>.+\.php)',
-      re.IGNORECASE)
+  RULES = [
+      log_analyzer.Rule(
+          'install', r'POST /wp-admin/install\.php\?step=2',
+          literals=['/wp-admin/install.php'], flags=re.IGNORECASE),
+      log_analyzer.Rule(
+          'theme_edit',
+          r'GET /wp-admin/theme-editor\.php\?file=(?P<edited_file>.+\.php)',
+          literals=['/wp-admin/theme-editor.php'], flags=re.IGNORECASE)
+  ]
 
   def run(self, evidence, result):
     """Run the Wordpress access log analysis worker.
@@ -54,17 +71,12 @@ class WordpressAccessLogAnalysisTask(TurbiniaTask):
     # Set the output file as the data source for the output evidence.
     output_evidence = ReportText(source_path=output_file_path)
 
-    # Change open function if file is GZIP compressed.
-    open_function = open
-    if evidence.local_path.lower().endswith('gz'):
-      open_function = gzip.open
-
-    # Read the input file
-    with open_function(evidence.local_path, 'rb') as input_file:
-      access_logs_content = input_file.read().decode('utf-8')
-
-    (report, priority,
-     summary) = self.analyze_wp_access_logs(access_logs_content)
+    log_paths = self.get_log_paths(evidence.local_path)
+    result.log(
+        'Analyzing {0:d} access log file(s) in {1:s}'.format(
+            len(log_paths), evidence.local_path))
+    (report, priority, summary) = self.analyze_wp_access_log_files(
+        log_paths, root=evidence.local_path)
     output_evidence.text_data = report
     result.report_data = report
     result.report_priority = priority
@@ -78,18 +90,62 @@ class WordpressAccessLogAnalysisTask(TurbiniaTask):
     result.close(self, success=True, status=summary)
     return result
 
-  def _get_timestamp(self, log_line):
+  @staticmethod
+  def get_log_paths(path):
+    """Gets the access log files to analyze.
+
+    Args:
+      path (str): An access log file, or a directory of access log files.
+
+    Returns:
+      list[str]: The paths of the access log files.
+    """
+    if not os.path.isdir(path):
+      return [path]
+    log_paths = []
+    for dirpath, _, filenames in os.walk(path):
+      for filename in filenames:
+        file_path = os.path.join(dirpath, filename)
+        if os.path.isfile(file_path):
+          log_paths.append(file_path)
+    return sorted(log_paths)
+
+  @classmethod
+  def _get_timestamp(cls, log_line):
     """Extracts a timestamp from an access log line."""
-    match = self.timestamp_regex.search(log_line)
+    match = cls.timestamp_regex.search(log_line)
     if match:
       return match.group('timestamp')
     return '[N/A]'
 
+  @classmethod
+  def get_findings(cls, lines):
+    """Gets the Wordpress findings in access logs.
+
+    Args:
+      lines (iterable[str]|str): access log lines, or the file content.
+
+    Returns:
+      list[tuple(str, str)]: (finding type, description) tuples.
+    """
+    findings = []
+    analyzer = log_analyzer.LogAnalyzer(cls.RULES)
+    for finding in analyzer.scan(lines):
+      if finding.rule == 'install':
+        line = '{0:s}: Wordpress installation successful'.format(
+            cls._get_timestamp(finding.line))
+      else:
+        line = '{0:s}: Wordpress theme editor edited file ({1:s})'.format(
+            cls._get_timestamp(finding.line),
+            finding.match.group('edited_file'))
+      findings.append((finding.rule, line))
+    return findings
+
   def analyze_wp_access_logs(self, config):
     """Analyses access logs containing Wordpress traffic.
 
     Args:
-      config (str): access log file content.
+      config (iterable[str]|str): access log lines, or the file content.
 
     Returns:
       Tuple(
@@ -98,23 +154,56 @@ class WordpressAccessLogAnalysisTask(TurbiniaTask):
         summary(str): A summary of the report (used for task status)
       )
     """
-    report = []
-    findings_summary = set()
+    return self._get_report(self.get_findings(config))
 
-    for log_line in config.split('\n'):
+  def analyze_wp_access_log_files(self, paths, root=None):
+    """Analyses access log files containing Wordpress traffic in parallel.
 
-      if self.install_step_regex.search(log_line):
-        line = '{0:s}: Wordpress installation successful'.format(
-            self._get_timestamp(log_line))
-        report.append(fmt.bullet(line))
-        findings_summary.add('install')
+    Args:
+      paths (list[str]): Paths to access log files, which may be gzip
+          compressed.
+      root (str): Directory the files are reported relative to when there is
+          more than one file.
 
-      match = self.theme_editor_regex.search(log_line)
-      if match:
-        line = '{0:s}: Wordpress theme editor edited file ({1:s})'.format(
-            self._get_timestamp(log_line), match.group('edited_file'))
-        report.append(fmt.bullet(line))
-        findings_summary.add('theme_edit')
+    Returns:
+      Tuple(
+        report_text(str): The report data
+        report_priority(int): The priority of the report (0 - 100)
+        summary(str): A summary of the report (used for task status)
+      )
+    """
+    processes = min(
+        len(paths), self.MAX_PROCESSES or multiprocessing.cpu_count())
+    if processes > 1:
+      with futures.ProcessPoolExecutor(processes) as executor:
+        file_findings = list(executor.map(get_file_findings, paths))
+    else:
+      file_findings = [get_file_findings(path) for path in paths]
+
+    findings = []
+    for path, path_findings in zip(paths, file_findings):
+      if len(paths) > 1:
+        name = os.path.relpath(path, root) if root else path
+        path_findings = [(finding_type, '{0:s}: {1:s}'.format(name, line))
+                         for finding_type, line in path_findings]
+      findings.extend(path_findings)
+    return self._get_report(findings)
+
+  def _get_report(self, findings):
+    """Generates the report for Wordpress findings.
+
+    Args:
+      findings (list[tuple(str, str)]): (finding type, description) tuples.
+
+    Returns:
+      Tuple(
+        report_text(str): The report data
+        report_priority(int): The priority of the report (0 - 100)
+        summary(str): A summary of the report (used for task status)
+      )
+    """
+    report = [fmt.bullet(line) for _, line in findings]
+    findings_summary = {finding_type for finding_type, _ in findings}
 
     if report:
       findings_summary = ', '.join(sorted(list(findings_summary)))
@@ -126,3 +215,18 @@ class WordpressAccessLogAnalysisTask(TurbiniaTask):
 
     report_text = 'No Wordpress install or theme editing found in access logs'
     return (fmt.heading4(report_text), Priority.LOW, report_text)
+
+
+def get_file_findings(path):
+  """Gets the Wordpress findings in an access log file.
+
+  This is a module level function so that it can be run in a process pool.
+
+  Args:
+    path (str): The path to the access log file, which may be gzip compressed.
+
+  Returns:
+    list[tuple(str, str)]: (finding type, description) tuples.
+  """
+  return WordpressAccessLogAnalysisTask.get_findings(
+      log_analyzer.open_lines(path))
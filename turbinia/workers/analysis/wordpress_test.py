@@ -16,7 +16,10 @@
 
 from __future__ import unicode_literals
 
+import gzip
 import os
+import shutil
+import tempfile
 import unittest
 
 from turbinia import config
@@ -51,6 +54,33 @@ class WordpressAccessLogAnalysisTaskTest(unittest.TestCase):
     self.assertEqual(
         summary, 'Wordpress access logs found (install, theme_edit)')
 
+  def test_analyze_wp_access_log_files(self):
+    """Tests analyzing a directory of plain and compressed access logs."""
+    config.LoadConfig()
+    task = wordpress.WordpressAccessLogAnalysisTask()
+    tmp_dir = tempfile.mkdtemp(prefix='turbinia-test-wordpress')
+    self.addCleanup(shutil.rmtree, tmp_dir)
+    os.makedirs(os.path.join(tmp_dir, 'nginx'))
+    with open(os.path.join(tmp_dir, 'access.log'), 'wb') as fh:
+      fh.write(b'1.2.3.4 - - [27/Jun/2018:19:29:00 +0000] "GET / HTTP/1.1"\n')
+    with gzip.open(os.path.join(tmp_dir, 'nginx', 'access.log.1.gz'),
+                   'wb') as fh:
+      fh.write(self.WORDPRESS_ACCESS_LOGS.encode('utf-8') + b'\xff\n')
+
+    paths = task.get_log_paths(tmp_dir)
+    self.assertEqual(len(paths), 2)
+    self.assertEqual(task.get_log_paths(paths[0]), [paths[0]])
+    task.MAX_PROCESSES = 2
+    (report, priority, summary) = task.analyze_wp_access_log_files(
+        paths, root=tmp_dir)
+    self.assertEqual(
+        report.split('\n')[1],
+        '* nginx/access.log.1.gz: 27/Jun/2018:19:29:54 +0000: Wordpress '
+        'installation successful')
+    self.assertEqual(priority, 20)
+    self.assertEqual(
+        summary, 'Wordpress access logs found (install, theme_edit)')
+
 
 if __name__ == '__main__':
   unittest.main()
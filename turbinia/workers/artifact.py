@@ -20,20 +20,29 @@ import os
 
 from turbinia import config
 from turbinia.evidence import ExportedFileArtifact
+from turbinia.evidence import ExportedFileArtifactCollection
 from turbinia.evidence import EvidenceState as state
 from turbinia.workers import TurbiniaTask
 
 
 class FileArtifactExtractionTask(TurbiniaTask):
-  """Task to run image_export (log2timeline)."""
+  """Task to run image_export (log2timeline).
+
+  Attributes:
+    artifact_name (str): The name of the artifact to extract.
+    group_files (bool): Whether to output all extracted files as a single
+        ExportedFileArtifactCollection instead of one ExportedFileArtifact per
+        file, so that they can be processed together in one Task.
+  """
 
   REQUIRED_STATES = [
       state.ATTACHED, state.PARENT_ATTACHED, state.PARENT_MOUNTED
   ]
 
-  def __init__(self, artifact_name='FileArtifact'):
+  def __init__(self, artifact_name='FileArtifact', group_files=False):
     super(FileArtifactExtractionTask, self).__init__()
     self.artifact_name = artifact_name
+    self.group_files = group_files
 
   def run(self, evidence, result):
     """Extracts artifacts using Plaso image_export.py.
@@ -78,16 +87,29 @@ class FileArtifactExtractionTask(TurbiniaTask):
               self.artifact_name))
       return result
 
+    file_count = 0
     for dirpath, _, filenames in os.walk(export_directory):
       for filename in filenames:
+        file_count += 1
+        if self.group_files:
+          continue
         exported_artifact = ExportedFileArtifact(
             artifact_name=self.artifact_name, source_path=os.path.join(
                 dirpath, filename))
         result.log('Adding artifact {0:s}'.format(filename))
         result.add_evidence(exported_artifact, evidence.config)
 
+    if self.group_files and file_count:
+      exported_artifacts = ExportedFileArtifactCollection(
+          artifact_name=self.artifact_name, source_path=export_directory)
+      result.log(
+          'Adding collection of {0:d} artifacts from {1:s}'.format(
+              file_count, export_directory))
+      exported_artifacts.compress()
+      result.add_evidence(exported_artifacts, evidence.config)
+
     result.close(
         self, True, 'Extracted {0:d} new {1:s} artifacts'.format(
-            len(result.evidence), self.artifact_name))
+            file_count, self.artifact_name))
 
     return result
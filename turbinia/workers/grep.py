@@ -16,15 +16,157 @@
 
 from __future__ import unicode_literals
 
+from concurrent import futures
+import io
 import os
+import subprocess
 from tempfile import NamedTemporaryFile
 
+from turbinia import config
 from turbinia.evidence import FilteredTextFile
 from turbinia.workers import TurbiniaTask
 
 
 class GrepTask(TurbiniaTask):
-  """Filter input based on extended regular expression patterns."""
+  """Filter input based on extended regular expression patterns.
+
+  Large inputs can be split into byte ranges aligned to lines, which are
+  filtered by parallel grep processes.  The output of each range is then merged
+  with the byte offsets and line numbers adjusted to those in the whole input,
+  so that the output is the same as from a single grep.
+  """
+
+  # Inputs are only split into ranges of at least this many bytes.
+  MIN_SHARD_SIZE = 64 * 2**20
+
+  # Number of bytes to read from the input at a time.
+  READ_SIZE = 2**20
+
+  def get_shards(self, path, shard_count):
+    """Splits a file into byte ranges that start at the beginning of lines.
+
+    Args:
+      path (str): The path to the file.
+      shard_count (int): The maximum number of ranges.
+
+    Returns:
+      list[tuple(int, int)]: The start and end offsets of the ranges.
+    """
+    size = os.path.getsize(path)
+    shard_count = max(1, min(shard_count, size // self.MIN_SHARD_SIZE))
+    boundaries = [0]
+    with open(path, 'rb') as input_file:
+      for i in range(1, shard_count):
+        # Start the range after the end of the line the split falls in.
+        input_file.seek(max(boundaries[-1], size * i // shard_count - 1))
+        input_file.readline()
+        boundary = input_file.tell()
+        if boundary >= size:
+          break
+        if boundary > boundaries[-1]:
+          boundaries.append(boundary)
+    boundaries.append(size)
+    return list(zip(boundaries, boundaries[1:]))
+
+  def _grep_shard(
+      self, patterns_file_path, input_path, start, end, output_path):
+    """Runs grep over a byte range of a file.
+
+    Args:
+      patterns_file_path (str): The path to the file with the patterns.
+      input_path (str): The path to the file to filter.
+      start (int): The offset of the start of the range.
+      end (int): The offset of the end of the range.
+      output_path (str): The path to write the output of grep to.
+
+    Returns:
+      tuple(int, int): The return code of grep, and the number of lines in the
+          range.
+    """
+    line_count = 0
+    with io.open(output_path, 'wb') as output_file:
+      process = subprocess.Popen(
+          ['grep', '-E', '-b', '-n', '-f', patterns_file_path],
+          stdin=subprocess.PIPE, stdout=output_file)
+      try:
+        with io.open(input_path, 'rb') as input_file:
+          input_file.seek(start)
+          remaining = end - start
+          while remaining > 0:
+            data = input_file.read(min(self.READ_SIZE, remaining))
+            if not data:
+              break
+            remaining -= len(data)
+            line_count += data.count(b'\n')
+            process.stdin.write(data)
+      except (IOError, OSError):
+        # grep exited early, so its return code has the error.
+        pass
+      finally:
+        try:
+          process.stdin.close()
+        except (IOError, OSError):
+          pass
+        process.wait()
+    return process.returncode, line_count
+
+  def merge_outputs(self, shard_outputs, output_file_path):
+    """Merges the output of the ranges with offsets into the whole input.
+
+    Args:
+      shard_outputs (list[tuple(int, int, str)]): The start offset of each
+          range, the number of lines before it, and the path of its output.
+      output_file_path (str): The path to write the merged output to.
+    """
+    with io.open(output_file_path, 'wb') as output_file:
+      for start, line_offset, path in shard_outputs:
+        with io.open(path, 'rb') as shard_file:
+          for line in shard_file:
+            fields = line.split(b':', 2)
+            if len(fields) == 3 and fields[0].isdigit() and fields[1].isdigit():
+              line = b'%d:%d:%s' % (
+                  int(fields[0]) + line_offset, int(fields[1]) + start,
+                  fields[2])
+            output_file.write(line)
+        os.remove(path)
+
+  def run_sharded(
+      self, patterns_file_path, input_path, shards, output_file_path):
+    """Runs grep over byte ranges of a file in parallel.
+
+    Args:
+      patterns_file_path (str): The path to the file with the patterns.
+      input_path (str): The path to the file to filter.
+      shards (list[tuple(int, int)]): The byte ranges.
+      output_file_path (str): The path to write the merged output to.
+
+    Returns:
+      int: The return code, as from a single grep.
+    """
+    output_paths = [
+        '{0:s}.{1:d}'.format(output_file_path, i) for i in range(len(shards))
+    ]
+    # The work is done by the grep processes, so threads are enough to run
+    # them in parallel.
+    with futures.ThreadPoolExecutor(len(shards)) as executor:
+      shard_results = list(
+          executor.map(
+              lambda args: self._grep_shard(patterns_file_path, *args),
+              [(input_path, start, end, output_path)
+               for (start, end), output_path in zip(shards, output_paths)]))
+
+    shard_outputs = []
+    line_offset = 0
+    for (start, _), (_, line_count), output_path in zip(shards, shard_results,
+                                                        output_paths):
+      shard_outputs.append((start, line_offset, output_path))
+      line_offset += line_count
+    self.merge_outputs(shard_outputs, output_file_path)
+
+    return_codes = [return_code for return_code, _ in shard_results]
+    if any(return_code not in (0, 1) for return_code in return_codes):
+      return max(return_codes)
+    return min(return_codes)
 
   def run(self, evidence, result):
     """Run grep binary.
@@ -46,7 +188,7 @@ class GrepTask(TurbiniaTask):
     # Used as input to grep (-f).
     with NamedTemporaryFile(dir=self.output_dir, delete=False) as fh:
       patterns_file_path = fh.name
-      fh.write('\n'.join(patterns))
+      fh.write('\n'.join(patterns).encode('utf-8'))
 
     # Create a path that we can write the new file to.
     base_name = os.path.basename(evidence.local_path)
@@ -54,13 +196,23 @@ class GrepTask(TurbiniaTask):
         self.output_dir, '{0:s}.filtered'.format(base_name))
 
     output_evidence = FilteredTextFile(source_path=output_file_path)
-    cmd = 'grep -E -b -n -f {0:s} {1:s} > {2:s}'.format(
-        patterns_file_path, evidence.local_path, output_file_path)
+    shards = self.get_shards(evidence.local_path, config.GREP_SHARDS or 1)
+    if len(shards) > 1:
+      result.log(
+          'Running grep over {0:d} byte ranges of {1:s}'.format(
+              len(shards), evidence.local_path))
+      ret = self.run_sharded(
+          patterns_file_path, evidence.local_path, shards, output_file_path)
+      if ret == 0:
+        result.add_evidence(output_evidence, evidence.config)
+    else:
+      cmd = 'grep -E -b -n -f {0:s} {1:s} > {2:s}'.format(
+          patterns_file_path, evidence.local_path, output_file_path)
 
-    result.log('Running [{0:s}]'.format(cmd))
-    ret, result = self.execute(
-        cmd, result, new_evidence=[output_evidence], shell=True,
-        success_codes=[0, 1])
+      result.log('Running [{0:s}]'.format(cmd))
+      ret, result = self.execute(
+          cmd, result, new_evidence=[output_evidence], shell=True,
+          success_codes=[0, 1])
 
     # Grep returns 0 on success and 1 if no results are found.
     if ret == 0:
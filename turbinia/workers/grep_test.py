@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the grep Task."""
+
+from __future__ import unicode_literals
+
+import io
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from turbinia.workers import grep
+
+
+class GrepTaskTest(unittest.TestCase):
+  """Tests for GrepTask."""
+
+  def setUp(self):
+    self.tmp_dir = tempfile.mkdtemp(prefix='turbinia-test-grep')
+    self.input_path = os.path.join(self.tmp_dir, 'input.txt')
+    with io.open(self.input_path, 'wb') as fh:
+      for i in range(1000):
+        fh.write(b'line %d %s\n' % (i, b'secret' if i % 7 else b'public'))
+      fh.write(b'secret without a newline')
+    self.patterns_path = os.path.join(self.tmp_dir, 'patterns')
+    with io.open(self.patterns_path, 'wb') as fh:
+      fh.write(b'^line [0-9]*5 secret\nnewline$')
+    self.task = grep.GrepTask()
+    self.task.MIN_SHARD_SIZE = 1000
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp_dir)
+
+  def testGetShards(self):
+    """Tests ranges start at the beginning of lines and cover the file."""
+    size = os.path.getsize(self.input_path)
+    self.assertEqual(self.task.get_shards(self.input_path, 1), [(0, size)])
+    self.assertEqual(
+        self.task.get_shards(self.input_path, 100),
+        self.task.get_shards(self.input_path, size // 1000))
+    shards = self.task.get_shards(self.input_path, 7)
+    self.assertEqual(len(shards), 7)
+    self.assertEqual(shards[0][0], 0)
+    self.assertEqual(shards[-1][1], size)
+    with io.open(self.input_path, 'rb') as fh:
+      data = fh.read()
+    for (_, end), (start, _) in zip(shards, shards[1:]):
+      self.assertEqual(end, start)
+      self.assertEqual(data[start - 1:start], b'\n')
+
+  def testRunSharded(self):
+    """Tests the merged output is the same as from a single grep."""
+    expected = subprocess.check_output(
+        ['grep', '-E', '-b', '-n', '-f', self.patterns_path, self.input_path])
+    output_path = os.path.join(self.tmp_dir, 'output')
+    shards = self.task.get_shards(self.input_path, 7)
+    self.assertEqual(
+        self.task.run_sharded(
+            self.patterns_path, self.input_path, shards, output_path), 0)
+    with io.open(output_path, 'rb') as fh:
+      self.assertEqual(fh.read(), expected)
+    self.assertEqual(os.listdir(self.tmp_dir).count('output'), 1)
+    self.assertEqual(len(os.listdir(self.tmp_dir)), 3)
+
+    with io.open(self.patterns_path, 'wb') as fh:
+      fh.write(b'not found')
+    self.assertEqual(
+        self.task.run_sharded(
+            self.patterns_path, self.input_path, shards, output_path), 1)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -16,13 +16,13 @@
 
 from __future__ import unicode_literals
 
-import codecs
+import functools
 import logging
 import os
-import subprocess
 
 from turbinia import TurbiniaException
 
+from turbinia.lib import strings_extractor
 from turbinia.lib import text_formatter as fmt
 from turbinia.evidence import EvidenceState as state
 from turbinia.evidence import ReportText
@@ -41,11 +41,19 @@ class HadoopAnalysisTask(TurbiniaTask):
       state.PARENT_MOUNTED
   ]
 
+  # Strings containing these are reported as suspicious commands.
+  SUSPICIOUS_KEYWORDS = [b'curl', b'wget']
+
+  # Maximum number of processes to extract strings with, or None for one per
+  # CPU.
+  MAX_PROCESSES = None
+
   def _AnalyzeHadoopAppRoot(self, collected_artifacts, output_dir):
     """Runs a naive AppRoot files parsing method.
 
     This extracts strings from the saved task file, and searches for usual
-    post-compromise suspicious patterns.
+    post-compromise suspicious patterns.  Files are processed in parallel, and
+    suspicious commands are added to the report as each file is done.
 
     TODO: properly parse the Proto. Some documentation can be found over there:
     https://svn.apache.org/repos/asf/hadoop/common/branches/branch-0.23.7/hadoop-yarn-project/hadoop-yarn/hadoop-yarn-api/src/main/proto/yarn_protos.proto
@@ -62,39 +70,37 @@ class HadoopAnalysisTask(TurbiniaTask):
       )
     """
     report = []
-    evil_commands = []
+    command_count = 0
     strings_count = 0
     priority = Priority.MEDIUM
     summary = ''
-    for filepath in collected_artifacts:
+    search_file = functools.partial(
+        strings_extractor.search_file_strings,
+        keywords=self.SUSPICIOUS_KEYWORDS)
+    log.debug(
+        'Extracting strings from {0:d} file(s)'.format(
+            len(collected_artifacts)))
+    for filepath, (file_strings_count, commands) in strings_extractor.map_files(
+        search_file, collected_artifacts, processes=self.MAX_PROCESSES):
+      strings_count += file_strings_count
       relpath = os.path.relpath(filepath, output_dir)
-      command = 'strings -a "{0:s}"'.format(filepath)
-      log.debug('Running command [{0:s}]'.format(command))
-      proc = subprocess.Popen(
-          command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-      strings_output, _ = proc.communicate()
-      strings_output = codecs.decode(strings_output, 'utf-8')
-      for line in strings_output.splitlines():
-        strings_count += 1
-        if (line.find('curl') >= 0) or (line.find('wget') >= 0):
-          evil_commands.append((relpath, line))
-
-    if evil_commands:
+      for command in commands:
+        command_count += 1
+        report.append(fmt.bullet(fmt.bold('Command:')))
+        report.append(fmt.code(command))
+        report.append('Found in file:')
+        report.append(fmt.code(relpath))
+
+    if command_count:
       msg = 'Found suspicious commands!'
-      report.append(fmt.heading4(fmt.bold(msg)))
+      report.insert(0, fmt.heading4(fmt.bold(msg)))
       summary = msg
       priority = Priority.CRITICAL
     else:
       msg = 'Did not find any suspicious commands.'
-      report.append(fmt.heading4(msg))
+      report.insert(0, fmt.heading4(msg))
       summary = msg
 
-    for filepath, command in evil_commands:
-      report.append(fmt.bullet(fmt.bold('Command:')))
-      report.append(fmt.code(command))
-      report.append('Found in file:')
-      report.append(fmt.code(filepath))
-
     msg = 'Extracted {0:d} strings from {1:d} file(s)'.format(
         strings_count, len(collected_artifacts))
     report.append(fmt.bullet(msg))
@@ -54,3 +54,20 @@ class HadoopAnalysisTest(unittest.TestCase):
     self.assertEqual(priority, 10)
     self.assertEqual(summary, 'Found suspicious commands!')
     self.assertEqual(report, self._EXPECTED_REPORT)
+
+  def testAnalyzeHadoopAppRootParallel(self):
+    """Tests files are analyzed in a process pool."""
+    config.LoadConfig()
+    task = hadoop.HadoopAnalysisTask()
+    task.MAX_PROCESSES = 2
+    # pylint: disable=protected-access
+    (report, priority, _) = task._AnalyzeHadoopAppRoot(
+        [self.test_file, self.test_file, __file__], self.filedir)
+    self.assertEqual(priority, 10)
+    self.assertEqual(report.count('`../../test_data/bad_yarn_saved_task`'), 2)
+    self.assertIn('`hadoop_test.py`', report)
+    self.assertTrue(report[-1].endswith('from 3 file(s)'))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -24,11 +24,18 @@ from turbinia.evidence import ReportText
 from turbinia.lib import text_formatter as fmt
 from turbinia.workers import TurbiniaTask
 from turbinia.workers import Priority
+from turbinia.workers.analysis import log_analyzer
 
 
 class RedisAnalysisTask(TurbiniaTask):
   """Task to analyze a Redis configuration file."""
 
+  RULES = [
+      log_analyzer.Rule(
+          'bind_everywhere', r'^\s*bind[\s"]*0\.0\.0\.0', literals=['0.0.0.0'],
+          flags=re.IGNORECASE)
+  ]
+
   REQUIRED_STATES = [
       state.ATTACHED, state.DOCKER_MOUNTED, state.PARENT_ATTACHED,
       state.PARENT_MOUNTED
@@ -50,9 +57,8 @@ class RedisAnalysisTask(TurbiniaTask):
     # Set the output file as the data source for the output evidence.
     output_evidence = ReportText(source_path=output_file_path)
 
-    # Read the input file
-    with open(evidence.local_path, 'r') as input_file:
-      redis_config = input_file.read()
+    # Stream the input file.
+    redis_config = log_analyzer.open_lines(evidence.local_path)
 
     (report, priority, summary) = self.analyse_redis_config(redis_config)
     output_evidence.text_data = report
@@ -72,7 +78,7 @@ class RedisAnalysisTask(TurbiniaTask):
     """Analyses a Redis configuration.
 
     Args:
-      config (str): configuration file content.
+      config (iterable[str]|str): configuration file lines, or the content.
 
     Returns:
       Tuple(
@@ -82,10 +88,10 @@ class RedisAnalysisTask(TurbiniaTask):
       )
     """
     findings = []
-    bind_everywhere_re = re.compile(
-        r'^\s*bind[\s"]*0\.0\.0\.0', re.IGNORECASE | re.MULTILINE)
+    matched_rules = log_analyzer.LogAnalyzer(
+        self.RULES).get_matched_rules(config)
 
-    if re.search(bind_everywhere_re, config):
+    if 'bind_everywhere' in matched_rules:
       findings.append(fmt.bullet('Redis listening on every IP'))
 
     if findings:
@@ -23,11 +23,26 @@ from turbinia.evidence import ReportText
 from turbinia.lib import text_formatter as fmt
 from turbinia.workers import TurbiniaTask
 from turbinia.workers import Priority
+from turbinia.workers.analysis import log_analyzer
 
 
 class SSHDAnalysisTask(TurbiniaTask):
   """Task to analyze a sshd_config file."""
 
+  RULES = [
+      log_analyzer.Rule(
+          'permit_root_login',
+          r'^\s*PermitRootLogin\s*(yes|prohibit-password|without-password)',
+          literals=['PermitRootLogin'], flags=re.IGNORECASE),
+      log_analyzer.Rule(
+          'password_authentication_disabled',
+          r'^\s*PasswordAuthentication[\s"]*No',
+          literals=['PasswordAuthentication'], flags=re.IGNORECASE),
+      log_analyzer.Rule(
+          'permit_empty_passwords', r'^\s*PermitEmptyPasswords[\s"]*Yes',
+          literals=['PermitEmptyPasswords'], flags=re.IGNORECASE)
+  ]
+
   def run(self, evidence, result):
     """Run the sshd_config analysis worker.
 
@@ -44,9 +59,8 @@ class SSHDAnalysisTask(TurbiniaTask):
     # Set the output file as the data source for the output evidence.
     output_evidence = ReportText(source_path=output_file_path)
 
-    # Read the input file
-    with open(evidence.local_path, 'r') as input_file:
-      sshd_config = input_file.read()
+    # Stream the input file.
+    sshd_config = log_analyzer.open_lines(evidence.local_path)
 
     (report, priority, summary) = self.analyse_sshd_config(sshd_config)
     output_evidence.text_data = report
@@ -66,7 +80,7 @@ class SSHDAnalysisTask(TurbiniaTask):
     """Analyses an SSH configuration.
 
     Args:
-      config (str): configuration file content.
+      config (iterable[str]|str): configuration file lines, or the content.
 
     Returns:
       Tuple(
@@ -76,21 +90,16 @@ class SSHDAnalysisTask(TurbiniaTask):
       )
     """
     findings = []
-    permit_root_login_re = re.compile(
-        r'^\s*PermitRootLogin\s*(yes|prohibit-password|without-password)',
-        re.IGNORECASE | re.MULTILINE)
-    password_authentication_re = re.compile(
-        r'^\s*PasswordAuthentication[\s"]*No', re.IGNORECASE | re.MULTILINE)
-    permit_empty_passwords_re = re.compile(
-        r'^\s*PermitEmptyPasswords[\s"]*Yes', re.IGNORECASE | re.MULTILINE)
-
-    if re.search(permit_root_login_re, config):
+    matched_rules = log_analyzer.LogAnalyzer(
+        self.RULES).get_matched_rules(config)
+
+    if 'permit_root_login' in matched_rules:
       findings.append(fmt.bullet('Root login enabled.'))
 
-    if not re.search(password_authentication_re, config):
+    if 'password_authentication_disabled' not in matched_rules:
       findings.append(fmt.bullet('Password authentication enabled.'))
 
-    if re.search(permit_empty_passwords_re, config):
+    if 'permit_empty_passwords' in matched_rules:
       findings.append(fmt.bullet('Empty passwords permitted.'))
 
     if findings:
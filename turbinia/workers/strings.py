@@ -12,84 +12,123 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-"""Task for gathering ascii strings."""
+"""Task for gathering ascii and Unicode strings."""
 
 from __future__ import unicode_literals
 
+import gzip
+import io
 import os
 
+from turbinia import config
+from turbinia.evidence import CompressedTextFile
 from turbinia.evidence import EvidenceState as state
 from turbinia.evidence import TextFile
+from turbinia.lib import strings_extractor
 from turbinia.workers import TurbiniaTask
 
 
-class StringsAsciiTask(TurbiniaTask):
-  """Task to generate ascii strings."""
+class StringsTask(TurbiniaTask):
+  """Task to generate ascii and Unicode (16 bit little endian) strings.
+
+  The device is read once, and each kind of string is written to its own file
+  in the format of `strings -a -t d`, or to a gzip compressed
+  CompressedTextFile when STRINGS_COMPRESSION is set.  Large devices can be
+  split into byte ranges that are processed by separate Tasks.
+
+  Attributes:
+    shard_index (int): The index of the byte range of the device to process.
+    shard_count (int): The number of byte ranges the device is split into.
+  """
 
   REQUIRED_STATES = [
       state.ATTACHED, state.PARENT_ATTACHED, state.PARENT_MOUNTED
   ]
 
-  def run(self, evidence, result):
-    """Run strings binary.
+  # File extensions of the output for each encoding.
+  OUTPUT_EXTENSIONS = {
+      strings_extractor.ENCODING_ASCII: 'ascii',
+      strings_extractor.ENCODING_UTF16LE: 'uni'
+  }
+
+  def __init__(self, shard_index=0, shard_count=1, *args, **kwargs):
+    super(StringsTask, self).__init__(*args, **kwargs)
+    self.shard_index = shard_index
+    self.shard_count = shard_count
+
+  def get_byte_range(self, size):
+    """Gets the byte range of the device this Task processes.
 
     Args:
-        evidence (Evidence object):  The evidence we will process.
-        result (TurbiniaTaskResult): The object to place task results into.
+      size (int): The size of the device in bytes.
 
     Returns:
-        TurbiniaTaskResult object.
+      tuple(int, int): The start and end offsets of the range.
     """
-    # Create a path that we can write the new file to.
-    base_name = os.path.basename(evidence.device_path)
-    output_file_path = os.path.join(
-        self.output_dir, '{0:s}.ascii'.format(base_name))
-    # Create the new Evidence object that will be generated by this Task.
-    output_evidence = TextFile(source_path=output_file_path)
-
-    # Generate the command we want to run.
-    cmd = 'strings -a -t d {0:s} > {1:s}'.format(
-        evidence.device_path, output_file_path)
-    # Add a log line to the result that will be returned.
-    result.log('Running strings as [{0:s}]'.format(cmd))
-    # Actually execute the binary
-    self.execute(
-        cmd, result, new_evidence=[output_evidence], close=True, shell=True)
-
-    return result
-
-
-class StringsUnicodeTask(TurbiniaTask):
-  """Task to generate Unicode (16 bit little endian) strings."""
-
-  REQUIRED_STATES = [
-      state.ATTACHED, state.PARENT_ATTACHED, state.PARENT_MOUNTED
-  ]
+    start = size * self.shard_index // self.shard_count
+    end = size * (self.shard_index + 1) // self.shard_count
+    return start, end
 
   def run(self, evidence, result):
-    """Run strings binary.
+    """Extracts the strings from the device.
 
     Args:
-        evidence (Evidence object):  The evidence we will process
+        evidence (Evidence object):  The evidence we will process.
         result (TurbiniaTaskResult): The object to place task results into.
 
     Returns:
         TurbiniaTaskResult object.
     """
-    # Create a path that we can write the new file to.
     base_name = os.path.basename(evidence.device_path)
-    output_file_path = os.path.join(
-        self.output_dir, '{0:s}.uni'.format(base_name))
-    # Create the new Evidence object that will be generated by this Task.
-    output_evidence = TextFile(source_path=output_file_path)
-
-    # Generate the command we want to run.
-    cmd = 'strings -a -t d -e l {0:s} > {1:s}'.format(
-        evidence.device_path, output_file_path)
-    # Add a log line to the result that will be returned.
-    result.log('Running strings as [{0:s}]'.format(cmd))
-    # Actually execute the binary
-    self.execute(
-        cmd, result, new_evidence=[output_evidence], close=True, shell=True)
-
+    if self.shard_count > 1:
+      base_name = '{0:s}.{1:d}'.format(base_name, self.shard_index)
+    compress = bool(config.STRINGS_COMPRESSION)
+    # Compressed output has its own Evidence type so that Jobs that read text,
+    # like GrepJob, don't process it.
+    evidence_class = CompressedTextFile if compress else TextFile
+
+    output_files = {}
+    output_evidence = []
+    try:
+      for encoding, extension in self.OUTPUT_EXTENSIONS.items():
+        output_file_path = os.path.join(
+            self.output_dir, '{0:s}.{1:s}{2:s}'.format(
+                base_name, extension, '.gz' if compress else ''))
+        if compress:
+          # Compress quickly so that writing doesn't slow down reading.
+          output_file = io.TextIOWrapper(
+              gzip.open(output_file_path, 'wb', compresslevel=1),
+              encoding='utf-8')
+        else:
+          output_file = io.open(output_file_path, 'w', encoding='utf-8')
+        output_files[encoding] = output_file
+        output_evidence.append(evidence_class(source_path=output_file_path))
+
+      counts = dict.fromkeys(output_files, 0)
+      with open(evidence.device_path, 'rb') as device:
+        device.seek(0, os.SEEK_END)
+        start, end = self.get_byte_range(device.tell())
+        result.log(
+            'Extracting strings from {0:s} bytes {1:d} to {2:d}'.format(
+                evidence.device_path, start, end))
+        for offset, encoding, string in strings_extractor.iter_strings(
+            device, start, end):
+          output_files[encoding].write('{0:7d} {1:s}\n'.format(offset, string))
+          counts[encoding] += 1
+    except (IOError, OSError) as exception:
+      result.close(
+          self, success=False,
+          status='Error extracting strings from {0:s}: {1!s}'.format(
+              evidence.device_path, exception))
+      return result
+    finally:
+      for output_file in output_files.values():
+        output_file.close()
+
+    for output_evidence_ in output_evidence:
+      result.add_evidence(output_evidence_, evidence.config)
+    status = 'Extracted {0:d} ascii and {1:d} Unicode strings'.format(
+        counts[strings_extractor.ENCODING_ASCII],
+        counts[strings_extractor.ENCODING_UTF16LE])
+    result.close(self, success=True, status=status)
     return result
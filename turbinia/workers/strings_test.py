@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the strings Task."""
+
+from __future__ import unicode_literals
+
+import gzip
+import io
+import os
+import unittest
+
+import mock
+
+from turbinia.evidence import CompressedTextFile
+from turbinia.evidence import TextFile
+from turbinia.workers import strings
+from turbinia.workers.workers_test import TestTurbiniaTaskBase
+
+DISK_DATA = (
+    b'\x00\x00ascii string\x00\xffu\x00n\x00i\x00c\x00o\x00d\x00e\x00\x00\x00'
+    b'\x01\x02more ascii\x00')
+
+
+class StringsTaskTest(TestTurbiniaTaskBase):
+  """Tests for StringsTask."""
+
+  def setUp(self):
+    # pylint: disable=arguments-differ
+    super(StringsTaskTest, self).setUp(task_class=strings.StringsTask)
+    self.setResults(mock_run=False)
+    self.task.output_dir = self.base_output_dir
+    self.evidence.device_path = self.evidence.source_path
+    with open(self.evidence.device_path, 'wb') as fh:
+      fh.write(DISK_DATA)
+
+  def _read_output(self, result, compressed=False):
+    """Reads the output files of the Task."""
+    output = []
+    for output_evidence in result.evidence:
+      path = output_evidence.source_path
+      self.remove_files.append(path)
+      open_function = gzip.open if compressed else io.open
+      with open_function(path, 'rb') as fh:
+        output.append((os.path.basename(path), fh.read().decode('utf-8')))
+    return sorted(output)
+
+  @mock.patch('turbinia.workers.strings.config')
+  def testStringsRun(self, mock_config):
+    """Tests both kinds of strings are extracted in one Task."""
+    mock_config.STRINGS_COMPRESSION = False
+    base_name = os.path.basename(self.evidence.device_path)
+    result = self.task.run(self.evidence, self.result)
+    result.close.assert_called_once_with(
+        self.task, success=True,
+        status='Extracted 2 ascii and 1 Unicode strings')
+    self.assertEqual(
+        self._read_output(result),
+        [(
+            '{0:s}.ascii'.format(base_name),
+            '      2 ascii string\n     34 more ascii\n'),
+         ('{0:s}.uni'.format(base_name), '     16 unicode\n')])
+    self.assertEqual([type(e) for e in result.evidence], [TextFile, TextFile])
+
+  @mock.patch('turbinia.workers.strings.config')
+  def testStringsRunShardedCompressed(self, mock_config):
+    """Tests a byte range of the device is extracted to compressed files."""
+    mock_config.STRINGS_COMPRESSION = True
+    self.task.shard_index = 1
+    self.task.shard_count = 2
+    base_name = os.path.basename(self.evidence.device_path)
+    self.assertEqual(self.task.get_byte_range(len(DISK_DATA)), (22, 45))
+    result = self.task.run(self.evidence, self.result)
+    result.close.assert_called_once_with(
+        self.task, success=True,
+        status='Extracted 1 ascii and 0 Unicode strings')
+    self.assertEqual(
+        self._read_output(result, compressed=True),
+        [('{0:s}.1.ascii.gz'.format(base_name), '     34 more ascii\n'),
+         ('{0:s}.1.uni.gz'.format(base_name), '')])
+    # GrepJob only processes uncompressed TextFile Evidence.
+    self.assertEqual([type(e) for e in result.evidence],
+                     [CompressedTextFile, CompressedTextFile])
+
+
+if __name__ == '__main__':
+  unittest.main()
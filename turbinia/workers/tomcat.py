@@ -16,18 +16,33 @@
 
 from __future__ import unicode_literals
 
+import collections
 import os
-import re
 
 from turbinia.evidence import ReportText
 from turbinia.lib import text_formatter as fmt
 from turbinia.workers import TurbiniaTask
 from turbinia.workers import Priority
+from turbinia.workers.analysis import log_analyzer
 
 
 class TomcatAnalysisTask(TurbiniaTask):
   """Task to analyze a Tomcat file."""
 
+  RULES = [
+      log_analyzer.Rule('password', 'password', literals=['password']),
+      log_analyzer.Rule(
+          'deploy', 'Deploying web application archive',
+          literals=['Deploying web application archive']),
+      log_analyzer.Rule(
+          'manager', 'POST /manager/html/upload',
+          literals=['POST /manager/html/upload'])
+  ]
+  # Finding descriptions for each rule, in the order they are reported.
+  FINDING_TITLES = collections.OrderedDict([('password', 'Tomcat user'),
+                                            ('deploy', 'Tomcat App Deployed'),
+                                            ('manager', 'Tomcat Management')])
+
   def run(self, evidence, result):
     """Run the Tomcat analysis worker.
 
@@ -45,9 +60,8 @@ class TomcatAnalysisTask(TurbiniaTask):
     # Set the output file as the data source for the output evidence.
     output_evidence = ReportText(source_path=output_file_path)
 
-    # Read the input file
-    with open(evidence.local_path, 'r') as input_file:
-      tomcat_file = input_file.read()
+    # Stream the input file.
+    tomcat_file = log_analyzer.open_lines(evidence.local_path)
 
     (report, priority, summary) = self.analyse_tomcat_file(tomcat_file)
     result.report_priority = priority
@@ -71,7 +85,7 @@ class TomcatAnalysisTask(TurbiniaTask):
     - Search for management control panel activity
 
     Args:
-      tomcat_file (str): Tomcat file content.
+      tomcat_file (iterable[str]|str): Tomcat file lines, or the file content.
     Returns:
       Tuple(
         report_text(str): The report data
@@ -79,27 +93,19 @@ class TomcatAnalysisTask(TurbiniaTask):
         summary(str): A summary of the report (used for task status)
       )
     """
-    findings = []
+    # Findings are grouped by rule in the report.
+    rule_findings = {rule: [] for rule in self.FINDING_TITLES}
+    analyzer = log_analyzer.LogAnalyzer(self.RULES)
+    for finding in analyzer.scan(tomcat_file):
+      rule_findings[finding.rule].append(
+          fmt.bullet(
+              '{0:s}: {1:s}'.format(
+                  self.FINDING_TITLES[finding.rule], finding.line.strip())))
 
-    tomcat_user_passwords_re = re.compile('(^.*password.*)', re.MULTILINE)
-    tomcat_deploy_re = re.compile(
-        '(^.*Deploying web application archive.*)', re.MULTILINE)
-    tomcat_manager_activity_re = re.compile(
-        '(^.*POST /manager/html/upload.*)', re.MULTILINE)
-
-    count = 0
-    for password_entry in re.findall(tomcat_user_passwords_re, tomcat_file):
-      findings.append(fmt.bullet('Tomcat user: ' + password_entry.strip()))
-      count += 1
-
-    for deployment_entry in re.findall(tomcat_deploy_re, tomcat_file):
-      findings.append(
-          fmt.bullet('Tomcat App Deployed: ' + deployment_entry.strip()))
-      count += 1
-
-    for mgmt_entry in re.findall(tomcat_manager_activity_re, tomcat_file):
-      findings.append(fmt.bullet('Tomcat Management: ' + mgmt_entry.strip()))
-      count += 1
+    findings = []
+    for rule in self.FINDING_TITLES:
+      findings.extend(rule_findings[rule])
+    count = len(findings)
 
     if findings:
       msg = 'Tomcat analysis found {0:d} results'.format(count)
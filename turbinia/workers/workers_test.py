@@ -140,6 +140,41 @@ class TestTurbiniaTask(TestTurbiniaTaskBase):
     self.assertEqual(new_result.status, 'TestStatus')
     self.result.close.assert_called()
 
+  def testTurbiniaTaskRunWrapperSavesDeferredOutput(self):
+    """Test that the run wrapper saves deferred output after running."""
+    self.setResults()
+    self.result.successful = True
+    self.result.log_deferred = True
+    self.task.output_manager.save_deferred.return_value = ['Upload failed']
+    logfile = os.path.join(self.base_output_dir, 'worker-log.txt')
+    self.remove_files.append(logfile)
+    new_result = self.task.run_wrapper(self.evidence.__dict__)
+    new_result = TurbiniaTaskResult.deserialize(new_result)
+    self.task.output_manager.save_deferred.assert_called_once_with()
+    self.assertFalse(new_result.successful)
+    self.assertIn('Upload failed', new_result.status)
+    # The worker log is saved after the deferred saves and includes the error.
+    self.assertFalse(new_result.log_deferred)
+    with open(logfile) as file_handle:
+      self.assertIn('Upload failed', file_handle.read())
+    self.task.output_manager.save_local_file.assert_called_with(
+        logfile, mock.ANY)
+
+  @mock.patch('turbinia.workers.filelock.FileLock')
+  @mock.patch('turbinia.workers.space_manager.SpaceManager')
+  def testTurbiniaTaskRunWrapperNoSpace(self, mock_space_manager, mock_lock):
+    """Test that Tasks without disk space fail before taking the lock."""
+    self.setResults()
+    mock_space_manager.enabled.return_value = True
+    manager = mock_space_manager.return_value
+    manager.ensure_space.side_effect = TurbiniaException('No space')
+    self.task.run_wrapper(self.evidence.__dict__)
+    mock_lock.assert_not_called()
+    self.task.run.assert_not_called()
+    self.result.close.assert_called_once_with(
+        self.task, success=False, status=mock.ANY)
+    manager.release.assert_called_once_with(self.task.id)
+
   @mock.patch('turbinia.state_manager.get_state_manager')
   def testTurbiniaTaskRunWrapperBadResult(self, _):
     """Test that the run wrapper recovers from run returning bad result."""
@@ -190,6 +225,34 @@ class TestTurbiniaTask(TestTurbiniaTaskBase):
     self.assertEqual(type(new_result), TurbiniaTaskResult)
     self.assertIn(canary_status, new_result.status)
 
+  @mock.patch('turbinia.recipe_store.get_recipe_store')
+  @mock.patch('turbinia.state_manager.get_state_manager')
+  def testTurbiniaTaskRunWrapperRecipeFail(self, _, mock_recipe_store):
+    """Test that the run wrapper recovers from recipes failing to resolve."""
+    self.task.result = None
+    mock_recipe_store.return_value.resolve_evidence.side_effect = (
+        TurbiniaException('Recipe abc123 does not exist'))
+    self.remove_files.append(
+        os.path.join(self.task.base_output_dir, 'worker-log.txt'))
+
+    new_result = self.task.run_wrapper(self.evidence.__dict__)
+    self.assertIn('Recipe abc123 does not exist', new_result['status'])
+
+  def testTurbiniaTaskResultDeserializeRecipeFail(self):
+    """Test results with recipes that fail to resolve are failed results."""
+    self.setResults()
+    self.result.evidence = [self.evidence]
+    serialized = self.result.serialize()
+
+    with mock.patch('turbinia.recipe_store.get_recipe_store') as mock_store:
+      mock_store.return_value.resolve_evidence.side_effect = (
+          TurbiniaException('Recipe abc123 does not exist'))
+      new_result = TurbiniaTaskResult.deserialize(serialized)
+    self.assertFalse(new_result.successful)
+    self.assertEqual(new_result.evidence, [])
+    self.assertIn('Recipe abc123 does not exist', new_result.status)
+    self.assertIn('Recipe abc123 does not exist', new_result.error['error'])
+
   def testTurbiniaTaskValidateResultGoodResult(self):
     """Tests validate_result with good result."""
     self.result.status = 'GoodStatus'